@@ -15,21 +15,66 @@ from datetime import datetime
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from conversation_manager import CustomConversationManager
+from models import SimpleLLMClient, RetryPolicy, ResponseCache
+from observability import get_tracer, setup_logging
+from observability.usage import UsageTracker, track_usage
+
+
+def _missing_column_message(input_file: str, df: pd.DataFrame, question_column: str) -> str:
+    """
+    问题列不存在时的提示信息
+    
+    Args:
+        input_file: 输入Excel文件路径
+        df: 读取的表格
+        question_column: 指定的问题列名
+        
+    Returns:
+        列出可用列名的错误信息
+    """
+    available_columns = list(df.columns)
+    error_msg = f"错误：未找到列 '{question_column}'。\n\n可用列：\n"
+    for i, col in enumerate(available_columns, 1):
+        error_msg += f"  {i}. {col}\n"
+    error_msg += f"\n请使用 -c 参数指定正确的列名，例如：\n"
+    error_msg += f"  python batch_qa_processor.py {input_file} -c \"{available_columns[0]}\"\n"
+    error_msg += f"\n或者使用 --list-columns 查看所有列名：\n"
+    error_msg += f"  python batch_qa_processor.py {input_file} --list-columns"
+    return error_msg
 
 
 class BatchQAProcessor:
     """批量问答处理器"""
     
-    def __init__(self, api_key: str = None, model: str = "qwen-plus"):
+    def __init__(self, api_key: str = None, model: str = "qwen-plus", max_retries: int = 4,
+                 hedge_delay: float = None, cache_path: str = None, trace_file: str = None,
+                 trace_format: str = "json"):
         """
         初始化批量问答处理器
         
         Args:
             api_key: API密钥
             model: 模型名称
+            max_retries: 单次模型调用的最大尝试次数，限流和超时会自动退避重试
+            hedge_delay: 对冲请求的触发延迟（秒），为None时不发对冲请求
+            cache_path: 模型响应缓存文件路径，设置后相同请求直接重放缓存结果
+            trace_file: 分阶段耗时记录的输出文件（JSON lines），设置后开启追踪并在结束时打印耗时汇总
+            trace_format: 耗时记录格式，"json" 或 "otel"（OpenTelemetry OTLP JSON）
         """
-        self.conversation_manager = CustomConversationManager(api_key, model)
+        llm_client = SimpleLLMClient(
+            api_key, model,
+            retry_policy=RetryPolicy(max_attempts=max_retries),
+            hedge_delay=hedge_delay,
+            cache=ResponseCache(cache_path) if cache_path else None,
+        )
+        self.conversation_manager = CustomConversationManager(api_key, model, llm_client=llm_client)
         self.results = []
+        # 整个批量运行的模型用量
+        self.usage = UsageTracker()
+        self.trace_file = trace_file
+        self.trace_format = trace_format
+        if trace_file:
+            get_tracer().enable()
     
     def process_excel_file(self, input_file: str, output_file: str = None, 
                           question_column: str = "问题", batch_size: int = 10,
@@ -53,15 +98,7 @@ class BatchQAProcessor:
             df = pd.read_excel(input_file)
             
             if question_column not in df.columns:
-                available_columns = list(df.columns)
-                error_msg = f"错误：未找到列 '{question_column}'。\n\n可用列：\n"
-                for i, col in enumerate(available_columns, 1):
-                    error_msg += f"  {i}. {col}\n"
-                error_msg += f"\n请使用 -c 参数指定正确的列名，例如：\n"
-                error_msg += f"  python batch_qa_processor.py {input_file} -c \"{available_columns[0]}\"\n"
-                error_msg += f"\n或者使用 --list-columns 查看所有列名：\n"
-                error_msg += f"  python batch_qa_processor.py {input_file} --list-columns"
-                return error_msg
+                return _missing_column_message(input_file, df, question_column)
             
             # 获取问题列表
             questions = df[question_column].dropna().tolist()
@@ -83,9 +120,11 @@ class BatchQAProcessor:
             for i, question in enumerate(questions, 1):
                 print(f"\n处理第 {i}/{total_questions} 个问题: {question[:50]}...")
                 
+                question_usage = UsageTracker()
                 try:
                     # 处理单个问题
-                    answer, conversation_history = self.conversation_manager.process_user_input(question)
+                    with track_usage(self.usage), track_usage(question_usage):
+                        answer, conversation_history = self.conversation_manager.process_user_input(question)
                     
                     # 保存结果
                     result = {
@@ -93,7 +132,8 @@ class BatchQAProcessor:
                         "问题": question,
                         "回答": answer,
                         "处理时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "状态": "成功"
+                        "状态": "成功",
+                        **self._usage_columns(question_usage)
                     }
                     
                     # 尝试提取参考文献
@@ -112,7 +152,8 @@ class BatchQAProcessor:
                         "问题": question,
                         "回答": f"处理失败: {str(e)}",
                         "处理时间": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "状态": "失败"
+                        "状态": "失败",
+                        **self._usage_columns(question_usage)
                     }
                     self.results.append(result)
                 
@@ -142,9 +183,12 @@ class BatchQAProcessor:
 成功处理: {successful}
 处理失败: {failed}
 成功率: {successful/total_questions*100:.1f}%
+模型用量: {self.usage.format_summary()}
             """
             
             print(result_summary)
+            if self.trace_file:
+                self._report_traces()
             return result_summary
             
         except Exception as e:
@@ -152,6 +196,23 @@ class BatchQAProcessor:
             print(error_msg)
             return error_msg
     
+    @staticmethod
+    def _usage_columns(usage: UsageTracker) -> Dict[str, int]:
+        """
+        单个问题的模型用量列
+        
+        Args:
+            usage: 该问题的用量统计
+            
+        Returns:
+            写入结果表格的列
+        """
+        return {
+            "模型调用次数": usage.calls,
+            "输入tokens": usage.input_tokens,
+            "输出tokens": usage.output_tokens,
+        }
+    
     def _extract_references(self, answer: str) -> str:
         """
         从回答中提取参考文献
@@ -194,11 +255,176 @@ class BatchQAProcessor:
         except Exception as e:
             print(f"保存最终结果失败: {e}")
     
+    def _report_traces(self):
+        """导出耗时记录并打印各阶段的 p50/p95/p99"""
+        tracer = get_tracer()
+        try:
+            count = tracer.export_jsonl(self.trace_file, self.trace_format)
+            print(f"已导出 {count} 条耗时记录到: {self.trace_file}")
+        except Exception as e:
+            print(f"导出耗时记录失败: {e}")
+        print("\n各阶段耗时汇总（毫秒）：")
+        print(tracer.format_report())
+    
     def get_results(self) -> List[Dict[str, Any]]:
         """获取处理结果"""
         return self.results.copy()
 
 
+class BatchRetrievalProcessor:
+    """批量检索处理器
+    
+    只评估检索质量时使用：不经过对话流程和模型，把表格中的问题分批编码（每批一次编码），
+    每个知识库对整批问题做一次矩阵搜索，结果按问题写入表格。
+    """
+    
+    def __init__(self, kb_manager=None, knowledge_base: str = "all", top_k: int = 5, chunk_size: int = 512):
+        """
+        初始化批量检索处理器
+        
+        Args:
+            kb_manager: 知识库管理器，为None时使用全局实例
+            knowledge_base: 要检索的知识库 (hpv, flu, hiv)，"all" 表示全部，也可以用逗号分隔多个
+            top_k: 每个问题写入的命中数量
+            chunk_size: 每批编码和搜索的问题数
+        """
+        from tools.knowledge_base_tool import get_kb_manager, parse_knowledge_base_names
+        
+        self.kb_manager = kb_manager if kb_manager is not None else get_kb_manager()
+        self.knowledge_base = knowledge_base
+        self.kb_types = parse_knowledge_base_names(knowledge_base)
+        self.top_k = top_k
+        self.chunk_size = max(1, chunk_size)
+        self.results = []
+    
+    def search(self, questions: List[str]) -> List[Dict[str, Any]]:
+        """
+        批量检索问题
+        
+        Args:
+            questions: 问题列表
+            
+        Returns:
+            与 questions 对应的结果行，包含命中的标题、来源、分数和分摊到每个问题的检索耗时；
+            不可搜索的知识库（未加载、加载失败等）的原因写入每一行的错误列
+        """
+        # 与 search_all_knowledge_bases 一样先检查各知识库，搜索时不可搜索的知识库会被跳过
+        unavailable = self.kb_manager.unsearchable_reasons(self.kb_types)
+        rows = []
+        for start in range(0, len(questions), self.chunk_size):
+            chunk = questions[start:start + self.chunk_size]
+            chunk_start = time.perf_counter()
+            results_by_kb = self.kb_manager.search_each_knowledge_base_many(chunk, self.top_k, self.kb_types)
+            elapsed_ms = (time.perf_counter() - chunk_start) * 1000
+            
+            for offset, question in enumerate(chunk):
+                hits = {}
+                errors = list(unavailable)
+                for kb_type, results in results_by_kb.items():
+                    if results[offset] and "error" in results[offset][0]:
+                        errors.append(f"{kb_type.value}: {results[offset][0]['error']}")
+                    else:
+                        hits[kb_type] = results[offset]
+                if len(self.kb_types) == 1:
+                    merged = next(iter(hits.values()), [])
+                else:
+                    merged = self.kb_manager.merge_search_results(hits, self.top_k) if hits else []
+                if not results_by_kb and not errors:
+                    errors.append("没有可以搜索的知识库")
+                rows.append(self._result_row(start + offset + 1, question, merged, elapsed_ms / len(chunk), errors))
+        return rows
+    
+    def _result_row(self, number: int, question: str, hits: List[Dict[str, Any]],
+                    elapsed_ms: float, errors: List[str]) -> Dict[str, Any]:
+        """
+        单个问题的结果行
+        
+        Args:
+            number: 问题序号
+            question: 问题
+            hits: 排序后的命中结果
+            elapsed_ms: 分摊到该问题的检索耗时（毫秒）
+            errors: 检索失败的知识库及错误信息
+            
+        Returns:
+            写入结果表格的列
+        """
+        row = {"序号": number, "问题": question, "知识库": self.knowledge_base, "命中数": len(hits)}
+        for rank in range(1, self.top_k + 1):
+            hit = hits[rank - 1] if rank <= len(hits) else {}
+            row[f"命中{rank}标题"] = hit.get("title", "")
+            if len(self.kb_types) > 1:
+                row[f"命中{rank}知识库"] = hit.get("knowledge_base", "")
+            row[f"命中{rank}来源"] = hit.get("source", "")
+            row[f"命中{rank}分数"] = round(hit["similarity_score"], 4) if hit else None
+        row["检索耗时(ms)"] = round(elapsed_ms, 3)
+        row["状态"] = "失败" if errors and not hits else "成功"
+        row["错误"] = "；".join(errors)
+        return row
+    
+    def process_excel_file(self, input_file: str, output_file: str = None, question_column: str = "问题") -> str:
+        """
+        检索Excel文件中的问题并保存结果
+        
+        Args:
+            input_file: 输入Excel文件路径
+            output_file: 输出Excel文件路径，如果为None则自动生成
+            question_column: 问题列名
+            
+        Returns:
+            处理结果信息
+        """
+        try:
+            print(f"正在读取Excel文件: {input_file}")
+            df = pd.read_excel(input_file)
+            if question_column not in df.columns:
+                return _missing_column_message(input_file, df, question_column)
+            
+            questions = [str(question) for question in df[question_column].dropna().tolist()]
+            if not questions:
+                return "错误：Excel文件中没有找到有效的问题"
+            print(f"找到 {len(questions)} 个问题，开始批量检索（每批 {self.chunk_size} 个）")
+            
+            if output_file is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                output_file = f"batch_retrieval_results_{timestamp}.xlsx"
+            
+            start = time.perf_counter()
+            self.results = self.search(questions)
+            elapsed = time.perf_counter() - start
+            
+            successful = len([r for r in self.results if r["状态"] == "成功"])
+            summary = {
+                "问题数": len(questions),
+                "知识库": self.knowledge_base,
+                "top_k": self.top_k,
+                "每批问题数": self.chunk_size,
+                "检索成功": successful,
+                "总耗时(秒)": round(elapsed, 3),
+                "每秒问题数": round(len(questions) / elapsed, 1) if elapsed > 0 else None,
+            }
+            with pd.ExcelWriter(output_file) as writer:
+                pd.DataFrame(self.results).to_excel(writer, sheet_name="检索结果", index=False)
+                pd.DataFrame(list(summary.items()), columns=["指标", "数值"]).to_excel(writer, sheet_name="统计", index=False)
+            
+            result_summary = f"""
+批量检索完成！
+
+输入文件: {input_file}
+输出文件: {output_file}
+总问题数: {len(questions)}
+检索成功: {successful}
+总耗时: {elapsed:.3f} 秒（{summary['每秒问题数']} 个问题/秒）
+            """
+            print(result_summary)
+            return result_summary
+            
+        except Exception as e:
+            error_msg = f"批量检索失败: {e}"
+            print(error_msg)
+            return error_msg
+
+
 def create_sample_excel():
     """创建示例Excel文件"""
     sample_questions = [
@@ -230,10 +456,29 @@ def main():
     parser.add_argument("-c", "--column", default="问题", help="问题列名（默认：问题）")
     parser.add_argument("-b", "--batch", type=int, default=10, help="批处理大小（默认：10）")
     parser.add_argument("-d", "--delay", type=float, default=1.0, help="请求间隔时间（秒，默认：1.0）")
+    parser.add_argument("-r", "--max-retries", type=int, default=4, help="单次模型调用的最大尝试次数（默认：4）")
+    parser.add_argument("--hedge-delay", type=float, default=None, help="对冲请求的触发延迟（秒，默认不对冲）")
+    parser.add_argument("--llm-cache", default=None, help="模型响应缓存文件（SQLite）路径，重跑时相同请求直接重放")
+    parser.add_argument("--trace-file", default=None, help="分阶段耗时记录输出文件（JSON lines），结束时打印 p50/p95/p99")
+    parser.add_argument("--trace-format", choices=["json", "otel"], default="json",
+                        help="耗时记录格式：json 或 otel（OpenTelemetry OTLP JSON，默认：json）")
+    parser.add_argument("--log-level", default=None,
+                        help="日志级别：DEBUG、INFO、WARNING（默认读取 LOG_LEVEL 环境变量，否则为 WARNING）")
+    parser.add_argument("--log-file", default=None, help="日志文件路径（默认只输出到终端）")
+    parser.add_argument("--retrieval-only", action="store_true",
+                        help="只检索知识库，不调用模型：写入每个问题的命中结果、分数和检索耗时")
+    parser.add_argument("--kb", default="all", help="检索模式使用的知识库：hpv、flu、hiv、all 或逗号分隔（默认：all）")
+    parser.add_argument("--top-k", type=int, default=5, help="检索模式每个问题写入的命中数量（默认：5）")
+    parser.add_argument("--search-batch", type=int, default=512, help="检索模式每批编码和搜索的问题数（默认：512）")
     parser.add_argument("--create-sample", action="store_true", help="创建示例Excel文件")
     parser.add_argument("--list-columns", action="store_true", help="列出Excel文件中的所有列名")
     
     args = parser.parse_args()
+    if args.top_k < 1:
+        parser.error("--top-k 必须大于等于1")
+    if args.search_batch < 1:
+        parser.error("--search-batch 必须大于等于1")
+    setup_logging(args.log_level or os.getenv("LOG_LEVEL", "WARNING"), args.log_file)
     
     if args.create_sample:
         create_sample_excel()
@@ -257,8 +502,23 @@ def main():
             print(f"读取Excel文件失败: {e}")
             return
     
+    if args.retrieval_only:
+        try:
+            processor = BatchRetrievalProcessor(knowledge_base=args.kb, top_k=args.top_k, chunk_size=args.search_batch)
+        except ValueError as e:
+            print(f"错误：{e}")
+            return
+        print(processor.process_excel_file(args.input_file, args.output, args.column))
+        return
+    
     # 创建处理器
-    processor = BatchQAProcessor()
+    processor = BatchQAProcessor(
+        max_retries=args.max_retries,
+        hedge_delay=args.hedge_delay,
+        cache_path=args.llm_cache,
+        trace_file=args.trace_file,
+        trace_format=args.trace_format
+    )
     
     # 处理文件
     result = processor.process_excel_file(
@@ -0,0 +1,3 @@
+"""
+性能基准测试包初始化文件
+"""
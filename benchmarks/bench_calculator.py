@@ -0,0 +1,47 @@
+"""
+计算器工具基准测试
+"""
+
+import pytest
+
+from tools.calculator_tool import CalculatorPool, calculate, compile_expression
+
+pytest.importorskip("pytest_benchmark")
+
+
+EXPRESSION = "(17 + 25) * 3 / sqrt(16) - pow(2, 3)"
+
+
+@pytest.fixture(scope="module")
+def pool():
+    calculator_pool = CalculatorPool()
+    yield calculator_pool
+    calculator_pool.close()
+
+
+def test_calculate_single(benchmark):
+    """单次调用（编译结果已缓存）：在当前线程中计算，不经过进程池"""
+    result = benchmark(calculate, EXPRESSION)
+    assert result == "计算结果：23.5000"
+
+
+def test_calculate_single_uncompiled(benchmark):
+    """单次调用（每次重新解析和编译）"""
+    def run():
+        compile_expression.cache_clear()
+        return calculate(EXPRESSION)
+    
+    assert benchmark(run) == "计算结果：23.5000"
+
+
+def test_pool_single(benchmark, pool):
+    """单个表达式在工作进程中计算：一次进程间往返的开销"""
+    assert benchmark(pool.calculate, EXPRESSION) == "计算结果：23.5000"
+
+
+@pytest.mark.parametrize("size", [100, 10_000])
+def test_calculate_many(benchmark, pool, size):
+    """批量计算：一批表达式分块在工作进程中计算"""
+    expressions = [f"{i} * 3 + sqrt({i})" for i in range(size)]
+    results = benchmark(pool.calculate_many, expressions)
+    assert len(results) == size
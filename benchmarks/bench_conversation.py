@@ -0,0 +1,59 @@
+"""
+完整对话轮次基准测试
+模型使用本地脚本化后端（无延迟），测量的是除模型推理以外的整条处理链路：
+提示词构建、模型客户端、解析、工具执行和知识库检索
+"""
+
+import pytest
+
+from conversation_manager import CustomConversationManager
+from models import ScriptedBackend, SimpleLLMClient
+from tools import knowledge_base_tool
+from tools.knowledge_base_tool import set_kb_manager
+
+pytest.importorskip("pytest_benchmark")
+
+
+def _manager(**kwargs) -> CustomConversationManager:
+    """创建使用脚本化后端的对话管理器：首轮按问题输出工具调用，拿到工具结果后输出最终回答"""
+    client = SimpleLLMClient(model="qwen-plus-bench", backend=ScriptedBackend())
+    return CustomConversationManager(llm_client=client, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def flu_kb(kb_manager_factory):
+    """把全局知识库管理器替换为 10000 篇文档的基准知识库"""
+    previous = knowledge_base_tool._kb_manager
+    set_kb_manager(kb_manager_factory(10_000))
+    yield
+    set_kb_manager(previous)
+
+
+@pytest.mark.parametrize("prompt_mode", ["text", "messages"])
+@pytest.mark.parametrize("stream", [False, True])
+def test_turn_with_knowledge_base(benchmark, flu_kb, prompt_mode, stream):
+    """一轮知识库工具调用加一轮最终回答"""
+    manager = _manager(prompt_mode=prompt_mode, stream=stream)
+    
+    _, history = benchmark(manager.process_user_input, "流感疫苗的保护期是多久？")
+    assert any(message["role"] == "tool" for message in history)
+
+
+def test_turn_with_calculator(benchmark):
+    """一轮计算器工具调用加一轮最终回答（不依赖知识库）"""
+    manager = _manager()
+    
+    answer, _ = benchmark(manager.process_user_input, "请计算 (12 + 30) * 4 / 7")
+    assert "计算结果：24" in answer
+
+
+@pytest.mark.parametrize("turns", [1, 20])
+def test_turn_with_history(benchmark, turns):
+    """带已有对话历史的一轮计算器调用"""
+    manager = _manager()
+    history = []
+    for i in range(turns):
+        _, history = manager.process_user_input(f"请计算 {i} + 1", history)
+    
+    answer, _ = benchmark(manager.process_user_input, "请计算 (12 + 30) * 4 / 7", history)
+    assert "计算结果：24" in answer
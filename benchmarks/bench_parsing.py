@@ -0,0 +1,83 @@
+"""
+工具调用解析和提示词构建基准测试
+"""
+
+import pytest
+
+from utils import MessageHandler, PromptBuilder, StreamingToolCallParser, ToolCallParser
+
+pytest.importorskip("pytest_benchmark")
+
+
+def _model_output(paragraphs: int, tool_calls: int) -> str:
+    """生成包含大段正文和若干工具调用的模型输出"""
+    parts = [f"第{i}段分析：流感疫苗的保护期通常为六到十二个月，建议每年接种。" * 4 for i in range(paragraphs)]
+    for i in range(tool_calls):
+        parts.append(
+            "<tool_call>\n工具名称：query_knowledge_base\n"
+            f'参数：{{"knowledge_base": "flu", "query": "流感问题{i}", "top_k": 3}}\n</tool_call>'
+        )
+    return "\n\n".join(parts)
+
+
+def _history(turns: int):
+    """生成包含工具调用和工具结果的对话历史"""
+    handler = MessageHandler()
+    history = []
+    for i in range(turns):
+        history.append(handler.create_user_message(f"第{i}个问题：流感疫苗什么时候接种？"))
+        history.append(handler.create_assistant_message(_model_output(1, 1)))
+        history.append(handler.create_tool_message("query_knowledge_base", "检索结果：" + "流感相关内容。" * 100))
+        history.append(handler.create_assistant_message(f"第{i}个回答：建议每年秋季接种。" * 5))
+    return history
+
+
+@pytest.mark.parametrize("paragraphs,tool_calls", [(10, 1), (200, 5), (2000, 20)])
+def test_parse_tool_calls(benchmark, paragraphs, tool_calls):
+    """批量解析：查找并解析工具调用，再提取普通回答"""
+    parser = ToolCallParser()
+    output = _model_output(paragraphs, tool_calls)
+    
+    def parse():
+        return parser.parse_tool_calls(output), parser.extract_regular_response(output)
+    
+    calls, _ = benchmark(parse)
+    assert len(calls) == tool_calls
+
+
+@pytest.mark.parametrize("paragraphs,tool_calls", [(200, 5), (2000, 20)])
+def test_streaming_parser(benchmark, paragraphs, tool_calls):
+    """流式解析：按 16 字的分块增量输入"""
+    output = _model_output(paragraphs, tool_calls)
+    chunks = [output[start:start + 16] for start in range(0, len(output), 16)]
+    
+    def parse():
+        parser = StreamingToolCallParser()
+        events = []
+        for chunk in chunks:
+            events.extend(parser.feed(chunk))
+        events.extend(parser.close())
+        return events
+    
+    events = benchmark(parse)
+    assert sum(event["type"] == "tool_call" for event in events) == tool_calls
+
+
+@pytest.mark.parametrize("turns", [1, 10, 100])
+def test_build_prompt_with_tools(benchmark, turns):
+    """文本格式：拼接静态前缀、按预算选择的历史和当前问题"""
+    builder = PromptBuilder()
+    history = _history(turns)
+    
+    prompt = benchmark(builder.build_prompt_with_tools, "流感疫苗的保护期是多久？", history)
+    assert "流感疫苗的保护期是多久？" in prompt
+
+
+@pytest.mark.parametrize("turns", [1, 10, 100])
+def test_build_messages_with_tools(benchmark, turns):
+    """消息格式：system 消息加按预算选择的历史消息"""
+    builder = PromptBuilder()
+    history = _history(turns)
+    
+    messages = benchmark(builder.build_messages_with_tools, history)
+    assert messages[0]["role"] == "system"
@@ -0,0 +1,80 @@
+"""
+向量量化基准测试：召回率、内存占用和加载耗时
+
+每个用例在 extra_info 中记录：
+    recall_at_5: 相对于不量化索引的前 5 个结果召回率（量化索引先取 5 * rescore_factor 个候选再精确重排）
+    index_bytes: 索引文件大小（常驻内存的部分）
+    vector_store_bytes: 原始向量文件大小（内存映射，重排时按需读入）
+用 --benchmark-columns 或保存的 JSON 结果对比各量化方式。
+"""
+
+import faiss
+import pytest
+
+from benchmarks.support import HashEncoder, build_corpus
+from tools.knowledge_base_tool import KnowledgeBaseManager, KnowledgeBaseType
+from tools.vector_quantization import open_vector_store
+
+pytest.importorskip("pytest_benchmark")
+
+
+QUANTIZATIONS = ["flat", "fp16", "sq8", "pq"]
+
+QUERIES = [f"流感疫苗第{i}个问题怎么回答？" for i in range(64)]
+
+
+@pytest.fixture(scope="module")
+def quantized_dirs(tmp_path_factory):
+    """按 (规模, 量化方式) 生成的知识库目录"""
+    dirs = {}
+    
+    def get(size: int, quantization: str):
+        if (size, quantization) not in dirs:
+            base_dir = tmp_path_factory.mktemp(f"kb_{size}_{quantization}")
+            build_corpus(base_dir, size)
+            manager = KnowledgeBaseManager(str(base_dir), embedding_model=HashEncoder())
+            try:
+                assert "成功转换" in manager.quantize_knowledge_base(KnowledgeBaseType.FLU, quantization)
+            finally:
+                manager.close()
+            dirs[size, quantization] = base_dir
+        return dirs[size, quantization]
+    
+    return get
+
+
+def _record_sizes(benchmark, base_dir):
+    index_file = base_dir / "flu" / "flu_index.faiss"
+    store_file = index_file.with_suffix(".vectors.npy")
+    benchmark.extra_info["index_bytes"] = index_file.stat().st_size
+    benchmark.extra_info["vector_store_bytes"] = store_file.stat().st_size if store_file.exists() else 0
+
+
+@pytest.mark.parametrize("quantization,rescore_factor", [(quantization, 4) for quantization in QUANTIZATIONS] + [("pq", 32)])
+@pytest.mark.parametrize("size", [10_000, 100_000])
+def test_quantized_search(benchmark, quantized_dirs, size, quantization, rescore_factor):
+    """批量搜索 64 个查询（量化索引含精确重排），记录召回率"""
+    manager = KnowledgeBaseManager(str(quantized_dirs(size, quantization)), embedding_model=HashEncoder(),
+                                   rescore_factor=rescore_factor)
+    exact = KnowledgeBaseManager(str(quantized_dirs(size, "flat")), embedding_model=HashEncoder())
+    try:
+        results = benchmark(manager.search_many, KnowledgeBaseType.FLU, QUERIES, 5)
+        expected = exact.search_many(KnowledgeBaseType.FLU, QUERIES, 5)
+    finally:
+        manager.close()
+        exact.close()
+    hits = sum(len({r["title"] for r in got} & {r["title"] for r in want}) for got, want in zip(results, expected))
+    benchmark.extra_info["recall_at_5"] = hits / (5 * len(QUERIES))
+    _record_sizes(benchmark, quantized_dirs(size, quantization))
+
+
+@pytest.mark.parametrize("quantization", QUANTIZATIONS)
+def test_quantized_load(benchmark, quantized_dirs, quantization):
+    """加载 10 万篇文档的索引和原始向量映射（文档加载与量化方式无关，不计入）"""
+    base_dir = quantized_dirs(100_000, quantization)
+    index_file = base_dir / "flu" / "flu_index.faiss"
+    index, _ = benchmark.pedantic(
+        lambda: (faiss.read_index(str(index_file)), open_vector_store(index_file)), rounds=5, iterations=1
+    )
+    assert index.ntotal == 100_000
+    _record_sizes(benchmark, base_dir)
@@ -0,0 +1,42 @@
+"""
+知识库检索基准测试
+"""
+
+import pytest
+
+from benchmarks.support import CORPUS_SIZES, HashEncoder
+from tools.knowledge_base_tool import KnowledgeBaseManager, KnowledgeBaseType
+
+pytest.importorskip("pytest_benchmark")
+
+
+QUERIES = [f"流感疫苗第{i}个问题怎么回答？" for i in range(64)]
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_search_knowledge_base(benchmark, kb_manager_factory, size):
+    """单个查询：编码 + FAISS 搜索 + 结果格式化"""
+    manager = kb_manager_factory(size)
+    queries = iter(QUERIES * 10_000)
+    
+    results = benchmark(lambda: manager.search_knowledge_base(KnowledgeBaseType.FLU, next(queries), 5))
+    assert len(results) == 5 and "error" not in results[0]
+
+
+@pytest.mark.parametrize("size", CORPUS_SIZES)
+def test_search_many(benchmark, kb_manager_factory, size):
+    """一次批量搜索 64 个查询"""
+    manager = kb_manager_factory(size)
+    
+    results = benchmark(manager.search_many, KnowledgeBaseType.FLU, QUERIES, 5)
+    assert len(results) == len(QUERIES)
+
+
+@pytest.mark.parametrize("size", [10_000])
+def test_load_knowledge_base(benchmark, corpus_dirs, size):
+    """加载索引和文档（服务启动耗时）"""
+    base_dir = str(corpus_dirs(size))
+    manager = benchmark.pedantic(
+        lambda: KnowledgeBaseManager(base_dir, embedding_model=HashEncoder()), rounds=3, iterations=1
+    )
+    assert manager.indices[KnowledgeBaseType.FLU].ntotal == size
@@ -0,0 +1,75 @@
+"""
+性能基准测试公共配置
+
+基准测试只在显式指定 benchmarks 目录（或其中的文件）时收集，例如：
+    python -m pytest benchmarks
+结果默认保存到 .benchmarks/ 目录，与上次结果对比：
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+"""
+
+import pathlib
+
+import pytest
+
+from benchmarks.support import HashEncoder, build_corpus
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager
+
+
+BENCHMARK_DIR = pathlib.Path(__file__).resolve().parent
+
+
+def _requested(config) -> bool:
+    """命令行参数中是否指定了 benchmarks 目录或其中的文件"""
+    for arg in config.args:
+        path = pathlib.Path(str(arg).split("::")[0]).resolve()
+        if path == BENCHMARK_DIR or BENCHMARK_DIR in path.parents:
+            return True
+    return False
+
+
+def pytest_configure(config):
+    # 没有显式设置时自动保存结果，便于与历史结果对比发现性能回退
+    if (_requested(config) and hasattr(config.option, "benchmark_autosave")
+            and not config.option.benchmark_autosave and not config.option.benchmark_save):
+        from pytest_benchmark.utils import get_tag
+        config.option.benchmark_autosave = get_tag()
+
+
+def pytest_collect_file(file_path, parent):
+    # 命令行直接指定的文件已由 pytest 收集
+    if (file_path.suffix == ".py" and file_path.name.startswith("bench_")
+            and _requested(parent.config) and not parent.session.isinitpath(file_path)):
+        return pytest.Module.from_parent(parent, path=file_path)
+    return None
+
+
+@pytest.fixture(scope="session")
+def corpus_dirs(tmp_path_factory):
+    """按规模生成的知识库目录（惰性生成，同一会话内复用）"""
+    if not FAISS_AVAILABLE:
+        pytest.skip("需要FAISS")
+    dirs = {}
+    
+    def get(size: int) -> pathlib.Path:
+        if size not in dirs:
+            base_dir = tmp_path_factory.mktemp(f"kb_{size}")
+            build_corpus(base_dir, size)
+            dirs[size] = base_dir
+        return dirs[size]
+    
+    return get
+
+
+@pytest.fixture(scope="session")
+def kb_manager_factory(corpus_dirs):
+    """创建使用确定性嵌入模型的知识库管理器"""
+    managers = []
+    
+    def create(size: int, **kwargs) -> KnowledgeBaseManager:
+        manager = KnowledgeBaseManager(str(corpus_dirs(size)), embedding_model=HashEncoder(), **kwargs)
+        managers.append(manager)
+        return manager
+    
+    yield create
+    for manager in managers:
+        manager.close()
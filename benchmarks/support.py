@@ -0,0 +1,61 @@
+"""
+性能基准测试辅助模块
+提供确定性的嵌入模型和按规模生成的知识库；模型使用本地脚本化后端，整个基准测试不需要网络和API密钥
+"""
+
+import hashlib
+import pathlib
+import pickle
+
+import numpy as np
+
+from tools.knowledge_base_tool import KnowledgeBaseType, KnowledgeDocument
+
+
+# 与 all-MiniLM-L6-v2 相同的向量维度
+EMBEDDING_DIMENSION = 384
+
+CORPUS_SIZES = [1_000, 10_000, 100_000]
+
+
+class HashEncoder:
+    """确定性的嵌入模型：相同文本总是得到相同的向量，编码耗时与真实模型无关"""
+    
+    dimension = EMBEDDING_DIMENSION
+    
+    def encode(self, texts, **kwargs):
+        vectors = np.empty((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors[row] = np.random.default_rng(seed).random(self.dimension)
+        return vectors
+
+
+def build_corpus(base_dir: pathlib.Path, size: int, kb_type: KnowledgeBaseType = KnowledgeBaseType.FLU):
+    """
+    在 base_dir 下生成指定规模的知识库索引和文档文件
+    
+    Args:
+        base_dir: 知识库根目录
+        size: 文档数
+        kb_type: 知识库类型
+    """
+    import faiss
+    
+    kb_dir = base_dir / kb_type.value
+    kb_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(size)
+    index = faiss.IndexFlatL2(EMBEDDING_DIMENSION)
+    index.add(rng.random((size, EMBEDDING_DIMENSION), dtype="float32"))
+    faiss.write_index(index, str(kb_dir / f"{kb_type.value}_index.faiss"))
+    
+    documents = [
+        KnowledgeDocument(
+            id=f"{kb_type.value}_pdf_bench_{i}", title=f"基准文档 - 第{i+1}段",
+            content=f"流感相关内容第{i}段。" * 20, summary=[f"流感问题{i}？"],
+            source="bench.pdf", file_type="pdf", metadata={"chunk_index": i},
+        )
+        for i in range(size)
+    ]
+    with open(kb_dir / f"{kb_type.value}_documents.pkl", "wb") as f:
+        pickle.dump(documents, f)
@@ -4,6 +4,7 @@
 """
 
 import json
+import os
 import sys
 from pathlib import Path
 from tools.knowledge_base_tool import get_kb_manager, KnowledgeBaseType
@@ -97,6 +98,17 @@ def build_specific_knowledge_base(kb_name: str):
     print(f"构建结果: {result}")
 
 
+def quantize_knowledge_bases(kb_names, quantization: str):
+    """把已构建的知识库索引转换为指定的量化方式（不重新处理文档和编码）"""
+    manager = get_kb_manager()
+    for kb_type in KnowledgeBaseType:
+        if kb_names and kb_type.value not in kb_names:
+            continue
+        print(f"\n=== 转换 {kb_type.value.upper()} 知识库索引 ===")
+        result = manager.quantize_knowledge_base(kb_type, quantization)
+        print(f"转换结果: {result}")
+
+
 def show_help():
     """显示帮助信息"""
     print("知识库构建工具")
@@ -105,12 +117,19 @@ def show_help():
     print("")
     print("参数:")
     print("  知识库名称: hpv, flu, hiv (可选，不指定则构建所有知识库)")
+    print("  --llm-cache 路径: 缓存生成问题时的模型响应，构建中断后重跑可直接重放")
+    print("  --embedding 模型: 构建使用的嵌入模型，预设名称（minilm、multilingual-minilm、bge-small-zh、")
+    print("                    multilingual-minilm-onnx、bge-small-zh-onnx）或 后端:模型，记录在索引元数据中")
+    print("  --quantization 方式: 向量量化方式 flat、fp16、sq8、pq、pq<子向量数>，搜索时用原始向量精确重排")
+    print("  --quantize-only: 只把已构建的索引转换为 --quantization 指定的方式，不重新处理文档")
     print("")
     print("示例:")
     print("  python build_knowledge_bases.py          # 构建所有知识库")
     print("  python build_knowledge_bases.py hpv      # 只构建HPV知识库")
     print("  python build_knowledge_bases.py flu      # 只构建FLU知识库")
     print("  python build_knowledge_bases.py hiv      # 只构建HIV知识库")
+    print("  python build_knowledge_bases.py flu --embedding bge-small-zh-onnx  # 用中文ONNX模型构建FLU知识库")
+    print("  python build_knowledge_bases.py --quantization sq8 --quantize-only  # 已有索引转换为8位标量量化")
     print("")
     print("目录结构:")
     print("  input/")
@@ -138,6 +157,46 @@ def show_help():
 
 def main():
     """主函数"""
+    # 开启模型响应缓存：构建中断后重跑时，已生成过问题的文本块直接重放
+    if "--llm-cache" in sys.argv:
+        option_index = sys.argv.index("--llm-cache")
+        if option_index + 1 >= len(sys.argv):
+            print("错误：--llm-cache 需要指定缓存文件路径")
+            return
+        os.environ["LLM_CACHE_PATH"] = sys.argv[option_index + 1]
+        del sys.argv[option_index:option_index + 2]
+    
+    # 指定嵌入模型：按知识库设置，优先于索引元数据中记录的旧模型
+    if "--embedding" in sys.argv:
+        option_index = sys.argv.index("--embedding")
+        if option_index + 1 >= len(sys.argv):
+            print("错误：--embedding 需要指定模型")
+            return
+        embedding = sys.argv[option_index + 1]
+        del sys.argv[option_index:option_index + 2]
+        targets = [sys.argv[1]] if len(sys.argv) > 1 else [kb_type.value for kb_type in KnowledgeBaseType]
+        for kb_name in targets:
+            os.environ[f"KB_EMBEDDING_{kb_name.upper()}"] = embedding
+    
+    # 向量量化：构建时生效，--quantize-only 时只转换已有索引
+    quantize_only = "--quantize-only" in sys.argv
+    if quantize_only:
+        sys.argv.remove("--quantize-only")
+    if "--quantization" in sys.argv:
+        option_index = sys.argv.index("--quantization")
+        if option_index + 1 >= len(sys.argv):
+            print("错误：--quantization 需要指定量化方式")
+            return
+        os.environ["KB_QUANTIZATION"] = sys.argv[option_index + 1]
+        del sys.argv[option_index:option_index + 2]
+    elif quantize_only:
+        print("错误：--quantize-only 需要同时指定 --quantization")
+        return
+    
+    if quantize_only:
+        quantize_knowledge_bases([name.lower() for name in sys.argv[1:]], os.environ["KB_QUANTIZATION"])
+        return
+    
     if len(sys.argv) > 1:
         if sys.argv[1] in ["-h", "--help", "help"]:
             show_help()
@@ -3,16 +3,33 @@
 使用提示词拼接和输出解析的方式实现工具调用
 """
 
-from typing import List, Dict, Any, Optional
+import asyncio
+import contextvars
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from models import SimpleLLMClient
-from utils import PromptBuilder, ToolCallParser, MessageHandler
-from tools import get_tool_function
+from utils import (PromptBuilder, ToolCallParser, MessageHandler, StreamingToolCallParser, SemanticAnswerCache,
+                   QueryRouter, SpeculativeRetrieval)
+from utils.speculative_retrieval import SpeculativeSearch
+from tools import acall_tool, call_tool, get_tool_function, is_tool_cacheable
+from observability import trace_span
+from observability.logger import get_logger, payload
+from observability.usage import (
+    PURPOSE_CHAT_ROUND, PURPOSE_TOOL_FOLLOWUP, UsageTracker, track_usage, usage_purpose
+)
+
+
+logger = get_logger("conversation")
 
 
 class CustomConversationManager:
     """自定义对话管理器类"""
     
-    def __init__(self, api_key: str = None, model: str = "qwen-plus", max_tool_calls: int = 10):
+    def __init__(self, api_key: str = None, model: str = "qwen-plus", max_tool_calls: int = 10,
+                 stream: bool = False, prompt_mode: str = "text", llm_client: Optional[SimpleLLMClient] = None,
+                 answer_cache: Optional[SemanticAnswerCache] = None, router: Optional[QueryRouter] = None,
+                 speculative_retrieval: Optional[SpeculativeRetrieval] = None):
         """
         初始化自定义对话管理器
         
@@ -20,12 +37,28 @@ class CustomConversationManager:
             api_key: API密钥
             model: 模型名称
             max_tool_calls: 最大工具调用轮数，防止无限循环
+            stream: 是否使用流式输出，开启后工具调用标签一闭合就开始执行工具
+            prompt_mode: 请求格式，"text" 每轮发送拼接后的完整提示词，
+                "messages" 以 system 消息发送静态说明，每轮只追加新增的消息
+            llm_client: 自定义的模型客户端（例如配置了重试策略），为None时按 api_key 和 model 创建
+            answer_cache: 语义答案缓存，首轮问题与历史问题足够相似时直接返回缓存的答案
+            router: 知识库查询路由，能确定问题所属知识库时直接检索，省去只输出工具调用的首轮模型请求
+            speculative_retrieval: 推测检索，路由不确定时在首轮模型请求的同时预先检索原始问题，
+                模型发起相同或几乎相同的知识库查询时直接使用预先检索的结果
         """
-        self.llm_client = SimpleLLMClient(api_key, model)
+        if prompt_mode not in ("text", "messages"):
+            raise ValueError(f"不支持的请求格式：{prompt_mode}，可选值为 text 或 messages")
+        
+        self.llm_client = llm_client or SimpleLLMClient(api_key, model)
         self.prompt_builder = PromptBuilder()
         self.tool_parser = ToolCallParser()
         self.message_handler = MessageHandler()
         self.max_tool_calls = max_tool_calls
+        self.stream = stream
+        self.prompt_mode = prompt_mode
+        self.answer_cache = answer_cache
+        self.router = router
+        self.speculative_retrieval = speculative_retrieval
     
     def process_user_input(self, user_input: str, conversation_history: Optional[List[Dict[str, Any]]] = None) -> tuple[str, List[Dict[str, Any]]]:
         """
@@ -35,6 +68,70 @@ class CustomConversationManager:
             user_input: 用户输入内容
             conversation_history: 对话历史记录
             
+        Returns:
+            (最终回答, 更新后的对话历史)
+        """
+        with trace_span("conversation.turn", prompt_mode=self.prompt_mode, stream=self.stream), \
+                track_usage() as usage:
+            result = self._process_user_input(user_input, conversation_history)
+        logger.info("本轮模型用量：调用 %d 次，输入 %d tokens，输出 %d tokens",
+                    usage.calls, usage.input_tokens, usage.output_tokens)
+        return result
+    
+    async def aprocess_user_input(self, user_input: str,
+                                  conversation_history: Optional[List[Dict[str, Any]]] = None) -> tuple[str, List[Dict[str, Any]]]:
+        """
+        异步处理用户输入（与 process_user_input 的流程相同）
+        
+        同一轮的多个工具调用并发执行：协程工具在当前事件循环中等待，同步工具在工具注册表的线程池中执行，
+        并遵守各工具声明的超时和并发限制。模型客户端是同步的，在线程中调用。
+        
+        Args:
+            user_input: 用户输入内容
+            conversation_history: 对话历史记录
+            
+        Returns:
+            (最终回答, 更新后的对话历史)
+        """
+        with trace_span("conversation.turn", prompt_mode=self.prompt_mode, stream=self.stream), \
+                track_usage() as usage:
+            steps = self._turn_steps(user_input, conversation_history)
+            try:
+                step = next(steps)
+                while True:
+                    if step[0] == "model":
+                        result = await asyncio.to_thread(self._call_model, *step[1:])
+                    else:
+                        result = await self._aexecute_tool_calls(*step[1:])
+                    step = steps.send(result)
+            except StopIteration as stop:
+                result = stop.value
+        logger.info("本轮模型用量：调用 %d 次，输入 %d tokens，输出 %d tokens",
+                    usage.calls, usage.input_tokens, usage.output_tokens)
+        return result
+    
+    def _process_user_input(self, user_input: str,
+                            conversation_history: Optional[List[Dict[str, Any]]]) -> tuple[str, List[Dict[str, Any]]]:
+        """处理用户输入（process_user_input 的实现，外层记录整轮耗时）"""
+        steps = self._turn_steps(user_input, conversation_history)
+        try:
+            step = next(steps)
+            while True:
+                if step[0] == "model":
+                    step = steps.send(self._call_model(*step[1:]))
+                else:
+                    step = steps.send(self._execute_tool_calls(*step[1:]))
+        except StopIteration as stop:
+            return stop.value
+    
+    def _turn_steps(self, user_input: str, conversation_history: Optional[List[Dict[str, Any]]]):
+        """
+        一轮对话的处理流程（生成器），同步和异步处理共用
+        
+        产出需要调用方执行的步骤，执行结果通过 send 传回：
+            ("model", 请求, 用途, 推测检索): 调用模型，传回 (模型输出, 流式模式下已开始执行的工具Future列表)
+            ("tools", 工具调用列表, 已开始执行的工具Future列表, 推测检索): 执行工具调用，传回 [(工具名称, 工具输出), ...]
+        
         Returns:
             (最终回答, 更新后的对话历史)
         """
@@ -44,38 +141,95 @@ class CustomConversationManager:
         else:
             conversation_history = conversation_history.copy()
         
+        # 只有首轮问题不依赖上下文，可以使用语义答案缓存
+        is_first_turn = not conversation_history
+        
         # 添加用户输入到历史
         user_message = self.message_handler.create_user_message(user_input)
         conversation_history.append(user_message)
         
+        if is_first_turn and self.answer_cache is not None:
+            with trace_span("answer_cache.lookup") as span:
+                cached_answer = self.answer_cache.lookup(user_input)
+                span.set_attribute("hit", cached_answer is not None)
+            if cached_answer is not None:
+                logger.info("命中答案缓存")
+                conversation_history.append(self.message_handler.create_assistant_message(cached_answer))
+                return cached_answer, conversation_history
+        
         # 多轮工具调用循环
         tool_call_count = 0
+        # 本轮对话执行过的工具，全部可缓存（或没有调用工具）时答案才写入答案缓存
+        used_tools = set()
+        # 消息格式下本轮对话的请求消息，只在首轮构建一次，之后每轮只追加新增消息
+        request_messages = None
         
+        # 路由确定时直接执行知识库查询，第一次模型请求即为生成回答的一轮（模型仍可继续调用工具）
+        routed_call = self._route(user_input) if self.router is not None else None
+        if routed_call is not None:
+            if self.prompt_mode == "messages":
+                request_messages = self.prompt_builder.build_messages_with_tools(conversation_history)
+                # 补上等价的工具调用，让模型看到工具结果的来由
+                self.prompt_builder.append_request_message(
+                    request_messages,
+                    self.message_handler.create_assistant_message(self.tool_parser.format_tool_call(routed_call))
+                )
+            [(tool_name, tool_result)] = yield "tools", [routed_call], [], None
+            used_tools.add(tool_name)
+            tool_message = self.message_handler.create_tool_message(tool_name, tool_result)
+            conversation_history.append(tool_message)
+            if request_messages is not None:
+                self.prompt_builder.append_request_message(request_messages, tool_message)
+            # 路由的查询不计入 max_tool_calls，保证之后至少请求一次模型生成回答
+        
+        # 推测检索与首轮模型请求并行，只用于首轮的工具调用
+        speculation = None
+        if routed_call is None and self.speculative_retrieval is not None:
+            speculation = self.speculative_retrieval.start(user_input)
+        
+        model_response = ""
         while tool_call_count < self.max_tool_calls:
-            print(f"\n=== 第 {tool_call_count + 1} 轮调用 ===")
+            logger.debug("第 %d 轮调用", tool_call_count + 1)
             
-            # 构建完整提示词
-            full_prompt = self.prompt_builder.build_prompt_with_tools(user_input, conversation_history)
+            # 构建请求
+            with trace_span("prompt.build", round=tool_call_count + 1):
+                if self.prompt_mode == "messages":
+                    if request_messages is None:
+                        request_messages = self.prompt_builder.build_messages_with_tools(conversation_history)
+                    request = {"messages": request_messages}
+                else:
+                    request = {"prompt": self.prompt_builder.build_prompt_with_tools(user_input, conversation_history)}
             
-            # 调用模型
-            model_response = self.llm_client.call(full_prompt)
-            print(f"模型原始输出：\n{model_response}\n")
+            # 调用模型（流式模式下工具在输出过程中即开始执行）
+            purpose = PURPOSE_CHAT_ROUND if tool_call_count == 0 and routed_call is None else PURPOSE_TOOL_FOLLOWUP
+            model_response, pending_results = yield "model", request, purpose, speculation
+            logger.debug("模型原始输出：\n%s", payload(model_response))
             
             # 检查是否包含工具调用
-            if not self.tool_parser.has_tool_calls(model_response):
+            with trace_span("parse.tool_calls") as span:
+                has_tool_calls = self.tool_parser.has_tool_calls(model_response)
+                tool_calls = self.tool_parser.parse_tool_calls(model_response) if has_tool_calls else []
+                span.set_attribute("tool_calls", len(tool_calls))
+            
+            if not has_tool_calls:
+                if speculation is not None:
+                    speculation.discard()
+                
                 # 没有工具调用，直接返回回答
                 final_answer = self.tool_parser.extract_regular_response(model_response)
-                print(f"最终答案：{final_answer}")
+                logger.debug("最终答案：%s", payload(final_answer))
                 
                 # 添加助手回答到对话历史
                 assistant_message = self.message_handler.create_assistant_message(final_answer)
                 conversation_history.append(assistant_message)
                 
+                # 时间、天气等实时工具的结果不能复用，答案也不缓存
+                if is_first_turn and self.answer_cache is not None and all(map(is_tool_cacheable, used_tools)):
+                    self.answer_cache.store(user_input, final_answer)
+                
                 return final_answer, conversation_history
             
-            # 解析工具调用
-            tool_calls = self.tool_parser.parse_tool_calls(model_response)
-            print(f"检测到 {len(tool_calls)} 个工具调用")
+            logger.debug("检测到 %d 个工具调用", len(tool_calls))
             
             # 提取助手的回答部分（如果有的话）
             assistant_content = self.tool_parser.extract_regular_response(model_response)
@@ -83,47 +237,34 @@ class CustomConversationManager:
                 assistant_message = self.message_handler.create_assistant_message(assistant_content)
                 conversation_history.append(assistant_message)
             
+            # 消息格式下保留模型的原始输出，让模型在下一轮看到自己发起的工具调用
+            if request_messages is not None:
+                self.prompt_builder.append_request_message(
+                    request_messages, self.message_handler.create_assistant_message(model_response)
+                )
+            
             # 执行工具调用
-            for i, tool_call in enumerate(tool_calls):
-                try:
-                    tool_name = tool_call["name"]
-                    arguments = tool_call["arguments"]
-                    
-                    print(f"工具 {i+1} ({tool_name}) 参数：{arguments}")
-                    
-                    # 获取并执行工具函数
-                    tool_function = get_tool_function(tool_name)
-                    if tool_function:
-                        tool_result = tool_function(**arguments)
-                        print(f"工具 {i+1} ({tool_name}) 输出：{tool_result}")
-                        
-                        # 添加工具消息到对话历史
-                        tool_message = self.message_handler.create_tool_message(tool_name, tool_result)
-                        conversation_history.append(tool_message)
-                    else:
-                        error_msg = f"未找到工具：{tool_name}"
-                        print(f"错误：{error_msg}")
-                        
-                        # 添加错误消息到对话历史
-                        error_message = self.message_handler.create_tool_message(tool_name, error_msg)
-                        conversation_history.append(error_message)
-                        
-                except Exception as e:
-                    error_msg = f"工具调用失败：{e}"
-                    print(f"错误：{error_msg}")
-                    
-                    # 添加错误消息到对话历史
-                    tool_name = tool_call.get("name", "unknown")
-                    error_message = self.message_handler.create_tool_message(tool_name, error_msg)
-                    conversation_history.append(error_message)
+            tool_results = yield "tools", tool_calls, pending_results, speculation
+            for tool_name, tool_result in tool_results:
+                used_tools.add(tool_name)
+                # 添加工具消息到对话历史
+                tool_message = self.message_handler.create_tool_message(tool_name, tool_result)
+                conversation_history.append(tool_message)
+                if request_messages is not None:
+                    self.prompt_builder.append_request_message(request_messages, tool_message)
+            
+            if speculation is not None:
+                # 之后的查询由模型根据工具结果改写，不再使用推测结果
+                speculation.discard()
+                speculation = None
             
             tool_call_count += 1
-            print(f"完成第 {tool_call_count} 轮工具调用\n")
+            logger.debug("完成第 %d 轮工具调用", tool_call_count)
         
         # 如果达到最大轮数，返回当前结果
-        print(f"警告：已达到最大工具调用轮数 ({self.max_tool_calls})")
+        logger.warning("已达到最大工具调用轮数 (%d)", self.max_tool_calls)
         final_answer = self.tool_parser.extract_regular_response(model_response)
-        print(f"最终答案：{final_answer}")
+        logger.debug("最终答案：%s", payload(final_answer))
         
         # 添加助手回答到对话历史
         assistant_message = self.message_handler.create_assistant_message(final_answer)
@@ -131,6 +272,197 @@ class CustomConversationManager:
         
         return final_answer, conversation_history
     
+    def _call_model(self, request: Dict[str, Any], purpose: str,
+                    speculation: Optional[SpeculativeSearch] = None) -> Tuple[str, List[Future]]:
+        """
+        调用一次模型
+        
+        Args:
+            request: 请求，包含 prompt（文本格式）或 messages（消息格式）
+            purpose: 用量统计中的调用用途
+            speculation: 本轮的推测检索（流式模式下工具在输出过程中执行）
+            
+        Returns:
+            (模型输出, 流式模式下按出现顺序排列的工具执行结果Future列表)
+        """
+        with usage_purpose(purpose):
+            if self.stream:
+                return self._call_model_streaming(**request, speculation=speculation)
+            if "messages" in request:
+                return self.llm_client.call_with_messages(request["messages"]), []
+            return self.llm_client.call(request["prompt"]), []
+    
+    def _execute_tool_calls(self, tool_calls: List[Dict[str, Any]], pending_results: List[Future],
+                            speculation: Optional[SpeculativeSearch] = None) -> List[Tuple[str, str]]:
+        """
+        依次执行本轮的工具调用
+        
+        Args:
+            tool_calls: 解析出的工具调用列表
+            pending_results: 流式模式下已开始执行的工具Future列表
+            speculation: 本轮的推测检索
+            
+        Returns:
+            与 tool_calls 等长的 (工具名称, 工具输出) 列表
+        """
+        results = []
+        for i, tool_call in enumerate(tool_calls):
+            if i < len(pending_results):
+                results.append(pending_results[i].result())
+            else:
+                results.append(self._execute_tool_call(i, tool_call, speculation))
+        return results
+    
+    async def _aexecute_tool_calls(self, tool_calls: List[Dict[str, Any]], pending_results: List[Future],
+                                   speculation: Optional[SpeculativeSearch] = None) -> List[Tuple[str, str]]:
+        """并发执行本轮的工具调用（参数和返回值同 _execute_tool_calls）"""
+        tasks = []
+        for i, tool_call in enumerate(tool_calls):
+            if i < len(pending_results):
+                tasks.append(asyncio.wrap_future(pending_results[i]))
+            else:
+                tasks.append(self._aexecute_tool_call(i, tool_call, speculation))
+        return list(await asyncio.gather(*tasks))
+    
+    def _route(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """
+        用查询路由判断问题所属知识库
+        
+        Args:
+            user_input: 用户输入内容
+            
+        Returns:
+            路由确定时返回知识库查询的工具调用，否则返回None
+        """
+        with trace_span("router.route") as span:
+            try:
+                decision = self.router.route(user_input)
+            except Exception as e:
+                logger.warning("查询路由失败，交给模型选择工具：%s", e)
+                decision = None
+            span.set_attribute("routed", decision is not None)
+            if decision is None:
+                return None
+            span.set_attribute("knowledge_base", decision.knowledge_base)
+            span.set_attribute("method", decision.method)
+        logger.debug("路由到 %s 知识库（%s，置信度 %.3f）", decision.knowledge_base, decision.method, decision.confidence)
+        return decision.to_tool_call(user_input, self.router.top_k)
+    
+    def _execute_tool_call(self, index: int, tool_call: Dict[str, Any],
+                           speculation: Optional[SpeculativeSearch] = None) -> Tuple[str, str]:
+        """
+        执行单个工具调用
+        
+        Args:
+            index: 工具调用在本轮中的序号（从0开始）
+            tool_call: 解析出的工具调用信息
+            speculation: 本轮的推测检索，知识库查询与原始问题相同时直接使用其结果
+            
+        Returns:
+            (工具名称, 工具输出或错误信息)
+        """
+        tool_name = tool_call.get("name", "unknown")
+        with trace_span("tool.execute", tool=tool_name, index=index):
+            return self._run_tool(index, tool_name, tool_call, speculation)
+    
+    def _run_tool(self, index: int, tool_name: str, tool_call: Dict[str, Any],
+                  speculation: Optional[SpeculativeSearch] = None) -> Tuple[str, str]:
+        """执行工具函数并把异常转换为错误信息"""
+        try:
+            arguments = tool_call["arguments"]
+            
+            logger.debug("工具 %d (%s) 参数：%s", index + 1, tool_name, payload(arguments))
+            
+            if speculation is not None and tool_name == "query_knowledge_base":
+                tool_result = speculation.serve(arguments)
+                if tool_result is not None:
+                    logger.debug("工具 %d (%s) 使用推测检索结果：%s", index + 1, tool_name, payload(tool_result))
+                    return tool_name, tool_result
+            
+            # 获取并执行工具函数（按工具声明的超时和并发限制）
+            if get_tool_function(tool_name):
+                tool_result = call_tool(tool_name, arguments)
+                logger.debug("工具 %d (%s) 输出：%s", index + 1, tool_name, payload(tool_result))
+                return tool_name, tool_result
+            
+            error_msg = f"未找到工具：{tool_name}"
+            logger.warning("工具 %d (%s) 错误：%s", index + 1, tool_name, error_msg)
+            return tool_name, error_msg
+            
+        except Exception as e:
+            error_msg = f"工具调用失败：{e}"
+            logger.warning("工具 %d (%s) 错误：%s", index + 1, tool_name, error_msg)
+            return tool_name, error_msg
+    
+    async def _aexecute_tool_call(self, index: int, tool_call: Dict[str, Any],
+                                  speculation: Optional[SpeculativeSearch] = None) -> Tuple[str, str]:
+        """异步执行单个工具调用（参数和返回值同 _execute_tool_call）"""
+        tool_name = tool_call.get("name", "unknown")
+        with trace_span("tool.execute", tool=tool_name, index=index):
+            try:
+                arguments = tool_call["arguments"]
+                
+                logger.debug("工具 %d (%s) 参数：%s", index + 1, tool_name, payload(arguments))
+                
+                if speculation is not None and tool_name == "query_knowledge_base":
+                    # 推测检索可能尚未完成，在线程中等待
+                    tool_result = await asyncio.to_thread(speculation.serve, arguments)
+                    if tool_result is not None:
+                        logger.debug("工具 %d (%s) 使用推测检索结果：%s", index + 1, tool_name, payload(tool_result))
+                        return tool_name, tool_result
+                
+                if get_tool_function(tool_name):
+                    tool_result = await acall_tool(tool_name, arguments)
+                    logger.debug("工具 %d (%s) 输出：%s", index + 1, tool_name, payload(tool_result))
+                    return tool_name, tool_result
+                
+                error_msg = f"未找到工具：{tool_name}"
+            
+            except Exception as e:
+                error_msg = f"工具调用失败：{e}"
+            logger.warning("工具 %d (%s) 错误：%s", index + 1, tool_name, error_msg)
+            return tool_name, error_msg
+    
+    def _call_model_streaming(self, prompt: str = None, messages: List[Dict[str, Any]] = None,
+                              speculation: Optional[SpeculativeSearch] = None) -> Tuple[str, List[Future]]:
+        """
+        流式调用模型，每个工具调用闭合后立即提交执行
+        
+        Args:
+            prompt: 完整提示词（文本格式）
+            messages: 请求消息列表（消息格式）
+            speculation: 本轮的推测检索
+            
+        Returns:
+            (完整的模型输出, 按出现顺序排列的工具执行结果Future列表)
+        """
+        stream_parser = StreamingToolCallParser()
+        chunks = []
+        pending_results = []
+        
+        # 退出with块时会等待所有已提交的工具执行完成
+        with ThreadPoolExecutor(max_workers=4) as executor, trace_span("llm.stream") as span:
+            for delta in self.llm_client.stream_call(prompt, messages=messages):
+                if not chunks:
+                    span.set_attribute("first_chunk_ms", round(self._elapsed_ms(span), 1))
+                chunks.append(delta)
+                for event in stream_parser.feed(delta):
+                    if event["type"] == "tool_call":
+                        index = len(pending_results)
+                        # 复制上下文，让工具执行的 span 挂在本轮调用之下
+                        context = contextvars.copy_context()
+                        pending_results.append(executor.submit(context.run, self._execute_tool_call, index, event,
+                                                                   speculation))
+            stream_parser.close()
+        
+        return "".join(chunks), pending_results
+    
+    @staticmethod
+    def _elapsed_ms(span) -> float:
+        """span 开始至今的毫秒数（追踪关闭时为0）"""
+        start = getattr(span, "start_time", None)
+        return (time.time() - start) * 1000 if start is not None else 0.0
+    
     def start_conversation(self):
         """开始交互式对话"""
         print("欢迎使用自定义工具调用智能助手！")
@@ -138,12 +470,14 @@ class CustomConversationManager:
         print(f"支持最多 {self.max_tool_calls} 轮工具调用")
         
         conversation_history = []
+        conversation_usage = UsageTracker()
         
         while True:
             try:
                 user_input = input("\n请输入：").strip()
                 
                 if user_input.lower() in ['quit', 'exit', '退出']:
+                    print(f"本次对话模型用量：{conversation_usage.format_summary()}")
                     print("再见！")
                     break
                 
@@ -151,7 +485,9 @@ class CustomConversationManager:
                     continue
                 
                 # 处理用户输入
-                answer, conversation_history = self.process_user_input(user_input, conversation_history)
+                with track_usage(conversation_usage):
+                    answer, conversation_history = self.process_user_input(user_input, conversation_history)
+                print(f"\n助手：{answer}")
                 
             except KeyboardInterrupt:
                 print("\n\n再见！")
@@ -0,0 +1,427 @@
+"""
+检索质量与延迟评估脚本
+从标注了相关文档的Excel文件读取问题，对每个知识库配置计算 recall@k、MRR 和搜索延迟，并排对比多次运行
+"""
+
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# 添加当前目录到Python路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from tools.knowledge_base_tool import KnowledgeBaseManager, parse_knowledge_base_names
+
+
+# 一个单元格中多个相关文档的分隔符（原文标注常含逗号和分号，不作为分隔符）
+_LABEL_SEPARATORS = re.compile(r"[\r\n|]+")
+
+# 按原文匹配的标注的最短长度，较短的标注只与文档编号或标题精确匹配（避免短词命中大量文档而虚高召回）
+MIN_PASSAGE_LENGTH = 10
+
+# 延迟指标（毫秒）和计数指标，其余指标为 0 到 1 之间的比例
+LATENCY_METRICS = ("p50_ms", "p99_ms", "mean_ms")
+COUNT_METRICS = ("questions", "errors")
+
+
+@dataclass
+class LabeledQuestion:
+    """标注了相关文档的问题
+    
+    Attributes:
+        question: 问题
+        labels: 相关文档标注，每项为文档编号、标题或文档内容中的一段原文（至少 MIN_PASSAGE_LENGTH 个字符）
+        knowledge_base: 检索的知识库名称（同查询工具的 knowledge_base 参数）
+    """
+    question: str
+    labels: List[str]
+    knowledge_base: str = "all"
+
+
+@dataclass
+class EvaluationResult:
+    """一次运行的评估结果
+    
+    Attributes:
+        name: 运行名称
+        metrics: 指标名称到数值的映射（recall@k、mrr、p50_ms、p99_ms 等）
+        details: 每个问题的首个相关命中排名和搜索耗时
+    """
+    name: str
+    metrics: Dict[str, float]
+    details: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def split_labels(value: Any) -> List[str]:
+    """把标注单元格拆分为相关文档列表（按换行或竖线分隔）"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return []
+    return [label.strip() for label in _LABEL_SEPARATORS.split(str(value)) if label.strip()]
+
+
+def is_relevant(hit: Dict[str, Any], label: str) -> bool:
+    """
+    判断搜索结果是否与标注匹配
+    
+    标注与文档编号或标题相同，或者是文档内容中的一段原文时匹配。按原文标注时，
+    修改分块方式后标注仍然有效；原文不少于 MIN_PASSAGE_LENGTH 个字符才参与匹配。
+    
+    Args:
+        hit: 搜索结果
+        label: 相关文档标注
+    
+    Returns:
+        是否匹配
+    """
+    if label == hit.get("id") or label == hit.get("title"):
+        return True
+    return len(label) >= MIN_PASSAGE_LENGTH and label in hit.get("content", "")
+
+
+def load_labeled_questions(input_file: str, question_column: str = "问题", label_column: str = "相关文档",
+                           kb_column: Optional[str] = None, knowledge_base: str = "all") -> List[LabeledQuestion]:
+    """
+    读取标注文件
+    
+    Args:
+        input_file: Excel文件路径
+        question_column: 问题列名
+        label_column: 相关文档列名
+        kb_column: 知识库列名，为None或单元格为空时使用 knowledge_base
+        knowledge_base: 默认检索的知识库
+    
+    Returns:
+        问题和标注都不为空的标注问题列表
+    
+    Raises:
+        ValueError: 找不到指定的列
+    """
+    df = pd.read_excel(input_file)
+    for column in (question_column, label_column, kb_column):
+        if column is not None and column not in df.columns:
+            raise ValueError(f"未找到列 '{column}'，可用列：{', '.join(map(str, df.columns))}")
+    
+    questions = []
+    for _, row in df.iterrows():
+        question = row[question_column]
+        labels = split_labels(row[label_column])
+        if pd.isna(question) or not str(question).strip() or not labels:
+            continue
+        row_kb = row[kb_column] if kb_column is not None else None
+        if row_kb is None or pd.isna(row_kb) or not str(row_kb).strip():
+            row_kb = knowledge_base
+        questions.append(LabeledQuestion(str(question).strip(), labels, str(row_kb).strip()))
+    return questions
+
+
+class RetrievalEvaluator:
+    """检索评估器类
+    
+    逐个问题调用与查询工具相同的搜索路径（单个知识库为 search_knowledge_base，多个知识库为
+    search_all_knowledge_bases），记录每次搜索的耗时，并用前 max(ks) 个结果计算召回率和 MRR。
+    """
+    
+    def __init__(self, kb_manager: KnowledgeBaseManager, ks: Sequence[int] = (1, 3, 5, 10), warmup: int = 5):
+        """
+        初始化检索评估器
+        
+        Args:
+            kb_manager: 要评估的知识库管理器
+            ks: 计算 recall@k 的 k 值
+            warmup: 正式计时前预热的搜索次数（加载模型、填充缓存），不计入延迟
+        """
+        self.kb_manager = kb_manager
+        self.ks = sorted(set(ks))
+        self.warmup = warmup
+    
+    def search(self, question: LabeledQuestion) -> List[Dict[str, Any]]:
+        """
+        按问题指定的知识库搜索
+        
+        Args:
+            question: 标注问题
+        
+        Returns:
+            前 max(ks) 个搜索结果
+        """
+        kb_types = parse_knowledge_base_names(question.knowledge_base)
+        k = self.ks[-1]
+        if len(kb_types) == 1:
+            return self.kb_manager.search_knowledge_base(kb_types[0], question.question, k)
+        return self.kb_manager.search_all_knowledge_bases(question.question, k, kb_types)
+    
+    def evaluate(self, questions: List[LabeledQuestion], name: str = "run") -> EvaluationResult:
+        """
+        评估一组标注问题
+        
+        Args:
+            questions: 标注问题列表
+            name: 运行名称
+        
+        Returns:
+            评估结果；recall@k 为每个问题前 k 个结果覆盖的标注比例的平均值，
+            mrr 为首个相关结果排名倒数的平均值（前 max(ks) 个结果中没有相关结果时记为0）
+        """
+        for question in questions[:self.warmup]:
+            self.search(question)
+        
+        recalls = {k: [] for k in self.ks}
+        reciprocal_ranks = []
+        latencies = []
+        errors = 0
+        details = []
+        for question in questions:
+            start = time.perf_counter()
+            hits = self.search(question)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            latencies.append(elapsed_ms)
+            
+            if hits and "error" in hits[0]:
+                errors += 1
+                hits = []
+            # 每个结果匹配的标注
+            matched = [{label for label in question.labels if is_relevant(hit, label)} for hit in hits]
+            for k in self.ks:
+                found = set().union(*matched[:k])
+                recalls[k].append(len(found) / len(question.labels))
+            first_rank = next((rank for rank, labels in enumerate(matched, 1) if labels), None)
+            reciprocal_ranks.append(1.0 / first_rank if first_rank else 0.0)
+            details.append({
+                "问题": question.question,
+                "知识库": question.knowledge_base,
+                "首个相关排名": first_rank,
+                **{f"recall@{k}": recalls[k][-1] for k in self.ks},
+                "耗时(ms)": round(elapsed_ms, 3),
+            })
+        
+        metrics: Dict[str, float] = {"questions": len(questions)}
+        for k in self.ks:
+            metrics[f"recall@{k}"] = float(np.mean(recalls[k])) if questions else 0.0
+        metrics["mrr"] = float(np.mean(reciprocal_ranks)) if questions else 0.0
+        metrics["p50_ms"] = float(np.percentile(latencies, 50)) if latencies else 0.0
+        metrics["p99_ms"] = float(np.percentile(latencies, 99)) if latencies else 0.0
+        metrics["mean_ms"] = float(np.mean(latencies)) if latencies else 0.0
+        metrics["errors"] = errors
+        return EvaluationResult(name, metrics, details)
+
+
+def _format_metric(metric: str, value: float, signed: bool = False) -> str:
+    """格式化指标数值：计数为整数，延迟保留两位小数，其余保留四位小数"""
+    sign = "+" if signed else ""
+    if metric in COUNT_METRICS:
+        return f"{value:{sign}.0f}"
+    if metric in LATENCY_METRICS:
+        return f"{value:{sign}.2f}"
+    return f"{value:{sign}.4f}"
+
+
+def format_comparison(results: List[EvaluationResult], baseline: Optional[str] = None) -> str:
+    """
+    生成多次运行的并排对比表
+    
+    Args:
+        results: 评估结果列表
+        baseline: 基准运行名称，指定时其他运行的数值后附加与基准的差值
+    
+    Returns:
+        每行一个指标、每列一次运行的文本表格
+    """
+    if not results:
+        return "没有评估结果"
+    base = next((result for result in results if result.name == baseline), None)
+    metric_names = list(dict.fromkeys(name for result in results for name in result.metrics))
+    width = max(18, *(len(result.name) + 2 for result in results))
+    
+    lines = [f"{'指标':<14}" + "".join(f"{result.name:>{width}}" for result in results)]
+    for metric in metric_names:
+        cells = []
+        for result in results:
+            value = result.metrics.get(metric)
+            if value is None:
+                cells.append(f"{'-':>{width}}")
+                continue
+            text = _format_metric(metric, value)
+            if base is not None and result is not base and metric in base.metrics and metric not in COUNT_METRICS:
+                text += f" ({_format_metric(metric, value - base.metrics[metric], signed=True)})"
+            cells.append(f"{text:>{width}}")
+        lines.append(f"{metric:<16}" + "".join(cells))
+    return "\n".join(lines)
+
+
+def check_regressions(results: List[EvaluationResult], baseline: str, max_recall_drop: Optional[float] = None,
+                      max_latency_increase: Optional[float] = None) -> List[str]:
+    """
+    检查各运行相对基准是否退化
+    
+    Args:
+        results: 评估结果列表
+        baseline: 基准运行名称
+        max_recall_drop: recall@k 和 MRR 允许下降的最大值（绝对值），为None时不检查
+        max_latency_increase: p50/p99 延迟允许增加的最大比例（如 0.1 表示 10%），为None时不检查
+    
+    Returns:
+        退化描述列表，为空表示全部通过
+    
+    Raises:
+        ValueError: 找不到基准运行
+    """
+    base = next((result for result in results if result.name == baseline), None)
+    if base is None:
+        raise ValueError(f"未找到基准运行：{baseline}")
+    
+    failures = []
+    for result in results:
+        if result is base:
+            continue
+        for metric, value in result.metrics.items():
+            base_value = base.metrics.get(metric)
+            if base_value is None:
+                continue
+            if max_recall_drop is not None and (metric.startswith("recall@") or metric == "mrr"):
+                if base_value - value > max_recall_drop:
+                    failures.append(f"{result.name}: {metric} 从 {base_value:.4f} 降到 {value:.4f}")
+            if max_latency_increase is not None and metric in ("p50_ms", "p99_ms") and base_value > 0:
+                if value > base_value * (1 + max_latency_increase):
+                    failures.append(f"{result.name}: {metric} 从 {base_value:.2f} 增加到 {value:.2f}")
+    return failures
+
+
+def save_results(results: List[EvaluationResult], output_file: str):
+    """
+    保存评估结果：.json 文件只保存指标（供之后对比），.xlsx 文件保存对比表和每次运行的逐题结果
+    
+    Args:
+        results: 评估结果列表
+        output_file: 输出文件路径
+    """
+    if output_file.endswith(".json"):
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump({result.name: result.metrics for result in results}, f, ensure_ascii=False, indent=2)
+        return
+    
+    with pd.ExcelWriter(output_file) as writer:
+        comparison = pd.DataFrame({result.name: result.metrics for result in results})
+        comparison.to_excel(writer, sheet_name="对比", index_label="指标")
+        for result in results:
+            if result.details:
+                # 工作表名称最长 31 个字符
+                pd.DataFrame(result.details).to_excel(writer, sheet_name=result.name[:31], index=False)
+
+
+def load_results(input_file: str) -> List[EvaluationResult]:
+    """
+    读取之前用 save_results 保存的指标（.json）
+    
+    Args:
+        input_file: 指标文件路径
+    
+    Returns:
+        评估结果列表（不含逐题结果）
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        return [EvaluationResult(name, metrics) for name, metrics in json.load(f).items()]
+
+
+def parse_run(spec: str) -> Dict[str, Any]:
+    """
+    解析运行配置
+    
+    Args:
+        spec: "名称=知识库目录"，可以在目录后追加逗号分隔的选项，如
+            "sq8=input_sq8,embedding=bge-small-zh-onnx,rescore_factor=8,mmap=1"
+    
+    Returns:
+        包含 name 和 KnowledgeBaseManager 参数的字典
+    
+    Raises:
+        ValueError: 格式不正确
+    """
+    name, separator, rest = spec.partition("=")
+    if not separator or not name or not rest:
+        raise ValueError(f"运行配置格式应为 名称=知识库目录：{spec}")
+    base_dir, *options = rest.split(",")
+    run = {"name": name, "base_dir": base_dir}
+    for option in options:
+        key, separator, value = option.partition("=")
+        if key == "embedding":
+            run["embedding"] = value
+        elif key == "rescore_factor":
+            run["rescore_factor"] = int(value)
+        elif key == "mmap":
+            run["mmap"] = value not in ("0", "false", "")
+        else:
+            raise ValueError(f"未知的运行选项：{option}")
+    return run
+
+
+def main():
+    """主函数"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="检索质量与延迟评估工具")
+    parser.add_argument("input_file", help="标注文件（Excel），每行一个问题和相关文档")
+    parser.add_argument("--run", action="append", default=[], metavar="名称=目录[,选项]",
+                        help="要评估的知识库配置，可重复；选项：embedding=、rescore_factor=、mmap=1（默认：base=input）")
+    parser.add_argument("-c", "--column", default="问题", help="问题列名（默认：问题）")
+    parser.add_argument("-l", "--label-column", default="相关文档",
+                        help="相关文档列名，单元格内可用换行或竖线分隔多个文档编号、标题或原文（默认：相关文档）")
+    parser.add_argument("--kb-column", default=None, help="知识库列名（默认所有问题使用 --kb）")
+    parser.add_argument("--kb", default="all", help="检索的知识库：hpv、flu、hiv、all 或逗号分隔（默认：all）")
+    parser.add_argument("-k", type=int, nargs="+", default=[1, 3, 5, 10], help="计算 recall@k 的 k 值（默认：1 3 5 10）")
+    parser.add_argument("--warmup", type=int, default=5, help="预热搜索次数（默认：5）")
+    parser.add_argument("--compare", action="append", default=[], help="之前保存的指标文件（.json），与本次运行并排对比")
+    parser.add_argument("--baseline", default=None, help="基准运行名称，对比表中显示与基准的差值")
+    parser.add_argument("--max-recall-drop", type=float, default=None,
+                        help="recall@k 和 MRR 相对基准允许下降的最大值，超出时以状态码 1 退出")
+    parser.add_argument("--max-latency-increase", type=float, default=None,
+                        help="p50/p99 延迟相对基准允许增加的最大比例（如 0.1），超出时以状态码 1 退出")
+    parser.add_argument("-o", "--output", default=None, help="保存结果：.json 只保存指标，.xlsx 保存对比表和逐题结果")
+    
+    args = parser.parse_args()
+    
+    try:
+        runs = [parse_run(spec) for spec in args.run or ["base=input"]]
+        questions = load_labeled_questions(args.input_file, args.column, args.label_column, args.kb_column, args.kb)
+    except (OSError, ValueError) as e:
+        print(f"错误：{e}")
+        sys.exit(2)
+    if not questions:
+        print("错误：标注文件中没有找到有效的问题")
+        sys.exit(2)
+    print(f"读取 {len(questions)} 个标注问题")
+    
+    results = [result for path in args.compare for result in load_results(path)]
+    for run in runs:
+        name = run.pop("name")
+        print(f"\n评估 {name}（{run['base_dir']}）...")
+        manager = KnowledgeBaseManager(**run)
+        try:
+            results.append(RetrievalEvaluator(manager, args.k, args.warmup).evaluate(questions, name))
+        finally:
+            manager.close()
+    
+    baseline = args.baseline or results[0].name
+    print("\n" + format_comparison(results, baseline))
+    if args.output:
+        save_results(results, args.output)
+        print(f"\n结果已保存到: {args.output}")
+    
+    if args.max_recall_drop is not None or args.max_latency_increase is not None:
+        failures = check_regressions(results, baseline, args.max_recall_drop, args.max_latency_increase)
+        if failures:
+            print("\n相对基准退化：")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"\n相对基准 {baseline} 没有退化")
+
+
+if __name__ == "__main__":
+    main()
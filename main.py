@@ -3,11 +3,17 @@
 使用提示词拼接和输出解析的方式实现工具调用
 """
 
+import os
+
 from conversation_manager import CustomConversationManager
+from observability.logger import setup_logging
 
 
 def main():
     """主函数"""
+    # 交互模式默认只输出警告，设置 LOG_LEVEL=DEBUG 可查看每轮的模型输出和工具调用
+    setup_logging(os.getenv("LOG_LEVEL", "WARNING"))
+    
     try:
         # 创建自定义对话管理器
         conversation_manager = CustomConversationManager()
@@ -3,5 +3,15 @@
 """
 
 from .simple_llm_client import SimpleLLMClient
+from .backends import LLMBackend, DashScopeBackend, ScriptedBackend, LatencyModel, create_backend
+from .response_cache import ResponseCache
+from .resilience import (
+    LLMError, RetryableLLMError, RateLimitError, LLMTimeoutError, ServerError,
+    AuthenticationError, BadRequestError, CircuitOpenError, RetryPolicy, CircuitBreaker
+)
 
-__all__ = ['SimpleLLMClient'] 
\ No newline at end of file
+__all__ = [
+    'SimpleLLMClient', 'LLMBackend', 'DashScopeBackend', 'ScriptedBackend', 'LatencyModel', 'create_backend',
+    'ResponseCache', 'LLMError', 'RetryableLLMError', 'RateLimitError', 'LLMTimeoutError', 'ServerError',
+    'AuthenticationError', 'BadRequestError', 'CircuitOpenError', 'RetryPolicy', 'CircuitBreaker'
+] 
\ No newline at end of file
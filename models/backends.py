@@ -0,0 +1,400 @@
+"""
+大模型后端模块
+SimpleLLMClient 通过后端发送请求：默认使用 DashScope，离线压测和基准测试时可换成本地脚本化后端，
+不需要网络和API密钥就能跑通对话、批量问答和知识库构建的完整流程
+"""
+
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional
+
+from dashscope import Generation
+
+
+class LLMBackend:
+    """大模型后端基类
+    
+    generate 的参数和返回值与 dashscope.Generation.call 一致：返回带 status_code、output、usage
+    属性的响应对象，stream=True 时返回逐个产出响应分块的迭代器。
+    """
+    
+    name = "base"
+    
+    def generate(self, model: str, seed: int, **request):
+        """
+        发送一次请求
+        
+        Args:
+            model: 模型名称
+            seed: 随机种子
+            **request: 请求参数（prompt/messages、result_format、stream、incremental_output 等）
+        
+        Returns:
+            响应对象（流式时为迭代器）
+        """
+        raise NotImplementedError
+
+
+class DashScopeBackend(LLMBackend):
+    """DashScope 后端"""
+    
+    name = "dashscope"
+    
+    def __init__(self, api_key: str, base_url: Optional[str] = None, request_timeout: Optional[int] = None):
+        """
+        初始化 DashScope 后端
+        
+        Args:
+            api_key: API密钥
+            base_url: 接口地址，为None时使用默认地址
+            request_timeout: 单次请求超时时间（秒），为None时使用 dashscope 的默认值
+        """
+        if not api_key:
+            raise ValueError("API密钥未设置，请设置DASHSCOPE_API_KEY环境变量或传入api_key参数")
+        self.api_key = api_key
+        self.base_url = base_url
+        self.request_timeout = request_timeout
+    
+    def generate(self, model: str, seed: int, **request):
+        options = {}
+        if self.request_timeout is not None:
+            options["request_timeout"] = self.request_timeout
+        if self.base_url:
+            options["base_address"] = self.base_url
+        
+        return Generation.call(api_key=self.api_key, model=model, seed=seed, **options, **request)
+
+
+class LatencyModel:
+    """延迟分布
+    
+    支持的分布（参数单位均为毫秒）：
+        fixed:均值
+        uniform:最小值,最大值
+        normal:均值,标准差（截断到0以上）
+        lognormal:中位数,sigma（长尾，接近真实接口的延迟分布）
+    """
+    
+    DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+    
+    def __init__(self, distribution: str = "fixed", *params: float, seed: Optional[int] = None):
+        """
+        初始化延迟分布
+        
+        Args:
+            distribution: 分布名称
+            *params: 分布参数（毫秒）
+            seed: 随机种子，固定后每次运行的延迟序列相同
+        """
+        if distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"不支持的延迟分布：{distribution}，可选值为 {', '.join(self.DISTRIBUTIONS)}")
+        expected = 1 if distribution == "fixed" else 2
+        if len(params) != expected:
+            raise ValueError(f"{distribution} 分布需要 {expected} 个参数，实际为 {len(params)} 个")
+        self.distribution = distribution
+        self.params = tuple(float(param) for param in params)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def parse(cls, spec: Optional[str], seed: Optional[int] = None) -> "LatencyModel":
+        """
+        从字符串解析延迟分布
+        
+        Args:
+            spec: 如 "fixed:300"、"uniform:200,800"、"lognormal:800,0.5"，为空时没有延迟
+            seed: 随机种子
+        
+        Returns:
+            LatencyModel 实例
+        """
+        if not spec:
+            return cls("fixed", 0, seed=seed)
+        distribution, _, params = spec.partition(":")
+        try:
+            values = [float(value) for value in params.split(",") if value.strip()]
+        except ValueError:
+            raise ValueError(f"无法解析延迟分布：{spec}")
+        return cls(distribution.strip(), *values, seed=seed)
+    
+    def sample(self) -> float:
+        """
+        抽取一次延迟
+        
+        Returns:
+            延迟秒数
+        """
+        with self._lock:
+            if self.distribution == "fixed":
+                value = self.params[0]
+            elif self.distribution == "uniform":
+                value = self._random.uniform(*self.params)
+            elif self.distribution == "normal":
+                value = self._random.gauss(*self.params)
+            else:
+                median, sigma = self.params
+                value = median * self._random.lognormvariate(0.0, sigma)
+        return max(0.0, value) / 1000.0
+
+
+class _Output:
+    """与 DashScope 响应的 output 属性兼容的对象"""
+    
+    def __init__(self, text: str, result_format: str, finish_reason: str = "stop"):
+        self.finish_reason = finish_reason
+        if result_format == "message":
+            self.text = None
+            self.choices = [{"finish_reason": finish_reason, "message": {"role": "assistant", "content": text}}]
+        else:
+            self.text = text
+            self.choices = None
+
+
+class _Response:
+    """与 DashScope 响应兼容的对象"""
+    
+    def __init__(self, status_code: int = 200, output: Optional[_Output] = None,
+                 usage: Optional[Dict[str, int]] = None, code: str = "", message: str = "",
+                 headers: Optional[Dict[str, Any]] = None):
+        self.status_code = status_code
+        self.request_id = "scripted-request"
+        self.output = output
+        self.usage = usage
+        self.code = code
+        self.message = message
+        self.headers = headers or {}
+
+
+# 判断当前轮次和选择工具用的关键词
+_QUESTION_PROMPT_MARKER = "生成1到3个用户可能会问的简明问题"
+_TOOL_RESULT_PATTERN = re.compile(r"^工具\([^)]*\)：", re.MULTILINE)
+_EXPRESSION_PATTERN = re.compile(r"[\d\s\.\+\-\*/\(\)%]*\d[\d\s\.\+\-\*/\(\)%]*")
+_CITY_PATTERN = re.compile(r"([一-龥]{2,4}?)(?:市|的)?(?:今天|明天|现在)?(?:的)?天气")
+_KNOWLEDGE_BASE_KEYWORDS = (
+    ("hpv", ("hpv", "宫颈", "乳头瘤")),
+    ("hiv", ("hiv", "艾滋", "免疫缺陷")),
+    ("flu", ("流感", "flu", "感冒", "发烧")),
+)
+
+
+class ScriptedBackend(LLMBackend):
+    """本地脚本化后端
+    
+    不发起网络请求，按以下规则生成与真实模型格式一致的输出：
+        1. 有预设脚本时按顺序返回脚本中的响应（可注入错误码和延迟），脚本用完后按规则生成
+        2. 知识库构建时生成相关问题的请求返回 3 个问题
+        3. 本轮对话还没有工具结果时，按问题中的关键词输出一个 <tool_call>（计算、天气、时间，否则查询知识库，涉及多个知识库时查询 all）
+        4. 已有工具结果时输出引用工具结果的最终回答
+    
+    每次请求前按延迟分布等待，流式请求在首个分块前等待一次，之后每个分块再等待 chunk_interval_ms。
+    token 数按字符数近似，便于用量统计和压测报表。request_count 记录请求总数，requests 只保留最近的
+    若干个请求（供测试检查请求内容），长时间压测时内存不随请求数增长。
+    """
+    
+    name = "scripted"
+    
+    def __init__(self, script: Optional[List[Any]] = None, latency: Optional[LatencyModel] = None,
+                 chunk_interval_ms: float = 0.0, chunk_size: int = 8, max_recorded_requests: int = 16):
+        """
+        初始化脚本化后端
+        
+        Args:
+            script: 预设响应列表，每项为文本，或包含 text、status、delay（秒）、retry_after 的字典
+            latency: 首个分块（非流式时为整个响应）前的延迟分布，为None时不等待
+            chunk_interval_ms: 流式输出相邻分块之间的间隔（毫秒）
+            chunk_size: 流式输出每个分块的字符数
+            max_recorded_requests: requests 中保留的最近请求数，为0时不保留
+        """
+        self.script = [step if isinstance(step, dict) else {"text": step} for step in (script or [])]
+        self.latency = latency
+        self.chunk_interval = chunk_interval_ms / 1000.0
+        self.chunk_size = max(1, chunk_size)
+        self.requests: "deque[Dict[str, Any]]" = deque(maxlen=max_recorded_requests)
+        self.request_count = 0
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_jsonl(cls, path: str, **kwargs) -> "ScriptedBackend":
+        """
+        从 JSON lines 文件加载脚本（回放录制的响应）
+        
+        Args:
+            path: 文件路径，每行一个字符串或脚本项字典
+            **kwargs: 传给构造函数的其他参数
+        
+        Returns:
+            ScriptedBackend 实例
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            script = [json.loads(line) for line in f if line.strip()]
+        return cls(script, **kwargs)
+    
+    def generate(self, model: str, seed: int, **request):
+        with self._lock:
+            self.request_count += 1
+            self.requests.append(request)
+            step = self.script.pop(0) if self.script else None
+        
+        result_format = request.get("result_format", "text")
+        if step is not None and step.get("status", 200) != 200:
+            self._sleep(step)
+            headers = {"Retry-After": str(step["retry_after"])} if step.get("retry_after") is not None else None
+            return _Response(step["status"], code=f"Scripted{step['status']}", message="injected fault", headers=headers)
+        
+        text = step.get("text", "") if step is not None else self.respond(request)
+        usage = {"input_tokens": _count_tokens(request), "output_tokens": len(text)}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        
+        if request.get("stream"):
+            return self._stream(text, result_format, usage, step, request.get("incremental_output", False))
+        
+        self._sleep(step)
+        if self.chunk_interval:
+            time.sleep(self.chunk_interval * (len(text) // self.chunk_size))
+        return _Response(output=_Output(text, result_format), usage=usage)
+    
+    def respond(self, request: Dict[str, Any]) -> str:
+        """
+        按规则生成一次响应文本
+        
+        Args:
+            request: 请求参数
+        
+        Returns:
+            模型输出文本
+        """
+        if "messages" in request:
+            question, tool_results = _inspect_messages(request["messages"])
+        else:
+            prompt = request.get("prompt", "")
+            if _QUESTION_PROMPT_MARKER in prompt:
+                return _generate_questions(prompt)
+            question, tool_results = _inspect_prompt(prompt)
+        
+        if tool_results:
+            summary = "；".join(result.strip().replace("\n", " ")[:120] for result in tool_results)
+            return f"根据工具返回的结果，关于“{question}”的回答如下：{summary}"
+        return _choose_tool_call(question)
+    
+    def _stream(self, text: str, result_format: str, usage: Dict[str, int], step: Optional[Dict[str, Any]],
+                incremental: bool) -> Iterator[_Response]:
+        """按分块产出流式响应"""
+        self._sleep(step)
+        emitted = ""
+        for start in range(0, len(text), self.chunk_size):
+            if start and self.chunk_interval:
+                time.sleep(self.chunk_interval)
+            chunk = text[start:start + self.chunk_size]
+            emitted += chunk
+            finished = start + self.chunk_size >= len(text)
+            yield _Response(
+                output=_Output(chunk if incremental else emitted, result_format, "stop" if finished else "null"),
+                usage=usage,
+            )
+    
+    def _sleep(self, step: Optional[Dict[str, Any]]):
+        """请求前等待：脚本项指定 delay 时使用该值，否则按延迟分布抽样"""
+        if step is not None and step.get("delay") is not None:
+            delay = step["delay"]
+        else:
+            delay = self.latency.sample() if self.latency is not None else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _count_tokens(request: Dict[str, Any]) -> int:
+    """按字符数近似估算输入 token 数"""
+    if "messages" in request:
+        return sum(len(str(message.get("content", ""))) for message in request["messages"])
+    return len(request.get("prompt", ""))
+
+
+def _inspect_messages(messages: List[Dict[str, Any]]):
+    """从消息列表中取出当前问题和本轮已有的工具结果（工具输出以“工具(名称)：”开头的 user 消息发送）"""
+    tool_results = []
+    for message in reversed(messages):
+        if message.get("role") != "user":
+            continue
+        content = message.get("content", "")
+        if not _TOOL_RESULT_PATTERN.match(content):
+            return content, tool_results
+        tool_results = [result.rstrip("\n") for result in _TOOL_RESULT_PATTERN.split(content)[1:]] + tool_results
+    return "", tool_results
+
+
+def _inspect_prompt(prompt: str):
+    """从文本提示词中取出当前问题和本轮已有的工具结果（对话历史中最后一条用户消息之后的工具输出）"""
+    question = prompt.rsplit("当前用户的问题是：", 1)[-1].strip()
+    history = prompt.rsplit("当前用户的问题是：", 1)[0]
+    last_turn = history.rsplit("\n用户：", 1)[-1] if "\n用户：" in history else ""
+    tool_results = re.findall(r"^工具\([^)]*\)：(.*)$", last_turn, re.MULTILINE)
+    return question, tool_results
+
+
+def _choose_tool_call(question: str) -> str:
+    """按问题中的关键词选择一个工具调用"""
+    lowered = question.lower()
+    if any(keyword in question for keyword in ("计算", "等于", "多少")) and _EXPRESSION_PATTERN.search(question):
+        expression = max(_EXPRESSION_PATTERN.findall(question), key=len).strip()
+        name, arguments = "calculate", {"expression": expression}
+    elif "天气" in question:
+        match = _CITY_PATTERN.search(question)
+        name, arguments = "get_current_weather", {"location": match.group(1) if match else "北京"}
+    elif any(keyword in question for keyword in ("几点", "时间", "日期", "今天几号")):
+        name, arguments = "get_current_time", {}
+    else:
+        # 涉及多个知识库时一次查询全部知识库
+        matched = [kb for kb, keywords in _KNOWLEDGE_BASE_KEYWORDS if any(keyword in lowered for keyword in keywords)]
+        knowledge_base = "all" if len(matched) > 1 else (matched or ["flu"])[0]
+        name, arguments = "query_knowledge_base", {"knowledge_base": knowledge_base, "query": question, "top_k": 3}
+    
+    return (
+        "我需要先调用工具获取信息。\n\n<tool_call>\n"
+        f"工具名称：{name}\n参数：{json.dumps(arguments, ensure_ascii=False)}\n</tool_call>"
+    )
+
+
+def _generate_questions(prompt: str) -> str:
+    """为知识库构建生成 3 个相关问题"""
+    content = prompt.split("\n\n", 1)[-1].rsplit("\n\n问题：", 1)[0]
+    topic = re.sub(r"\s+", "", content)[:12] or "这段内容"
+    return f"{topic}是什么意思？\n{topic}有哪些注意事项？\n{topic}适用于哪些人群？"
+
+
+def create_backend(name: Optional[str] = None, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                   request_timeout: Optional[int] = None) -> LLMBackend:
+    """
+    按名称创建后端
+    
+    未传入名称时读取 LLM_BACKEND 环境变量（默认 dashscope）。脚本化后端读取以下环境变量：
+        LLM_BACKEND_SCRIPT: 回放用的 JSON lines 脚本文件
+        LLM_BACKEND_LATENCY: 延迟分布，如 "lognormal:800,0.5"
+        LLM_BACKEND_CHUNK_INTERVAL_MS: 流式分块间隔（毫秒）
+        LLM_BACKEND_SEED: 延迟分布的随机种子
+    
+    Args:
+        name: 后端名称，"dashscope" 或 "scripted"
+        api_key: API密钥（DashScope 后端）
+        base_url: 接口地址（DashScope 后端）
+        request_timeout: 单次请求超时时间（DashScope 后端）
+    
+    Returns:
+        LLMBackend 实例
+    """
+    name = (name or os.getenv("LLM_BACKEND") or DashScopeBackend.name).lower()
+    if name == DashScopeBackend.name:
+        return DashScopeBackend(api_key, base_url, request_timeout)
+    if name == ScriptedBackend.name:
+        seed = os.getenv("LLM_BACKEND_SEED")
+        options = {
+            "latency": LatencyModel.parse(os.getenv("LLM_BACKEND_LATENCY"), int(seed) if seed else None),
+            "chunk_interval_ms": float(os.getenv("LLM_BACKEND_CHUNK_INTERVAL_MS", "0")),
+        }
+        script_path = os.getenv("LLM_BACKEND_SCRIPT")
+        return ScriptedBackend.from_jsonl(script_path, **options) if script_path else ScriptedBackend(**options)
+    raise ValueError(f"不支持的大模型后端：{name}，可选值为 dashscope 或 scripted")
@@ -0,0 +1,340 @@
+"""
+大模型调用容错模块
+提供错误分类、指数退避重试、熔断器和对冲请求
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import requests
+except ImportError:  # requests 是 dashscope 的依赖，正常情况下总是可用
+    requests = None
+
+
+class LLMError(Exception):
+    """大模型调用错误基类"""
+    
+    def __init__(self, message: str, status_code: Optional[int] = None, code: Optional[str] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.code = code
+        self.retry_after = retry_after
+
+
+class RetryableLLMError(LLMError):
+    """可重试的错误（限流、超时、服务端错误）"""
+
+
+class RateLimitError(RetryableLLMError):
+    """限流错误（HTTP 429）"""
+
+
+class LLMTimeoutError(RetryableLLMError):
+    """请求超时"""
+
+
+class ServerError(RetryableLLMError):
+    """服务端错误（HTTP 5xx）或连接失败"""
+
+
+class AuthenticationError(LLMError):
+    """鉴权失败（HTTP 401/403），不可重试"""
+
+
+class BadRequestError(LLMError):
+    """请求参数错误（HTTP 4xx），不可重试"""
+
+
+class CircuitOpenError(LLMError):
+    """熔断器处于打开状态，等待超时后仍未恢复"""
+
+
+def _parse_retry_after(headers: Optional[Dict[str, Any]]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头
+    
+    Args:
+        headers: 响应头字典
+    
+    Returns:
+        需要等待的秒数，没有或无法解析时返回None
+    """
+    if not headers:
+        return None
+    for key, value in headers.items():
+        if str(key).lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def check_response(response) -> None:
+    """
+    检查 DashScope 响应状态，非200时抛出分类后的错误
+    
+    Args:
+        response: DashScope 响应对象
+    """
+    status_code = getattr(response, 'status_code', 200)
+    if status_code == 200:
+        return
+    
+    code = getattr(response, 'code', None)
+    message = f"调用模型失败：{status_code} {code}: {getattr(response, 'message', '')}"
+    retry_after = _parse_retry_after(getattr(response, 'headers', None))
+    
+    if status_code == 429:
+        error_class = RateLimitError
+    elif status_code in (408, 504):
+        error_class = LLMTimeoutError
+    elif status_code >= 500:
+        error_class = ServerError
+    elif status_code in (401, 403):
+        error_class = AuthenticationError
+    else:
+        error_class = BadRequestError
+    raise error_class(message, status_code=status_code, code=code, retry_after=retry_after)
+
+
+def classify_exception(error: Exception) -> LLMError:
+    """
+    将调用过程中抛出的异常转换为分类后的错误
+    
+    Args:
+        error: 原始异常
+    
+    Returns:
+        分类后的错误
+    """
+    if isinstance(error, LLMError):
+        return error
+    if requests is not None:
+        if isinstance(error, requests.exceptions.Timeout):
+            return LLMTimeoutError(f"调用模型失败：请求超时 {error}")
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return ServerError(f"调用模型失败：连接失败 {error}")
+    if isinstance(error, TimeoutError):
+        return LLMTimeoutError(f"调用模型失败：请求超时 {error}")
+    return LLMError(f"调用模型失败：{error}")
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略：带全抖动的指数退避"""
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    max_retry_after: float = 60.0
+    
+    def compute_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        计算第 attempt 次失败后的等待时间
+        
+        Args:
+            attempt: 已失败的次数（从0开始）
+            retry_after: 服务端要求的等待时间
+        
+        Returns:
+            等待秒数
+        """
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """熔断器类
+    
+    连续可重试错误达到阈值后打开，打开期间所有调用方阻塞等待（而不是继续请求已经降级的上游），
+    冷却时间过后放行一个探测请求，探测成功则关闭，失败则重新打开。
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 max_wait: Optional[float] = 300.0):
+        """
+        初始化熔断器
+        
+        Args:
+            failure_threshold: 打开熔断器所需的连续失败次数
+            recovery_timeout: 打开后到放行探测请求的冷却时间（秒）
+            max_wait: 调用方最长等待时间，超过后抛出 CircuitOpenError；None 表示一直等待
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_wait = max_wait
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._condition = threading.Condition()
+    
+    def before_call(self):
+        """调用前检查熔断器状态，打开期间阻塞等待"""
+        deadline = None if self.max_wait is None else time.monotonic() + self.max_wait
+        
+        with self._condition:
+            while True:
+                if self.state == self.CLOSED:
+                    return
+                
+                now = time.monotonic()
+                if self.state == self.OPEN:
+                    remaining = self._opened_at + self.recovery_timeout - now
+                    if remaining <= 0:
+                        self.state = self.HALF_OPEN
+                        self._probe_in_flight = True
+                        return
+                    wait_time = remaining
+                elif not self._probe_in_flight:
+                    self._probe_in_flight = True
+                    return
+                else:
+                    wait_time = self.recovery_timeout
+                
+                if deadline is not None:
+                    if now >= deadline:
+                        raise CircuitOpenError("调用模型失败：上游服务降级，熔断器处于打开状态")
+                    wait_time = min(wait_time, deadline - now)
+                self._condition.wait(wait_time)
+    
+    def record_success(self):
+        """记录一次成功调用"""
+        with self._condition:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+            self._condition.notify_all()
+    
+    def record_failure(self):
+        """记录一次可重试的失败调用"""
+        with self._condition:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+            self._condition.notify_all()
+
+
+class ResilientCaller:
+    """容错调用器类，组合重试、熔断和对冲请求"""
+    
+    def __init__(self, retry_policy: Optional[RetryPolicy] = None,
+                 circuit_breaker: Optional[CircuitBreaker] = None,
+                 hedge_delay: Optional[float] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        初始化容错调用器
+        
+        Args:
+            retry_policy: 重试策略，默认使用 RetryPolicy()
+            circuit_breaker: 熔断器，为None时不熔断
+            hedge_delay: 对冲请求的触发延迟（秒），首个请求在此时间内未返回时再发一个相同请求，
+                取先成功的结果；为None时不对冲
+            sleep: 等待函数，便于测试替换
+        """
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.hedge_delay = hedge_delay
+        self._sleep = sleep
+        self._executor = ThreadPoolExecutor(max_workers=8) if hedge_delay is not None else None
+    
+    def call(self, func: Callable[[], Any]) -> Any:
+        """
+        容错地调用函数
+        
+        Args:
+            func: 无参调用函数，失败时应抛出 LLMError 或可被 classify_exception 分类的异常
+        
+        Returns:
+            函数返回值
+        """
+        max_attempts = max(1, self.retry_policy.max_attempts)
+        
+        for attempt in range(max_attempts):
+            if self.circuit_breaker:
+                self.circuit_breaker.before_call()
+            
+            try:
+                result = self._call_once(func)
+            except Exception as e:
+                error = classify_exception(e)
+                if not isinstance(error, RetryableLLMError):
+                    # 不可重试的错误说明上游是健康的，不计入熔断
+                    if self.circuit_breaker:
+                        self.circuit_breaker.record_success()
+                    raise error from e
+                
+                if self.circuit_breaker:
+                    self.circuit_breaker.record_failure()
+                if attempt == max_attempts - 1:
+                    raise error from e
+                self._sleep(self.retry_policy.compute_delay(attempt, error.retry_after))
+                continue
+            
+            if self.circuit_breaker:
+                self.circuit_breaker.record_success()
+            return result
+    
+    def _call_once(self, func: Callable[[], Any]) -> Any:
+        """
+        执行一次调用，开启对冲时可能并发发出两个相同请求
+        
+        Args:
+            func: 调用函数
+        
+        Returns:
+            先成功的结果
+        """
+        if self._executor is None:
+            return func()
+        
+        primary = self._executor.submit(func)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        if done:
+            return primary.result()
+        
+        hedge = self._executor.submit(func)
+        pending = {primary, hedge}
+        last_error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+        raise last_error
+
+
+# 按模型共享的熔断器，同一进程内所有线程在上游降级时一起暂停
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """
+    获取指定名称的共享熔断器
+    
+    Args:
+        name: 熔断器名称，通常为模型名称
+    
+    Returns:
+        熔断器实例
+    """
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker()
+        return _circuit_breakers[name]
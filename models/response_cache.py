@@ -0,0 +1,144 @@
+"""
+大模型响应缓存模块
+以 SQLite 文件保存 (模型, 请求内容, 参数) 到响应文本的映射，用于确定性重放和评测重跑
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    """基于 SQLite 的大模型响应缓存类
+    
+    按最近访问时间淘汰，条目数或总字节数超过上限时删除最久未使用的条目。
+    """
+    
+    def __init__(self, path: str, max_entries: int = 50000, max_bytes: Optional[int] = 512 * 1024 * 1024):
+        """
+        初始化响应缓存
+        
+        Args:
+            path: SQLite 数据库文件路径，":memory:" 表示仅在内存中缓存
+            max_entries: 最大条目数
+            max_bytes: 缓存响应的最大总字节数，为None时不限制
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+    
+    @staticmethod
+    def make_key(model: str, request: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        计算缓存键
+        
+        Args:
+            model: 模型名称
+            request: 请求内容（prompt 或 messages）
+            params: 影响输出的其他参数（seed、result_format 等）
+        
+        Returns:
+            SHA-256 十六进制摘要
+        """
+        payload = json.dumps(
+            {"model": model, "request": request, "params": params or {}},
+            ensure_ascii=False, sort_keys=True, default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        """
+        读取缓存的响应
+        
+        Args:
+            key: 缓存键
+        
+        Returns:
+            响应文本，未命中时返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+    
+    def put(self, key: str, model: str, response: str):
+        """
+        写入响应并按上限淘汰旧条目
+        
+        Args:
+            key: 缓存键
+            model: 模型名称
+            response: 响应文本
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, size, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+    
+    def _evict(self):
+        """删除最久未使用的条目，直到满足条目数和字节数上限（调用方需持有锁）"""
+        count, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+            count, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        
+        if self.max_bytes is not None and total_bytes > self.max_bytes:
+            for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                if total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total_bytes -= size
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
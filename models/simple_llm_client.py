@@ -5,26 +5,61 @@
 
 import os
 import random
-from typing import List, Dict, Any
-from dashscope import Generation
+from typing import List, Dict, Any, Iterator, Optional
+from .backends import DashScopeBackend, LLMBackend, create_backend
+from .resilience import (
+    RetryableLLMError, RetryPolicy, ResilientCaller, check_response, classify_exception, get_circuit_breaker
+)
+from .response_cache import ResponseCache
+from observability import trace_span
+from observability.usage import current_usage_context, record_usage
+
+
+# 开启响应缓存时使用的固定随机种子，保证相同请求可以复现
+DEFAULT_CACHE_SEED = 1234
 
 
 class SimpleLLMClient:
     """简单LLM客户端类"""
     
-    def __init__(self, api_key: str = None, model: str = "qwen-plus"):
+    def __init__(self, api_key: str = None, model: str = "qwen-plus",
+                 retry_policy: Optional[RetryPolicy] = None, hedge_delay: Optional[float] = None,
+                 request_timeout: Optional[int] = None, base_url: Optional[str] = None,
+                 cache: Optional[ResponseCache] = None, seed: Optional[int] = None,
+                 backend: Optional[LLMBackend] = None):
         """
         初始化简单LLM客户端
         
         Args:
             api_key: API密钥，如果为None则从环境变量获取
             model: 模型名称
+            retry_policy: 重试策略，默认对限流、超时和服务端错误做指数退避重试
+            hedge_delay: 对冲请求的触发延迟（秒），为None时不发对冲请求
+            request_timeout: 单次请求超时时间（秒），为None时使用 dashscope 的默认值
+            base_url: DashScope 接口地址，为None时使用默认地址（测试时可指向本地模拟服务）
+            cache: 响应缓存，为None时若设置了 LLM_CACHE_PATH 环境变量则使用该路径的缓存，否则不缓存
+            seed: 固定随机种子；开启缓存时默认使用 DEFAULT_CACHE_SEED，否则每次请求随机
+            backend: 模型后端，为None时按 LLM_BACKEND 环境变量创建（默认 DashScope，
+                离线压测时设为 scripted 使用本地脚本化后端）
         """
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         self.model = model
+        self.request_timeout = request_timeout
+        self.base_url = base_url
         
-        if not self.api_key:
-            raise ValueError("API密钥未设置，请设置DASHSCOPE_API_KEY环境变量或传入api_key参数")
+        if cache is None and os.getenv("LLM_CACHE_PATH"):
+            cache = ResponseCache(os.getenv("LLM_CACHE_PATH"))
+        self.cache = cache
+        self.seed = seed if seed is not None or cache is None else DEFAULT_CACHE_SEED
+        # 同一模型的所有客户端共享一个熔断器，上游降级时所有工作线程一起暂停
+        self.resilient_caller = ResilientCaller(
+            retry_policy=retry_policy,
+            circuit_breaker=get_circuit_breaker(model),
+            hedge_delay=hedge_delay,
+        )
+        
+        # DashScope 后端在未设置API密钥时抛出 ValueError
+        self.backend = backend or create_backend(api_key=self.api_key, base_url=base_url, request_timeout=request_timeout)
     
     def call(self, prompt: str) -> str:
         """
@@ -32,64 +67,206 @@ class SimpleLLMClient:
         
         Args:
             prompt: 完整的提示词
-            
+        
         Returns:
             模型响应文本
+        
+        Raises:
+            LLMError: 重试后仍然失败，具体子类表示错误类别
         """
-        try:
-            response = Generation.call(
-                api_key=self.api_key,
-                model=self.model,
+        # 重试和对冲请求可能在其他线程执行，先在调用线程取得用量统计上下文
+        usage_context = current_usage_context()
+        
+        def request():
+            response = self._generate(
                 prompt=prompt,
-                seed=random.randint(1, 10000),
                 result_format="text",  # 使用文本格式而不是message格式
             )
+            check_response(response)
+            record_usage(usage_context, self.model, getattr(response, 'usage', None))
             
             # 提取响应文本
             if hasattr(response, 'output') and hasattr(response.output, 'text'):
                 return response.output.text
             else:
                 return str(response)
-                
+        
+        return self._cached_call({"prompt": prompt}, "text", lambda: self.resilient_caller.call(request))
+    
+    def stream_call(self, prompt: str = None, messages: List[Dict[str, Any]] = None) -> Iterator[str]:
+        """
+        以流式方式调用大语言模型
+        
+        流式调用只在熔断器上排队，不做重试：已经产出的分块无法撤回。
+        
+        Args:
+            prompt: 完整的提示词
+            messages: 消息列表，传入时使用消息格式调用
+        
+        Yields:
+            模型输出的增量文本
+        """
+        if messages is not None:
+            request = {"messages": messages}
+            result_format = "message"
+        else:
+            request = {"prompt": prompt}
+            result_format = "text"
+        
+        usage_context = current_usage_context()
+        
+        # 命中缓存时一次性产出完整文本
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self._cache_key(request, result_format)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                record_usage(usage_context, self.model, cached=True)
+                yield cached
+                return
+        
+        circuit_breaker = self.resilient_caller.circuit_breaker
+        if circuit_breaker:
+            circuit_breaker.before_call()
+        
+        chunks = []
+        usage = None
+        try:
+            responses = self._generate(
+                result_format=result_format,
+                stream=True,
+                incremental_output=True,  # 每个分块只包含新增文本
+                **request,
+            )
+            
+            for response in responses:
+                if messages is not None:
+                    delta = self._extract_message_text(response)
+                else:
+                    check_response(response)
+                    delta = response.output.text if hasattr(response, 'output') and hasattr(response.output, 'text') else ""
+                # 每个分块都带有截至当前的累计用量，以最后一个为准
+                usage = getattr(response, 'usage', None) or usage
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        
         except Exception as e:
-            raise Exception(f"调用模型失败：{e}")
+            error = classify_exception(e)
+            if circuit_breaker:
+                if isinstance(error, RetryableLLMError):
+                    circuit_breaker.record_failure()
+                else:
+                    circuit_breaker.record_success()
+            raise error from e
+        
+        if circuit_breaker:
+            circuit_breaker.record_success()
+        record_usage(usage_context, self.model, usage)
+        if cache_key is not None:
+            self.cache.put(cache_key, self.model, "".join(chunks))
     
     def call_with_messages(self, messages: List[Dict[str, Any]]) -> str:
         """
-        使用消息格式调用模型（兼容性方法）
+        使用消息格式调用模型
+        
+        直接以 system/user/assistant 角色发送消息列表，不再拼接成单个提示词，
+        固定不变的 system 消息可以被服务端的上下文缓存复用。
         
         Args:
             messages: 消息列表
-            
+        
         Returns:
             模型响应文本
         """
-        # 将消息转换为提示词
-        prompt = self._messages_to_prompt(messages)
-        return self.call(prompt)
+        usage_context = current_usage_context()
+        
+        def request():
+            response = self._generate(messages=messages, result_format="message")
+            text = self._extract_message_text(response)
+            record_usage(usage_context, self.model, getattr(response, 'usage', None))
+            return text
+        
+        return self._cached_call({"messages": messages}, "message", lambda: self.resilient_caller.call(request))
     
-    def _messages_to_prompt(self, messages: List[Dict[str, Any]]) -> str:
+    def _cached_call(self, request: Dict[str, Any], result_format: str, func) -> str:
         """
-        将消息列表转换为提示词
+        带响应缓存的调用（整个调用记录为一个 llm.call 阶段）
         
         Args:
-            messages: 消息列表
+            request: 请求内容（prompt 或 messages），参与计算缓存键
+            result_format: 结果格式，参与计算缓存键
+            func: 未命中时实际发起请求的函数
             
         Returns:
-            提示词文本
+            模型响应文本
+        """
+        with trace_span("llm.call", model=self.model, result_format=result_format) as span:
+            if self.cache is None:
+                return func()
+        
+            key = self._cache_key(request, result_format)
+            cached = self.cache.get(key)
+            span.set_attribute("cache_hit", cached is not None)
+            if cached is not None:
+                record_usage(current_usage_context(), self.model, cached=True)
+                return cached
+        
+            text = func()
+            self.cache.put(key, self.model, text)
+            return text
+    
+    def _cache_key(self, request: Dict[str, Any], result_format: str) -> str:
         """
-        prompt_parts = []
+        计算请求的缓存键
         
-        for message in messages:
-            role = message.get("role", "")
-            content = message.get("content", "")
+        Args:
+            request: 请求内容（prompt 或 messages）
+            result_format: 结果格式
             
-            if role == "user":
-                prompt_parts.append(f"用户：{content}")
-            elif role == "assistant":
-                prompt_parts.append(f"助手：{content}")
-            elif role == "tool":
-                name = message.get("name", "")
-                prompt_parts.append(f"工具({name})：{content}")
-        
-        return "\n\n".join(prompt_parts) 
\ No newline at end of file
+        Returns:
+            缓存键
+        """
+        params = {"seed": self.seed, "result_format": result_format}
+        # 本地后端的输出不能与真实模型的缓存混用；DashScope 不加该字段，保持已有缓存可用
+        if self.backend.name != DashScopeBackend.name:
+            params["backend"] = self.backend.name
+        return ResponseCache.make_key(self.model, request, params)
+    
+    def _generate(self, **request):
+        """
+        通过模型后端发送一次请求
+        
+        Args:
+            **request: 请求参数（prompt/messages、result_format、stream 等）
+        
+        Returns:
+            DashScope 格式的响应对象（流式时为生成器）
+        """
+        return self.backend.generate(
+            model=self.model,
+            seed=self.seed if self.seed is not None else random.randint(1, 10000),
+            **request,
+        )
+    
+    def _extract_message_text(self, response) -> str:
+        """
+        从消息格式的响应中提取文本
+        
+        Args:
+            response: 模型响应
+        
+        Returns:
+            助手消息内容
+        """
+        check_response(response)
+        
+        output = getattr(response, 'output', None)
+        choices = getattr(output, 'choices', None) if output is not None else None
+        if choices:
+            message = choices[0]['message']
+            return message.get('content', '') or ''
+        
+        if output is not None and getattr(output, 'text', None):
+            return output.text
+        return str(response)
@@ -0,0 +1,12 @@
+"""
+可观测性包初始化文件
+不依赖项目中的其他包，models、tools、utils 都可以直接导入
+"""
+
+from .logger import get_logger, payload, setup_logging
+from .tracing import Span, Tracer, get_tracer, trace_span
+from .usage import UsageTracker, get_usage_tracker, track_usage, usage_purpose
+
+__all__ = ['get_logger', 'payload', 'setup_logging',
+           'Span', 'Tracer', 'get_tracer', 'trace_span',
+           'UsageTracker', 'get_usage_tracker', 'track_usage', 'usage_purpose']
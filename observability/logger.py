@@ -0,0 +1,180 @@
+"""
+日志模块
+提供分级、惰性格式化的日志记录。大段内容（模型输出、工具结果）用 Payload 包装后按比例采样并截断，
+日志记录经队列交给后台线程格式化和写出，热路径不会阻塞在终端或文件 I/O 上
+"""
+
+import atexit
+import itertools
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+
+LOGGER_NAME = "funccall"
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+_max_payload_chars = 2000
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    获取项目日志记录器
+    
+    未调用 setup_logging 时只有 WARNING 及以上的日志会输出（Python 默认行为），
+    因此库代码中的调试日志默认没有 I/O 开销。
+    
+    Args:
+        name: 模块名称，如 "conversation"
+    
+    Returns:
+        名为 funccall.<name> 的日志记录器
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class Payload:
+    """大段日志内容的包装类
+    
+    只有日志真正输出时才会在后台线程中调用 __str__ 截断，被过滤或被采样丢弃时没有格式化开销。
+    包装的内容应当是不可变的字符串。
+    """
+    
+    __slots__ = ("text", "max_chars")
+    
+    def __init__(self, text, max_chars: Optional[int] = None):
+        self.text = text
+        self.max_chars = max_chars
+    
+    def __str__(self) -> str:
+        text = self.text if isinstance(self.text, str) else str(self.text)
+        limit = self.max_chars if self.max_chars is not None else _max_payload_chars
+        if limit and len(text) > limit:
+            return f"{text[:limit]}……（共 {len(text)} 字，已截断）"
+        return text
+
+
+def payload(text, max_chars: Optional[int] = None) -> Payload:
+    """
+    包装大段日志内容
+    
+    Args:
+        text: 日志内容
+        max_chars: 最大输出字符数，为None时使用 setup_logging 的配置
+    
+    Returns:
+        Payload 实例
+    """
+    return Payload(text, max_chars)
+
+
+class PayloadSampler(logging.Filter):
+    """按比例采样带 Payload 参数的日志记录，其他记录全部放行"""
+    
+    def __init__(self, rate: float = 1.0):
+        """
+        初始化采样过滤器
+        
+        Args:
+            rate: 保留比例，0 表示全部丢弃，1 表示全部保留
+        """
+        super().__init__()
+        self.rate = max(0.0, min(1.0, rate))
+        self._counter = itertools.count()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        args = record.args if isinstance(record.args, tuple) else ()
+        if not any(isinstance(arg, Payload) for arg in args):
+            return True
+        if self.rate <= 0.0:
+            return False
+        # 确定性采样：每 1/rate 条保留一条
+        return next(self._counter) % round(1 / self.rate) == 0
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """把日志记录原样放入队列的处理器
+    
+    标准 QueueHandler 会在调用线程中先格式化消息，这里改为在后台监听线程中格式化。
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: Optional[str] = None, log_file: Optional[str] = None,
+                  payload_sample_rate: Optional[float] = None,
+                  max_payload_chars: Optional[int] = None) -> QueueListener:
+    """
+    配置项目日志：记录先进入内存队列，由后台线程写到 stderr（以及可选的日志文件）
+    
+    可以重复调用，后一次调用会替换前一次的配置。未传入的参数依次读取环境变量
+    LOG_LEVEL、LOG_FILE、LOG_PAYLOAD_SAMPLE_RATE、LOG_MAX_PAYLOAD_CHARS。
+    
+    Args:
+        level: 日志级别，默认 INFO
+        log_file: 日志文件路径，为None时只输出到 stderr
+        payload_sample_rate: 大段内容日志的保留比例，默认 1.0
+        max_payload_chars: 大段内容的最大输出字符数，默认 2000，0 表示不截断
+    
+    Returns:
+        后台监听器
+    """
+    global _listener, _max_payload_chars
+    
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    log_file = log_file or os.getenv("LOG_FILE")
+    if payload_sample_rate is None:
+        payload_sample_rate = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+    if max_payload_chars is None:
+        max_payload_chars = int(os.getenv("LOG_MAX_PAYLOAD_CHARS", "2000"))
+    
+    with _setup_lock:
+        _stop_listener()
+        
+        _max_payload_chars = max_payload_chars
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+        
+        log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(PayloadSampler(payload_sample_rate))
+        
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.handlers = [queue_handler]
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+        logger.propagate = False
+        
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        return _listener
+
+
+def shutdown_logging():
+    """停止后台监听线程并写出队列中剩余的日志"""
+    with _setup_lock:
+        _stop_listener()
+
+
+def _stop_listener():
+    """停止当前监听器并关闭其处理器，调用方需持有 _setup_lock"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            if not isinstance(handler, logging.StreamHandler) or isinstance(handler, logging.FileHandler):
+                handler.close()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
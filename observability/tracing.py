@@ -0,0 +1,270 @@
+"""
+分阶段耗时追踪模块
+记录一次对话中提示词构建、模型调用、解析、工具执行、向量编码、FAISS搜索等阶段的耗时，
+可导出为 JSON lines 或 OpenTelemetry（OTLP JSON）格式，并汇总各阶段的 p50/p95/p99
+"""
+
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一个计时阶段"""
+    
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_time", "end_time",
+                 "_start", "duration", "attributes", "error")
+    
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self.end_time = None
+        self._start = time.perf_counter()
+        self.duration = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+    
+    def set_attribute(self, key: str, value: Any):
+        """设置属性"""
+        self.attributes[key] = value
+    
+    def end(self):
+        """结束计时"""
+        self.duration = time.perf_counter() - self._start
+        self.end_time = self.start_time + self.duration
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为 JSON lines 记录"""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+    
+    def to_otel(self) -> Dict[str, Any]:
+        """转换为 OTLP JSON 格式的 span 记录"""
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(int(self.start_time * 1e9)),
+            "endTimeUnixNano": str(int((self.end_time or self.start_time) * 1e9)),
+            "attributes": [{"key": key, "value": _otel_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            record["parentSpanId"] = self.parent_id
+        return record
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 span"""
+    
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _otel_value(value: Any) -> Dict[str, Any]:
+    """把属性值转换为 OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """线性插值计算分位数"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class Tracer:
+    """追踪器类
+    
+    默认关闭，关闭时 span() 几乎没有开销。父子关系通过 contextvars 传递：
+    同一线程（或 asyncio 任务）中嵌套的 span 自动成为子 span，提交到线程池的任务
+    需要用 contextvars.copy_context().run 包装才能继承当前 span。
+    """
+    
+    def __init__(self, max_spans: int = 100000):
+        """
+        初始化追踪器
+        
+        Args:
+            max_spans: 内存中保留的最大 span 数，超出时丢弃最早的记录
+        """
+        self.enabled = False
+        self._spans: deque = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+    
+    def enable(self):
+        """开启追踪"""
+        self.enabled = True
+    
+    def disable(self):
+        """关闭追踪"""
+        self.enabled = False
+    
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Any]:
+        """
+        记录一个阶段的耗时
+        
+        Args:
+            name: 阶段名称，如 "llm.call"、"kb.faiss_search"
+            **attributes: 附加属性
+        
+        Yields:
+            Span 实例（追踪关闭时为空对象），可在阶段内继续 set_attribute
+        """
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+            with self._lock:
+                self._spans.append(span)
+    
+    def current_span(self) -> Optional[Span]:
+        """当前上下文中的 span"""
+        return _current_span.get()
+    
+    def finished_spans(self) -> List[Span]:
+        """已结束的 span 列表"""
+        with self._lock:
+            return list(self._spans)
+    
+    def clear(self):
+        """清空已记录的 span"""
+        with self._lock:
+            self._spans.clear()
+    
+    def export_jsonl(self, path: str, format: str = "json") -> int:
+        """
+        导出为 JSON lines 文件
+        
+        Args:
+            path: 输出文件路径
+            format: "json" 每行一个简单记录；"otel" 每行一个 OTLP JSON 的 resourceSpans 导出请求
+        
+        Returns:
+            导出的 span 数
+        """
+        spans = self.finished_spans()
+        with open(path, "w", encoding="utf-8") as f:
+            if format == "otel":
+                # 每条 trace 一行，可直接逐行发送给 OTLP/HTTP JSON 接收端
+                traces: Dict[str, List[Span]] = {}
+                for span in spans:
+                    traces.setdefault(span.trace_id, []).append(span)
+                for trace_spans in traces.values():
+                    payload = {"resourceSpans": [{
+                        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "funccall"}}]},
+                        "scopeSpans": [{"scope": {"name": "funccall"},
+                                        "spans": [span.to_otel() for span in trace_spans]}],
+                    }]}
+                    f.write(json.dumps(payload, ensure_ascii=False, default=str) + "\n")
+            else:
+                for span in spans:
+                    f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+        return len(spans)
+    
+    def latency_report(self) -> Dict[str, Dict[str, float]]:
+        """
+        按阶段汇总耗时
+        
+        Returns:
+            {阶段名称: {"count", "total_ms", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"}}
+        """
+        durations: Dict[str, List[float]] = {}
+        for span in self.finished_spans():
+            durations.setdefault(span.name, []).append(span.duration * 1000)
+        
+        report = {}
+        for name, values in durations.items():
+            values.sort()
+            report[name] = {
+                "count": len(values),
+                "total_ms": sum(values),
+                "mean_ms": sum(values) / len(values),
+                "p50_ms": _percentile(values, 0.50),
+                "p95_ms": _percentile(values, 0.95),
+                "p99_ms": _percentile(values, 0.99),
+                "max_ms": values[-1],
+            }
+        return report
+    
+    def format_report(self) -> str:
+        """
+        生成耗时汇总表
+        
+        Returns:
+            按总耗时降序排列的文本表格
+        """
+        report = self.latency_report()
+        if not report:
+            return "没有记录到耗时数据"
+        
+        lines = [f"{'阶段':<28}{'次数':>8}{'总计(ms)':>12}{'p50':>10}{'p95':>10}{'p99':>10}{'最大':>10}"]
+        for name, stats in sorted(report.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+            lines.append(
+                f"{name:<30}{stats['count']:>8}{stats['total_ms']:>12.1f}{stats['p50_ms']:>10.1f}"
+                f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+
+# 全局追踪器实例
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """获取全局追踪器实例"""
+    return _tracer
+
+
+def trace_span(name: str, **attributes):
+    """
+    在全局追踪器上记录一个阶段的耗时
+    
+    用法：
+        with trace_span("kb.faiss_search", kb="flu") as span:
+            ...
+    """
+    return _tracer.span(name, **attributes)
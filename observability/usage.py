@@ -0,0 +1,208 @@
+"""
+大模型用量统计模块
+记录每次模型调用的输入/输出 token 数，按用途（对话首轮、工具结果后的后续轮、构建时生成问题等）分类，
+并可按单次对话、一次批量运行或一次知识库构建汇总
+"""
+
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+# 各模型每千 token 的价格（元）：(输入, 输出)。价格可能调整，以实际账单为准
+MODEL_PRICES = {
+    "qwen-turbo": (0.0003, 0.0006),
+    "qwen-plus": (0.0008, 0.002),
+    "qwen-max": (0.0024, 0.0096),
+}
+
+# 调用用途
+PURPOSE_CHAT_ROUND = "chat_round"
+PURPOSE_TOOL_FOLLOWUP = "tool_followup"
+PURPOSE_QUESTION_GENERATION = "question_generation"
+PURPOSE_OTHER = "other"
+
+
+class UsageTracker:
+    """用量统计类，线程安全"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.cached_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.by_purpose: Dict[str, Dict[str, int]] = {}
+        self.by_model: Dict[str, Dict[str, int]] = {}
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+    
+    def record(self, purpose: str, model: str, input_tokens: int = 0, output_tokens: int = 0,
+               cached: bool = False):
+        """
+        记录一次调用
+        
+        Args:
+            purpose: 调用用途
+            model: 模型名称
+            input_tokens: 输入 token 数
+            output_tokens: 输出 token 数
+            cached: 是否命中响应缓存（命中时不消耗 token）
+        """
+        with self._lock:
+            self.calls += 1
+            self.cached_calls += int(cached)
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            for key, table in ((purpose, self.by_purpose), (model, self.by_model)):
+                stats = table.setdefault(key, {"calls": 0, "cached_calls": 0, "input_tokens": 0, "output_tokens": 0})
+                stats["calls"] += 1
+                stats["cached_calls"] += int(cached)
+                stats["input_tokens"] += input_tokens
+                stats["output_tokens"] += output_tokens
+    
+    def cost(self, prices: Optional[Dict[str, Tuple[float, float]]] = None) -> float:
+        """
+        按模型价格估算费用
+        
+        Args:
+            prices: {模型名称: (输入每千token价格, 输出每千token价格)}，为None时使用 MODEL_PRICES
+        
+        Returns:
+            估算费用（元），价格表中没有的模型不计入
+        """
+        prices = prices or MODEL_PRICES
+        total = 0.0
+        with self._lock:
+            for model, stats in self.by_model.items():
+                if model in prices:
+                    input_price, output_price = prices[model]
+                    total += stats["input_tokens"] / 1000 * input_price + stats["output_tokens"] / 1000 * output_price
+        return total
+    
+    def summary(self) -> Dict[str, Any]:
+        """
+        汇总结果
+        
+        Returns:
+            包含总量、按用途和按模型分类统计以及估算费用的字典
+        """
+        with self._lock:
+            result = {
+                "calls": self.calls,
+                "cached_calls": self.cached_calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.total_tokens,
+                "by_purpose": {key: dict(value) for key, value in self.by_purpose.items()},
+                "by_model": {key: dict(value) for key, value in self.by_model.items()},
+            }
+        result["estimated_cost"] = round(self.cost(), 6)
+        return result
+    
+    def format_summary(self) -> str:
+        """
+        生成用量汇总文本
+        
+        Returns:
+            多行文本
+        """
+        lines = [
+            f"模型调用 {self.calls} 次（缓存命中 {self.cached_calls} 次），"
+            f"输入 {self.input_tokens} tokens，输出 {self.output_tokens} tokens，估算费用 {self.cost():.4f} 元"
+        ]
+        for purpose, stats in sorted(self.by_purpose.items()):
+            lines.append(
+                f"  {purpose}: {stats['calls']} 次，输入 {stats['input_tokens']} tokens，输出 {stats['output_tokens']} tokens"
+            )
+        return "\n".join(lines)
+
+
+_active_trackers: contextvars.ContextVar[Tuple[UsageTracker, ...]] = contextvars.ContextVar("usage_trackers", default=())
+_current_purpose: contextvars.ContextVar[str] = contextvars.ContextVar("usage_purpose", default=PURPOSE_OTHER)
+
+# 进程级别的全局统计，所有调用都会计入
+_global_tracker = UsageTracker()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """获取进程级别的全局用量统计"""
+    return _global_tracker
+
+
+@contextmanager
+def track_usage(tracker: Optional[UsageTracker] = None) -> Iterator[UsageTracker]:
+    """
+    在当前上下文中统计用量，可以嵌套（例如批量运行内的单个对话），每层都会计入
+    
+    Args:
+        tracker: 用量统计实例，为None时新建
+    
+    Yields:
+        UsageTracker 实例
+    """
+    tracker = tracker if tracker is not None else UsageTracker()
+    token = _active_trackers.set(_active_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _active_trackers.reset(token)
+
+
+@contextmanager
+def usage_purpose(purpose: str) -> Iterator[None]:
+    """
+    标记当前上下文中模型调用的用途
+    
+    Args:
+        purpose: 调用用途
+    """
+    token = _current_purpose.set(purpose)
+    try:
+        yield
+    finally:
+        _current_purpose.reset(token)
+
+
+def current_usage_context() -> Tuple[Tuple[UsageTracker, ...], str]:
+    """
+    获取当前上下文的统计目标和用途
+    
+    重试和对冲请求在其他线程中执行，调用方需先在自己的线程中取得上下文再传给 record_usage。
+    
+    Returns:
+        (当前生效的统计实例, 调用用途)
+    """
+    return _active_trackers.get(), _current_purpose.get()
+
+
+def record_usage(context: Tuple[Tuple[UsageTracker, ...], str], model: str, usage: Any = None,
+                 cached: bool = False):
+    """
+    把一次调用的用量计入全局统计和上下文中的所有统计
+    
+    Args:
+        context: current_usage_context() 的返回值
+        model: 模型名称
+        usage: DashScope 响应的 usage（字典或带属性的对象），为None时按0计
+        cached: 是否命中响应缓存
+    """
+    input_tokens = _usage_value(usage, "input_tokens")
+    output_tokens = _usage_value(usage, "output_tokens")
+    trackers, purpose = context
+    for tracker in (_global_tracker,) + trackers:
+        tracker.record(purpose, model, input_tokens, output_tokens, cached)
+
+
+def _usage_value(usage: Any, key: str) -> int:
+    """从 usage 中读取整数字段"""
+    if usage is None:
+        return 0
+    value = usage.get(key) if isinstance(usage, dict) else getattr(usage, key, None)
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
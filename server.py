@@ -0,0 +1,643 @@
+"""
+HTTP服务入口
+基于asyncio的轻量HTTP服务，提供对话接口和知识库查询接口
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import signal
+import socket
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from observability.logger import get_logger, setup_logging
+from observability.usage import UsageTracker, track_usage
+from tools.knowledge_base_tool import DOCUMENT_FILTER_KEYS, get_kb_manager, query_knowledge_base
+
+
+logger = get_logger("server")
+
+# 知识库查询接口的 top_k 上限（与查询工具参数定义一致）
+MAX_TOP_K = 20
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    414: "URI Too Long",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class HTTPError(Exception):
+    """请求处理错误，携带HTTP状态码"""
+    
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class SessionStore:
+    """服务端会话历史存储类，按最近访问淘汰并支持过期"""
+    
+    def __init__(self, ttl: float = 1800.0, max_sessions: int = 10000):
+        """
+        初始化会话存储
+        
+        Args:
+            ttl: 会话空闲多久后过期（秒）
+            max_sessions: 最大会话数，超出时淘汰最久未访问的会话
+        """
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    
+    def get(self, session_id: str) -> Dict[str, Any]:
+        """
+        获取会话，不存在或已过期时创建新会话
+        
+        Args:
+            session_id: 会话ID
+        
+        Returns:
+            会话字典，包含 history、lock 和累计模型用量 usage
+        """
+        self._purge_expired()
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = {"history": [], "lock": asyncio.Lock(), "usage": UsageTracker(), "last_access": time.monotonic()}
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        else:
+            session["last_access"] = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return session
+    
+    def delete(self, session_id: str) -> bool:
+        """
+        删除会话
+        
+        Args:
+            session_id: 会话ID
+        
+        Returns:
+            会话是否存在
+        """
+        return self._sessions.pop(session_id, None) is not None
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def _purge_expired(self):
+        """清理过期会话"""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session["last_access"] <= self.ttl:
+                break
+            self._sessions.pop(session_id)
+
+
+class ConversationServer:
+    """对话HTTP服务类
+    
+    所有请求共享同一个 CustomConversationManager 和全局 KnowledgeBaseManager（及其嵌入模型）。
+    同步的对话处理在线程池中执行；同时执行的请求数受 max_concurrency 限制，
+    排队请求超过 max_pending 时直接返回503，避免无限堆积。
+    """
+    
+    def __init__(self, conversation_manager=None, host: str = "127.0.0.1", port: int = 8000,
+                 max_concurrency: int = 8, max_pending: int = 64, request_timeout: float = 120.0,
+                 session_ttl: float = 1800.0, max_sessions: int = 10000, max_body_bytes: int = 1024 * 1024,
+                 warm_up: bool = True, reuse_port: bool = False):
+        """
+        初始化对话HTTP服务
+        
+        Args:
+            conversation_manager: 对话管理器，为None时使用默认配置创建
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            max_concurrency: 同时处理的最大请求数
+            max_pending: 最大排队请求数，超过后返回503
+            request_timeout: 单个请求的处理超时时间（秒）
+            session_ttl: 会话空闲过期时间（秒）
+            max_sessions: 最大会话数
+            max_body_bytes: 请求体最大字节数
+            warm_up: 启动时是否预先加载知识库管理器
+            reuse_port: 是否设置 SO_REUSEPORT，多个工作进程监听同一端口时由内核分配连接
+        """
+        if conversation_manager is None:
+            from conversation_manager import CustomConversationManager
+            conversation_manager = CustomConversationManager()
+        self.conversation_manager = conversation_manager
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        self.max_body_bytes = max_body_bytes
+        self.warm_up = warm_up
+        self.reuse_port = reuse_port
+        self.sessions = SessionStore(session_ttl, max_sessions)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="conversation")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._in_flight = 0
+        self._connections = set()
+        self._shutting_down = False
+    
+    async def start(self):
+        """启动服务并预热共享的知识库管理器"""
+        loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        # 预先加载嵌入模型和索引，避免第一个请求承担加载耗时
+        if self.warm_up:
+            await loop.run_in_executor(self._executor, get_kb_manager)
+        
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, reuse_port=self.reuse_port or None
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("服务已启动：http://%s:%d", self.host, self.port)
+    
+    async def serve_forever(self):
+        """启动服务并运行到收到 SIGINT/SIGTERM"""
+        await self.start()
+        
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:  # Windows 不支持
+                pass
+        
+        await stop_event.wait()
+        await self.shutdown()
+    
+    async def shutdown(self, timeout: float = 30.0):
+        """
+        优雅关闭：停止接受新连接，等待进行中的请求完成
+        
+        Args:
+            timeout: 等待进行中请求的最长时间（秒）
+        """
+        self._shutting_down = True
+        if self._server is not None:
+            self._server.close()
+        
+        deadline = time.monotonic() + timeout
+        while self._in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        
+        # 关闭空闲的 keep-alive 连接后再等待服务完全关闭
+        for writer in list(self._connections):
+            writer.close()
+        if self._server is not None:
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=False)
+        logger.info("服务已关闭")
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个连接，支持 keep-alive"""
+        self._connections.add(writer)
+        try:
+            while not self._shutting_down:
+                try:
+                    request = await self._read_request(reader)
+                except HTTPError as e:
+                    await self._write_response(writer, e.status, {"error": e.message}, keep_alive=False)
+                    await self._discard_input(reader, writer)
+                    break
+                if request is None:
+                    break
+                
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload, extra_headers = await self._dispatch(method, path, body)
+                await self._write_response(writer, status, payload, keep_alive and not self._shutting_down, extra_headers)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+    
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """
+        读取一个HTTP请求
+        
+        Returns:
+            (方法, 路径, 请求头, 请求体)，连接关闭时返回None
+        """
+        request_line = await self._read_line(reader, 414, "请求行过长")
+        if not request_line:
+            return None
+        
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "请求行格式错误")
+        
+        headers = {}
+        while True:
+            line = await self._read_line(reader, 431, "请求头过长")
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        content_length = headers.get("content-length", "0").strip() or "0"
+        if not content_length.isdigit():
+            raise HTTPError(400, "Content-Length 格式错误")
+        length = int(content_length)
+        if length > self.max_body_bytes:
+            raise HTTPError(413, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path.split("?", 1)[0], headers, body
+    
+    async def _read_line(self, reader: asyncio.StreamReader, status: int, message: str) -> bytes:
+        """
+        读取一行，超过 StreamReader 的缓冲区上限时转为HTTP错误
+        
+        Args:
+            reader: 连接的读取流
+            status: 行过长时返回的状态码
+            message: 行过长时返回的错误信息
+        
+        Returns:
+            读取的行（含换行符），连接关闭时为空
+        """
+        try:
+            return await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            raise HTTPError(status, message)
+    
+    async def _discard_input(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                             timeout: float = 1.0):
+        """
+        错误响应后关闭写方向并丢弃客户端未读完的数据
+        
+        直接关闭仍有未读数据的连接会发送RST，客户端可能收不到已写出的错误响应。
+        
+        Args:
+            reader: 连接的读取流
+            writer: 连接的写入流
+            timeout: 等待客户端关闭连接的最长秒数
+        """
+        if writer.can_write_eof():
+            writer.write_eof()
+        
+        async def drain():
+            while await reader.read(65536):
+                pass
+        
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                              keep_alive: bool = True, extra_headers: Optional[Dict[str, str]] = None):
+        """写出JSON响应"""
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        lines = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(data)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        for name, value in (extra_headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+    
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        """
+        路由请求
+        
+        Returns:
+            (状态码, 响应体, 额外响应头)
+        """
+        routes = {
+            ("POST", "/chat"): self._handle_chat,
+            ("POST", "/kb/query"): self._handle_kb_query,
+        }
+        
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "pid": os.getpid(), "in_flight": self._in_flight, "sessions": len(self.sessions)}, {}
+        if method == "DELETE" and path.startswith("/sessions/"):
+            existed = self.sessions.delete(path[len("/sessions/"):])
+            return (200, {"deleted": True}, {}) if existed else (404, {"error": "会话不存在"}, {})
+        
+        handler = routes.get((method, path))
+        if handler is None:
+            known_paths = {route_path for _, route_path in routes}
+            if path in known_paths:
+                return 405, {"error": "不支持的请求方法"}, {}
+            return 404, {"error": "接口不存在"}, {}
+        
+        # 背压：排队请求过多时直接拒绝，让客户端稍后重试
+        if self._shutting_down or self._in_flight >= self.max_concurrency + self.max_pending:
+            return 503, {"error": "服务繁忙，请稍后重试"}, {"Retry-After": "1"}
+        
+        try:
+            payload = json.loads(body.decode("utf-8") or "{}")
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是JSON对象")
+        except ValueError as e:
+            return 400, {"error": f"请求体不是合法的JSON：{e}"}, {}
+        
+        self._in_flight += 1
+        try:
+            return 200, await asyncio.wait_for(handler(payload), self.request_timeout), {}
+        except HTTPError as e:
+            return e.status, {"error": e.message}, {}
+        except asyncio.TimeoutError:
+            return 504, {"error": "处理超时"}, {}
+        except Exception as e:
+            return 500, {"error": f"处理失败：{e}"}, {}
+        finally:
+            self._in_flight -= 1
+    
+    async def _run_blocking(self, func, *args):
+        """在并发限制内于线程池中执行同步函数"""
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+    
+    async def _handle_chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        对话接口
+        
+        请求体：{"message": "问题", "session_id": "可选，省略时创建新会话"}
+        """
+        message = payload.get("message")
+        if not isinstance(message, str):
+            raise HTTPError(400, "缺少 message 字段")
+        
+        session_id = payload.get("session_id") or uuid.uuid4().hex
+        session = self.sessions.get(session_id)
+        
+        # 同一会话的多个请求按顺序处理，保证历史一致
+        async with session["lock"]:
+            if hasattr(self.conversation_manager, "aprocess_user_input"):
+                answer, history, usage = await self._aprocess_turn(message, session["history"], session["usage"])
+            else:
+                answer, history, usage = await self._run_blocking(
+                    self._process_turn, message, session["history"], session["usage"]
+                )
+            session["history"] = history
+        
+        return {
+            "session_id": session_id,
+            "answer": answer,
+            "usage": {"input_tokens": usage.input_tokens, "output_tokens": usage.output_tokens},
+            "session_usage": {
+                "input_tokens": session["usage"].input_tokens,
+                "output_tokens": session["usage"].output_tokens,
+            },
+        }
+    
+    def _process_turn(self, message: str, history, session_usage: UsageTracker):
+        """
+        在线程池中处理一轮对话并统计模型用量
+        
+        Returns:
+            (回答, 更新后的历史, 本轮用量)
+        """
+        with track_usage(session_usage), track_usage() as usage:
+            answer, history = self.conversation_manager.process_user_input(message, history)
+        return answer, history, usage
+    
+    async def _aprocess_turn(self, message: str, history, session_usage: UsageTracker):
+        """
+        在并发限制内异步处理一轮对话（工具不占用事件循环）并统计模型用量
+        
+        Returns:
+            (回答, 更新后的历史, 本轮用量)
+        """
+        async with self._semaphore:
+            with track_usage(session_usage), track_usage() as usage:
+                answer, history = await self.conversation_manager.aprocess_user_input(message, history)
+        return answer, history, usage
+    
+    async def _handle_kb_query(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        知识库查询接口
+        
+        请求体：{"knowledge_base": "hpv|flu|hiv|all", "query": "查询文本", "top_k": 5,
+                 "filters": {"file_type": "pdf", "source": "指南", "date_from": "2023-01-01"}}（filters 可选）
+        """
+        knowledge_base = payload.get("knowledge_base")
+        query = payload.get("query")
+        if not isinstance(knowledge_base, str) or not isinstance(query, str):
+            raise HTTPError(400, "缺少 knowledge_base 或 query 字段")
+        top_k = _parse_top_k(payload.get("top_k", 5))
+        filters = payload.get("filters") or {}
+        if not isinstance(filters, dict) or set(filters) - set(DOCUMENT_FILTER_KEYS):
+            raise HTTPError(400, f"filters 只支持 {', '.join(DOCUMENT_FILTER_KEYS)}")
+        
+        result = await self._run_blocking(
+            functools.partial(query_knowledge_base, knowledge_base, query, top_k, **filters)
+        )
+        return {"knowledge_base": knowledge_base, "query": query, "result": result}
+
+
+def _parse_top_k(value: Any) -> int:
+    """
+    解析知识库查询接口的 top_k 参数
+    
+    Args:
+        value: 请求体中的 top_k（整数或数字字符串）
+        
+    Returns:
+        限制在 1 到 MAX_TOP_K 之间的结果数量
+        
+    Raises:
+        HTTPError: 不是整数时返回400
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise HTTPError(400, "top_k 必须是整数")
+    try:
+        top_k = int(value)
+    except ValueError:
+        raise HTTPError(400, "top_k 必须是整数") from None
+    return min(max(top_k, 1), MAX_TOP_K)
+
+
+def _worker_main(worker_id: int, encoder, options: Dict[str, Any]):
+    """
+    工作进程入口：使用远程编码器和内存映射索引创建知识库管理器，然后运行HTTP服务
+    
+    Args:
+        worker_id: 工作进程编号
+        encoder: 连接到独立编码进程的 RemoteEncoder
+        options: 服务配置
+    """
+    from conversation_manager import CustomConversationManager
+    from tools.knowledge_base_tool import KnowledgeBaseManager, set_kb_manager
+    from utils import QueryRouter, SemanticAnswerCache, SpeculativeRetrieval
+    
+    setup_logging(options.get("log_level"))
+    set_kb_manager(KnowledgeBaseManager(
+        options["kb_dir"], embedding_model=encoder, mmap=True,
+        batch_max_wait_ms=options.get("batch_wait_ms"), batch_max_size=options.get("batch_size", 32),
+    ))
+    conversation_manager = CustomConversationManager(
+        prompt_mode=options["prompt_mode"],
+        answer_cache=SemanticAnswerCache() if options["answer_cache"] else None,
+        router=QueryRouter() if options.get("route") else None,
+        speculative_retrieval=SpeculativeRetrieval() if options.get("speculative_retrieval") else None,
+    )
+    server = ConversationServer(
+        conversation_manager,
+        host=options["host"],
+        port=options["port"],
+        max_concurrency=options["max_concurrency"],
+        max_pending=options["max_pending"],
+        reuse_port=True,
+    )
+    logger.info("工作进程 %d (pid=%d) 启动", worker_id, os.getpid())
+    asyncio.run(server.serve_forever())
+
+
+def run_workers(num_workers: int, options: Dict[str, Any], embedding: Optional[str] = None):
+    """
+    多进程模式运行服务
+    
+    启动一个独立编码进程和 num_workers 个工作进程。工作进程通过 SO_REUSEPORT 监听同一端口，
+    以内存映射方式只读打开索引和文档（共享页缓存），嵌入向量统一由编码进程计算，
+    因此内存占用不会随工作进程数线性增长。
+    
+    Args:
+        num_workers: 工作进程数
+        options: 服务配置，包含 host、port、max_concurrency、max_pending、prompt_mode、answer_cache、kb_dir，
+            可选 batch_wait_ms、batch_size、route、speculative_retrieval
+        embedding: 编码进程加载的嵌入模型描述（预设名称或 "后端:模型"），为None时读取 KB_EMBEDDING 环境变量，
+            否则为 "minilm"
+    """
+    import multiprocessing
+    from tools.encoder_service import EncoderService
+    
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("当前平台不支持 SO_REUSEPORT，无法使用多进程模式")
+    
+    # 端口为0时先占用一个随机端口，所有工作进程绑定同一个端口号
+    reserved = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    reserved.bind((options["host"], options["port"]))
+    options = dict(options, port=reserved.getsockname()[1])
+    
+    from tools.embedding_backends import DEFAULT_EMBEDDING
+    
+    embedding = embedding or os.getenv("KB_EMBEDDING") or DEFAULT_EMBEDDING
+    encoder_service = EncoderService(embedding, num_clients=num_workers).start()
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=_worker_main, args=(i, encoder_service.client(i), options), name=f"worker-{i}")
+        for i in range(num_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    logger.info("多进程服务：%d 个工作进程监听 http://%s:%d", num_workers, options["host"], options["port"])
+    
+    def _stop(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+    
+    signal.signal(signal.SIGINT, _stop)
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        encoder_service.stop()
+        reserved.close()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="对话HTTP服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址（默认：127.0.0.1）")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口（默认：8000）")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="同时处理的最大请求数（默认：8）")
+    parser.add_argument("--max-pending", type=int, default=64, help="最大排队请求数，超过后返回503（默认：64）")
+    parser.add_argument("--prompt-mode", choices=["text", "messages"], default="text", help="请求格式（默认：text）")
+    parser.add_argument("--answer-cache", action="store_true", help="开启语义答案缓存")
+    parser.add_argument("--route", action="store_true",
+                        help="开启知识库查询路由，能确定问题所属知识库时直接检索，省去首轮模型请求")
+    parser.add_argument("--speculative-retrieval", action="store_true",
+                        help="开启推测检索，首轮模型请求的同时预先检索用户问题")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="工作进程数，大于1时共享内存映射索引和独立编码进程（默认：1）")
+    parser.add_argument("--batch-wait-ms", type=float, default=None,
+                        help="并发知识库查询的凑批等待时间（毫秒），不指定时不开启微批")
+    parser.add_argument("--batch-size", type=int, default=32, help="每批最多合并的查询数（默认：32）")
+    parser.add_argument("--embedding", default=None,
+                        help="知识库默认嵌入模型：预设名称（如 bge-small-zh-onnx）或 后端:模型，默认读取 KB_EMBEDDING 环境变量")
+    parser.add_argument("--log-level", default=None,
+                        help="日志级别：DEBUG、INFO、WARNING（默认读取 LOG_LEVEL 环境变量，否则为 INFO）")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    
+    if args.workers > 1:
+        run_workers(args.workers, {
+            "host": args.host,
+            "port": args.port,
+            "max_concurrency": args.max_concurrency,
+            "max_pending": args.max_pending,
+            "prompt_mode": args.prompt_mode,
+            "answer_cache": args.answer_cache,
+            "route": args.route,
+            "speculative_retrieval": args.speculative_retrieval,
+            "kb_dir": "input",
+            "batch_wait_ms": args.batch_wait_ms,
+            "batch_size": args.batch_size,
+            "log_level": args.log_level,
+        }, embedding=args.embedding)
+        return
+    
+    from conversation_manager import CustomConversationManager
+    from tools.knowledge_base_tool import KnowledgeBaseManager, set_kb_manager
+    from utils import QueryRouter, SemanticAnswerCache, SpeculativeRetrieval
+    
+    if args.batch_wait_ms is not None or args.embedding:
+        set_kb_manager(KnowledgeBaseManager(
+            batch_max_wait_ms=args.batch_wait_ms, batch_max_size=args.batch_size, embedding=args.embedding
+        ))
+    
+    conversation_manager = CustomConversationManager(
+        prompt_mode=args.prompt_mode,
+        answer_cache=SemanticAnswerCache() if args.answer_cache else None,
+        router=QueryRouter() if args.route else None,
+        speculative_retrieval=SpeculativeRetrieval() if args.speculative_retrieval else None,
+    )
+    server = ConversationServer(
+        conversation_manager,
+        host=args.host,
+        port=args.port,
+        max_concurrency=args.max_concurrency,
+        max_pending=args.max_pending,
+    )
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+本地模拟 DashScope 服务
+按预设的故障脚本返回限流、服务端错误、延迟或正常响应，用于测试大模型调用的容错逻辑
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any
+
+
+class FakeDashScopeServer:
+    """模拟 DashScope 文本生成接口的本地服务
+    
+    故障脚本中的每一项对应一次请求，脚本用完后返回 default 响应。每项支持的字段：
+        status: HTTP 状态码，默认200
+        text: 正常响应的文本
+        delay: 返回前等待的秒数
+        retry_after: 错误响应携带的 Retry-After 头
+    
+    消息格式的请求按 DashScope 的规则检查角色，不符合时返回400（不消耗脚本项）。
+    """
+    
+    def __init__(self, script: List[Dict[str, Any]] = None, default: Dict[str, Any] = None):
+        self.script = list(script or [])
+        self.default = default or {"status": 200, "text": "模拟回答"}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+    
+    @property
+    def base_url(self) -> str:
+        """服务地址，传给 SimpleLLMClient 的 base_url"""
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/api/v1"
+    
+    def start(self):
+        """在后台线程中启动服务"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """停止服务"""
+        self._server.shutdown()
+        self._server.server_close()
+    
+    def _next_step(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.requests.append(body)
+            return self.script.pop(0) if self.script else self.default
+    
+    def _make_handler(self):
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                error = _check_messages(body.get("input", {}).get("messages"))
+                if error is not None:
+                    with server._lock:
+                        server.requests.append(body)
+                    step = {"status": 400, "message": error}
+                else:
+                    step = server._next_step(body)
+                
+                if step.get("delay"):
+                    time.sleep(step["delay"])
+                
+                status = step.get("status", 200)
+                if status == 200:
+                    payload = {
+                        "request_id": "fake-request",
+                        "output": {"text": step.get("text", "模拟回答"), "finish_reason": "stop"},
+                        "usage": {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15},
+                    }
+                else:
+                    payload = {"request_id": "fake-request", "code": f"Fake{status}",
+                               "message": step.get("message", "injected fault")}
+                
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    if step.get("retry_after") is not None:
+                        self.send_header("Retry-After", str(step["retry_after"]))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return Handler
+
+
+def _check_messages(messages: List[Dict[str, Any]]):
+    """
+    按 DashScope 的规则检查消息列表
+    
+    Args:
+        messages: 请求中的消息列表，为None时不检查
+    
+    Returns:
+        错误信息，符合规则时返回None
+    """
+    if messages is None:
+        return None
+    tool_call_ids = set()
+    for index, message in enumerate(messages):
+        role = message.get("role")
+        if role == "system" and index == 0:
+            continue
+        if role == "assistant":
+            tool_call_ids.update(call.get("id") for call in message.get("tool_calls") or [])
+        elif role == "tool":
+            if message.get("tool_call_id") not in tool_call_ids:
+                return "tool message must follow an assistant message with a matching tool_call_id"
+        elif role != "user":
+            return f"invalid role: {role}"
+    if not messages or messages[-1].get("role") not in ("user", "tool"):
+        return "the last message must be a user or tool message"
+    return None
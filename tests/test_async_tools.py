@@ -0,0 +1,259 @@
+"""
+异步工具执行测试模块
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from conversation_manager import CustomConversationManager
+from models import ScriptedBackend, SimpleLLMClient
+from tools import ToolCachePolicy, ToolTimeoutError
+from tools.tool_registry import ToolRegistry
+
+
+class TestToolExecution(unittest.TestCase):
+    """工具注册表执行方式测试类"""
+    
+    def setUp(self):
+        self.registry = ToolRegistry(max_workers=8)
+    
+    def test_sync_and_coroutine_tools(self):
+        """测试同步工具和协程工具都可以同步或异步调用"""
+        async def async_echo(text):
+            await asyncio.sleep(0)
+            return f"异步：{text}"
+        
+        self.registry.register_tool("sync_echo", lambda text: f"同步：{text}", {})
+        self.registry.register_tool("async_echo", async_echo, {}, timeout=1)
+        self.assertTrue(self.registry.get_tool_spec("async_echo").is_async)
+        
+        self.assertEqual(self.registry.call_tool("sync_echo", {"text": "a"}), "同步：a")
+        self.assertEqual(self.registry.call_tool("async_echo", {"text": "b"}), "异步：b")
+        self.assertEqual(asyncio.run(self.registry.acall_tool("sync_echo", {"text": "c"})), "同步：c")
+        self.assertEqual(asyncio.run(self.registry.acall_tool("async_echo", {"text": "d"})), "异步：d")
+        with self.assertRaises(KeyError):
+            self.registry.call_tool("missing", {})
+    
+    def test_invalid_registration(self):
+        """测试协程工具不能缓存，并发限制必须为正数"""
+        async def async_echo(text):
+            return text
+        
+        with self.assertRaises(ValueError):
+            self.registry.register_tool("async_echo", async_echo, {}, ToolCachePolicy(cacheable=True))
+        with self.assertRaises(ValueError):
+            self.registry.register_tool("echo", lambda text: text, {}, max_concurrency=0)
+    
+    def test_timeout(self):
+        """测试同步工具和协程工具超时"""
+        async def async_sleep():
+            await asyncio.sleep(1)
+        
+        self.registry.register_tool("sync_sleep", lambda: time.sleep(0.5), {}, timeout=0.05)
+        self.registry.register_tool("async_sleep", async_sleep, {}, timeout=0.05)
+        for name in ("sync_sleep", "async_sleep"):
+            with self.subTest(name=name):
+                with self.assertRaises(ToolTimeoutError):
+                    self.registry.call_tool(name, {})
+                with self.assertRaises(ToolTimeoutError):
+                    asyncio.run(self.registry.acall_tool(name, {}))
+    
+    def test_max_concurrency(self):
+        """测试同时执行的次数不超过工具声明的并发限制"""
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+        
+        def track():
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+        
+        def untrack():
+            with lock:
+                state["running"] -= 1
+        
+        def sync_tool():
+            track()
+            time.sleep(0.02)
+            untrack()
+        
+        async def async_tool():
+            track()
+            await asyncio.sleep(0.02)
+            untrack()
+        
+        self.registry.register_tool("sync_tool", sync_tool, {}, max_concurrency=2)
+        self.registry.register_tool("async_tool", async_tool, {}, max_concurrency=2)
+        
+        async def run(name):
+            await asyncio.gather(*(self.registry.acall_tool(name, {}) for _ in range(6)))
+        
+        for name in ("sync_tool", "async_tool"):
+            with self.subTest(name=name):
+                state["peak"] = 0
+                asyncio.run(run(name))
+                self.assertEqual(state["peak"], 2)
+    
+    def test_max_concurrency_shared(self):
+        """测试同步调用和多个事件循环中的异步调用共用同一个并发限制"""
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+        
+        async def async_tool():
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            await asyncio.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+        
+        self.registry.register_tool("async_tool", async_tool, {}, max_concurrency=2)
+        
+        async def run():
+            await asyncio.gather(*(self.registry.acall_tool("async_tool", {}) for _ in range(4)))
+        
+        threads = [threading.Thread(target=asyncio.run, args=(run(),)) for _ in range(3)]
+        threads += [threading.Thread(target=self.registry.call_tool, args=("async_tool", {})) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(state["peak"], 2)
+        self.assertEqual(state["running"], 0)
+    
+    def test_timed_out_queued_call_not_run(self):
+        """测试排队等待并发名额时超时的调用不再执行，名额转交给后续调用"""
+        started = []
+        release = threading.Event()
+        
+        def blocking(key):
+            started.append(key)
+            release.wait(1)
+            return key
+        
+        async def async_blocking(key):
+            started.append(key)
+            await asyncio.sleep(0.2)
+            return key
+        
+        def hold():
+            with self.assertRaises(ToolTimeoutError):
+                self.registry.call_tool("blocking", {"key": "first"})
+        
+        self.registry.register_tool("blocking", blocking, {}, timeout=0.1, max_concurrency=1)
+        holder = threading.Thread(target=hold)
+        holder.start()
+        time.sleep(0.02)
+        with self.assertRaises(ToolTimeoutError):
+            self.registry.call_tool("blocking", {"key": "queued"})
+        with self.assertRaises(ToolTimeoutError):
+            asyncio.run(self.registry.acall_tool("blocking", {"key": "queued_async"}))
+        release.set()
+        holder.join()
+        time.sleep(0.05)
+        self.assertEqual(started, ["first"])
+        self.assertEqual(self.registry.call_tool("blocking", {"key": "next"}), "next")
+        
+        self.registry.register_tool("async_blocking", async_blocking, {}, timeout=0.1, max_concurrency=1)
+        
+        async def run():
+            return await asyncio.gather(*(self.registry.acall_tool("async_blocking", {"key": key})
+                                          for key in ("a", "b")), return_exceptions=True)
+        
+        started.clear()
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ToolTimeoutError) for result in results))
+        self.assertEqual(started, ["a"])
+        self.assertEqual(self.registry.get_tool_spec("async_blocking").limit._active, 0)
+    
+    def test_default_tools_declare_limits(self):
+        """测试默认工具都声明了超时和并发限制，并发限制之和小于线程池大小"""
+        registry = ToolRegistry()
+        specs = [registry.get_tool_spec(name) for name in registry.list_tools()]
+        for spec in specs:
+            self.assertIsNotNone(spec.timeout)
+            self.assertIsNotNone(spec.max_concurrency)
+        self.assertLess(sum(spec.max_concurrency for spec in specs), registry._max_workers)
+    
+    def test_hung_tool_leaves_threads_for_others(self):
+        """测试卡住的工具占满自己的并发名额后，其他工具仍可执行"""
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.registry.register_tool("hang", lambda: release.wait(2), {}, timeout=0.05, max_concurrency=2)
+        for _ in range(8):
+            with self.assertRaises(ToolTimeoutError):
+                self.registry.call_tool("hang", {})
+        self.assertEqual(self.registry.call_tool("calculate", {"expression": "1+1"}), "计算结果：2")
+    
+    def test_slow_tool_does_not_block_loop(self):
+        """测试慢的同步工具在线程池中执行，事件循环仍能处理其他任务"""
+        self.registry.register_tool("slow", lambda: time.sleep(0.2) or "完成", {})
+        
+        async def run():
+            ticks = 0
+            task = asyncio.ensure_future(self.registry.acall_tool("slow", {}))
+            while not task.done():
+                ticks += 1
+                await asyncio.sleep(0.01)
+            return await task, ticks
+        
+        result, ticks = asyncio.run(run())
+        self.assertEqual(result, "完成")
+        self.assertGreater(ticks, 5)
+
+
+class TestAsyncConversation(unittest.TestCase):
+    """异步对话流程测试类"""
+    
+    def setUp(self):
+        self.registry = ToolRegistry()
+        
+        async def slow_lookup(key):
+            await asyncio.sleep(0.2)
+            return f"{key}的结果"
+        
+        self.registry.register_tool("slow_lookup", slow_lookup, {}, timeout=1)
+        for name, function in (("get_tool_function", self.registry.get_tool), ("call_tool", self.registry.call_tool),
+                               ("acall_tool", self.registry.acall_tool)):
+            patcher = mock.patch(f"conversation_manager.{name}", function)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_tool_calls_run_concurrently(self):
+        """测试同一轮的多个工具调用并发执行，回答与同步流程一致"""
+        tool_calls = "\n".join(
+            f'<tool_call>\n工具名称：slow_lookup\n参数：{{"key": "{key}"}}\n</tool_call>' for key in ("甲", "乙", "丙")
+        )
+        client = SimpleLLMClient(model="scripted-async-tools", backend=ScriptedBackend([tool_calls]))
+        manager = CustomConversationManager(llm_client=client)
+        
+        start = time.perf_counter()
+        answer, history = asyncio.run(manager.aprocess_user_input("查一下甲乙丙"))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        for key in ("甲", "乙", "丙"):
+            self.assertIn(f"{key}的结果", answer)
+        
+        client = SimpleLLMClient(model="scripted-sync-tools", backend=ScriptedBackend([tool_calls]))
+        manager = CustomConversationManager(llm_client=client)
+        self.assertEqual(manager.process_user_input("查一下甲乙丙"), (answer, history))
+    
+    def test_tool_timeout_reported(self):
+        """测试工具超时作为工具调用失败返回给模型"""
+        async def hang():
+            await asyncio.sleep(1)
+        
+        self.registry.register_tool("hang", hang, {}, timeout=0.05)
+        tool_call = "<tool_call>\n工具名称：hang\n参数：{}\n</tool_call>"
+        client = SimpleLLMClient(model="scripted-async-timeout", backend=ScriptedBackend([tool_call]))
+        manager = CustomConversationManager(llm_client=client)
+        
+        answer, _ = asyncio.run(manager.aprocess_user_input("等一下"))
+        self.assertIn("工具调用失败", answer)
+        self.assertIn("超时", answer)
+
+
+if __name__ == "__main__":
+    unittest.main()
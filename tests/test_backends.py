@@ -0,0 +1,129 @@
+"""
+大模型后端测试模块
+"""
+
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from conversation_manager import CustomConversationManager
+from models import LatencyModel, RateLimitError, RetryPolicy, ScriptedBackend, SimpleLLMClient, create_backend
+
+
+class TestLatencyModel(unittest.TestCase):
+    """延迟分布测试类"""
+    
+    def test_parse_and_sample(self):
+        """测试解析分布并按参数抽样"""
+        self.assertAlmostEqual(LatencyModel.parse("fixed:250").sample(), 0.25)
+        uniform = LatencyModel.parse("uniform:100,200", seed=1)
+        samples = [uniform.sample() for _ in range(100)]
+        self.assertTrue(all(0.1 <= value <= 0.2 for value in samples))
+        self.assertEqual(LatencyModel.parse(None).sample(), 0.0)
+    
+    def test_seed_is_reproducible(self):
+        """测试固定种子后延迟序列相同"""
+        first = LatencyModel.parse("lognormal:800,0.5", seed=7)
+        second = LatencyModel.parse("lognormal:800,0.5", seed=7)
+        self.assertEqual([first.sample() for _ in range(5)], [second.sample() for _ in range(5)])
+    
+    def test_invalid_spec(self):
+        """测试不支持的分布和参数个数错误"""
+        with self.assertRaises(ValueError):
+            LatencyModel.parse("poisson:3")
+        with self.assertRaises(ValueError):
+            LatencyModel.parse("uniform:100")
+
+
+class TestScriptedBackend(unittest.TestCase):
+    """脚本化后端测试类"""
+    
+    def _client(self, backend, **kwargs):
+        return SimpleLLMClient(model=f"scripted-{id(backend)}", backend=backend, **kwargs)
+    
+    def test_script_then_rules(self):
+        """测试按顺序返回脚本，用完后按规则生成工具调用"""
+        client = self._client(ScriptedBackend(["第一条", {"text": "第二条"}]))
+        self.assertEqual(client.call("问题"), "第一条")
+        self.assertEqual(client.call_with_messages([{"role": "user", "content": "问题"}]), "第二条")
+        self.assertIn("<tool_call>", client.call("当前用户的问题是：流感疫苗的保护期是多久？"))
+    
+    def test_injected_fault_is_retried(self):
+        """测试脚本中的错误码按真实接口的错误分类处理"""
+        backend = ScriptedBackend([{"status": 429, "retry_after": 0}, "恢复"])
+        client = self._client(backend, retry_policy=RetryPolicy(max_attempts=2, base_delay=0))
+        self.assertEqual(client.call("问题"), "恢复")
+        
+        client = self._client(ScriptedBackend([{"status": 429}]), retry_policy=RetryPolicy(max_attempts=1))
+        with self.assertRaises(RateLimitError):
+            client.call("问题")
+    
+    def test_stream_chunks(self):
+        """测试流式输出按分块产出，拼接后与完整文本一致"""
+        client = self._client(ScriptedBackend(["流感疫苗每年接种一次"], chunk_size=4))
+        chunks = list(client.stream_call("问题"))
+        self.assertEqual(chunks, ["流感疫苗", "每年接种", "一次"])
+    
+    def test_latency_applied(self):
+        """测试请求前按延迟分布等待"""
+        client = self._client(ScriptedBackend(latency=LatencyModel("fixed", 50)))
+        start = time.perf_counter()
+        client.call("问题")
+        self.assertGreaterEqual(time.perf_counter() - start, 0.045)
+    
+    def test_recorded_requests_bounded(self):
+        """测试只保留最近的请求，请求总数单独计数"""
+        backend = ScriptedBackend(max_recorded_requests=2)
+        client = self._client(backend)
+        for i in range(5):
+            client.call(f"当前用户的问题是：问题{i}")
+        self.assertEqual(backend.request_count, 5)
+        self.assertEqual([request["prompt"] for request in backend.requests],
+                         ["当前用户的问题是：问题3", "当前用户的问题是：问题4"])
+        
+        backend = ScriptedBackend(max_recorded_requests=0)
+        self._client(backend).call("问题")
+        self.assertEqual((backend.request_count, len(backend.requests)), (1, 0))
+    
+    def test_replay_from_jsonl(self):
+        """测试从 JSON lines 文件回放响应"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "script.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(json.dumps("回放一", ensure_ascii=False) + "\n")
+                f.write(json.dumps({"text": "回放二"}, ensure_ascii=False) + "\n")
+            client = self._client(ScriptedBackend.from_jsonl(path))
+            self.assertEqual([client.call("a"), client.call("b")], ["回放一", "回放二"])
+    
+    def test_create_backend_from_env(self):
+        """测试通过环境变量选择后端，脚本化后端不需要API密钥"""
+        with patch.dict(os.environ, {"LLM_BACKEND": "scripted", "LLM_BACKEND_LATENCY": "fixed:0"}):
+            self.assertIsInstance(create_backend(), ScriptedBackend)
+        with self.assertRaises(ValueError):
+            create_backend("unknown")
+        with self.assertRaises(ValueError):
+            create_backend("dashscope", api_key=None)
+
+
+class TestOfflineConversation(unittest.TestCase):
+    """使用脚本化后端的完整对话测试类"""
+    
+    def test_tool_round_then_answer(self):
+        """测试首轮输出工具调用，拿到工具结果后输出最终回答"""
+        for prompt_mode in ("text", "messages"):
+            for stream in (False, True):
+                with self.subTest(prompt_mode=prompt_mode, stream=stream):
+                    client = SimpleLLMClient(model="scripted-conversation", backend=ScriptedBackend())
+                    manager = CustomConversationManager(llm_client=client, prompt_mode=prompt_mode, stream=stream)
+                    
+                    answer, history = manager.process_user_input("请计算 (12 + 30) * 4 / 7")
+                    self.assertIn("计算结果：24", answer)
+                    self.assertEqual([message["role"] for message in history],
+                                     ["user", "assistant", "tool", "assistant"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+批量检索测试模块
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from batch_qa_processor import BatchRetrievalProcessor, main
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType
+from tests.test_cross_kb_search import HashEncoder, _build
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestBatchRetrieval(unittest.TestCase):
+    """批量检索测试类"""
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        _build(os.path.join(self.tmp, "kb"), HashEncoder())
+        self.manager = KnowledgeBaseManager(os.path.join(self.tmp, "kb"), embedding_model=HashEncoder())
+        self.addCleanup(self.manager.close)
+    
+    def test_matches_single_search(self):
+        """测试分批矩阵搜索的命中与逐个搜索一致"""
+        questions = [f"{kb_type.value}内容{i}" for kb_type in KnowledgeBaseType for i in range(6)]
+        for knowledge_base in ("flu", "all"):
+            with self.subTest(knowledge_base=knowledge_base):
+                processor = BatchRetrievalProcessor(self.manager, knowledge_base, top_k=3, chunk_size=4)
+                rows = processor.search(questions)
+                self.assertEqual([row["序号"] for row in rows], list(range(1, len(questions) + 1)))
+                for question, row in zip(questions, rows):
+                    if knowledge_base == "flu":
+                        expected = self.manager.search_knowledge_base(KnowledgeBaseType.FLU, question, 3)
+                    else:
+                        expected = self.manager.search_all_knowledge_bases(question, 3)
+                    self.assertEqual([row[f"命中{rank}标题"] for rank in range(1, 4)],
+                                     [hit["title"] for hit in expected])
+                    self.assertEqual(row["状态"], "成功")
+                # 问题与文档内容相同时排在第一位
+                self.assertEqual(rows[6]["命中1标题"], "flu - 第1段")
+    
+    def test_unsearchable_knowledge_base_reported(self):
+        """测试不可搜索的知识库的原因写入每一行的错误列"""
+        self.manager.load_errors[KnowledgeBaseType.HIV] = "索引文件损坏"
+        questions = ["hpv内容1", "flu内容2"]
+        
+        rows = BatchRetrievalProcessor(self.manager, "all", top_k=2).search(questions)
+        for row in rows:
+            self.assertEqual(row["状态"], "成功")
+            self.assertEqual(row["错误"], "hiv 知识库加载失败：索引文件损坏")
+        self.assertEqual(rows[0]["命中1知识库"], "hpv")
+        
+        rows = BatchRetrievalProcessor(self.manager, "hiv", top_k=2).search(questions)
+        for row in rows:
+            self.assertEqual(row["状态"], "失败")
+            self.assertEqual(row["命中数"], 0)
+            self.assertEqual(row["错误"], "hiv 知识库加载失败：索引文件损坏")
+    
+    def test_unsearchable_reasons(self):
+        """测试不可搜索的原因去重，全部可以搜索时为空"""
+        self.assertEqual(self.manager.unsearchable_reasons(), [])
+        with mock.patch("tools.knowledge_base_tool.FAISS_AVAILABLE", False):
+            self.assertEqual(self.manager.unsearchable_reasons(), ["FAISS未安装，无法进行向量搜索"])
+        self.manager.load_errors[KnowledgeBaseType.HIV] = "索引文件损坏"
+        self.assertEqual(self.manager.unsearchable_reasons([KnowledgeBaseType.HPV]), [])
+        self.assertEqual(self.manager.unsearchable_reasons(), ["hiv 知识库加载失败：索引文件损坏"])
+    
+    def test_invalid_top_k_rejected(self):
+        """测试检索模式的 --top-k 小于1时命令行报错"""
+        for value in ("0", "-1"):
+            with self.subTest(value=value):
+                argv = ["batch_qa_processor.py", "questions.xlsx", "--retrieval-only", "--top-k", value]
+                with mock.patch("sys.argv", argv), mock.patch("sys.stderr"), \
+                        self.assertRaises(SystemExit) as cm:
+                    main()
+                self.assertEqual(cm.exception.code, 2)
+    
+    def test_excel_output(self):
+        """测试从表格读取问题，结果和统计写入输出表格"""
+        input_file = os.path.join(self.tmp, "questions.xlsx")
+        output_file = os.path.join(self.tmp, "results.xlsx")
+        pd.DataFrame({"问题": ["hpv内容1", None, "hiv内容2"]}).to_excel(input_file, index=False)
+        
+        processor = BatchRetrievalProcessor(self.manager, "hpv,hiv", top_k=2)
+        summary = processor.process_excel_file(input_file, output_file)
+        self.assertIn("批量检索完成", summary)
+        
+        results = pd.read_excel(output_file, sheet_name="检索结果")
+        self.assertEqual(results["问题"].tolist(), ["hpv内容1", "hiv内容2"])
+        self.assertEqual(results["命中1知识库"].tolist(), ["hpv", "hiv"])
+        self.assertIn("命中2分数", results.columns)
+        self.assertIn("检索耗时(ms)", results.columns)
+        stats = pd.read_excel(output_file, sheet_name="统计")
+        self.assertIn("每秒问题数", stats["指标"].tolist())
+        
+        self.assertIn("未找到列", processor.process_excel_file(input_file, output_file, question_column="问句"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+计算器编译和进程池测试模块
+"""
+
+import unittest
+from unittest import mock
+
+import tools.calculator_tool as calculator_tool
+from tools import calculate_many
+from tools.calculator_tool import CalculatorPool, compile_expression, evaluate_expression, set_calculator_pool
+
+
+class TestCompiledExpression(unittest.TestCase):
+    """表达式编译测试类"""
+    
+    def test_results_match_previous_format(self):
+        """测试计算结果和错误信息的格式"""
+        cases = {
+            "2+3*4": "计算结果：14",
+            "SQRT(16) + pow(2, 3)": "计算结果：12",
+            "10/3": "计算结果：3.3333",
+            "-3**2": "计算结果：-9",
+            "abs(-2.5)": "计算结果：2.5000",
+            "1/0": "错误：除数不能为零",
+            "import os": "错误：表达式包含不允许的字符",
+            "2 % 3": "错误：表达式包含不允许的字符",
+            "x + 1": "错误：不支持的名称：x",
+            "exit(1)": "错误：不支持的函数：exit",
+            "(1, 2)": "错误：不支持的表达式",
+        }
+        for expression, expected in cases.items():
+            with self.subTest(expression=expression):
+                self.assertEqual(evaluate_expression(expression), expected)
+    
+    def test_large_power_rejected(self):
+        """测试结果过大的整数乘方不执行"""
+        self.assertEqual(evaluate_expression("9**9**9"), "计算错误：结果过大")
+        self.assertEqual(evaluate_expression("2**100"), f"计算结果：{2 ** 100}")
+    
+    def test_compiled_cache(self):
+        """测试相同表达式只编译一次"""
+        compile_expression.cache_clear()
+        compile_expression("(17 + 25) * 3")
+        compile_expression("(17 + 25) * 3")
+        self.assertEqual(compile_expression.cache_info().hits, 1)
+
+
+class TestCalculatorPool(unittest.TestCase):
+    """计算器进程池测试类"""
+    
+    def test_calculate_many(self):
+        """测试批量计算按输入顺序返回结果，相同表达式只计算一次"""
+        pool = CalculatorPool()
+        self.addCleanup(pool.close)
+        self.addCleanup(set_calculator_pool, calculator_tool._calculator_pool)
+        set_calculator_pool(pool)
+        
+        expressions = [f"{i} * 3 + sqrt({i})" for i in range(600)] + ["1/0", "0 * 3 + sqrt(0)"]
+        results = calculate_many(expressions)
+        self.assertEqual(len(results), len(expressions))
+        self.assertEqual(results[4], "计算结果：14")
+        self.assertEqual(results[-2:], ["错误：除数不能为零", "计算结果：0"])
+        self.assertEqual(calculate_many([]), [])
+    
+    def test_single_expression_inline(self):
+        """测试单个表达式不经过进程池"""
+        pool = CalculatorPool()
+        self.addCleanup(set_calculator_pool, calculator_tool._calculator_pool)
+        set_calculator_pool(pool)
+        self.assertEqual(calculator_tool.calculate("9**9**9"), "计算错误：结果过大")
+        self.assertIsNone(pool._executor)
+    
+    def test_inline_fallback(self):
+        """测试无法创建工作进程时在当前进程中计算"""
+        pool = CalculatorPool()
+        with mock.patch.object(calculator_tool, "ProcessPoolExecutor", side_effect=OSError("不支持")):
+            self.assertEqual(pool.calculate("2+3*4"), "计算结果：14")
+        self.assertIsNone(pool._executor)
+
+
+@unittest.skipUnless(calculator_tool.RESOURCE_AVAILABLE, "需要 resource 模块")
+class TestCalculatorLimits(unittest.TestCase):
+    """计算器资源限制测试类（工作进程中去掉乘方位数限制模拟病态表达式）"""
+    
+    def _pool(self, **kwargs):
+        pool = CalculatorPool(max_workers=1, max_integer_bits=10 ** 12, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+    
+    def test_timeout_recovers(self):
+        """测试等待超时后终止工作进程，之后的计算正常进行"""
+        pool = self._pool(timeout=0.3, cpu_seconds=None)
+        self.assertEqual(pool.calculate("9**9**9"), "错误：计算超时")
+        self.assertEqual(pool.calculate("2+3*4"), "计算结果：14")
+    
+    def test_cpu_limit(self):
+        """测试超出 CPU 时间限制的工作进程被终止"""
+        pool = self._pool(timeout=30, cpu_seconds=1)
+        self.assertEqual(pool.calculate("9**9**9"), "错误：计算超出资源限制")
+        self.assertEqual(pool.calculate("2+3*4"), "计算结果：14")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,184 @@
+"""
+跨知识库搜索与文档过滤测试模块
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import tools.knowledge_base_tool as knowledge_base_tool
+from models.backends import _choose_tool_call
+from tools.knowledge_base_tool import (FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType, KnowledgeDocument,
+                                       match_document_filters, query_knowledge_base, set_kb_manager)
+
+
+class HashEncoder:
+    """确定性的测试编码器：相同文本总是得到相同向量"""
+    
+    dimension = 16
+    
+    def encode(self, texts, **kwargs):
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).random(self.dimension))
+        return np.asarray(vectors, dtype="float32")
+
+
+def _documents(kb_type: KnowledgeBaseType):
+    """每个知识库 6 篇文档：偶数为 PDF（2023 年），奇数为 Excel（2024 年）"""
+    documents = []
+    for i in range(6):
+        file_type = "pdf" if i % 2 == 0 else "excel"
+        documents.append(KnowledgeDocument(
+            id=f"{kb_type.value}_{file_type}_{i}", title=f"{kb_type.value} - 第{i+1}段", content=f"{kb_type.value}内容{i}",
+            summary=[f"问题{i}"], source=f"input/{kb_type.value}/{file_type}/{kb_type.value}指南.{file_type}",
+            file_type=file_type, metadata={"date": f"{2023 + i % 2}-0{i % 6 + 1}-15"},
+        ))
+    return documents
+
+
+def _build(base_dir: str, encoder: HashEncoder):
+    import faiss
+    
+    for kb_type in KnowledgeBaseType:
+        kb_dir = os.path.join(base_dir, kb_type.value)
+        os.makedirs(kb_dir)
+        documents = _documents(kb_type)
+        index = faiss.IndexFlatL2(encoder.dimension)
+        index.add(encoder.encode([document.content for document in documents]))
+        faiss.write_index(index, os.path.join(kb_dir, f"{kb_type.value}_index.faiss"))
+        with open(os.path.join(kb_dir, f"{kb_type.value}_documents.pkl"), "wb") as f:
+            pickle.dump(documents, f)
+
+
+class TestDocumentFilters(unittest.TestCase):
+    """文档过滤条件测试类"""
+    
+    def test_match(self):
+        """测试文件类型、来源和日期范围条件"""
+        pdf, excel = _documents(KnowledgeBaseType.FLU)[:2]
+        self.assertTrue(match_document_filters(pdf, {"file_type": "pdf"}))
+        self.assertFalse(match_document_filters(excel, {"file_type": "pdf"}))
+        self.assertTrue(match_document_filters(excel, {"file_type": ["pdf", "excel"]}))
+        self.assertTrue(match_document_filters(pdf, {"source": "FLU指南"}))
+        self.assertFalse(match_document_filters(pdf, {"source": "hpv"}))
+        self.assertTrue(match_document_filters(excel, {"date_from": "2024-01-01", "date_to": "2024-12-31"}))
+        self.assertFalse(match_document_filters(pdf, {"date_from": "2024-01-01"}))
+        
+        undated = KnowledgeDocument("id", "标题", "内容", "摘要", "来源", "pdf")
+        self.assertFalse(match_document_filters(undated, {"date_to": "2030-01-01"}))
+        with self.assertRaises(ValueError):
+            match_document_filters(pdf, {"author": "张三"})
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestCrossKnowledgeBaseSearch(unittest.TestCase):
+    """跨知识库搜索测试类"""
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.encoder = HashEncoder()
+        _build(tmp.name, self.encoder)
+        self.manager = KnowledgeBaseManager(tmp.name, embedding_model=self.encoder)
+        self.addCleanup(self.manager.close)
+    
+    def test_merged_by_distance(self):
+        """测试一次搜索全部知识库，结果按距离合并并重新编号"""
+        results = self.manager.search_all_knowledge_bases("hiv内容3", k=4)
+        self.assertEqual(results[0]["knowledge_base"], "hiv")
+        self.assertEqual(results[0]["content"], "hiv内容3")
+        self.assertEqual([result["rank"] for result in results], [1, 2, 3, 4])
+        distances = [result["distance"] for result in results]
+        self.assertEqual(distances, sorted(distances))
+        
+        per_kb = {kb_type.value: self.manager.search_knowledge_base(kb_type, "hiv内容3", 4) for kb_type in KnowledgeBaseType}
+        expected = sorted((result["distance"] for results in per_kb.values() for result in results))[:4]
+        np.testing.assert_allclose(distances, expected)
+    
+    def test_subset_and_filters(self):
+        """测试只搜索部分知识库，并按文件类型和日期过滤"""
+        results = self.manager.search_all_knowledge_bases(
+            "flu内容3", k=10, kb_types=[KnowledgeBaseType.FLU, KnowledgeBaseType.HPV], filters={"file_type": "excel"}
+        )
+        self.assertEqual(len(results), 6)
+        self.assertEqual({result["knowledge_base"] for result in results}, {"flu", "hpv"})
+        self.assertTrue(all(result["file_type"] == "excel" for result in results))
+        
+        results = self.manager.search_knowledge_base(KnowledgeBaseType.FLU, "flu内容1", 5,
+                                                     {"date_from": "2023-01-01", "date_to": "2023-12-31"})
+        self.assertEqual(sorted(result["content"] for result in results), ["flu内容0", "flu内容2", "flu内容4"])
+        self.assertEqual(self.manager.search_knowledge_base(KnowledgeBaseType.FLU, "flu内容1", 5, {"source": "不存在"}), [])
+    
+    def test_invalid_filter_returns_error(self):
+        """测试不支持的过滤条件以错误结果返回"""
+        results = self.manager.search_knowledge_base(KnowledgeBaseType.FLU, "问题", 3, {"author": "张三"})
+        self.assertIn("不支持的过滤条件", results[0]["error"])
+    
+    def test_filters_on_quantized_indexes(self):
+        """测试量化索引（含不支持 IDSelector 的乘积量化）同样按条件过滤"""
+        for quantization in ("sq8", "pq4"):
+            with self.subTest(quantization=quantization):
+                self.manager.quantize_knowledge_base(KnowledgeBaseType.FLU, quantization)
+                results = self.manager.search_knowledge_base(KnowledgeBaseType.FLU, "flu内容3", 5, {"file_type": "excel"})
+                self.assertEqual(results[0]["content"], "flu内容3")
+                self.assertEqual(len(results), 3)
+                self.assertTrue(all(result["file_type"] == "excel" for result in results))
+    
+    def test_failed_knowledge_bases_skipped(self):
+        """测试部分知识库不可搜索或搜索失败时合并其余知识库的结果并列出原因，全部失败时才返回错误"""
+        self.manager.load_errors[KnowledgeBaseType.HIV] = "索引文件损坏"
+        search_vectors = self.manager._search_vectors
+        
+        def failing_flu(kb_type, *args, **kwargs):
+            if kb_type == KnowledgeBaseType.FLU:
+                return [[{"error": "搜索失败: 磁盘错误"}]]
+            return search_vectors(kb_type, *args, **kwargs)
+        
+        with mock.patch.object(self.manager, "_search_vectors", side_effect=failing_flu):
+            results, errors = self.manager.search_all_knowledge_bases_with_errors("hpv内容2", k=3)
+            self.assertEqual(results[0]["content"], "hpv内容2")
+            self.assertEqual({result["knowledge_base"] for result in results}, {"hpv"})
+            self.assertEqual(errors, ["hiv 知识库加载失败：索引文件损坏", "flu: 搜索失败: 磁盘错误"])
+            
+            previous = knowledge_base_tool._kb_manager
+            set_kb_manager(self.manager)
+            self.addCleanup(set_kb_manager, previous)
+            text = query_knowledge_base("all", "hpv内容2", top_k=3)
+            self.assertIn("知识库: HPV", text)
+            self.assertIn("以下知识库未能搜索：hiv 知识库加载失败：索引文件损坏；flu: 搜索失败: 磁盘错误", text)
+            
+            results = self.manager.search_all_knowledge_bases("hpv内容2", k=3,
+                                                              kb_types=[KnowledgeBaseType.FLU, KnowledgeBaseType.HIV])
+            self.assertEqual(results, [{"error": "hiv 知识库加载失败：索引文件损坏；flu: 搜索失败: 磁盘错误"}])
+    
+    def test_query_tool_all(self):
+        """测试查询工具支持 all 和过滤参数，结果标注所属知识库"""
+        previous = knowledge_base_tool._kb_manager
+        set_kb_manager(self.manager)
+        self.addCleanup(set_kb_manager, previous)
+        
+        text = query_knowledge_base("all", "hpv内容2", top_k=3, file_type="pdf")
+        self.assertIn("知识库: HPV", text)
+        self.assertIn("原文内容: hpv内容2", text)
+        self.assertNotIn("文件类型: excel", text)
+        self.assertIn("错误", query_knowledge_base("flu,abc", "问题"))
+
+
+class TestScriptedMultiTopicQuery(unittest.TestCase):
+    """脚本化后端多主题查询测试类"""
+    
+    def test_multi_topic_uses_all(self):
+        """测试问题同时涉及多个知识库时，生成一次查询全部知识库的工具调用"""
+        self.assertIn('"knowledge_base": "all"', _choose_tool_call("HPV疫苗和流感疫苗可以同时接种吗？"))
+        self.assertIn('"knowledge_base": "hpv"', _choose_tool_call("HPV疫苗几岁可以接种？"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,220 @@
+"""
+嵌入模型后端测试模块
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from tools.embedding_backends import (ONNX_AVAILABLE, EmbeddingBackend, EmbeddingSpec, check_index_compatibility,
+                                      create_embedding_backend, parse_embedding_spec, read_index_metadata,
+                                      register_embedding_backend, write_index_metadata)
+from tools.encoder_service import EncoderService
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType, KnowledgeDocument
+
+
+class HashBackend(EmbeddingBackend):
+    """确定性的测试后端：维度取自模型名称，如 hash:dim8"""
+    
+    def __init__(self, spec: EmbeddingSpec):
+        super().__init__(spec)
+        spec.dimension = int(spec.model.replace("dim", ""))
+    
+    def encode(self, texts, **kwargs):
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.md5(f"{self.spec.model}:{text}".encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).random(self.spec.dimension))
+        return np.asarray(vectors, dtype="float32")
+
+
+register_embedding_backend("hash", HashBackend)
+
+
+def _build_index(base_dir: str, kb_type: KnowledgeBaseType, spec_text: str, record: bool = True):
+    """用指定的测试后端构建索引，record 为 False 时模拟旧版本（没有元数据）"""
+    import faiss
+    
+    backend = create_embedding_backend(spec_text)
+    documents = [
+        KnowledgeDocument(
+            id=f"{kb_type.value}_pdf_guide_{i}", title=f"指南 - 第{i+1}段", content=f"内容{i}",
+            summary=[f"问题{i}"], source="guide.pdf", file_type="pdf", metadata={"chunk_index": i},
+        )
+        for i in range(5)
+    ]
+    kb_dir = os.path.join(base_dir, kb_type.value)
+    os.makedirs(kb_dir, exist_ok=True)
+    index_file = os.path.join(kb_dir, f"{kb_type.value}_index.faiss")
+    vectors = backend.encode([document.content for document in documents])
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, index_file)
+    with open(os.path.join(kb_dir, f"{kb_type.value}_documents.pkl"), "wb") as f:
+        pickle.dump(documents, f)
+    if record:
+        import pathlib
+        write_index_metadata(pathlib.Path(index_file), backend.describe(), dimension=vectors.shape[1])
+
+
+class TestEmbeddingSpec(unittest.TestCase):
+    """模型描述解析测试类"""
+    
+    def test_parse(self):
+        """测试预设名称、"后端:模型" 和旧版本的模型名称"""
+        preset = parse_embedding_spec("bge-small-zh-onnx")
+        self.assertEqual((preset.backend, preset.dimension, preset.options["pooling"]), ("onnx", 512, "cls"))
+        preset.options["pooling"] = "mean"
+        self.assertEqual(parse_embedding_spec("bge-small-zh-onnx").options["pooling"], "cls")
+        
+        self.assertEqual(parse_embedding_spec("onnx:/models/bge").identity(), {"backend": "onnx", "model": "/models/bge"})
+        legacy = parse_embedding_spec("all-MiniLM-L6-v2")
+        self.assertEqual((legacy.backend, legacy.dimension), ("sentence-transformers", 384))
+        self.assertEqual(parse_embedding_spec("BAAI/bge-m3").backend, "sentence-transformers")
+    
+    def test_compatibility(self):
+        """测试维度或模型不一致时给出错误信息"""
+        metadata = {"embedding": {"backend": "hash", "model": "dim8"}}
+        self.assertIsNone(check_index_compatibility(metadata, EmbeddingSpec("hash", "dim8", 8), 8))
+        self.assertIn("维度不匹配", check_index_compatibility(None, EmbeddingSpec("hash", "dim4", 4), 8))
+        self.assertIn("模型不匹配", check_index_compatibility(metadata, EmbeddingSpec("onnx", "dim8", 8), 8))
+        # 旧版本索引没有元数据，也无法描述的自定义模型只检查维度
+        self.assertIsNone(check_index_compatibility(None, None, 8))
+    
+    def test_unknown_backend(self):
+        """测试未注册的后端"""
+        with self.assertRaises(ValueError):
+            create_embedding_backend(EmbeddingSpec("unknown", "model"))
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestPerKnowledgeBaseEmbedding(unittest.TestCase):
+    """按知识库选择嵌入模型的测试类"""
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base_dir = tmp.name
+    
+    def _manager(self, **kwargs) -> KnowledgeBaseManager:
+        manager = KnowledgeBaseManager(self.base_dir, embedding="hash:dim8", **kwargs)
+        self.addCleanup(manager.close)
+        return manager
+    
+    def test_models_selected_from_metadata(self):
+        """测试每个知识库使用构建索引时记录的模型，维度不同的知识库可以同时检索"""
+        _build_index(self.base_dir, KnowledgeBaseType.FLU, "hash:dim8")
+        _build_index(self.base_dir, KnowledgeBaseType.HPV, "hash:dim16")
+        for batch_max_wait_ms in (None, 2):
+            with self.subTest(batch_max_wait_ms=batch_max_wait_ms):
+                manager = self._manager(batch_max_wait_ms=batch_max_wait_ms)
+                self.assertEqual(manager.load_errors, {})
+                self.assertEqual(manager.indices[KnowledgeBaseType.HPV].d, 16)
+                
+                results = manager.search_knowledge_base(KnowledgeBaseType.FLU, "内容3", k=1)
+                self.assertEqual(results[0]["content"], "内容3")
+                results = manager.search_knowledge_base(KnowledgeBaseType.HPV, "内容1", k=1)
+                self.assertEqual(results[0]["content"], "内容1")
+    
+    def test_mismatched_model_rejected(self):
+        """测试配置的模型与索引记录的模型不一致时拒绝加载，检索返回错误"""
+        _build_index(self.base_dir, KnowledgeBaseType.FLU, "hash:dim8")
+        manager = self._manager(kb_embeddings={"flu": "hash:dim16"})
+        self.assertIn(KnowledgeBaseType.FLU, manager.load_errors)
+        self.assertIsNone(manager.indices[KnowledgeBaseType.FLU])
+        
+        results = manager.search_knowledge_base(KnowledgeBaseType.FLU, "内容3")
+        self.assertIn("error", results[0])
+        self.assertIn("维度不匹配", results[0]["error"])
+    
+    def test_legacy_index_checks_dimension(self):
+        """测试没有元数据的旧索引按默认模型加载，只检查维度"""
+        _build_index(self.base_dir, KnowledgeBaseType.FLU, "hash:dim8", record=False)
+        _build_index(self.base_dir, KnowledgeBaseType.HPV, "hash:dim16", record=False)
+        manager = self._manager()
+        self.assertIsNotNone(manager.indices[KnowledgeBaseType.FLU])
+        self.assertIn(KnowledgeBaseType.HPV, manager.load_errors)
+    
+    def test_metadata_round_trip(self):
+        """测试元数据写出后可以读回"""
+        import pathlib
+        
+        _build_index(self.base_dir, KnowledgeBaseType.FLU, "hash:dim8")
+        metadata = read_index_metadata(pathlib.Path(self.base_dir, "flu", "flu_index.faiss"))
+        self.assertEqual(metadata["embedding"]["model"], "dim8")
+        self.assertEqual(metadata["dimension"], 8)
+
+
+class TestEncoderServiceDescription(unittest.TestCase):
+    """编码服务模型描述测试类"""
+    
+    def test_client_describes_model(self):
+        """测试编码服务客户端携带模型描述，知识库据此检查索引是否匹配"""
+        service = EncoderService(model_name="hash:dim8")
+        client = service.client(0)
+        self.assertEqual(client.describe().identity(), {"backend": "hash", "model": "dim8"})
+
+
+@unittest.skipUnless(ONNX_AVAILABLE, "需要 onnxruntime 和 tokenizers")
+class TestOnnxBackend(unittest.TestCase):
+    """ONNX Runtime 后端测试类"""
+    
+    @classmethod
+    def setUpClass(cls):
+        try:
+            import onnx
+            from onnx import TensorProto, helper
+        except ImportError:
+            raise unittest.SkipTest("需要 onnx 生成测试模型")
+        from tokenizers import Tokenizer, models, pre_tokenizers
+        
+        cls.tmp = tempfile.TemporaryDirectory()
+        model_dir = cls.tmp.name
+        vocab = {"[PAD]": 0, "[UNK]": 1, "流感": 2, "疫苗": 3, "发热": 4}
+        tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+        tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+        tokenizer.save(os.path.join(model_dir, "tokenizer.json"))
+        
+        # 最小的"编码器"：按 token 查表得到每个位置的隐藏状态
+        table = np.arange(len(vocab) * 4, dtype="float32").reshape(len(vocab), 4)
+        graph = helper.make_graph(
+            [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+            "lookup",
+            [helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "sequence"]),
+             helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "sequence"])],
+            [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", 4])],
+            [helper.make_tensor("table", TensorProto.FLOAT, table.shape, table.flatten())],
+        )
+        model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+        model.ir_version = 8
+        os.makedirs(os.path.join(model_dir, "onnx"))
+        onnx.save(model, os.path.join(model_dir, "onnx", "model.onnx"))
+        cls.model_dir = model_dir
+        cls.table = table
+    
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+    
+    def test_mean_pooling_ignores_padding(self):
+        """测试平均池化只统计有效 token，批内补齐不影响结果"""
+        backend = create_embedding_backend(f"onnx:{self.model_dir}")
+        vectors = backend.encode(["流感 疫苗", "发热"])
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_allclose(vectors[0], (self.table[2] + self.table[3]) / 2)
+        np.testing.assert_allclose(vectors[1], self.table[4])
+    
+    def test_cls_pooling_normalized(self):
+        """测试取首个 token 并归一化"""
+        spec = EmbeddingSpec("onnx", self.model_dir, 4, {"pooling": "cls", "normalize": True, "batch_size": 1})
+        vectors = create_embedding_backend(spec).encode(["疫苗 发热", "流感"])
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), [1.0, 1.0], rtol=1e-6)
+        np.testing.assert_allclose(vectors[0], self.table[3] / np.linalg.norm(self.table[3]), rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+检索评估测试模块
+"""
+
+import json
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from eval_retrieval import (EvaluationResult, LabeledQuestion, RetrievalEvaluator, check_regressions,
+                            format_comparison, is_relevant, load_labeled_questions, load_results, parse_run,
+                            save_results, split_labels)
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager
+from tests.test_cross_kb_search import HashEncoder, _build
+
+
+class TestLabels(unittest.TestCase):
+    """标注解析和匹配测试类"""
+    
+    def test_split_and_match(self):
+        """测试多个标注的拆分，以及按编号、标题和原文匹配"""
+        self.assertEqual(split_labels("flu_pdf_0|flu - 第2段\n流感内容"), ["flu_pdf_0", "flu - 第2段", "流感内容"])
+        passage = "接种HPV疫苗后，需要注意休息；避免剧烈运动"
+        self.assertEqual(split_labels(f"{passage}\r\nhpv_pdf_0"), [passage, "hpv_pdf_0"])
+        self.assertEqual(split_labels(float("nan")), [])
+        hit = {"id": "flu_pdf_0", "title": "flu - 第1段", "content": "流感疫苗每年接种一次，接种后约两周产生保护"}
+        self.assertTrue(is_relevant(hit, "flu_pdf_0"))
+        self.assertTrue(is_relevant(hit, "flu - 第1段"))
+        self.assertTrue(is_relevant(hit, "流感疫苗每年接种一次"))
+        self.assertFalse(is_relevant(hit, "flu_pdf_1"))
+        self.assertTrue(is_relevant({"content": f"接种后的注意事项：{passage}。"}, passage))
+        # 编号和标题的一部分、过短的原文都不匹配
+        for label in ("flu_pdf", "第1段", "每年接种", "流感"):
+            with self.subTest(label=label):
+                self.assertFalse(is_relevant(hit, label))
+    
+    def test_load(self):
+        """测试读取标注文件，跳过没有标注的问题，按行指定知识库"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "labels.xlsx")
+            pd.DataFrame({
+                "问题": ["流感疫苗", "没有标注", "HPV疫苗"],
+                "相关文档": ["flu_pdf_0", None, "hpv_pdf_0\nhpv_excel_1"],
+                "知识库": ["flu", "flu", None],
+            }).to_excel(path, index=False)
+            questions = load_labeled_questions(path, kb_column="知识库")
+            self.assertEqual(questions, [
+                LabeledQuestion("流感疫苗", ["flu_pdf_0"], "flu"),
+                LabeledQuestion("HPV疫苗", ["hpv_pdf_0", "hpv_excel_1"], "all"),
+            ])
+            with self.assertRaises(ValueError):
+                load_labeled_questions(path, label_column="答案")
+    
+    def test_parse_run(self):
+        """测试运行配置的名称、目录和选项"""
+        self.assertEqual(parse_run("sq8=input_sq8,rescore_factor=8,mmap=1"),
+                         {"name": "sq8", "base_dir": "input_sq8", "rescore_factor": 8, "mmap": True})
+        for spec in ("input", "a=input,nprobe=4"):
+            with self.assertRaises(ValueError):
+                parse_run(spec)
+
+
+class TestComparison(unittest.TestCase):
+    """运行对比测试类"""
+    
+    def setUp(self):
+        self.results = [
+            EvaluationResult("base", {"questions": 10, "recall@5": 0.9, "mrr": 0.8, "p50_ms": 2.0, "p99_ms": 5.0}),
+            EvaluationResult("sq8", {"questions": 10, "recall@5": 0.85, "mrr": 0.79, "p50_ms": 1.0, "p99_ms": 6.0}),
+        ]
+    
+    def test_format(self):
+        """测试对比表包含各运行的指标和与基准的差值"""
+        table = format_comparison(self.results, "base")
+        self.assertIn("sq8", table)
+        self.assertIn("0.8500 (-0.0500)", table)
+        self.assertIn("1.00 (-1.00)", table)
+    
+    def test_regressions(self):
+        """测试召回率下降和延迟增加超过阈值时报告退化"""
+        failures = check_regressions(self.results, "base", max_recall_drop=0.02, max_latency_increase=0.1)
+        self.assertEqual(len(failures), 2)
+        self.assertTrue(any("recall@5" in failure for failure in failures))
+        self.assertTrue(any("p99_ms" in failure for failure in failures))
+        self.assertEqual(check_regressions(self.results, "base", max_recall_drop=0.1, max_latency_increase=0.5), [])
+        with self.assertRaises(ValueError):
+            check_regressions(self.results, "missing")
+    
+    def test_save_and_load(self):
+        """测试指标保存为 JSON 后可以重新读取对比，Excel 包含对比表"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "metrics.json")
+            save_results(self.results, path)
+            self.assertEqual([result.metrics for result in load_results(path)], [result.metrics for result in self.results])
+            with open(path, encoding="utf-8") as f:
+                self.assertEqual(list(json.load(f)), ["base", "sq8"])
+            
+            path = os.path.join(tmp, "metrics.xlsx")
+            save_results(self.results, path)
+            comparison = pd.read_excel(path, sheet_name="对比", index_col=0)
+            self.assertEqual(comparison.loc["recall@5", "sq8"], 0.85)
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestRetrievalEvaluator(unittest.TestCase):
+    """检索评估器测试类"""
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        _build(tmp.name, HashEncoder())
+        self.manager = KnowledgeBaseManager(tmp.name, embedding_model=HashEncoder())
+        self.addCleanup(self.manager.close)
+    
+    def test_metrics(self):
+        """测试问题与文档内容相同时排第一，标注不在结果中时召回为0"""
+        questions = [
+            LabeledQuestion("flu内容0", ["flu_pdf_0"], "flu"),
+            LabeledQuestion("hpv内容1", ["hpv - 第2段", "hpv内容1"], "all"),
+            LabeledQuestion("hiv内容2", ["hiv_excel_999"], "hiv"),
+        ]
+        result = RetrievalEvaluator(self.manager, ks=(1, 3), warmup=1).evaluate(questions, "hash")
+        self.assertEqual(result.name, "hash")
+        self.assertEqual(result.metrics["questions"], 3)
+        self.assertAlmostEqual(result.metrics["recall@1"], (1 + 0.5 + 0) / 3)
+        self.assertAlmostEqual(result.metrics["mrr"], 2 / 3)
+        self.assertEqual(result.metrics["errors"], 0)
+        self.assertGreaterEqual(result.metrics["p99_ms"], result.metrics["p50_ms"])
+        self.assertEqual([detail["首个相关排名"] for detail in result.details], [1, 1, None])
+
+
+if __name__ == "__main__":
+    unittest.main()
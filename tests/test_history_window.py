@@ -0,0 +1,86 @@
+"""
+对话历史窗口测试模块
+"""
+
+import unittest
+from utils.history_window import HistoryWindow, estimate_tokens, summarize_tool_output
+
+
+def _kb_result(n):
+    """构造一段较长的知识库查询结果"""
+    text = "在 FLU 知识库中搜索 '流感' 的结果：\n"
+    for i in range(1, n + 1):
+        text += f"排名 {i}:\n标题: 指南 - 第{i}段\n原文内容: {'流感疫苗接种说明。' * 50}\n来源: input/flu/pdf/指南.pdf\n"
+    return text
+
+
+class TestHistoryWindow(unittest.TestCase):
+    """对话历史窗口测试类"""
+    
+    def test_estimate_tokens(self):
+        """测试token估算"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("流感疫苗"), 4)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+    
+    def test_summarize_kb_output_keeps_titles(self):
+        """测试知识库结果压缩后保留标题和来源"""
+        summary = summarize_tool_output(_kb_result(3), 300)
+        self.assertIn("标题: 指南 - 第1段", summary)
+        self.assertIn("来源:", summary)
+        self.assertNotIn("原文内容", summary)
+        self.assertIn("已省略", summary)
+    
+    def test_current_turn_kept_in_full(self):
+        """测试当前轮次的工具结果完整保留"""
+        window = HistoryWindow(max_tokens=200)
+        long_result = _kb_result(5)
+        history = [
+            {"role": "user", "content": "流感疫苗什么时候打？"},
+            {"role": "tool", "name": "query_knowledge_base", "content": long_result},
+        ]
+        
+        selected = window.select(history)
+        
+        self.assertEqual(selected[-1]["content"], long_result)
+    
+    def test_current_turn_counts_against_budget(self):
+        """测试当前轮次先计入总预算，超出预算时不再加入较早历史"""
+        window = HistoryWindow(max_tokens=200)
+        earlier = [
+            {"role": "user", "content": "之前的问题"},
+            {"role": "assistant", "content": "之前的回答"},
+        ]
+        current = [
+            {"role": "user", "content": "流感疫苗什么时候打？"},
+            {"role": "tool", "name": "query_knowledge_base", "content": _kb_result(5)},
+        ]
+        
+        self.assertEqual(window.select(earlier + current[:1]), earlier + current[:1])
+        self.assertEqual(window.select(earlier + current), current)
+    
+    def test_older_tool_outputs_compressed_and_bounded(self):
+        """测试较早的工具输出被压缩，且总量受预算约束"""
+        window = HistoryWindow(max_tokens=600)
+        history = []
+        for i in range(10):
+            history.append({"role": "user", "content": f"问题{i}"})
+            history.append({"role": "tool", "name": "query_knowledge_base", "content": _kb_result(5)})
+            history.append({"role": "assistant", "content": f"回答{i}"})
+        history.append({"role": "user", "content": "新的问题"})
+        
+        selected = window.select(history)
+        total = sum(window.count_message_tokens(m) for m in selected)
+        
+        self.assertLessEqual(total, 600)
+        self.assertEqual(selected[-1]["content"], "新的问题")
+        self.assertEqual(selected[-2]["content"], "回答9")
+        for message in selected:
+            if message["role"] == "tool":
+                self.assertIn("已省略", message["content"])
+        # 原历史不被修改
+        self.assertNotIn("已省略", history[1]["content"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+日志模块测试
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+from observability.logger import (
+    LOGGER_NAME, Payload, PayloadSampler, get_logger, payload, setup_logging, shutdown_logging
+)
+
+
+class _ThreadRecorder:
+    """记录 __str__ 被调用时所在线程的对象"""
+    
+    def __init__(self):
+        self.threads = []
+    
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return "recorded"
+
+
+class TestPayload(unittest.TestCase):
+    """大段内容包装测试类"""
+    
+    def test_truncates_long_text(self):
+        """测试超长内容被截断"""
+        text = str(payload("a" * 50, max_chars=10))
+        self.assertTrue(text.startswith("a" * 10))
+        self.assertIn("共 50 字", text)
+    
+    def test_short_text_unchanged(self):
+        """测试短内容原样输出"""
+        self.assertEqual(str(Payload("hello", max_chars=10)), "hello")
+
+
+class TestPayloadSampler(unittest.TestCase):
+    """采样过滤器测试类"""
+    
+    def _record(self, *args):
+        return logging.LogRecord("funccall.test", logging.DEBUG, __file__, 1, "msg %s", args, None)
+    
+    def test_samples_payload_records(self):
+        """测试按比例保留带 Payload 的记录"""
+        sampler = PayloadSampler(0.25)
+        kept = sum(sampler.filter(self._record(payload("x"))) for _ in range(100))
+        self.assertEqual(kept, 25)
+    
+    def test_plain_records_always_pass(self):
+        """测试不带 Payload 的记录不受采样影响"""
+        sampler = PayloadSampler(0.0)
+        self.assertTrue(sampler.filter(self._record("plain")))
+        self.assertFalse(sampler.filter(self._record(payload("x"))))
+
+
+class TestSetupLogging(unittest.TestCase):
+    """日志配置测试类"""
+    
+    def tearDown(self):
+        shutdown_logging()
+        logger = logging.getLogger(LOGGER_NAME)
+        logger.handlers = []
+        logger.setLevel(logging.NOTSET)
+        logger.propagate = True
+    
+    def test_writes_to_file_in_background(self):
+        """测试日志写入文件，且消息在后台线程而不是调用线程中格式化"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            log_file = os.path.join(tmpdir, "app.log")
+            setup_logging("DEBUG", log_file)
+            recorder = _ThreadRecorder()
+            get_logger("test").debug("工具输出：%s", recorder)
+            get_logger("test").info("服务已启动")
+            shutdown_logging()
+            
+            with open(log_file, encoding="utf-8") as f:
+                content = f.read()
+            self.assertIn("工具输出：recorded", content)
+            self.assertIn("服务已启动", content)
+            self.assertNotIn(threading.current_thread().name, recorder.threads)
+    
+    def test_level_filters_before_formatting(self):
+        """测试低于日志级别的记录不会被格式化"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            setup_logging("WARNING", os.path.join(tmpdir, "app.log"))
+            recorder = _ThreadRecorder()
+            get_logger("test").debug("模型输出：%s", recorder)
+            shutdown_logging()
+            self.assertEqual(recorder.threads, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
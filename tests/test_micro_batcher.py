@@ -0,0 +1,134 @@
+"""
+微批调度测试模块
+"""
+
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tests.test_shared_index import HashEncoder, _documents
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType
+from tools.micro_batcher import MicroBatchEncoder, MicroBatcher
+
+
+class CountingEncoder(HashEncoder):
+    """记录每次 encode 调用文本数的测试编码器"""
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+    
+    def encode(self, texts, **kwargs):
+        with self._lock:
+            self.calls.append(len(texts))
+        time.sleep(self.delay)
+        return super().encode(texts)
+
+
+class TestMicroBatcher(unittest.TestCase):
+    """微批调度器测试类"""
+    
+    def test_concurrent_requests_are_batched(self):
+        """测试并发请求被合并，且每个调用方拿到自己的结果"""
+        batch_sizes = []
+        
+        def double(items):
+            batch_sizes.append(len(items))
+            return [item * 2 for item in items]
+        
+        batcher = MicroBatcher(double, max_wait_ms=20, max_batch_size=8)
+        self.addCleanup(batcher.close)
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(batcher.submit, range(32)))
+        
+        self.assertEqual(results, [i * 2 for i in range(32)])
+        self.assertLess(len(batch_sizes), 32)
+        self.assertLessEqual(max(batch_sizes), 8)
+    
+    def test_single_request_waits_at_most_max_wait(self):
+        """测试单个请求的额外等待不超过 max_wait_ms"""
+        batcher = MicroBatcher(lambda items: items, max_wait_ms=30)
+        self.addCleanup(batcher.close)
+        
+        start = time.monotonic()
+        self.assertEqual(batcher.submit("a"), "a")
+        self.assertLess(time.monotonic() - start, 0.5)
+    
+    def test_batch_error_propagates(self):
+        """测试批处理异常传递给同批所有调用方"""
+        def fail(items):
+            raise ValueError("坏批次")
+        
+        batcher = MicroBatcher(fail, max_wait_ms=1)
+        self.addCleanup(batcher.close)
+        with self.assertRaises(ValueError):
+            batcher.submit(1)
+
+
+class TestMicroBatchEncoder(unittest.TestCase):
+    """微批编码器测试类"""
+    
+    def test_merges_concurrent_encode_calls(self):
+        """测试并发 encode 合并为更少的模型调用，结果与逐条编码一致"""
+        base = CountingEncoder(delay=0.01)
+        encoder = MicroBatchEncoder(base, max_wait_ms=10, max_batch_size=16)
+        self.addCleanup(encoder.batcher.close)
+        
+        texts = [f"问题{i}" for i in range(40)]
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(lambda text: encoder.encode([text]), texts))
+        
+        np.testing.assert_allclose(np.vstack(results), HashEncoder().encode(texts))
+        self.assertLess(len(base.calls), 40)
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestBatchedKnowledgeBaseSearch(unittest.TestCase):
+    """知识库微批搜索测试类"""
+    
+    def setUp(self):
+        import faiss
+        
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        documents = _documents()
+        KnowledgeBaseManager(self._tmp.name, embedding_model=HashEncoder())  # 创建目录
+        index = faiss.IndexFlatL2(HashEncoder.dimension)
+        index.add(HashEncoder().encode([doc.summary[0] for doc in documents]))
+        faiss.write_index(index, f"{self._tmp.name}/flu/flu_index.faiss")
+        with open(f"{self._tmp.name}/flu/flu_documents.pkl", "wb") as f:
+            pickle.dump(documents, f)
+    
+    def test_batched_results_match_unbatched(self):
+        """测试并发搜索合并执行，结果与逐条搜索一致"""
+        queries = [f"问题{i % 5}" for i in range(30)]
+        plain = KnowledgeBaseManager(self._tmp.name, embedding_model=HashEncoder())
+        expected = [plain.search_knowledge_base(KnowledgeBaseType.FLU, query, 2) for query in queries]
+        
+        encoder = CountingEncoder(delay=0.01)
+        batched = KnowledgeBaseManager(self._tmp.name, embedding_model=encoder, batch_max_wait_ms=10)
+        self.addCleanup(batched.close)
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(
+                lambda query: batched.search_knowledge_base(KnowledgeBaseType.FLU, query, 2), queries
+            ))
+        
+        self.assertEqual(results, expected)
+        self.assertLess(len(encoder.calls), len(queries))
+    
+    def test_search_many(self):
+        """测试批量搜索接口"""
+        manager = KnowledgeBaseManager(self._tmp.name, embedding_model=HashEncoder())
+        results = manager.search_many(KnowledgeBaseType.FLU, ["问题1", "问题3"], k=1)
+        self.assertEqual([r[0]["title"] for r in results], ["指南 - 第2段", "指南 - 第4段"])
+        self.assertIn("error", manager.search_many(KnowledgeBaseType.HPV, ["问题1"])[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+知识库查询路由测试模块
+"""
+
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+import tools.knowledge_base_tool as knowledge_base_tool
+from conversation_manager import CustomConversationManager
+from models import ScriptedBackend, SimpleLLMClient
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType, set_kb_manager
+from utils import QueryRouter
+
+
+class TopicEncoder:
+    """按主题词生成向量的测试编码器"""
+    
+    TOPICS = ["疫苗", "病毒", "检测", "治疗"]
+    
+    def encode(self, texts, **kwargs):
+        vectors = [[1.0 if topic in text else 0.0 for topic in self.TOPICS] + [0.1] for text in texts]
+        return np.array(vectors, dtype="float32")
+
+
+def _flat_index(vectors):
+    import faiss
+    
+    index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+class TestKeywordRouting(unittest.TestCase):
+    """关键词路由测试类"""
+    
+    def setUp(self):
+        self.router = QueryRouter(kb_manager=SimpleNamespace(), use_centroids=False)
+    
+    def test_single_and_multiple_topics(self):
+        """测试命中一个知识库时直接路由，命中多个时查询全部知识库"""
+        self.assertEqual(self.router.route("HPV疫苗几岁可以接种？").knowledge_base, "hpv")
+        self.assertEqual(self.router.route("得了甲流要吃奥司他韦吗").knowledge_base, "flu")
+        decision = self.router.route("HPV疫苗和流感疫苗可以同时接种吗？")
+        self.assertEqual((decision.knowledge_base, decision.method), ("all", "keyword"))
+    
+    def test_not_routed(self):
+        """测试其他工具的问题和没有关键词的问题不路由"""
+        self.assertIsNone(self.router.route("请计算 HPV 疫苗三针共多少钱"))
+        self.assertIsNone(self.router.route("北京今天天气怎么样"))
+        self.assertIsNone(self.router.route("疫苗打完可以喝酒吗"))
+    
+    def test_tool_call(self):
+        """测试路由结果转换为知识库查询的工具调用"""
+        tool_call = self.router.route("艾滋病怎么检测").to_tool_call("艾滋病怎么检测", 3)
+        self.assertEqual(tool_call, {
+            "name": "query_knowledge_base",
+            "arguments": {"knowledge_base": "hiv", "query": "艾滋病怎么检测", "top_k": 3},
+        })
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestCentroidRouting(unittest.TestCase):
+    """向量中心路由测试类"""
+    
+    def setUp(self):
+        encoder = TopicEncoder()
+        self.kb_manager = SimpleNamespace(
+            generation=0,
+            embedding_models={kb_type: encoder for kb_type in KnowledgeBaseType},
+            indices={
+                KnowledgeBaseType.HPV: _flat_index(encoder.encode(["疫苗接种", "疫苗剂次", "疫苗年龄"])),
+                KnowledgeBaseType.HIV: _flat_index(encoder.encode(["病毒检测", "检测窗口期", "治疗方案"])),
+                KnowledgeBaseType.FLU: None,
+            },
+        )
+        self.router = QueryRouter(kb_manager=self.kb_manager, keywords={}, min_similarity=0.5, min_margin=0.2)
+    
+    def test_nearest_centroid(self):
+        """测试没有关键词时路由到向量中心最相近的知识库"""
+        decision = self.router.route("接种疫苗后注意什么")
+        self.assertEqual((decision.knowledge_base, decision.method), ("hpv", "centroid"))
+        self.assertEqual(set(decision.scores), {"hpv", "hiv"})
+        self.assertEqual(self.router.route("检测结果怎么看").knowledge_base, "hiv")
+    
+    def test_ambiguous_not_routed(self):
+        """测试最高分与次高分差距不够时不路由"""
+        self.assertIsNone(self.router.route("疫苗检测"))
+        self.assertIsNone(self.router.route("你好"))
+    
+    def test_centroids_refreshed_after_rebuild(self):
+        """测试知识库重新构建后重新计算向量中心"""
+        self.assertEqual(self.router.route("接种疫苗后注意什么").knowledge_base, "hpv")
+        encoder = TopicEncoder()
+        self.kb_manager.indices[KnowledgeBaseType.HPV] = _flat_index(encoder.encode(["病毒检测"]))
+        self.kb_manager.indices[KnowledgeBaseType.HIV] = _flat_index(encoder.encode(["疫苗接种"]))
+        self.assertEqual(self.router.route("接种疫苗后注意什么").knowledge_base, "hpv")
+        self.kb_manager.generation += 1
+        self.assertEqual(self.router.route("接种疫苗后注意什么").knowledge_base, "hiv")
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestRoutedConversation(unittest.TestCase):
+    """路由后跳过首轮模型请求的对话测试类"""
+    
+    def setUp(self):
+        import os
+        import pickle
+        import tempfile
+        import faiss
+        from tools.knowledge_base_tool import KnowledgeDocument
+        
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        encoder = TopicEncoder()
+        kb_dir = os.path.join(tmp.name, "hpv")
+        os.makedirs(kb_dir)
+        documents = [KnowledgeDocument("hpv_pdf_0", "HPV指南", "HPV疫苗建议9至45岁接种", ["几岁接种"], "guide.pdf", "pdf")]
+        index = faiss.IndexFlatL2(5)
+        index.add(encoder.encode([documents[0].content]))
+        faiss.write_index(index, os.path.join(kb_dir, "hpv_index.faiss"))
+        with open(os.path.join(kb_dir, "hpv_documents.pkl"), "wb") as f:
+            pickle.dump(documents, f)
+        
+        manager = KnowledgeBaseManager(tmp.name, embedding_model=encoder)
+        self.addCleanup(manager.close)
+        self.addCleanup(set_kb_manager, knowledge_base_tool._kb_manager)
+        set_kb_manager(manager)
+    
+    def test_single_model_call(self):
+        """测试路由确定时直接检索，只请求一次模型即得到引用检索结果的回答"""
+        for prompt_mode in ("text", "messages"):
+            for stream in (False, True):
+                with self.subTest(prompt_mode=prompt_mode, stream=stream):
+                    backend = ScriptedBackend()
+                    client = SimpleLLMClient(model=f"scripted-router-{prompt_mode}-{stream}", backend=backend)
+                    manager = CustomConversationManager(llm_client=client, prompt_mode=prompt_mode, stream=stream,
+                                                        router=QueryRouter())
+                    
+                    answer, history = manager.process_user_input("HPV疫苗几岁可以接种？")
+                    self.assertEqual(backend.request_count, 1)
+                    self.assertIn("在 HPV 知识库中搜索", answer)
+                    self.assertEqual([message["role"] for message in history], ["user", "tool", "assistant"])
+                    if prompt_mode == "messages":
+                        messages = backend.requests[0]["messages"]
+                        self.assertEqual([message["role"] for message in messages],
+                                         ["system", "user", "assistant", "user"])
+                        self.assertIn("<tool_call>", messages[2]["content"])
+                        self.assertTrue(messages[3]["content"].startswith("工具(query_knowledge_base)："))
+    
+    def test_routed_lookup_not_counted_as_tool_round(self):
+        """测试路由的查询不占用工具调用轮数，max_tool_calls=1 时仍请求模型生成回答"""
+        backend = ScriptedBackend()
+        client = SimpleLLMClient(model="scripted-router-max-calls", backend=backend)
+        manager = CustomConversationManager(llm_client=client, max_tool_calls=1, router=QueryRouter())
+        
+        answer, history = manager.process_user_input("HPV疫苗打几针？")
+        self.assertEqual(backend.request_count, 1)
+        self.assertIn("在 HPV 知识库中搜索", answer)
+        self.assertEqual([message["role"] for message in history], ["user", "tool", "assistant"])
+    
+    def test_unrouted_question_uses_model(self):
+        """测试不能路由的问题仍由模型选择工具"""
+        backend = ScriptedBackend()
+        client = SimpleLLMClient(model="scripted-router-fallback", backend=backend)
+        manager = CustomConversationManager(llm_client=client, router=QueryRouter(use_centroids=False))
+        
+        answer, _ = manager.process_user_input("请计算 (12 + 30) * 4 / 7")
+        self.assertEqual(backend.request_count, 2)
+        self.assertIn("计算结果：24", answer)
+
+
+if __name__ == "__main__":
+    unittest.main()
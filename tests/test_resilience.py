@@ -0,0 +1,111 @@
+"""
+大模型调用容错测试模块
+"""
+
+import time
+import unittest
+from models.simple_llm_client import SimpleLLMClient
+from models.resilience import (
+    AuthenticationError, CircuitBreaker, CircuitOpenError, RateLimitError, ResilientCaller, RetryPolicy
+)
+from tests.fake_llm_server import FakeDashScopeServer
+
+
+class TestSimpleLLMClientResilience(unittest.TestCase):
+    """针对本地模拟服务的容错测试类"""
+    
+    def _client(self, server, **kwargs):
+        """创建指向模拟服务的客户端，每个测试使用独立的熔断器"""
+        client = SimpleLLMClient(api_key="test-key", model=f"fake-{id(server)}", base_url=server.base_url, **kwargs)
+        client.resilient_caller.circuit_breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=0.2)
+        return client
+    
+    def _server(self, script, default=None):
+        """启动模拟服务并在测试结束时关闭"""
+        server = FakeDashScopeServer(script, default).start()
+        self.addCleanup(server.stop)
+        return server
+    
+    def test_retries_transient_errors(self):
+        """测试限流和服务端错误会被重试"""
+        server = self._server([{"status": 429}, {"status": 503}, {"status": 200, "text": "成功"}])
+        client = self._client(server, retry_policy=RetryPolicy(max_attempts=4, base_delay=0.01))
+        
+        self.assertEqual(client.call("你好"), "成功")
+        self.assertEqual(len(server.requests), 3)
+    
+    def test_honors_retry_after(self):
+        """测试遵循 Retry-After 响应头"""
+        server = self._server([{"status": 429, "retry_after": 0.3}, {"status": 200, "text": "成功"}])
+        client = self._client(server, retry_policy=RetryPolicy(max_attempts=2, base_delay=0.0))
+        
+        start = time.monotonic()
+        self.assertEqual(client.call("你好"), "成功")
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+    
+    def test_gives_up_with_classified_error(self):
+        """测试重试耗尽后抛出分类错误"""
+        server = self._server([], default={"status": 429})
+        client = self._client(server, retry_policy=RetryPolicy(max_attempts=2, base_delay=0.01))
+        
+        with self.assertRaises(RateLimitError) as context:
+            client.call("你好")
+        self.assertEqual(context.exception.status_code, 429)
+        self.assertEqual(len(server.requests), 2)
+    
+    def test_auth_error_not_retried(self):
+        """测试鉴权错误不重试"""
+        server = self._server([{"status": 401}])
+        client = self._client(server, retry_policy=RetryPolicy(max_attempts=4, base_delay=0.01))
+        
+        with self.assertRaises(AuthenticationError):
+            client.call("你好")
+        self.assertEqual(len(server.requests), 1)
+    
+    def test_hedged_request_cuts_tail_latency(self):
+        """测试首个请求过慢时对冲请求先返回"""
+        server = self._server([{"status": 200, "text": "慢", "delay": 1.0}, {"status": 200, "text": "快"}])
+        client = self._client(server, hedge_delay=0.1)
+        
+        start = time.monotonic()
+        self.assertEqual(client.call("你好"), "快")
+        self.assertLess(time.monotonic() - start, 0.9)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """熔断器测试类"""
+    
+    def test_opens_after_threshold_and_recovers(self):
+        """测试连续失败后打开，冷却后放行探测请求"""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.2, max_wait=0.05)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        
+        time.sleep(0.2)
+        breaker.before_call()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_open_breaker_pauses_callers(self):
+        """测试熔断器打开时调用方暂停等待，而不是继续请求上游"""
+        calls = []
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.2)
+        caller = ResilientCaller(RetryPolicy(max_attempts=2, base_delay=0.0), breaker)
+        
+        def flaky():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RateLimitError("限流")
+            return "ok"
+        
+        self.assertEqual(caller.call(flaky), "ok")
+        self.assertGreaterEqual(calls[1] - calls[0], 0.2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+大模型响应缓存测试模块
+"""
+
+import unittest
+from models.response_cache import ResponseCache
+from models.simple_llm_client import SimpleLLMClient, DEFAULT_CACHE_SEED
+from tests.fake_llm_server import FakeDashScopeServer
+
+
+class TestResponseCache(unittest.TestCase):
+    """响应缓存测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.cache = ResponseCache(":memory:", max_entries=3)
+        self.addCleanup(self.cache.close)
+    
+    def test_key_depends_on_model_request_and_params(self):
+        """测试缓存键由模型、请求和参数共同决定"""
+        key = ResponseCache.make_key("qwen-plus", {"prompt": "你好"}, {"seed": 1})
+        self.assertEqual(key, ResponseCache.make_key("qwen-plus", {"prompt": "你好"}, {"seed": 1}))
+        self.assertNotEqual(key, ResponseCache.make_key("qwen-max", {"prompt": "你好"}, {"seed": 1}))
+        self.assertNotEqual(key, ResponseCache.make_key("qwen-plus", {"prompt": "您好"}, {"seed": 1}))
+        self.assertNotEqual(key, ResponseCache.make_key("qwen-plus", {"prompt": "你好"}, {"seed": 2}))
+    
+    def test_put_and_get(self):
+        """测试写入和读取"""
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.put("a", "qwen-plus", "回答")
+        self.assertEqual(self.cache.get("a"), "回答")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+    
+    def test_evicts_least_recently_used(self):
+        """测试超过条目上限时淘汰最久未使用的条目"""
+        for key in ("a", "b", "c"):
+            self.cache.put(key, "qwen-plus", key)
+        self.cache.get("a")
+        self.cache.put("d", "qwen-plus", "d")
+        
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.get("a"), "a")
+    
+    def test_evicts_by_size(self):
+        """测试超过字节上限时淘汰条目"""
+        cache = ResponseCache(":memory:", max_entries=100, max_bytes=10)
+        self.addCleanup(cache.close)
+        cache.put("a", "qwen-plus", "x" * 6)
+        cache.put("b", "qwen-plus", "y" * 6)
+        
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), "y" * 6)
+
+
+class TestClientWithCache(unittest.TestCase):
+    """带缓存的客户端测试类"""
+    
+    def test_replays_identical_prompt_without_request(self):
+        """测试相同提示词第二次调用直接重放"""
+        server = FakeDashScopeServer(default={"status": 200, "text": "缓存的回答"}).start()
+        self.addCleanup(server.stop)
+        cache = ResponseCache(":memory:")
+        client = SimpleLLMClient(api_key="test-key", model="fake-cache", base_url=server.base_url, cache=cache)
+        
+        self.assertEqual(client.call("你好"), "缓存的回答")
+        self.assertEqual(client.call("你好"), "缓存的回答")
+        self.assertEqual("".join(client.stream_call("你好")), "缓存的回答")
+        
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.requests[0]["parameters"]["seed"], DEFAULT_CACHE_SEED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+语义答案缓存测试模块
+"""
+
+import time
+import unittest
+from types import SimpleNamespace
+import numpy as np
+from conversation_manager import CustomConversationManager
+from models import ScriptedBackend, SimpleLLMClient
+from utils.semantic_cache import SemanticAnswerCache
+
+
+class KeywordEncoder:
+    """按关键词生成向量的测试编码器，包含相同关键词的问题向量相近"""
+    
+    KEYWORDS = ["HPV", "流感", "保护", "副作用"]
+    
+    def encode(self, texts):
+        vectors = []
+        for text in texts:
+            vector = [1.0 if keyword in text else 0.0 for keyword in self.KEYWORDS]
+            vector.append(0.1)
+            vectors.append(vector)
+        return np.array(vectors, dtype='float32')
+
+
+class TestSemanticAnswerCache(unittest.TestCase):
+    """语义答案缓存测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.kb_manager = SimpleNamespace(embedding_model=KeywordEncoder(), generation=0)
+        self.cache = SemanticAnswerCache(self.kb_manager, similarity_threshold=0.95)
+    
+    def test_hit_for_paraphrase(self):
+        """测试语义相近的问题命中缓存"""
+        self.cache.store("HPV疫苗保护期多久", "大约10年")
+        self.assertEqual(self.cache.lookup("HPV疫苗能保护多少年"), "大约10年")
+        self.assertIsNone(self.cache.lookup("流感疫苗有副作用吗"))
+    
+    def test_ttl_expiry(self):
+        """测试过期条目不再命中"""
+        cache = SemanticAnswerCache(self.kb_manager, ttl=0.05)
+        cache.store("HPV疫苗保护期多久", "大约10年")
+        time.sleep(0.1)
+        self.assertIsNone(cache.lookup("HPV疫苗保护期多久"))
+        self.assertEqual(len(cache), 0)
+    
+    def test_size_eviction(self):
+        """测试超过上限时淘汰最早的条目"""
+        cache = SemanticAnswerCache(self.kb_manager, max_entries=1)
+        cache.store("HPV疫苗保护期多久", "大约10年")
+        cache.store("流感疫苗有副作用吗", "一般较轻")
+        self.assertEqual(len(cache), 1)
+        self.assertIsNone(cache.lookup("HPV疫苗保护期多久"))
+        self.assertEqual(cache.lookup("流感疫苗有副作用吗"), "一般较轻")
+    
+    def test_invalidated_on_kb_rebuild(self):
+        """测试知识库重新构建后缓存失效"""
+        self.cache.store("HPV疫苗保护期多久", "大约10年")
+        self.kb_manager.generation += 1
+        self.assertIsNone(self.cache.lookup("HPV疫苗保护期多久"))
+
+
+
+class TestConversationAnswerCache(unittest.TestCase):
+    """对话流程写入答案缓存测试类"""
+    
+    def setUp(self):
+        self.cache = SemanticAnswerCache(SimpleNamespace(embedding_model=KeywordEncoder(), generation=0))
+    
+    def _manager(self, backend):
+        client = SimpleLLMClient(model=f"scripted-answer-cache-{id(backend)}", backend=backend)
+        return CustomConversationManager(llm_client=client, answer_cache=self.cache)
+    
+    def test_realtime_tool_answer_not_cached(self):
+        """测试调用了不可缓存工具（当前时间）的回答不写入缓存，再次提问时重新调用工具"""
+        backend = ScriptedBackend()
+        manager = self._manager(backend)
+        _, history = manager.process_user_input("现在几点了？")
+        self.assertIn("get_current_time", [message.get("name") for message in history])
+        self.assertEqual(len(self.cache), 0)
+        
+        _, history = manager.process_user_input("现在几点了？")
+        self.assertEqual(backend.request_count, 4)
+        self.assertIn("tool", [message["role"] for message in history])
+    
+    def test_answer_without_tools_cached(self):
+        """测试没有调用工具的首轮回答写入缓存"""
+        manager = self._manager(ScriptedBackend(["HPV疫苗的保护期大约10年。"]))
+        manager.process_user_input("HPV疫苗保护期多久")
+        self.assertEqual(self.cache.lookup("HPV疫苗保护期多久"), "HPV疫苗的保护期大约10年。")
+
+
+if __name__ == "__main__":
+    unittest.main()
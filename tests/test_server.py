@@ -0,0 +1,145 @@
+"""
+对话HTTP服务测试模块
+"""
+
+import asyncio
+import json
+import threading
+import unittest
+from unittest import mock
+
+from server import ConversationServer
+
+
+class EchoConversationManager:
+    """回显问题并记录历史长度的对话管理器测试替身"""
+    
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.release = threading.Event()
+        self.release.set()
+    
+    def process_user_input(self, user_input, conversation_history=None):
+        self.release.wait(5)
+        history = list(conversation_history or [])
+        history.append({"role": "user", "content": user_input})
+        answer = f"{user_input}（历史{len(history)}条）"
+        history.append({"role": "assistant", "content": answer})
+        return answer, history
+
+
+class TestConversationServer(unittest.IsolatedAsyncioTestCase):
+    """对话HTTP服务测试类"""
+    
+    async def asyncSetUp(self):
+        """启动服务"""
+        self.manager = EchoConversationManager()
+        self.server = ConversationServer(self.manager, port=0, max_concurrency=1, max_pending=1, warm_up=False)
+        await self.server.start()
+    
+    async def asyncTearDown(self):
+        """关闭服务"""
+        self.manager.release.set()
+        await self.server.shutdown(timeout=1)
+    
+    async def _request(self, method, path, payload=None):
+        """发送一个请求并返回 (状态码, 响应体)"""
+        reader, writer = await asyncio.open_connection(self.server.host, self.server.port)
+        body = json.dumps(payload or {}, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\nHost: test\r\nConnection: close\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+        raw = await reader.read()
+        writer.close()
+        head, _, data = raw.partition(b"\r\n\r\n")
+        status = int(head.split(b" ")[1])
+        return status, json.loads(data.decode("utf-8"))
+    
+    async def test_health(self):
+        """测试健康检查接口"""
+        status, payload = await self._request("GET", "/health")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["status"], "ok")
+    
+    async def test_chat_keeps_session_history(self):
+        """测试同一会话的历史保存在服务端"""
+        status, first = await self._request("POST", "/chat", {"message": "你好"})
+        self.assertEqual(status, 200)
+        
+        status, second = await self._request("POST", "/chat", {"message": "再见", "session_id": first["session_id"]})
+        self.assertEqual(status, 200)
+        self.assertEqual(second["answer"], "再见（历史3条）")
+    
+    async def test_bad_request(self):
+        """测试缺少字段时返回400"""
+        status, _ = await self._request("POST", "/chat", {})
+        self.assertEqual(status, 400)
+        status, _ = await self._request("GET", "/unknown")
+        self.assertEqual(status, 404)
+        status, _ = await self._request("POST", "/kb/query", {"knowledge_base": "all", "query": "疫苗",
+                                                              "filters": {"author": "张三"}})
+        self.assertEqual(status, 400)
+    
+    async def _raw_request(self, data: bytes) -> int:
+        """发送原始请求并返回状态码"""
+        reader, writer = await asyncio.open_connection(self.server.host, self.server.port)
+        writer.write(data)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return int(raw.split(b" ")[1])
+    
+    async def test_malformed_content_length(self):
+        """测试 Content-Length 不是非负整数时返回400"""
+        for value in ("abc", "-1", "1.5"):
+            with self.subTest(value=value):
+                status = await self._raw_request(
+                    f"POST /chat HTTP/1.1\r\nHost: test\r\nContent-Length: {value}\r\n\r\n{{}}".encode()
+                )
+                self.assertEqual(status, 400)
+    
+    async def test_overlong_lines_rejected(self):
+        """测试请求行或请求头超过缓冲区上限时返回错误而不是断开连接"""
+        long_value = "a" * (128 * 1024)
+        status = await self._raw_request(f"GET /{long_value} HTTP/1.1\r\n\r\n".encode())
+        self.assertEqual(status, 414)
+        status = await self._raw_request(f"GET /health HTTP/1.1\r\nX-Long: {long_value}\r\n\r\n".encode())
+        self.assertEqual(status, 431)
+        
+        status, _ = await self._request("GET", "/health")
+        self.assertEqual(status, 200)
+    
+    async def test_kb_query_top_k(self):
+        """测试 top_k 不是整数时返回400，超出范围时限制在 1 到 20"""
+        for top_k in ("abc", 2.5, None, True):
+            with self.subTest(top_k=top_k):
+                status, _ = await self._request("POST", "/kb/query", {"knowledge_base": "flu", "query": "疫苗",
+                                                                      "top_k": top_k})
+                self.assertEqual(status, 400)
+        
+        with mock.patch("server.query_knowledge_base", return_value="结果") as query:
+            for top_k, expected in ((100000, 20), (0, 1), ("7", 7)):
+                with self.subTest(top_k=top_k):
+                    status, _ = await self._request("POST", "/kb/query", {"knowledge_base": "flu", "query": "疫苗",
+                                                                          "top_k": top_k})
+                    self.assertEqual(status, 200)
+                    self.assertEqual(query.call_args.args, ("flu", "疫苗", expected))
+    
+    async def test_backpressure_returns_503(self):
+        """测试排队请求超过上限时返回503"""
+        self.manager.release.clear()
+        blocked = [asyncio.create_task(self._request("POST", "/chat", {"message": str(i)})) for i in range(2)]
+        await asyncio.sleep(0.2)
+        
+        status, _ = await self._request("POST", "/chat", {"message": "溢出"})
+        self.assertEqual(status, 503)
+        
+        self.manager.release.set()
+        results = await asyncio.gather(*blocked)
+        self.assertEqual([status for status, _ in results], [200, 200])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""
+多进程共享索引测试模块
+"""
+
+import hashlib
+import os
+import pathlib
+import pickle
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+
+from tools.document_store import MmapDocumentStore, document_store_paths, write_document_store
+from tools.encoder_service import EncoderService
+import tools.knowledge_base_tool as knowledge_base_tool
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType, KnowledgeDocument
+
+
+class HashEncoder:
+    """确定性的测试编码器：相同文本总是得到相同向量"""
+    
+    dimension = 16
+    
+    def encode(self, texts, **kwargs):
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).random(self.dimension))
+        return np.asarray(vectors, dtype="float32")
+
+
+def _documents():
+    return [
+        KnowledgeDocument(
+            id=f"flu_pdf_guide_{i}", title=f"指南 - 第{i+1}段", content=f"内容{i}", summary=[f"问题{i}"],
+            source="guide.pdf", file_type="pdf", metadata={"chunk_index": i},
+        )
+        for i in range(5)
+    ]
+
+
+class TestMmapDocumentStore(unittest.TestCase):
+    """内存映射文档存储测试类"""
+    
+    def test_round_trip(self):
+        """测试写出后按下标读取的文档与原文档一致"""
+        with tempfile.TemporaryDirectory() as tmp:
+            jsonl_file, offsets_file = document_store_paths(f"{tmp}/flu_documents.pkl")
+            write_document_store(_documents(), jsonl_file, offsets_file)
+            
+            store = MmapDocumentStore(jsonl_file, offsets_file, factory=lambda record: KnowledgeDocument(**record))
+            self.addCleanup(store.close)
+            self.assertEqual(len(store), 5)
+            self.assertEqual(store[3], _documents()[3])
+            self.assertEqual(store[-1].id, "flu_pdf_guide_4")
+            with self.assertRaises(IndexError):
+                store[5]
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestMmapKnowledgeBase(unittest.TestCase):
+    """以内存映射方式加载知识库的测试类"""
+    
+    def test_search_with_mmap_index(self):
+        """测试内存映射的索引和文档可以正常检索"""
+        import faiss
+        
+        encoder = HashEncoder()
+        documents = _documents()
+        with tempfile.TemporaryDirectory() as tmp:
+            kb_dir = f"{tmp}/flu"
+            KnowledgeBaseManager(tmp, embedding_model=encoder)  # 创建目录
+            index = faiss.IndexFlatL2(HashEncoder.dimension)
+            index.add(encoder.encode([doc.summary[0] for doc in documents]))
+            faiss.write_index(index, f"{kb_dir}/flu_index.faiss")
+            with open(f"{kb_dir}/flu_documents.pkl", "wb") as f:
+                pickle.dump(documents, f)
+            
+            manager = KnowledgeBaseManager(tmp, embedding_model=encoder, mmap=True)
+            self.assertIsInstance(manager.documents[KnowledgeBaseType.FLU], MmapDocumentStore)
+            
+            results = manager.search_knowledge_base(KnowledgeBaseType.FLU, "问题2", k=2)
+            self.assertEqual(results[0]["title"], "指南 - 第3段")
+            self.assertEqual(results[0]["distance"], 0.0)
+
+    def test_rebuild_keeps_mapped_index_valid(self):
+        """测试重新构建时替换索引文件而不是原地覆盖，已映射旧索引的工作进程仍可检索"""
+        encoder = HashEncoder()
+        documents = [KnowledgeDocument(id=f"flu_pdf_guide_{i}", title=f"指南 - 第{i+1}段", content=f"内容{i}",
+                                       summary=f"问题{i}", source="guide.pdf", file_type="pdf") for i in range(5)]
+        with tempfile.TemporaryDirectory() as tmp:
+            builder = KnowledgeBaseManager(tmp, embedding_model=encoder)
+            self.addCleanup(builder.close)
+            os.makedirs(f"{tmp}/flu/pdf", exist_ok=True)
+            pathlib.Path(f"{tmp}/flu/pdf/guide.pdf").touch()
+            with mock.patch.object(knowledge_base_tool, "CONTENT_PROCESSING_AVAILABLE", True), \
+                    mock.patch.object(builder, "_process_pdf_file", side_effect=[documents, documents[:2]]):
+                self.assertIn("成功构建", builder.build_knowledge_base(KnowledgeBaseType.FLU))
+                worker = KnowledgeBaseManager(tmp, embedding_model=encoder, mmap=True)
+                self.addCleanup(worker.close)
+                index_file = pathlib.Path(tmp, "flu", "flu_index.faiss")
+                inode = index_file.stat().st_ino
+                # 重新构建后文档变少，索引文件变短
+                self.assertIn("成功构建", builder.build_knowledge_base(KnowledgeBaseType.FLU))
+            
+            self.assertNotEqual(index_file.stat().st_ino, inode)
+            self.assertFalse([name for name in os.listdir(index_file.parent) if ".tmp" in name])
+            results = worker.search_knowledge_base(KnowledgeBaseType.FLU, "问题4", k=1)
+            self.assertEqual(results[0]["title"], "指南 - 第5段")
+
+
+class TestEncoderService(unittest.TestCase):
+    """独立编码进程测试类"""
+    
+    def test_remote_encode_matches_local(self):
+        """测试多线程经队列请求编码，结果与本地编码一致"""
+        service = EncoderService(num_clients=2, model_factory=HashEncoder).start()
+        self.addCleanup(service.stop)
+        encoder = service.client(1, timeout=30)
+        
+        texts = [f"问题{i}" for i in range(20)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = list(executor.map(lambda text: encoder.encode([text]), texts))
+        
+        expected = HashEncoder().encode(texts)
+        np.testing.assert_allclose(np.vstack(results), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+推测检索测试模块
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+import tools.knowledge_base_tool as knowledge_base_tool
+from conversation_manager import CustomConversationManager
+from models import ScriptedBackend, SimpleLLMClient
+from tools.knowledge_base_tool import (FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType, KnowledgeDocument,
+                                       query_knowledge_base, set_kb_manager)
+from utils import SpeculativeRetrieval
+from utils.speculative_retrieval import normalize_query
+
+
+class CountingEncoder:
+    """确定性的测试编码器，记录编码次数"""
+    
+    dimension = 16
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def encode(self, texts, **kwargs):
+        self.calls += 1
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).random(self.dimension))
+        return np.asarray(vectors, dtype="float32")
+
+
+class TestNormalizeQuery(unittest.TestCase):
+    """查询比较测试类"""
+    
+    def test_ignores_spacing_and_punctuation(self):
+        """测试忽略空白、标点和大小写"""
+        self.assertEqual(normalize_query("HPV疫苗 几岁可以接种？"), normalize_query("hpv疫苗几岁可以接种"))
+        self.assertNotEqual(normalize_query("HPV疫苗几岁接种"), normalize_query("HIV几岁检测"))
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestSpeculativeRetrieval(unittest.TestCase):
+    """推测检索测试类"""
+    
+    def setUp(self):
+        import faiss
+        
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.encoder = CountingEncoder()
+        for kb_type in KnowledgeBaseType:
+            kb_dir = os.path.join(tmp.name, kb_type.value)
+            os.makedirs(kb_dir)
+            documents = [
+                KnowledgeDocument(f"{kb_type.value}_pdf_{i}", f"{kb_type.value} - 第{i+1}段", f"{kb_type.value}内容{i}",
+                                  [f"问题{i}"], "guide.pdf", "pdf")
+                for i in range(12)
+            ]
+            index = faiss.IndexFlatL2(self.encoder.dimension)
+            index.add(self.encoder.encode([document.content for document in documents]))
+            faiss.write_index(index, os.path.join(kb_dir, f"{kb_type.value}_index.faiss"))
+            with open(os.path.join(kb_dir, f"{kb_type.value}_documents.pkl"), "wb") as f:
+                pickle.dump(documents, f)
+        
+        self.manager = KnowledgeBaseManager(tmp.name, embedding_model=self.encoder)
+        self.addCleanup(self.manager.close)
+        self.addCleanup(set_kb_manager, knowledge_base_tool._kb_manager)
+        set_kb_manager(self.manager)
+        self.retrieval = SpeculativeRetrieval(self.manager, k=5)
+        self.addCleanup(self.retrieval.close)
+    
+    def test_served_results_match_tool(self):
+        """测试推测结果与直接调用查询工具的输出一致（单个知识库和多个知识库）"""
+        question = "流感疫苗什么时候接种？"
+        for knowledge_base, top_k in (("flu", 3), ("all", 5), ("hpv,hiv", 4)):
+            with self.subTest(knowledge_base=knowledge_base):
+                speculation = self.retrieval.start(question)
+                served = speculation.serve({"knowledge_base": knowledge_base, "query": question, "top_k": top_k})
+                self.assertEqual(served, query_knowledge_base(knowledge_base, question, top_k))
+    
+    def test_declined(self):
+        """测试查询不同、带过滤条件或结果数超过预取数量时不使用推测结果"""
+        speculation = self.retrieval.start("流感疫苗什么时候接种？", ["flu"])
+        for arguments in (
+            {"knowledge_base": "flu", "query": "奥司他韦怎么吃"},
+            {"knowledge_base": "flu", "query": "流感疫苗什么时候接种", "file_type": "pdf"},
+            {"knowledge_base": "flu", "query": "流感疫苗什么时候接种", "top_k": 6},
+            {"knowledge_base": "hpv", "query": "流感疫苗什么时候接种"},
+            {"knowledge_base": "abc", "query": "流感疫苗什么时候接种"},
+        ):
+            with self.subTest(arguments=arguments):
+                self.assertIsNone(speculation.serve(arguments))
+        # 只差空白和标点的查询、空的过滤条件仍使用推测结果
+        self.assertIsNotNone(speculation.serve({"knowledge_base": "flu", "query": "流感疫苗 什么时候接种", "file_type": ""}))
+    
+    def test_conversation_uses_speculative_results(self):
+        """测试模型的查询与原始问题相同时，工具调用不再编码查询"""
+        for stream in (False, True):
+            with self.subTest(stream=stream):
+                client = SimpleLLMClient(model=f"scripted-speculative-{stream}", backend=ScriptedBackend())
+                manager = CustomConversationManager(llm_client=client, stream=stream, speculative_retrieval=self.retrieval)
+                served = self.retrieval.stats["served"]
+                calls = self.encoder.calls
+                
+                answer, history = manager.process_user_input("流感疫苗什么时候接种？")
+                self.assertIn("在 FLU 知识库中搜索", answer)
+                self.assertEqual([message["role"] for message in history], ["user", "assistant", "tool", "assistant"])
+                self.assertEqual(self.retrieval.stats["served"], served + 1)
+                self.assertEqual(self.encoder.calls, calls + 1)
+    
+    def test_rewritten_query_runs_tool(self):
+        """测试模型改写了查询时照常执行工具"""
+        tool_call = ('<tool_call>\n工具名称：query_knowledge_base\n'
+                     '参数：{"knowledge_base": "flu", "query": "流感疫苗接种时间和禁忌人群", "top_k": 3}\n</tool_call>')
+        client = SimpleLLMClient(model="scripted-speculative-rewrite", backend=ScriptedBackend([tool_call]))
+        manager = CustomConversationManager(llm_client=client, speculative_retrieval=self.retrieval)
+        
+        answer, _ = manager.process_user_input("流感疫苗什么时候接种？")
+        self.assertIn("流感疫苗接种时间和禁忌人群", answer)
+        self.assertEqual(self.retrieval.stats, {"started": 1, "served": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+流式工具调用解析器测试模块
+"""
+
+import unittest
+from utils.stream_parser import StreamingToolCallParser
+from utils.tool_parser import ToolCallParser
+
+
+class TestStreamingToolCallParser(unittest.TestCase):
+    """流式工具调用解析器测试类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.parser = StreamingToolCallParser()
+        self.model_output = """我来帮您查询时间和天气。
+
+<tool_call>
+工具名称：get_current_time
+参数：{}
+</tool_call>
+
+<TOOL_CALL>
+工具名称：get_current_weather
+参数：{"location": "北京"}
+</TOOL_CALL>
+这是额外的回答内容。"""
+    
+    def _feed_in_chunks(self, text, size):
+        """按固定大小分块输入并收集全部事件"""
+        events = []
+        for start in range(0, len(text), size):
+            events.extend(self.parser.feed(text[start:start + size]))
+        events.extend(self.parser.close())
+        return events
+    
+    def test_matches_batch_parser_for_any_chunk_size(self):
+        """测试任意分块大小下的结果与批量解析一致"""
+        batch_parser = ToolCallParser()
+        expected_calls = batch_parser.parse_tool_calls(self.model_output)
+        expected_text = batch_parser.extract_regular_response(self.model_output)
+        
+        for size in (1, 2, 3, 7, 13, len(self.model_output)):
+            self.parser.reset()
+            events = self._feed_in_chunks(self.model_output, size)
+            
+            tool_calls = [{"name": e["name"], "arguments": e["arguments"]} for e in events if e["type"] == "tool_call"]
+            text = "".join(e["content"] for e in events if e["type"] == "text")
+            
+            self.assertEqual(tool_calls, expected_calls, f"分块大小 {size}")
+            self.assertEqual(ToolCallParser().extract_regular_response(text), expected_text)
+    
+    def test_tool_call_emitted_when_tag_closes(self):
+        """测试结束标签到达时立即产出工具调用事件"""
+        events = self.parser.feed("<tool_call>\n工具名称：get_current_time\n参数：{}\n</tool")
+        self.assertEqual([e for e in events if e["type"] == "tool_call"], [])
+        
+        events = self.parser.feed("_call>后续")
+        self.assertEqual(events[0]["type"], "tool_call")
+        self.assertEqual(events[0]["name"], "get_current_time")
+    
+    def test_partial_open_tag_is_held_back(self):
+        """测试可能是开始标签前缀的文本会被暂存"""
+        events = self.parser.feed("你好<tool")
+        self.assertEqual(events, [{"type": "text", "content": "你好"}])
+        
+        events = self.parser.feed("s>")
+        self.assertEqual(events, [{"type": "text", "content": "<tools>"}])
+    
+    def test_unterminated_tool_call_flushed_as_text(self):
+        """测试未闭合的工具调用在结束时按普通文本产出"""
+        self.parser.feed("<tool_call>\n工具名称：get_current_time")
+        events = self.parser.close()
+        self.assertEqual(events, [{"type": "text", "content": "<tool_call>\n工具名称：get_current_time"}])
+    
+    def test_invalid_tool_call_dropped(self):
+        """测试格式无效的工具调用被丢弃"""
+        events = self._feed_in_chunks("<tool_call>无效格式</tool_call>", 4)
+        self.assertEqual(events, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
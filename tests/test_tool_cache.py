@@ -0,0 +1,101 @@
+"""
+工具结果缓存测试模块
+"""
+
+import time
+import unittest
+from types import SimpleNamespace
+
+import tools.knowledge_base_tool as knowledge_base_tool
+from tools import ToolCachePolicy, get_tool_cache_stats, get_tool_function
+from tools.knowledge_base_tool import set_kb_manager
+from tools.tool_registry import MemoizedTool, ToolRegistry, _knowledge_base_cache_key
+
+
+class TestToolCachePolicy(unittest.TestCase):
+    """工具缓存策略测试类"""
+    
+    def setUp(self):
+        self.registry = ToolRegistry()
+        self.calls = []
+    
+    def _tool(self, **kwargs):
+        self.calls.append(kwargs)
+        return f"结果{len(self.calls)}"
+    
+    def test_memoized_by_arguments(self):
+        """测试相同参数（键顺序不同）命中缓存，不同参数重新执行"""
+        self.registry.register_tool("echo", self._tool, {}, ToolCachePolicy(cacheable=True))
+        tool = self.registry.get_tool("echo")
+        self.assertEqual(tool(a=1, b=2), "结果1")
+        self.assertEqual(tool(b=2, a=1), "结果1")
+        self.assertEqual(tool(a=2, b=2), "结果2")
+        self.assertEqual(self.registry.get_cache_stats()["echo"], {"hits": 1, "misses": 2, "entries": 2})
+        
+        self.registry.clear_cache("echo")
+        self.assertEqual(tool(a=1, b=2), "结果3")
+    
+    def test_ttl_and_eviction(self):
+        """测试过期条目重新执行，超过上限时淘汰最久未使用的条目"""
+        self.registry.register_tool("echo", self._tool, {}, ToolCachePolicy(cacheable=True, ttl=0.05, max_entries=2))
+        tool = self.registry.get_tool("echo")
+        tool(x=1)
+        time.sleep(0.1)
+        self.assertEqual(tool(x=1), "结果2")
+        
+        tool(x=2)
+        tool(x=1)
+        tool(x=3)
+        self.assertEqual(tool(x=1), "结果2")
+        self.assertEqual(tool(x=2), "结果5")
+    
+    def test_should_cache_and_key(self):
+        """测试自定义缓存键，以及不写入缓存的结果"""
+        policy = ToolCachePolicy(cacheable=True, key=lambda arguments: arguments["query"].strip(),
+                                 should_cache=lambda result: result != "结果1")
+        self.registry.register_tool("echo", self._tool, {}, policy)
+        tool = self.registry.get_tool("echo")
+        self.assertEqual(tool(query="流感"), "结果1")
+        self.assertEqual(tool(query=" 流感 "), "结果2")
+        self.assertEqual(tool(query="流感"), "结果2")
+    
+    def test_uncacheable_tools_bound_directly(self):
+        """测试不缓存的工具直接绑定函数，默认工具的缓存策略"""
+        from tools.time_tool import get_current_time
+        
+        self.registry.register_tool("echo", self._tool, {}, ToolCachePolicy())
+        self.assertEqual(self.registry.get_tool("echo"), self._tool)
+        self.assertIs(self.registry.get_tool("get_current_time"), get_current_time)
+        self.assertIsInstance(self.registry.get_tool("calculate"), MemoizedTool)
+        self.assertIsInstance(self.registry.get_tool("query_knowledge_base"), MemoizedTool)
+
+
+class TestDefaultToolCache(unittest.TestCase):
+    """默认工具缓存测试类"""
+    
+    def test_calculate_memoized(self):
+        """测试计算器工具跨调用复用结果"""
+        calculate = get_tool_function("calculate")
+        before = get_tool_cache_stats()["calculate"]["hits"]
+        first = calculate(expression="(17 + 25) * 3")
+        self.assertEqual(calculate(expression="(17 + 25) * 3"), first)
+        self.assertEqual(get_tool_cache_stats()["calculate"]["hits"], before + 1)
+    
+    def test_knowledge_base_key_follows_generation(self):
+        """测试知识库替换或重新构建后缓存键变化"""
+        previous = knowledge_base_tool._kb_manager
+        self.addCleanup(set_kb_manager, previous)
+        manager = SimpleNamespace(instance_id=-1, generation=0)
+        set_kb_manager(manager)
+        
+        arguments = {"knowledge_base": "flu", "query": "流感疫苗", "top_k": 3}
+        key = _knowledge_base_cache_key(arguments)
+        self.assertEqual(_knowledge_base_cache_key(dict(reversed(list(arguments.items())))), key)
+        manager.generation += 1
+        self.assertNotEqual(_knowledge_base_cache_key(arguments), key)
+        set_kb_manager(SimpleNamespace(instance_id=-2, generation=0))
+        self.assertNotEqual(_knowledge_base_cache_key(arguments), key)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,9 +3,14 @@
 """
 
 import unittest
+from unittest.mock import patch
+from conversation_manager import CustomConversationManager
+from models.resilience import CircuitBreaker
+from models.simple_llm_client import SimpleLLMClient
 from utils.prompt_builder import PromptBuilder
 from utils.tool_parser import ToolCallParser
 from tools import get_tools
+from tests.fake_llm_server import FakeDashScopeServer
 
 
 class TestPromptBuilder(unittest.TestCase):
@@ -43,6 +48,51 @@ class TestPromptBuilder(unittest.TestCase):
         self.assertIn("我来帮您查询时间", prompt)
         self.assertIn("工具(get_current_time)", prompt)
     
+    def test_static_prefix_is_stable(self):
+        """测试不同轮次的提示词共享完全相同的静态前缀"""
+        prefix = self.builder.get_static_prefix()
+        history = [{"role": "user", "content": "现在几点了？"}]
+        
+        first_prompt = self.builder.build_prompt_with_tools("现在几点了？")
+        second_prompt = self.builder.build_prompt_with_tools("北京天气如何？", history)
+        
+        self.assertTrue(first_prompt.startswith(prefix))
+        self.assertTrue(second_prompt.startswith(prefix))
+        self.assertIs(self.builder.get_static_prefix(), prefix)
+    
+    def test_static_prefix_invalidated_on_tool_registration(self):
+        """测试注册新工具后静态前缀重新渲染"""
+        prefix = self.builder.get_static_prefix()
+        new_tool = {
+            "type": "function",
+            "function": {"name": "dummy_tool", "description": "测试用工具", "parameters": {}}
+        }
+        
+        with patch("utils.prompt_builder.get_tools_version", return_value=self.builder._tools_version + 1), \
+                patch("utils.prompt_builder.get_tools", return_value=get_tools() + [new_tool]):
+            new_prefix = self.builder.get_static_prefix()
+        
+        self.assertNotIn("dummy_tool", prefix)
+        self.assertIn("dummy_tool", new_prefix)
+    
+    def test_build_messages_with_tools(self):
+        """测试构建消息格式的请求"""
+        history = [
+            {"role": "user", "content": "现在几点了？"},
+            {"role": "tool", "name": "get_current_time", "content": "当前时间：2024-01-01 12:00:00"},
+            {"role": "assistant", "content": "现在是中午12点。"},
+            {"role": "user", "content": "谢谢"},
+        ]
+        
+        messages = self.builder.build_messages_with_tools(history)
+        
+        self.assertEqual(messages[0], {"role": "system", "content": self.builder.get_static_prefix()})
+        self.assertEqual(messages[1], {
+            "role": "user",
+            "content": "现在几点了？\n工具(get_current_time)：当前时间：2024-01-01 12:00:00"
+        })
+        self.assertEqual([message["role"] for message in messages[2:]], ["assistant", "user"])
+    
     def test_get_available_tools(self):
         """测试获取可用工具列表"""
         tools = self.builder.get_available_tools()
@@ -53,6 +103,40 @@ class TestPromptBuilder(unittest.TestCase):
         self.assertIn("get_current_weather", tools)
 
 
+class TestMessagesRequest(unittest.TestCase):
+    """消息格式请求测试类（模拟 DashScope 服务检查消息角色）"""
+    
+    def setUp(self):
+        tool_call = '我来查一下时间。\n<tool_call>\n工具名称：get_current_time\n参数：{}\n</tool_call>'
+        self.server = FakeDashScopeServer([{"text": tool_call}, {"text": "现在是中午12点。"}]).start()
+        self.addCleanup(self.server.stop)
+        self.client = SimpleLLMClient(api_key="test-key", model="qwen-plus", base_url=self.server.base_url)
+        self.client.resilient_caller.circuit_breaker = CircuitBreaker()
+    
+    def test_tool_results_accepted(self):
+        """测试工具调用后的请求被服务接受，工具输出按文本协议作为 user 消息发送"""
+        manager = CustomConversationManager(llm_client=self.client, prompt_mode="messages")
+        with patch("conversation_manager.call_tool", return_value="当前时间：2024-01-01 12:00:00"):
+            answer, history = manager.process_user_input("现在几点了？")
+        
+        self.assertEqual(answer, "现在是中午12点。")
+        self.assertEqual([message["role"] for message in history], ["user", "assistant", "tool", "assistant"])
+        self.assertEqual(len(self.server.requests), 2)
+        messages = self.server.requests[1]["input"]["messages"]
+        self.assertEqual([message["role"] for message in messages], ["system", "user", "assistant", "user"])
+        self.assertIn("<tool_call>", messages[2]["content"])
+        self.assertEqual(messages[3]["content"], "工具(get_current_time)：当前时间：2024-01-01 12:00:00")
+    
+    def test_tool_message_without_call_id_rejected(self):
+        """测试模拟服务与 DashScope 一样拒绝没有对应 tool_call_id 的 tool 消息"""
+        with self.assertRaises(Exception):
+            self.client.call_with_messages([
+                {"role": "user", "content": "现在几点了？"},
+                {"role": "tool", "name": "get_current_time", "content": "12:00"},
+            ])
+        self.assertEqual(len(self.server.script), 2)
+
+
 class TestToolCallParser(unittest.TestCase):
     """工具调用解析器测试类"""
     
@@ -0,0 +1,89 @@
+"""
+分阶段耗时追踪测试模块
+"""
+
+import contextvars
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from observability import Tracer
+
+
+class TestTracer(unittest.TestCase):
+    """追踪器测试类"""
+    
+    def setUp(self):
+        self.tracer = Tracer()
+        self.tracer.enable()
+    
+    def test_disabled_tracer_records_nothing(self):
+        """测试关闭时不记录"""
+        tracer = Tracer()
+        with tracer.span("llm.call") as span:
+            span.set_attribute("model", "qwen-plus")
+        self.assertEqual(tracer.finished_spans(), [])
+    
+    def test_nested_spans_share_trace(self):
+        """测试嵌套 span 的父子关系，以及复制上下文后线程池任务继承父 span"""
+        with self.tracer.span("conversation.turn") as root:
+            with self.tracer.span("llm.call"):
+                pass
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                context = contextvars.copy_context()
+                executor.submit(context.run, self._tool_span).result()
+        
+        spans = {span.name: span for span in self.tracer.finished_spans()}
+        self.assertEqual(spans["llm.call"].parent_id, root.span_id)
+        self.assertEqual(spans["tool.execute"].parent_id, root.span_id)
+        self.assertEqual(len({span.trace_id for span in spans.values()}), 1)
+        self.assertIsNone(root.parent_id)
+    
+    def _tool_span(self):
+        with self.tracer.span("tool.execute", tool="calculate"):
+            pass
+    
+    def test_error_is_recorded(self):
+        """测试异常记录到 span 并继续抛出"""
+        with self.assertRaises(ValueError):
+            with self.tracer.span("kb.faiss_search"):
+                raise ValueError("索引损坏")
+        self.assertIn("索引损坏", self.tracer.finished_spans()[0].error)
+    
+    def test_latency_report_percentiles(self):
+        """测试按阶段汇总分位数"""
+        for _ in range(10):
+            with self.tracer.span("kb.embed"):
+                pass
+        report = self.tracer.latency_report()
+        self.assertEqual(report["kb.embed"]["count"], 10)
+        self.assertLessEqual(report["kb.embed"]["p50_ms"], report["kb.embed"]["p99_ms"])
+        self.assertIn("kb.embed", self.tracer.format_report())
+    
+    def test_export_formats(self):
+        """测试导出 JSON lines 和 OTLP JSON"""
+        with self.tracer.span("conversation.turn"):
+            with self.tracer.span("llm.call", model="qwen-plus", cache_hit=False):
+                pass
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            self.assertEqual(self.tracer.export_jsonl(path), 2)
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f]
+            self.assertEqual({record["name"] for record in records}, {"conversation.turn", "llm.call"})
+            
+            self.tracer.export_jsonl(path, format="otel")
+            with open(path, encoding="utf-8") as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines), 1)
+            spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            llm_span = next(span for span in spans if span["name"] == "llm.call")
+            self.assertIn("parentSpanId", llm_span)
+            self.assertIn({"key": "cache_hit", "value": {"boolValue": False}}, llm_span["attributes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
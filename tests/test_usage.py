@@ -0,0 +1,83 @@
+"""
+大模型用量统计测试模块
+"""
+
+import unittest
+from unittest.mock import patch
+
+from conversation_manager import CustomConversationManager
+from models import ResponseCache
+from models.resilience import CircuitBreaker
+from models.simple_llm_client import SimpleLLMClient
+from observability.usage import (
+    PURPOSE_CHAT_ROUND, PURPOSE_TOOL_FOLLOWUP, UsageTracker, track_usage, usage_purpose
+)
+from tests.fake_llm_server import FakeDashScopeServer
+
+
+class TestUsageTracker(unittest.TestCase):
+    """用量统计类测试"""
+    
+    def test_aggregates_by_purpose_and_cost(self):
+        """测试按用途汇总并估算费用"""
+        tracker = UsageTracker()
+        tracker.record(PURPOSE_CHAT_ROUND, "qwen-plus", 1000, 500)
+        tracker.record(PURPOSE_TOOL_FOLLOWUP, "qwen-plus", 2000, 100)
+        tracker.record(PURPOSE_TOOL_FOLLOWUP, "qwen-plus", cached=True)
+        
+        summary = tracker.summary()
+        self.assertEqual(summary["input_tokens"], 3000)
+        self.assertEqual(summary["by_purpose"][PURPOSE_TOOL_FOLLOWUP]["calls"], 2)
+        self.assertEqual(summary["cached_calls"], 1)
+        self.assertAlmostEqual(tracker.cost({"qwen-plus": (1.0, 2.0)}), 3.0 + 1.2)
+
+
+class TestClientUsage(unittest.TestCase):
+    """客户端用量采集测试类"""
+    
+    def setUp(self):
+        self.server = FakeDashScopeServer(default={"status": 200, "text": "你好"}).start()
+        self.addCleanup(self.server.stop)
+    
+    def _client(self, **kwargs):
+        client = SimpleLLMClient(api_key="test-key", model="qwen-plus", base_url=self.server.base_url, **kwargs)
+        client.resilient_caller.circuit_breaker = CircuitBreaker()
+        return client
+    
+    def test_nested_scopes_and_purpose(self):
+        """测试嵌套的统计范围都计入，并按用途分类"""
+        client = self._client()
+        with track_usage() as run_usage:
+            with track_usage() as question_usage, usage_purpose(PURPOSE_CHAT_ROUND):
+                client.call("你好")
+            client.call_with_messages([{"role": "user", "content": "你好"}])
+        
+        self.assertEqual(question_usage.calls, 1)
+        self.assertEqual(question_usage.input_tokens, 10)
+        self.assertEqual(run_usage.calls, 2)
+        self.assertEqual(run_usage.output_tokens, 10)
+        self.assertEqual(set(run_usage.by_purpose), {PURPOSE_CHAT_ROUND, "other"})
+    
+    def test_cache_hit_costs_no_tokens(self):
+        """测试命中响应缓存的调用不计 token"""
+        client = self._client(cache=ResponseCache(":memory:"))
+        with track_usage() as usage:
+            client.call("你好")
+            client.call("你好")
+        
+        self.assertEqual(usage.calls, 2)
+        self.assertEqual(usage.cached_calls, 1)
+        self.assertEqual(usage.input_tokens, 10)
+    
+    def test_conversation_tags_first_round(self):
+        """测试对话首轮调用标记为 chat_round"""
+        manager = CustomConversationManager(llm_client=self._client())
+        with patch("builtins.print"), track_usage() as usage:
+            answer, _ = manager.process_user_input("你好")
+        
+        self.assertEqual(answer, "你好")
+        self.assertEqual(usage.by_purpose[PURPOSE_CHAT_ROUND]["input_tokens"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
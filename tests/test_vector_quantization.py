@@ -0,0 +1,195 @@
+"""
+向量量化存储测试模块
+"""
+
+import hashlib
+import os
+import pathlib
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+
+from tools.knowledge_base_tool import FAISS_AVAILABLE, KnowledgeBaseManager, KnowledgeBaseType, KnowledgeDocument
+
+
+class HashEncoder:
+    """确定性的测试编码器：相同文本总是得到相同向量"""
+    
+    dimension = 32
+    
+    def encode(self, texts, **kwargs):
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+            vectors.append(np.random.default_rng(seed).random(self.dimension))
+        return np.asarray(vectors, dtype="float32")
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestQuantizedIndex(unittest.TestCase):
+    """量化索引与精确重排测试类"""
+    
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.random((10_000, 32), dtype="float32")
+        self.queries = rng.random((20, 32), dtype="float32")
+    
+    def _exact(self, k):
+        from tools.vector_quantization import build_quantized_index
+        
+        return build_quantized_index(self.vectors, None).search(self.queries, k)
+    
+    def test_parse_quantization(self):
+        """测试量化方式名称的规范化和校验"""
+        from tools.vector_quantization import parse_quantization
+        
+        self.assertIsNone(parse_quantization("flat"))
+        self.assertIsNone(parse_quantization(None))
+        self.assertEqual(parse_quantization(" SQ8 "), "sq8")
+        self.assertEqual(parse_quantization("pq16"), "pq16")
+        for invalid in ("int4", "pqx"):
+            with self.assertRaises(ValueError):
+                parse_quantization(invalid)
+    
+    def test_rescore_restores_exact_ranking(self):
+        """测试各量化方式重排后的前 k 个结果及距离与精确搜索一致"""
+        from tools.vector_quantization import build_quantized_index, rescore
+        
+        exact_distances, exact_ids = self._exact(5)
+        # 均匀随机向量没有聚类结构，乘积量化需要更多候选
+        for quantization, candidate_count in (("fp16", 20), ("sq8", 20), ("pq8", 500)):
+            with self.subTest(quantization=quantization):
+                index = build_quantized_index(self.vectors, quantization)
+                _, candidates = index.search(self.queries, candidate_count)
+                distances, ids = rescore(self.queries, candidates, self.vectors, 5)
+                np.testing.assert_array_equal(ids, exact_ids)
+                np.testing.assert_allclose(distances, exact_distances, rtol=1e-4)
+    
+    def test_rescore_pads_missing_candidates(self):
+        """测试候选不足 k 个时与 FAISS 一样用 -1 填充"""
+        from tools.vector_quantization import rescore
+        
+        distances, ids = rescore(self.queries[:1], np.array([[3, -1, -1]]), self.vectors, 3)
+        self.assertEqual(ids.tolist(), [[3, -1, -1]])
+        self.assertTrue(np.isinf(distances[0, 1:]).all())
+    
+    def test_pq_falls_back_to_sq8_for_small_corpus(self):
+        """测试向量数不足以训练乘积量化的码本时改用 sq8"""
+        import faiss
+        from tools.vector_quantization import MIN_PQ_TRAINING_VECTORS, build_quantized_index, resolve_quantization
+        
+        self.assertEqual(resolve_quantization("pq8", MIN_PQ_TRAINING_VECTORS), "pq8")
+        with self.assertLogs("funccall.vector_quantization", level="WARNING"):
+            self.assertEqual(resolve_quantization("pq", 144), "sq8")
+        self.assertEqual(resolve_quantization("fp16", 144), "fp16")
+        self.assertIsNone(resolve_quantization("flat", 144))
+        
+        index = build_quantized_index(self.vectors[:144], "pq8")
+        self.assertIsInstance(index, faiss.IndexScalarQuantizer)
+        index = build_quantized_index(self.vectors, "pq8")
+        self.assertIsInstance(index, faiss.IndexPQ)
+        self.assertEqual(index.pq.nbits, 8)
+    
+    def test_pq_subvectors_must_divide_dimension(self):
+        """测试子向量数不能整除维度时报错"""
+        from tools.vector_quantization import build_quantized_index
+        
+        with self.assertRaises(ValueError):
+            build_quantized_index(self.vectors, "pq5")
+
+
+@unittest.skipUnless(FAISS_AVAILABLE, "需要FAISS")
+class TestQuantizedKnowledgeBase(unittest.TestCase):
+    """量化知识库测试类"""
+    
+    def setUp(self):
+        import faiss
+        
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.base_dir = tmp.name
+        self.encoder = HashEncoder()
+        documents = [
+            KnowledgeDocument(
+                id=f"flu_pdf_guide_{i}", title=f"指南 - 第{i+1}段", content=f"内容{i}", summary=[f"问题{i}"],
+                source="guide.pdf", file_type="pdf", metadata={"chunk_index": i},
+            )
+            for i in range(400)
+        ]
+        kb_dir = f"{self.base_dir}/flu"
+        os.makedirs(kb_dir)
+        index = faiss.IndexFlatL2(HashEncoder.dimension)
+        index.add(self.encoder.encode([document.content for document in documents]))
+        faiss.write_index(index, f"{kb_dir}/flu_index.faiss")
+        with open(f"{kb_dir}/flu_documents.pkl", "wb") as f:
+            pickle.dump(documents, f)
+    
+    def _manager(self, **kwargs) -> KnowledgeBaseManager:
+        manager = KnowledgeBaseManager(self.base_dir, embedding_model=self.encoder, **kwargs)
+        self.addCleanup(manager.close)
+        return manager
+    
+    def _search(self, manager):
+        queries = [f"内容{i}" for i in range(0, 400, 40)]
+        return [[result["title"] for result in results] for results in manager.search_many(KnowledgeBaseType.FLU, queries, 5)]
+    
+    def test_quantize_and_reload(self):
+        """测试转换为量化索引后重新加载（含内存映射方式），重排后的结果与原始索引一致"""
+        from tools.embedding_backends import read_index_metadata
+        
+        expected = self._search(self._manager())
+        # 400 篇文档不足以训练乘积量化，改用 sq8 并记录实际的量化方式
+        for quantization, actual in (("sq8", "sq8"), ("pq", "sq8")):
+            with self.subTest(quantization=quantization):
+                result = self._manager().quantize_knowledge_base(KnowledgeBaseType.FLU, quantization)
+                self.assertIn(f"成功转换 flu 知识库索引为 {actual}", result)
+                self.assertEqual("改用 sq8" in result, quantization != actual)
+                index_file = pathlib.Path(self.base_dir, "flu", "flu_index.faiss")
+                self.assertEqual(read_index_metadata(index_file)["quantization"], actual)
+                self.assertTrue(index_file.with_suffix(".vectors.npy").exists())
+                
+                for mmap in (False, True):
+                    manager = self._manager(mmap=mmap)
+                    self.assertIsNotNone(manager.vector_stores[KnowledgeBaseType.FLU])
+                    self.assertEqual(self._search(manager), expected)
+    
+    def test_convert_back_to_flat(self):
+        """测试转换回不量化的索引时使用保存的原始向量，并删除向量文件"""
+        expected = self._search(self._manager())
+        self._manager().quantize_knowledge_base(KnowledgeBaseType.FLU, "sq8")
+        self._manager().quantize_knowledge_base(KnowledgeBaseType.FLU, "flat")
+        self.assertFalse(pathlib.Path(self.base_dir, "flu", "flu_index.vectors.npy").exists())
+        
+        manager = self._manager()
+        self.assertIsNone(manager.vector_stores[KnowledgeBaseType.FLU])
+        self.assertEqual(self._search(manager), expected)
+    
+    def test_conversion_replaces_index_file(self):
+        """测试转换时替换索引文件而不是原地覆盖，已映射旧文件的进程仍可搜索"""
+        import faiss
+        
+        index_file = pathlib.Path(self.base_dir, "flu", "flu_index.faiss")
+        mapped = faiss.read_index(str(index_file), faiss.IO_FLAG_MMAP)
+        inode = index_file.stat().st_ino
+        self._manager().quantize_knowledge_base(KnowledgeBaseType.FLU, "sq8")
+        
+        self.assertNotEqual(index_file.stat().st_ino, inode)
+        self.assertEqual(sorted(os.listdir(index_file.parent)),
+                         ["flu_documents.pkl", "flu_index.faiss", "flu_index.meta.json", "flu_index.vectors.npy"])
+        _, ids = mapped.search(self.encoder.encode(["内容7"]), 1)
+        self.assertEqual(ids.tolist(), [[7]])
+    
+    def test_missing_vector_store_falls_back(self):
+        """测试原始向量文件缺失时仍可搜索，只是不做重排"""
+        self._manager().quantize_knowledge_base(KnowledgeBaseType.FLU, "sq8")
+        pathlib.Path(self.base_dir, "flu", "flu_index.vectors.npy").unlink()
+        manager = self._manager()
+        self.assertIsNone(manager.vector_stores[KnowledgeBaseType.FLU])
+        results = manager.search_knowledge_base(KnowledgeBaseType.FLU, "内容7", 1)
+        self.assertEqual(results[0]["title"], "指南 - 第8段")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,8 +4,12 @@
 
 from .weather_tool import get_current_weather
 from .time_tool import get_current_time
-from .calculator_tool import calculate
+from .calculator_tool import calculate, calculate_many
 from .knowledge_base_tool import query_knowledge_base
-from .tool_registry import get_tools, get_tool_function
+from .tool_registry import (ToolCachePolicy, ToolTimeoutError, acall_tool, call_tool, clear_tool_cache,
+                            get_tool_cache_stats, get_tool_function, get_tools, get_tools_version, is_tool_cacheable,
+                            register_tool)
 
-__all__ = ['get_current_weather', 'get_current_time', 'calculate', 'get_tools', 'get_tool_function', 'query_knowledge_base']
\ No newline at end of file
+__all__ = ['get_current_weather', 'get_current_time', 'calculate', 'get_tools', 'get_tool_function', 'get_tools_version', 'query_knowledge_base',
+           'register_tool', 'ToolCachePolicy', 'clear_tool_cache', 'get_tool_cache_stats', 'call_tool', 'acall_tool',
+           'ToolTimeoutError', 'calculate_many', 'is_tool_cacheable']
\ No newline at end of file
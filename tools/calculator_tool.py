@@ -1,60 +1,383 @@
 """
 计算器工具模块
 支持基本数学运算
+
+表达式解析为语法树后只允许数字、四则运算、乘方和 sqrt/pow/abs 函数，编译为闭包并缓存。
+乘方结果的位数有上限，单个表达式的计算量有界，直接在当前线程中计算；批量计算在受资源限制
+（CPU 时间、内存）的工作进程池中进行，大批表达式不会占用对话线程。
 """
 
+import ast
+import functools
+import math
+import multiprocessing
+import operator
 import re
-from typing import Union, Dict, Any
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Union
 
+from observability.logger import get_logger
 
-def calculate(expression: str) -> str:
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+
+logger = get_logger("calculator")
+
+# 安全检查：只允许数字、运算符、括号、字母和基本函数
+_ALLOWED_CHARACTERS = re.compile(r'^[0-9+\-*/().\s,a-zA-Z]+$')
+# 额外的安全检查：不允许危险的关键字
+_DANGEROUS_KEYWORDS = ['import', 'exec', 'eval', 'open', 'file', 'system', 'subprocess']
+
+# 整数乘方结果的最大位数（约 3000 位十进制数），避免 9**9**9 这类表达式耗尽 CPU 和内存
+MAX_INTEGER_BITS = 10000
+
+Number = Union[int, float]
+
+
+class CalculatorError(ValueError):
+    """表达式不合法"""
+
+
+def _power(base: Number, exponent: Number) -> Number:
+    """乘方，整数结果过大时拒绝计算"""
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if base.bit_length() * exponent > MAX_INTEGER_BITS:
+            raise OverflowError("结果过大")
+    return operator.pow(base, exponent)
+
+
+_BINARY_OPERATORS: Dict[type, Callable[[Number, Number], Number]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: _power,
+}
+
+_UNARY_OPERATORS: Dict[type, Callable[[Number], Number]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_FUNCTIONS: Dict[str, Callable[..., Number]] = {
+    "sqrt": math.sqrt,
+    "pow": math.pow,
+    "abs": abs,
+}
+
+
+def _compile_node(node: ast.AST) -> Callable[[], Number]:
+    """把语法树节点编译为无参闭包"""
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        value = node.value
+        return lambda: value
+    
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        function = _BINARY_OPERATORS[type(node.op)]
+        left, right = _compile_node(node.left), _compile_node(node.right)
+        return lambda: function(left(), right())
+    
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        function = _UNARY_OPERATORS[type(node.op)]
+        operand = _compile_node(node.operand)
+        return lambda: function(operand())
+    
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        function = _FUNCTIONS.get(node.func.id)
+        if function is None:
+            raise CalculatorError(f"不支持的函数：{node.func.id}")
+        arguments = [_compile_node(argument) for argument in node.args]
+        return lambda: function(*[argument() for argument in arguments])
+    
+    if isinstance(node, ast.Name):
+        raise CalculatorError(f"不支持的名称：{node.id}")
+    raise CalculatorError("不支持的表达式")
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> Callable[[], Number]:
     """
-    计算数学表达式
+    编译数学表达式（按表达式文本缓存）
     
     Args:
-        expression: 数学表达式，如 "2+3*4" 或 "sqrt(16)"
-        
+        expression: 数学表达式
+    
+    Returns:
+        计算表达式的无参函数
+    
+    Raises:
+        CalculatorError: 表达式包含不允许的内容
+    """
+    if not _ALLOWED_CHARACTERS.match(expression):
+        raise CalculatorError("表达式包含不允许的字符")
+    expression = expression.lower()
+    if any(keyword in expression for keyword in _DANGEROUS_KEYWORDS):
+        raise CalculatorError("表达式包含不允许的字符")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError:
+        raise CalculatorError("表达式格式不正确") from None
+    return _compile_node(tree.body)
+
+
+def _format_result(result: Number) -> str:
+    """格式化计算结果"""
+    if result == int(result):
+        return f"计算结果：{int(result)}"
+    return f"计算结果：{result:.4f}"
+
+
+def evaluate_expression(expression: str) -> str:
+    """
+    在当前进程中计算数学表达式（calculate 和工作进程执行的计算）
+    
+    Args:
+        expression: 数学表达式
+    
     Returns:
         计算结果字符串
     """
     try:
-        # 安全检查：只允许数字、运算符、括号、字母和基本函数
-        allowed_chars = r'^[0-9+\-*/().\s,a-zA-Z]+$'
-        if not re.match(allowed_chars, expression):
-            return "错误：表达式包含不允许的字符"
+        return _format_result(compile_expression(expression)())
+    except CalculatorError as e:
+        return f"错误：{e}"
+    except ZeroDivisionError:
+        return "错误：除数不能为零"
+    except MemoryError:
+        return "错误：计算超出资源限制"
+    except Exception as e:
+        return f"计算错误：{str(e)}"
+
+
+def _init_worker(memory_mb: Optional[int], max_integer_bits: Optional[int]):
+    """工作进程初始化：设置乘方位数上限，并在进程当前占用的地址空间之上限制可用内存"""
+    global MAX_INTEGER_BITS
+    if max_integer_bits is not None:
+        MAX_INTEGER_BITS = max_integer_bits
+    if not RESOURCE_AVAILABLE or memory_mb is None:
+        return
+    try:
+        # 工作进程启动时已导入工具模块，限制按新增内存计算
+        with open("/proc/self/statm") as f:
+            current = int(f.read().split()[0]) * resource.getpagesize()
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        limit = current + memory_mb * 1024 * 1024
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    except (OSError, ValueError):
+        pass
+
+
+def _evaluate_chunk(expressions: List[str], cpu_seconds: Optional[float]) -> List[str]:
+    """在工作进程中计算一批表达式，整批的 CPU 时间不超过 cpu_seconds（超出时进程被系统终止）"""
+    if RESOURCE_AVAILABLE and cpu_seconds is not None:
+        # CPU 时间限制按进程累计，每批在已用时间之上重新设置
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        soft = math.ceil(usage.ru_utime + usage.ru_stime + cpu_seconds)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+        except (OSError, ValueError):
+            pass
+    return [evaluate_expression(expression) for expression in expressions]
+
+
+def _worker_context():
+    """工作进程的启动方式：多线程进程中 fork 不安全，优先使用 forkserver，其次 spawn"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class CalculatorPool:
+    """计算器进程池类
+    
+    批量表达式在工作进程中计算：每批表达式受 CPU 时间限制，工作进程受内存限制，调用方等待超过 timeout
+    时终止工作进程并重建进程池。工作进程用 forkserver（不支持时用 spawn）启动，不从多线程的服务进程
+    直接 fork。无法创建工作进程时（如受限环境）在当前进程中计算，乘方仍有位数限制。
+    """
+    
+    def __init__(self, max_workers: int = 2, timeout: float = 2.0, cpu_seconds: Optional[float] = 1.0,
+                 memory_mb: Optional[int] = 256, chunk_size: int = 256, max_integer_bits: Optional[int] = None,
+                 startup_timeout: float = 60.0):
+        """
+        初始化计算器进程池
         
-        # 额外的安全检查：不允许危险的关键字
-        dangerous_keywords = ['import', 'exec', 'eval', 'open', 'file', 'system', 'subprocess']
-        expression_lower = expression.lower()
-        for keyword in dangerous_keywords:
-            if keyword in expression_lower:
-                return "错误：表达式包含不允许的字符"
+        Args:
+            max_workers: 工作进程数
+            timeout: 等待一批表达式计算完成的时间（秒）
+            cpu_seconds: 每批表达式的 CPU 时间上限（秒），为None时不限制
+            memory_mb: 每个工作进程可新增的内存（MB），为None时不限制
+            chunk_size: 批量计算时每个工作进程任务的表达式数
+            max_integer_bits: 工作进程中整数乘方结果的最大位数，为None时使用 MAX_INTEGER_BITS
+            startup_timeout: 等待工作进程启动的时间（秒），超时后在当前进程中计算
+        """
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.chunk_size = max(1, chunk_size)
+        self.max_integer_bits = max_integer_bits
+        self.startup_timeout = startup_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inline = False
+    
+    def calculate_many(self, expressions: List[str]) -> List[str]:
+        """
+        批量计算表达式（相同的表达式只计算一次）
         
-        # 替换一些常见的数学函数
-        expression = expression.lower()
-        expression = expression.replace('sqrt', 'math.sqrt')
-        expression = expression.replace('pow', 'math.pow')
-        expression = expression.replace('abs', 'abs')
+        Args:
+            expressions: 数学表达式列表
         
-        # 添加math模块导入
-        import math
+        Returns:
+            与输入顺序对应的计算结果字符串列表
+        """
+        unique = list(dict.fromkeys(expressions))
+        if not unique:
+            return []
+        executor = self._get_executor()
+        if executor is None:
+            results = dict(zip(unique, (evaluate_expression(expression) for expression in unique)))
+            return [results[expression] for expression in expressions]
         
-        # 计算表达式
-        result = eval(expression, {"__builtins__": {}}, {"math": math, "abs": abs})
+        chunks = [unique[start:start + self.chunk_size] for start in range(0, len(unique), self.chunk_size)]
+        try:
+            futures = [executor.submit(_evaluate_chunk, chunk, self.cpu_seconds) for chunk in chunks]
+        except BrokenProcessPool:
+            self._reset(executor)
+            return self.calculate_many(expressions)
         
-        # 格式化结果
-        if isinstance(result, (int, float)):
-            if result == int(result):
-                return f"计算结果：{int(result)}"
-            else:
-                return f"计算结果：{result:.4f}"
-        else:
-            return f"计算结果：{result}"
-            
-    except ZeroDivisionError:
-        return "错误：除数不能为零"
-    except Exception as e:
-        return f"计算错误：{str(e)}"
+        results: Dict[str, str] = {}
+        for chunk, future in zip(chunks, futures):
+            try:
+                chunk_results = future.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                logger.warning("计算超时，重建计算器进程池")
+                self._reset(executor, terminate=True)
+                chunk_results = ["错误：计算超时"] * len(chunk)
+            except BrokenProcessPool:
+                logger.warning("计算器工作进程异常退出，重建计算器进程池")
+                self._reset(executor)
+                chunk_results = ["错误：计算超出资源限制"] * len(chunk)
+            results.update(zip(chunk, chunk_results))
+        return [results[expression] for expression in expressions]
+    
+    def calculate(self, expression: str) -> str:
+        """
+        在工作进程中计算单个表达式（需要隔离时使用，单次调用有一次进程间往返的开销）
+        
+        Args:
+            expression: 数学表达式
+        
+        Returns:
+            计算结果字符串
+        """
+        return self.calculate_many([expression])[0]
+    
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        """工作进程池（首次使用时创建），无法创建时返回None"""
+        if self._executor is None and not self._inline:
+            with self._lock:
+                if self._executor is None and not self._inline:
+                    executor = None
+                    try:
+                        executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers, mp_context=_worker_context(),
+                            initializer=_init_worker, initargs=(self.memory_mb, self.max_integer_bits)
+                        )
+                        # 预先启动全部工作进程，进程启动（导入模块）的耗时不计入计算超时
+                        for future in [executor.submit(_evaluate_chunk, [], None) for _ in range(self.max_workers)]:
+                            future.result(timeout=self.startup_timeout)
+                        self._executor = executor
+                    except (OSError, NotImplementedError, FutureTimeoutError, BrokenProcessPool) as e:
+                        logger.warning("无法创建计算器进程池，在当前进程中计算：%s", e)
+                        if executor is not None:
+                            executor.shutdown(wait=False, cancel_futures=True)
+                        self._inline = True
+        return self._executor
+    
+    def _reset(self, executor: ProcessPoolExecutor, terminate: bool = False):
+        """丢弃出错的进程池，下次使用时重新创建"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        if terminate:
+            # 卡住的工作进程不会自行退出（没有 CPU 时间限制时）
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    def close(self):
+        """关闭工作进程池"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# 全局计算器进程池实例
+_calculator_pool = None
+_calculator_pool_lock = threading.Lock()
+
+
+def get_calculator_pool() -> CalculatorPool:
+    """获取计算器进程池实例"""
+    global _calculator_pool
+    if _calculator_pool is None:
+        with _calculator_pool_lock:
+            if _calculator_pool is None:
+                _calculator_pool = CalculatorPool()
+    return _calculator_pool
+
+
+def set_calculator_pool(pool: CalculatorPool):
+    """
+    替换全局计算器进程池实例
+    
+    Args:
+        pool: 计算器进程池
+    """
+    global _calculator_pool
+    with _calculator_pool_lock:
+        _calculator_pool = pool
+
+
+def calculate(expression: str) -> str:
+    """
+    计算数学表达式
+    
+    单个表达式的计算量受乘方位数上限约束，在当前线程中直接计算，不经过进程池。
+    
+    Args:
+        expression: 数学表达式，如 "2+3*4" 或 "sqrt(16)"
+    
+    Returns:
+        计算结果字符串
+    """
+    return evaluate_expression(expression)
+
+
+def calculate_many(expressions: List[str]) -> List[str]:
+    """
+    批量计算数学表达式（一次进程间往返计算一批）
+    
+    Args:
+        expressions: 数学表达式列表
+    
+    Returns:
+        与输入顺序对应的计算结果字符串列表
+    """
+    return get_calculator_pool().calculate_many(expressions)
 
 
 def get_calculator_tool_config():
@@ -80,4 +403,4 @@ def get_calculator_tool_config():
                 "required": ["expression"]
             }
         }
-    } 
\ No newline at end of file
+    }
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""
+内存映射文档存储模块
+知识库文档以每行一个JSON的形式保存，配合偏移量数组按需读取，多个进程可共享同一份页缓存
+"""
+
+import json
+import mmap
+import os
+import pathlib
+from dataclasses import asdict, is_dataclass
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import numpy as np
+
+
+def document_store_paths(docs_file: pathlib.Path):
+    """
+    根据 pickle 文档文件路径推导 JSONL 文档文件和偏移量文件路径
+    
+    Args:
+        docs_file: 形如 {kb}_documents.pkl 的路径
+    
+    Returns:
+        (JSONL 文件路径, 偏移量文件路径)
+    """
+    docs_file = pathlib.Path(docs_file)
+    return docs_file.with_suffix(".jsonl"), docs_file.with_suffix(".offsets.npy")
+
+
+def write_document_store(documents: Iterable[Any], jsonl_file: pathlib.Path, offsets_file: pathlib.Path):
+    """
+    写出 JSONL 文档文件和偏移量文件
+    
+    Args:
+        documents: 文档列表（数据类实例或字典）
+        jsonl_file: JSONL 文件路径
+        offsets_file: 偏移量文件路径，第 i 个文档位于 [offsets[i], offsets[i+1])
+    """
+    # 先写临时文件再原子替换，多个进程同时转换时读者不会看到写了一半的文件
+    suffix = f".tmp{os.getpid()}"
+    offsets = [0]
+    with open(f"{jsonl_file}{suffix}", "wb") as f:
+        for doc in documents:
+            record = asdict(doc) if is_dataclass(doc) else dict(doc)
+            line = json.dumps(record, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    with open(f"{offsets_file}{suffix}", "wb") as f:
+        np.save(f, np.asarray(offsets, dtype="int64"))
+    os.replace(f"{jsonl_file}{suffix}", jsonl_file)
+    os.replace(f"{offsets_file}{suffix}", offsets_file)
+
+
+class MmapDocumentStore:
+    """内存映射文档存储类
+    
+    只读打开，行为类似列表：支持 len()、下标访问和迭代。文档在访问时才解析，
+    文件内容由操作系统页缓存在进程之间共享。
+    """
+    
+    def __init__(self, jsonl_file: pathlib.Path, offsets_file: pathlib.Path,
+                 factory: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        """
+        初始化文档存储
+        
+        Args:
+            jsonl_file: JSONL 文件路径
+            offsets_file: 偏移量文件路径
+            factory: 把解析出的字典转换为文档对象的函数，为None时直接返回字典
+        """
+        self.jsonl_file = pathlib.Path(jsonl_file)
+        self.factory = factory
+        self._offsets = np.load(offsets_file, mmap_mode="r")
+        self._file = open(self.jsonl_file, "rb")
+        # 空文件无法映射
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if len(self) else None
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, idx: int):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("文档下标越界")
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        record = json.loads(self._mmap[start:end].decode("utf-8"))
+        return self.factory(record) if self.factory else record
+    
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+    
+    def close(self):
+        """关闭映射和文件"""
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
@@ -0,0 +1,301 @@
+"""
+嵌入模型后端模块
+提供可注册的嵌入后端（sentence-transformers、ONNX Runtime CPU）和常用模型预设，
+每个知识库可以选择不同的模型，在准确率和CPU延迟之间取舍；ONNX 后端不依赖 torch
+"""
+
+import json
+import os
+import pathlib
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import onnxruntime
+    from tokenizers import Tokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+
+@dataclass
+class EmbeddingSpec:
+    """嵌入模型描述，记录在知识库的索引元数据中"""
+    backend: str
+    model: str
+    dimension: Optional[int] = None
+    options: Dict[str, Any] = field(default_factory=dict)
+    
+    def identity(self) -> Dict[str, Any]:
+        """用于判断两个模型是否兼容的字段（后端和模型名称）"""
+        return {"backend": self.backend, "model": self.model}
+
+
+# 模型预设：名称 -> 模型描述
+EMBEDDING_PRESETS: Dict[str, EmbeddingSpec] = {
+    # 英文模型，旧版本默认使用，已有索引均由它构建
+    "minilm": EmbeddingSpec("sentence-transformers", "all-MiniLM-L6-v2", 384),
+    # 多语言小模型，支持中文
+    "multilingual-minilm": EmbeddingSpec("sentence-transformers", "paraphrase-multilingual-MiniLM-L12-v2", 384),
+    # 中文小模型
+    "bge-small-zh": EmbeddingSpec("sentence-transformers", "BAAI/bge-small-zh-v1.5", 512),
+    # 以下为 ONNX Runtime CPU 版本，服务镜像中不需要安装 torch
+    "multilingual-minilm-onnx": EmbeddingSpec(
+        "onnx", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2", 384,
+        {"pooling": "mean", "normalize": False},
+    ),
+    "bge-small-zh-onnx": EmbeddingSpec(
+        "onnx", "Xenova/bge-small-zh-v1.5", 512, {"pooling": "cls", "normalize": True},
+    ),
+}
+
+DEFAULT_EMBEDDING = "minilm"
+
+
+class EmbeddingBackend:
+    """嵌入后端基类
+    
+    encode 的接口与 SentenceTransformer.encode 一致，返回 float32 向量数组。
+    """
+    
+    def __init__(self, spec: EmbeddingSpec):
+        self.spec = spec
+    
+    def describe(self) -> EmbeddingSpec:
+        """返回模型描述"""
+        return self.spec
+    
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """sentence-transformers 后端"""
+    
+    def __init__(self, spec: EmbeddingSpec):
+        super().__init__(spec)
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(spec.model, device=spec.options.get("device", "cpu"))
+        if spec.dimension is None:
+            spec.dimension = self.model.get_sentence_embedding_dimension()
+    
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, **kwargs), dtype="float32")
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """ONNX Runtime CPU 后端
+    
+    使用 tokenizers 分词、ONNX Runtime 推理，不依赖 torch 和 transformers。
+    model 为本地目录，或 HuggingFace 仓库名（需要安装 huggingface_hub，首次使用时下载）。
+    目录中需要包含 tokenizer.json 和 ONNX 模型文件（默认 onnx/model.onnx，可用 model_file 选项指定）。
+    
+    支持的选项：
+        model_file: ONNX 模型文件相对路径
+        pooling: "mean"（按注意力掩码平均）或 "cls"（取第一个 token）
+        normalize: 是否做 L2 归一化
+        max_length: 最大 token 数
+        batch_size: 每次推理的文本数
+        num_threads: 推理线程数，0 表示由 ONNX Runtime 决定
+    """
+    
+    def __init__(self, spec: EmbeddingSpec):
+        super().__init__(spec)
+        if not ONNX_AVAILABLE:
+            raise ImportError("ONNX 后端需要安装 onnxruntime 和 tokenizers")
+        
+        options = spec.options
+        model_dir = self._resolve_model_dir(spec.model, options.get("model_file", "onnx/model.onnx"))
+        self.pooling = options.get("pooling", "mean")
+        self.normalize = options.get("normalize", False)
+        self.batch_size = options.get("batch_size", 32)
+        
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=options.get("max_length", 256))
+        self.tokenizer.enable_padding()
+        
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = options.get("num_threads", 0)
+        self.session = onnxruntime.InferenceSession(
+            str(model_dir / options.get("model_file", "onnx/model.onnx")), session_options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {model_input.name for model_input in self.session.get_inputs()}
+        # InferenceSession.run 可以并发调用，分词器的填充状态不是线程安全的
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _resolve_model_dir(model: str, model_file: str) -> pathlib.Path:
+        """本地目录直接使用，否则从 HuggingFace 下载所需文件"""
+        if os.path.isdir(model):
+            return pathlib.Path(model)
+        try:
+            from huggingface_hub import snapshot_download
+        except ImportError:
+            raise ImportError(f"模型 {model} 不是本地目录，下载需要安装 huggingface_hub")
+        return pathlib.Path(snapshot_download(model, allow_patterns=["tokenizer.json", model_file]))
+    
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        # show_progress_bar 等 sentence-transformers 参数不适用，忽略
+        texts = [text if isinstance(text, str) else "\n".join(map(str, text)) for text in texts]
+        batches = [self._encode_batch(texts[start:start + self.batch_size])
+                   for start in range(0, len(texts), self.batch_size)]
+        if not batches:
+            return np.zeros((0, self.spec.dimension or 0), dtype="float32")
+        return np.concatenate(batches).astype("float32")
+    
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype="int64")
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype="int64")
+        inputs = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": np.zeros_like(input_ids)}
+        
+        hidden = self.session.run(None, {name: value for name, value in inputs.items() if name in self._input_names})[0]
+        if self.pooling == "cls":
+            embeddings = hidden[:, 0]
+        else:
+            mask = attention_mask[..., None].astype("float32")
+            embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
+
+
+# 后端注册表：后端名称 -> 创建函数
+_BACKENDS: Dict[str, Callable[[EmbeddingSpec], EmbeddingBackend]] = {
+    "sentence-transformers": SentenceTransformerBackend,
+    "onnx": OnnxEmbeddingBackend,
+}
+
+
+def register_embedding_backend(name: str, factory: Callable[[EmbeddingSpec], EmbeddingBackend]):
+    """
+    注册嵌入后端
+    
+    Args:
+        name: 后端名称，用于 "后端:模型" 形式的模型描述
+        factory: 根据 EmbeddingSpec 创建后端实例的函数
+    """
+    _BACKENDS[name] = factory
+
+
+def parse_embedding_spec(spec: Any) -> EmbeddingSpec:
+    """
+    解析模型描述
+    
+    Args:
+        spec: 预设名称（如 "bge-small-zh-onnx"）、"后端:模型"（如 "onnx:/models/bge-small-zh"）、
+            不带后端的 sentence-transformers 模型名称，或 EmbeddingSpec 实例
+    
+    Returns:
+        EmbeddingSpec 实例（预设会被复制，可以安全修改）
+    """
+    if isinstance(spec, EmbeddingSpec):
+        return spec
+    if spec in EMBEDDING_PRESETS:
+        preset = EMBEDDING_PRESETS[spec]
+        return EmbeddingSpec(preset.backend, preset.model, preset.dimension, dict(preset.options))
+    backend, separator, model = str(spec).partition(":")
+    if separator and backend in _BACKENDS:
+        return EmbeddingSpec(backend, model)
+    # 兼容旧配置：直接给出 sentence-transformers 模型名称
+    for preset in EMBEDDING_PRESETS.values():
+        if preset.backend == "sentence-transformers" and preset.model == spec:
+            return EmbeddingSpec(preset.backend, preset.model, preset.dimension, dict(preset.options))
+    return EmbeddingSpec("sentence-transformers", str(spec))
+
+
+def create_embedding_backend(spec: Any) -> EmbeddingBackend:
+    """
+    按模型描述创建嵌入后端
+    
+    Args:
+        spec: 见 parse_embedding_spec
+    
+    Returns:
+        EmbeddingBackend 实例
+    """
+    spec = parse_embedding_spec(spec)
+    if spec.backend not in _BACKENDS:
+        raise ValueError(f"不支持的嵌入后端：{spec.backend}，可选值为 {', '.join(_BACKENDS)}")
+    return _BACKENDS[spec.backend](spec)
+
+
+def describe_embedding_model(model: Any) -> Optional[EmbeddingSpec]:
+    """
+    获取嵌入模型的描述
+    
+    Args:
+        model: 嵌入模型（EmbeddingBackend、RemoteEncoder、MicroBatchEncoder 等提供 describe 方法的对象）
+    
+    Returns:
+        EmbeddingSpec，无法识别的模型返回None（不做一致性检查）
+    """
+    describe = getattr(model, "describe", None)
+    return describe() if callable(describe) else None
+
+
+def index_metadata_path(index_file: pathlib.Path) -> pathlib.Path:
+    """索引元数据文件路径：{kb}_index.faiss -> {kb}_index.meta.json"""
+    return index_file.with_suffix(".meta.json")
+
+
+def read_index_metadata(index_file: pathlib.Path) -> Optional[Dict[str, Any]]:
+    """
+    读取索引元数据
+    
+    Returns:
+        元数据字典，文件不存在时返回None（旧版本构建的索引）
+    """
+    metadata_file = index_metadata_path(index_file)
+    if not metadata_file.exists():
+        return None
+    with open(metadata_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_index_metadata(index_file: pathlib.Path, spec: Optional[EmbeddingSpec], **extra):
+    """
+    写出索引元数据
+    
+    Args:
+        index_file: 索引文件路径
+        spec: 构建索引使用的嵌入模型描述，为None时只记录 extra
+        **extra: 其他字段（如文档数、维度）
+    """
+    metadata = dict(extra)
+    if spec is not None:
+        metadata["embedding"] = asdict(spec)
+    metadata_file = index_metadata_path(index_file)
+    tmp_file = metadata_file.with_name(metadata_file.name + ".tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, metadata_file)
+
+
+def check_index_compatibility(metadata: Optional[Dict[str, Any]], spec: Optional[EmbeddingSpec],
+                              index_dimension: int) -> Optional[str]:
+    """
+    检查索引与当前嵌入模型是否匹配
+    
+    Args:
+        metadata: 索引元数据
+        spec: 当前嵌入模型描述，为None时只检查维度
+        index_dimension: 索引的向量维度
+    
+    Returns:
+        不匹配时的错误信息，匹配时返回None
+    """
+    if spec is not None and spec.dimension is not None and spec.dimension != index_dimension:
+        return f"嵌入维度不匹配：索引为 {index_dimension} 维，当前模型 {spec.model} 为 {spec.dimension} 维"
+    recorded = (metadata or {}).get("embedding")
+    if spec is None or not recorded:
+        return None
+    if {"backend": recorded.get("backend"), "model": recorded.get("model")} != spec.identity():
+        return (f"嵌入模型不匹配：索引由 {recorded.get('backend')}:{recorded.get('model')} 构建，"
+                f"当前为 {spec.backend}:{spec.model}，请重新构建知识库或改用相同的模型")
+    return None
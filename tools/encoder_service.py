@@ -0,0 +1,231 @@
+"""
+独立编码进程模块
+在单独的进程中加载一份嵌入模型，多个服务工作进程通过本地队列请求编码，避免每个进程各自加载模型
+"""
+
+import functools
+import itertools
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from tools.embedding_backends import parse_embedding_spec
+
+
+def _load_embedding_backend(spec: str):
+    """在编码进程中加载嵌入模型"""
+    from tools.embedding_backends import create_embedding_backend
+    return create_embedding_backend(spec)
+
+
+def _encoder_main(model_factory: Callable[[], Any], request_queue, response_queues: List[Any],
+                  max_batch_size: int = 64):
+    """
+    编码进程主循环
+    
+    取到一个请求后，顺带取出队列中已经在等待的请求（不额外等待），参数相同的请求合并为一次 encode 调用。
+    
+    Args:
+        model_factory: 创建嵌入模型的函数
+        request_queue: 请求队列，元素为 (客户端编号, 请求编号, 文本列表, encode参数)，None 表示退出
+        response_queues: 各客户端的响应队列，元素为 (请求编号, 向量, 错误信息)
+        max_batch_size: 每次合并的最大请求数
+    """
+    model = model_factory()
+    stopping = False
+    while not stopping:
+        message = request_queue.get()
+        if message is None:
+            break
+        
+        batch = [message]
+        while len(batch) < max_batch_size:
+            try:
+                message = request_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message is None:
+                stopping = True
+                break
+            batch.append(message)
+        
+        groups: Dict[str, List[Any]] = {}
+        for message in batch:
+            groups.setdefault(repr(sorted(message[3].items())), []).append(message)
+        for messages in groups.values():
+            _encode_group(model, messages, response_queues)
+
+
+def _encode_group(model, messages: List[Any], response_queues: List[Any]):
+    """把参数相同的多个请求拼接后编码一次，再按请求拆分返回"""
+    kwargs = messages[0][3]
+    texts = [text for message in messages for text in message[2]]
+    try:
+        embeddings = np.asarray(model.encode(texts, **kwargs), dtype="float32")
+    except Exception as e:
+        for client_id, request_id, _, _ in messages:
+            response_queues[client_id].put((request_id, None, f"{type(e).__name__}: {e}"))
+        return
+    
+    start = 0
+    for client_id, request_id, request_texts, _ in messages:
+        response_queues[client_id].put((request_id, embeddings[start:start + len(request_texts)], None))
+        start += len(request_texts)
+
+
+class RemoteEncoder:
+    """远程编码器类
+    
+    提供与 SentenceTransformer 相同的 encode 接口，请求经队列发往编码进程。
+    可安全地在多个线程中使用，也可以传给子进程（只序列化队列和客户端编号）。
+    """
+    
+    def __init__(self, request_queue, response_queue, client_id: int, timeout: float = 60.0,
+                 description=None):
+        """
+        初始化远程编码器
+        
+        Args:
+            request_queue: 编码进程的请求队列
+            response_queue: 本客户端的响应队列
+            client_id: 客户端编号
+            timeout: 单次编码的等待超时时间（秒）
+            description: 编码进程中模型的描述（EmbeddingSpec），用于检查索引是否匹配
+        """
+        self.request_queue = request_queue
+        self.response_queue = response_queue
+        self.client_id = client_id
+        self.timeout = timeout
+        self.description = description
+        self._init_local_state()
+    
+    def _init_local_state(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._request_ids = itertools.count()
+        self._dispatcher = None
+    
+    def __getstate__(self):
+        return {
+            "request_queue": self.request_queue,
+            "response_queue": self.response_queue,
+            "client_id": self.client_id,
+            "timeout": self.timeout,
+            "description": self.description,
+        }
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_local_state()
+    
+    def describe(self):
+        """编码进程中模型的描述"""
+        return self.description
+    
+    def encode(self, texts, **kwargs):
+        """
+        编码文本
+        
+        Args:
+            texts: 文本列表
+            **kwargs: 透传给编码进程中模型 encode 的参数
+        
+        Returns:
+            float32 向量数组
+        """
+        future = Future()
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch_responses, daemon=True)
+                self._dispatcher.start()
+        
+        self.request_queue.put((self.client_id, request_id, list(texts), kwargs))
+        try:
+            return future.result(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+    
+    def _dispatch_responses(self):
+        """后台线程：把响应分发给等待中的调用方"""
+        while True:
+            request_id, embeddings, error = self.response_queue.get()
+            with self._lock:
+                future = self._pending.get(request_id)
+            if future is None:  # 调用方已超时
+                continue
+            if error is None:
+                future.set_result(embeddings)
+            else:
+                future.set_exception(RuntimeError(f"编码进程出错：{error}"))
+
+
+class EncoderService:
+    """编码进程管理类"""
+    
+    def __init__(self, model_name: str = "minilm", num_clients: int = 1,
+                 model_factory: Optional[Callable[[], Any]] = None, start_method: str = "spawn",
+                 max_batch_size: int = 64):
+        """
+        初始化编码服务
+        
+        Args:
+            model_name: 嵌入模型描述（预设名称或 "后端:模型"，见 embedding_backends）
+            num_clients: 客户端（工作进程）数量，每个客户端拥有独立的响应队列
+            model_factory: 创建嵌入模型的函数（需可被序列化），为None时加载 model_name
+            start_method: 进程启动方式
+            max_batch_size: 编码进程每次合并的最大请求数
+        """
+        self.model_name = model_name
+        self.model_factory = model_factory
+        self.max_batch_size = max_batch_size
+        self._context = multiprocessing.get_context(start_method)
+        self._request_queue = self._context.Queue()
+        self._response_queues = [self._context.Queue() for _ in range(num_clients)]
+        self._process = None
+    
+    def start(self):
+        """启动编码进程"""
+        if self.model_factory is not None:
+            factory = self.model_factory
+        else:
+            factory = functools.partial(_load_embedding_backend, self.model_name)
+        self._process = self._context.Process(
+            target=_encoder_main,
+            args=(factory, self._request_queue, self._response_queues, self.max_batch_size),
+            name="encoder",
+            daemon=True,
+        )
+        self._process.start()
+        return self
+    
+    def client(self, client_id: int, timeout: float = 60.0) -> RemoteEncoder:
+        """
+        获取指定编号的远程编码器
+        
+        Args:
+            client_id: 客户端编号，范围 [0, num_clients)
+            timeout: 单次编码的等待超时时间（秒）
+        
+        Returns:
+            RemoteEncoder 实例
+        """
+        # 自定义 model_factory 时无法得知模型描述，不做索引一致性检查
+        description = parse_embedding_spec(self.model_name) if self.model_factory is None else None
+        return RemoteEncoder(self._request_queue, self._response_queues[client_id], client_id, timeout, description)
+    
+    def stop(self, timeout: float = 5.0):
+        """停止编码进程"""
+        if self._process is None:
+            return
+        self._request_queue.put(None)
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process = None
@@ -3,9 +3,12 @@
 支持HPV、FLU、HIV三个知识库的FAISS向量搜索
 """
 
+import datetime
+import itertools
 import os
 import pathlib
-from typing import Dict, List, Any, Optional
+import threading
+from typing import Dict, List, Any, Optional, Tuple
 import json
 import pickle
 from dataclasses import dataclass
@@ -15,11 +18,24 @@ from enum import Enum
 try:
     import faiss
     import numpy as np
-    from sentence_transformers import SentenceTransformer
+    from tools.document_store import MmapDocumentStore, document_store_paths, write_document_store
+    from tools.micro_batcher import MicroBatchEncoder, MicroBatcher
+    from tools.vector_quantization import (
+        build_quantized_index, open_vector_store, parse_quantization, reconstruct_vectors, rescore,
+        resolve_quantization, vector_store_path, write_index, write_vector_store
+    )
     FAISS_AVAILABLE = True
 except ImportError:
     FAISS_AVAILABLE = False
-    print("警告：FAISS或sentence-transformers未安装，知识库功能将不可用")
+    print("警告：FAISS未安装，知识库功能将不可用")
+
+# 嵌入模型相关导入（多进程服务中由独立编码进程提供嵌入，工作进程不需要）
+try:
+    from sentence_transformers import SentenceTransformer
+    SENTENCE_TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    SENTENCE_TRANSFORMERS_AVAILABLE = False
+    print("警告：sentence-transformers未安装，需要外部提供嵌入模型")
 
 # 内容处理相关导入
 try:
@@ -33,6 +49,16 @@ except ImportError:
     print("警告：pandas或pymupdf4llm未安装，内容处理功能将不可用")
 
 from models.simple_llm_client import SimpleLLMClient
+from tools.embedding_backends import (
+    DEFAULT_EMBEDDING, EmbeddingSpec, check_index_compatibility, create_embedding_backend, describe_embedding_model,
+    parse_embedding_spec, read_index_metadata, write_index_metadata
+)
+from observability import trace_span
+from observability.logger import get_logger
+from observability.usage import PURPOSE_QUESTION_GENERATION, track_usage, usage_purpose
+
+
+logger = get_logger("knowledge_base")
 
 
 class KnowledgeBaseType(Enum):
@@ -54,18 +80,118 @@ class KnowledgeDocument:
     metadata: Optional[Dict[str, Any]] = None
 
 
+# 管理器实例编号（id() 可能被后创建的实例复用，缓存用编号区分不同的管理器）
+_manager_instance_ids = itertools.count(1)
+
+# 支持的文档过滤条件
+DOCUMENT_FILTER_KEYS = ("file_type", "source", "date_from", "date_to")
+
+
+def match_document_filters(doc: KnowledgeDocument, filters: Dict[str, Any]) -> bool:
+    """
+    判断文档是否满足过滤条件
+    
+    Args:
+        doc: 知识库文档
+        filters: 过滤条件，可包含：
+            file_type: 文件类型（"pdf" 或 "excel"），或类型列表
+            source: 来源文件名或路径中包含的文本（不区分大小写）
+            date_from / date_to: 文档日期范围（YYYY-MM-DD，含边界），没有日期的文档不满足日期条件
+    
+    Returns:
+        是否满足全部条件
+    """
+    unknown = set(filters) - set(DOCUMENT_FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"不支持的过滤条件：{', '.join(sorted(unknown))}，可选值为 {', '.join(DOCUMENT_FILTER_KEYS)}")
+    
+    metadata = doc.metadata or {}
+    file_type = filters.get("file_type")
+    if file_type:
+        file_types = [file_type] if isinstance(file_type, str) else list(file_type)
+        if doc.file_type not in file_types:
+            return False
+    source = filters.get("source")
+    if source and str(source).lower() not in f"{doc.source} {metadata.get('file_name', '')}".lower():
+        return False
+    if filters.get("date_from") or filters.get("date_to"):
+        date = str(metadata.get("date") or "")[:10]
+        if not date:
+            return False
+        if filters.get("date_from") and date < str(filters["date_from"])[:10]:
+            return False
+        if filters.get("date_to") and date > str(filters["date_to"])[:10]:
+            return False
+    return True
+
+
 class KnowledgeBaseManager:
     """知识库管理器"""
     
-    def __init__(self, base_dir: str = "input"):
+    def __init__(self, base_dir: str = "input", embedding_model=None, mmap: bool = False,
+                 batch_max_wait_ms: Optional[float] = None, batch_max_size: int = 32,
+                 embedding: Optional[str] = None, kb_embeddings: Optional[Dict[str, str]] = None,
+                 quantization: Optional[str] = None, rescore_factor: int = 4):
+        """
+        初始化知识库管理器
+        
+        每个知识库使用的嵌入模型按以下顺序确定：kb_embeddings 中的配置（或 KB_EMBEDDING_<知识库> 环境变量）、
+        传入的 embedding_model、索引元数据中记录的模型、默认模型。配置的模型与索引元数据记录的模型不一致时，
+        该知识库拒绝加载。
+        
+        Args:
+            base_dir: 知识库根目录
+            embedding_model: 所有知识库共用的嵌入模型（需提供 encode 方法），为None时按模型描述加载
+            mmap: 是否以内存映射方式只读打开索引和文档，多个进程共享同一份页缓存
+            batch_max_wait_ms: 并发搜索凑批的最长等待时间（毫秒），为None时不开启微批
+            batch_max_size: 每批最多合并的搜索请求数
+            embedding: 默认嵌入模型描述（预设名称或 "后端:模型"），为None时读取 KB_EMBEDDING 环境变量，
+                否则为 "minilm"
+            kb_embeddings: 按知识库指定的嵌入模型描述，如 {"flu": "bge-small-zh-onnx"}
+            quantization: 构建索引时的向量量化方式（fp16、sq8、pq、pq<子向量数>），为None时读取 KB_QUANTIZATION
+                环境变量，否则不量化；加载时按索引元数据识别，不受该参数影响
+            rescore_factor: 量化索引的候选倍数，先取 k * rescore_factor 个候选，再用原始向量精确重排取前 k 个
+        """
         self.base_dir = pathlib.Path(base_dir)
-        self.embedding_model = None
+        self.embedding_model = embedding_model
+        self.mmap = mmap
+        self._search_batcher = None
+        self._batch_options = (batch_max_wait_ms, batch_max_size)
+        if batch_max_wait_ms is not None and FAISS_AVAILABLE:
+            self._search_batcher = MicroBatcher(
+                self._run_search_batch, batch_max_wait_ms, batch_max_size, name="kb-search-batcher"
+            )
+        self.default_embedding = embedding or os.getenv("KB_EMBEDDING") or DEFAULT_EMBEDDING
+        self.kb_embeddings = {
+            kb_type: (kb_embeddings or {}).get(kb_type.value) or os.getenv(f"KB_EMBEDDING_{kb_type.name}")
+            for kb_type in KnowledgeBaseType
+        }
+        # 按 (后端, 模型) 缓存已加载的嵌入模型，使用相同模型的知识库共享一份
+        self._loaded_embeddings: Dict[Any, Any] = {}
+        self.embedding_models = {}
+        # 拒绝加载的知识库及原因（如嵌入模型不匹配）
+        self.load_errors: Dict[KnowledgeBaseType, str] = {}
+        self.quantization = parse_quantization(quantization or os.getenv("KB_QUANTIZATION")) if FAISS_AVAILABLE else None
+        self.rescore_factor = max(1, rescore_factor)
+        # 量化索引对应的原始向量（内存映射），为None时直接使用索引返回的距离
+        self.vector_stores = {}
+        # 过滤条件 -> 满足条件的文档编号
+        self._filter_cache: Dict[Any, Any] = {}
         self.indices = {}
         self.documents = {}
         self.llm_client = None
+        # 每次成功构建知识库时递增，依赖检索结果的缓存据此失效
+        self.generation = 0
+        self.instance_id = next(_manager_instance_ids)
+        # 最近一次构建知识库的模型用量（生成相关问题）
+        self.last_build_usage = None
         
-        if FAISS_AVAILABLE:
-            self.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+        # 其他组件（如语义答案缓存）通过 embedding_model 发起的编码同样合并
+        self._shared_embedding = embedding_model is not None
+        if self._shared_embedding:
+            self.embedding_model = self._wrap_embedding_model(embedding_model)
+        elif FAISS_AVAILABLE:
+            self.embedding_model = self._load_embedding_model(self.default_embedding)
         
         try:
             self.llm_client = SimpleLLMClient()
@@ -86,19 +212,129 @@ class KnowledgeBaseManager:
         kb_dir.mkdir(parents=True, exist_ok=True)
         
         # 尝试加载现有索引
+        self.embedding_models[kb_type] = self.embedding_model
         if FAISS_AVAILABLE and index_file.exists() and docs_file.exists():
             try:
-                self.indices[kb_type] = faiss.read_index(str(index_file))
-                with open(docs_file, 'rb') as f:
-                    self.documents[kb_type] = pickle.load(f)
+                metadata = read_index_metadata(index_file)
+                model = self.embedding_models[kb_type] = self._select_embedding_model(kb_type, metadata)
+                
+                if self.mmap:
+                    index = faiss.read_index(str(index_file), self._mmap_io_flags())
+                else:
+                    index = faiss.read_index(str(index_file))
+                # 用不同模型编码的查询与索引中的向量不可比，直接拒绝加载
+                error = check_index_compatibility(metadata, describe_embedding_model(model), index.d)
+                if error:
+                    raise ValueError(error)
+                self.vector_stores[kb_type] = self._open_vector_store(index_file, index, metadata)
+                
+                if self.mmap:
+                    self.documents[kb_type] = self._open_document_store(docs_file)
+                else:
+                    with open(docs_file, 'rb') as f:
+                        self.documents[kb_type] = pickle.load(f)
+                self.indices[kb_type] = index
                 print(f"已加载 {kb_type.value} 知识库索引")
             except Exception as e:
                 print(f"加载 {kb_type.value} 知识库失败: {e}")
+                self.load_errors[kb_type] = str(e)
                 self.indices[kb_type] = None
                 self.documents[kb_type] = []
+                self.vector_stores[kb_type] = None
         else:
+            if FAISS_AVAILABLE:
+                self.embedding_models[kb_type] = self._select_embedding_model(kb_type, None)
             self.indices[kb_type] = None
             self.documents[kb_type] = []
+            self.vector_stores[kb_type] = None
+    
+    def _select_embedding_model(self, kb_type: KnowledgeBaseType, metadata: Optional[Dict[str, Any]]):
+        """
+        确定知识库使用的嵌入模型
+        
+        Args:
+            kb_type: 知识库类型
+            metadata: 索引元数据，没有索引或旧版本索引时为None
+        
+        Returns:
+            嵌入模型，不可用时返回None
+        """
+        if self.kb_embeddings.get(kb_type):
+            return self._load_embedding_model(self.kb_embeddings[kb_type])
+        if self._shared_embedding:
+            return self.embedding_model
+        recorded = (metadata or {}).get("embedding")
+        if recorded:
+            return self._load_embedding_model(EmbeddingSpec(**recorded))
+        return self.embedding_model
+    
+    def _load_embedding_model(self, spec):
+        """
+        按模型描述加载嵌入模型，相同的 (后端, 模型) 只加载一次
+        
+        Args:
+            spec: 模型描述（预设名称、"后端:模型" 或 EmbeddingSpec）
+        
+        Returns:
+            嵌入模型，加载失败时返回None
+        """
+        spec = parse_embedding_spec(spec)
+        key = (spec.backend, spec.model)
+        if key not in self._loaded_embeddings:
+            model = None
+            # sentence-transformers 未安装时模块导入处已经给出警告
+            if spec.backend != "sentence-transformers" or SENTENCE_TRANSFORMERS_AVAILABLE:
+                try:
+                    model = self._wrap_embedding_model(create_embedding_backend(spec))
+                except Exception as e:
+                    print(f"警告：嵌入模型 {spec.backend}:{spec.model} 加载失败：{e}")
+            self._loaded_embeddings[key] = model
+        return self._loaded_embeddings[key]
+    
+    def _wrap_embedding_model(self, model):
+        """开启微批时用 MicroBatchEncoder 包装嵌入模型"""
+        if self._search_batcher is None:
+            return model
+        return MicroBatchEncoder(model, *self._batch_options)
+    
+    @staticmethod
+    def _mmap_io_flags() -> int:
+        """内存映射只读打开索引的 FAISS 标志（IO_FLAG_MMAP_IFC 使扁平索引的向量数据也走映射）"""
+        return faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+    
+    @staticmethod
+    def _open_vector_store(index_file: pathlib.Path, index, metadata: Optional[Dict[str, Any]]):
+        """
+        打开量化索引对应的原始向量，用于精确重排
+        
+        Returns:
+            内存映射的原始向量，未量化或文件缺失、与索引不一致时返回None（直接使用量化距离）
+        """
+        if not (metadata or {}).get("quantization") or metadata["quantization"] == "flat":
+            return None
+        store = open_vector_store(index_file)
+        if store is None or store.shape != (index.ntotal, index.d):
+            logger.warning("%s 的原始向量文件缺失或与索引不一致，搜索结果不做精确重排", index_file.name)
+            return None
+        return store
+    
+    @staticmethod
+    def _open_document_store(docs_file: pathlib.Path) -> "MmapDocumentStore":
+        """
+        打开内存映射文档存储，JSONL 文件缺失或比 pickle 文件旧时先从 pickle 转换
+        
+        Args:
+            docs_file: pickle 文档文件路径
+        
+        Returns:
+            MmapDocumentStore 实例
+        """
+        jsonl_file, offsets_file = document_store_paths(docs_file)
+        if (not jsonl_file.exists() or not offsets_file.exists()
+                or jsonl_file.stat().st_mtime < docs_file.stat().st_mtime):
+            with open(docs_file, 'rb') as f:
+                write_document_store(pickle.load(f), jsonl_file, offsets_file)
+        return MmapDocumentStore(jsonl_file, offsets_file, factory=lambda record: KnowledgeDocument(**record))
     
     def build_knowledge_base(self, kb_type: KnowledgeBaseType, 
                            excel_config: Optional[Dict] = None):
@@ -114,7 +350,17 @@ class KnowledgeBaseManager:
                 "sheet_name": "工作表名"
             }
         """
-        if not FAISS_AVAILABLE or not CONTENT_PROCESSING_AVAILABLE:
+        with track_usage() as usage, usage_purpose(PURPOSE_QUESTION_GENERATION):
+            result = self._build_knowledge_base(kb_type, excel_config)
+        self.last_build_usage = usage
+        if usage.calls:
+            print(f"构建 {kb_type.value} 知识库的模型用量：{usage.format_summary()}")
+        return result
+    
+    def _build_knowledge_base(self, kb_type: KnowledgeBaseType, excel_config: Optional[Dict]):
+        """构建知识库（build_knowledge_base 的实现，外层统计生成问题的模型用量）"""
+        embedding_model = self.embedding_models.get(kb_type)
+        if not FAISS_AVAILABLE or not CONTENT_PROCESSING_AVAILABLE or embedding_model is None:
             return "错误：缺少必要的依赖包，无法构建知识库"
         
         kb_dir = self.base_dir / kb_type.value
@@ -149,12 +395,12 @@ class KnowledgeBaseManager:
         try:
             # 提取摘要进行embedding
             summaries = [doc.summary for doc in documents]
-            embeddings = self.embedding_model.encode(summaries, show_progress_bar=True)
+            embeddings = np.asarray(embedding_model.encode(summaries, show_progress_bar=True))
             
-            # 创建索引
+            # 创建索引（开启量化时同时保存原始向量用于重排）
             dimension = embeddings.shape[1]
-            index = faiss.IndexFlatL2(dimension)
-            index.add(embeddings.astype('float32'))
+            quantization = resolve_quantization(self.quantization, len(embeddings))
+            index = build_quantized_index(embeddings, quantization)
             
             # 保存索引和文档
             self.indices[kb_type] = index
@@ -164,15 +410,74 @@ class KnowledgeBaseManager:
             index_file = kb_dir / f"{kb_type.value}_index.faiss"
             docs_file = kb_dir / f"{kb_type.value}_documents.pkl"
             
-            faiss.write_index(index, str(index_file))
+            write_index(index, index_file)
             with open(docs_file, 'wb') as f:
                 pickle.dump(documents, f)
+            write_document_store(documents, *document_store_paths(docs_file))
+            self.vector_stores[kb_type] = self._write_vectors(index_file, embeddings, quantization)
+            # 记录构建所用的嵌入模型，加载时据此拒绝不匹配的模型
+            write_index_metadata(index_file, describe_embedding_model(embedding_model), dimension=dimension,
+                                 documents=len(documents), quantization=quantization or "flat")
+            self.load_errors.pop(kb_type, None)
             
+            self.generation += 1
             return f"成功构建 {kb_type.value} 知识库，包含 {len(documents)} 个文档"
             
         except Exception as e:
             return f"构建知识库失败: {e}"
     
+    def quantize_knowledge_base(self, kb_type: KnowledgeBaseType, quantization: Optional[str]) -> str:
+        """
+        把已加载的知识库索引转换为指定的量化方式，不需要重新处理文档和编码
+        
+        原始向量取自已保存的向量文件，没有时从索引重建（从量化索引转换会带入原有的量化误差）。
+        
+        Args:
+            kb_type: 知识库类型
+            quantization: 量化方式（fp16、sq8、pq、pq<子向量数>），None 或 "flat" 表示转换回不量化的索引
+            
+        Returns:
+            转换结果信息
+        """
+        if not FAISS_AVAILABLE or self.indices.get(kb_type) is None:
+            return f"错误：{kb_type.value} 知识库未加载，无法转换"
+        
+        try:
+            requested = parse_quantization(quantization)
+            index_file = self.base_dir / kb_type.value / f"{kb_type.value}_index.faiss"
+            vectors = reconstruct_vectors(self.indices[kb_type], index_file)
+            quantization = resolve_quantization(requested, len(vectors))
+            index = build_quantized_index(vectors, quantization)
+            write_index(index, index_file)
+            
+            metadata = read_index_metadata(index_file) or {}
+            embedding = metadata.pop("embedding", None)
+            metadata.update(dimension=index.d, documents=index.ntotal, quantization=quantization or "flat")
+            write_index_metadata(index_file, EmbeddingSpec(**embedding) if embedding else None, **metadata)
+            
+            self.vector_stores[kb_type] = self._write_vectors(index_file, vectors, quantization)
+            self.indices[kb_type] = index
+            self.generation += 1
+            note = f"（{len(vectors)} 个向量不足以训练乘积量化，改用 sq8）" if quantization != requested else ""
+            return (f"成功转换 {kb_type.value} 知识库索引为 {quantization or 'flat'}{note}，"
+                    f"索引文件 {index_file.stat().st_size} 字节")
+        except Exception as e:
+            return f"转换知识库索引失败: {e}"
+    
+    @staticmethod
+    def _write_vectors(index_file: pathlib.Path, vectors, quantization: Optional[str]):
+        """
+        量化索引同时写出原始向量并以内存映射方式打开，不量化时删除遗留的向量文件
+        
+        Returns:
+            内存映射的原始向量，不量化时返回None
+        """
+        if quantization is None:
+            vector_store_path(index_file).unlink(missing_ok=True)
+            return None
+        write_vector_store(index_file, vectors)
+        return open_vector_store(index_file)
+    
     def _generate_summary(self, content: str) -> list:
         """用大模型生成1-3个相关问题，失败时降级为1个问题"""
         if self.llm_client:
@@ -188,7 +493,7 @@ class KnowledgeBaseManager:
                 if qlist:
                     return qlist[:3]
             except Exception as e:
-                print(f"大模型生成问题失败，降级为内容片段：{e}")
+                logger.warning("大模型生成问题失败，降级为内容片段：%s", e)
         # 降级方案
         base = content[:30].replace('\n', '')
         return [base + "……相关问题？"] if base else ["这段内容的相关问题？"]
@@ -200,6 +505,9 @@ class KnowledgeBaseManager:
         # 使用pymupdf4llm处理PDF
         md_text = pymupdf4llm.to_markdown(str(pdf_file))
         
+        # 文档日期取文件修改日期，用于按日期过滤
+        file_date = datetime.date.fromtimestamp(pdf_file.stat().st_mtime).isoformat()
+        
         # 文本分割
         splitter = CharacterTextSplitter(chunk_size=1000, separator="\n", chunk_overlap=20)
         chunks = splitter.split_text(md_text)
@@ -215,7 +523,7 @@ class KnowledgeBaseManager:
                 summary=summary,
                 source=str(pdf_file),
                 file_type="pdf",
-                metadata={"file_name": pdf_file.name, "chunk_index": i}
+                metadata={"file_name": pdf_file.name, "chunk_index": i, "date": file_date}
             )
             documents.append(doc)
         
@@ -231,6 +539,7 @@ class KnowledgeBaseManager:
             content_column = config["content_column"]
             source_column = config.get("source_column", "")
             link_column = config.get("link_column", "")
+            date_column = config.get("date_column", "")
             
             for idx, row in df.iterrows():
                 content = str(row[content_column])
@@ -258,7 +567,8 @@ class KnowledgeBaseManager:
                         "file_name": excel_file.name,
                         "row_index": idx,
                         "source": row.get(source_column, "") if source_column else "",
-                        "link": row.get(link_column, "") if link_column else ""
+                        "link": row.get(link_column, "") if link_column else "",
+                        "date": self._format_date(row.get(date_column)) if date_column else None
                     }
                 )
                 documents.append(doc)
@@ -268,125 +578,523 @@ class KnowledgeBaseManager:
         
         return documents
     
+    @staticmethod
+    def _format_date(value) -> Optional[str]:
+        """把 Excel 日期单元格转换为 YYYY-MM-DD，空值或无法识别时返回None"""
+        if value is None or pd.isna(value):
+            return None
+        try:
+            return pd.Timestamp(value).date().isoformat()
+        except (ValueError, TypeError):
+            return None
+    
     def search_knowledge_base(self, kb_type: KnowledgeBaseType, query: str, 
-                            k: int = 5) -> List[Dict[str, Any]]:
+                            k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         搜索知识库
         
+        开启微批后，并发的搜索请求在后台线程中合并：查询一次性编码，同一知识库的查询合并为一次 FAISS 搜索。
+        
         Args:
             kb_type: 知识库类型
             query: 查询文本
             k: 返回结果数量
+            filters: 文档过滤条件（见 match_document_filters），只在满足条件的文档中搜索
             
         Returns:
             搜索结果列表
         """
+        error = self._check_searchable(kb_type)
+        if error:
+            return [{"error": error}]
+        
+        if filters:
+            return self.search_many(kb_type, [query], k, filters)[0]
+        
+        if self._search_batcher is not None:
+            try:
+                return self._search_batcher.submit((kb_type, query, k))
+            except Exception as e:
+                return [{"error": f"搜索失败: {e}"}]
+        
+        return self.search_many(kb_type, [query], k)[0]
+    
+    def search_many(self, kb_type: KnowledgeBaseType, queries: List[str],
+                    k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        批量搜索同一知识库
+        
+        Args:
+            kb_type: 知识库类型
+            queries: 查询文本列表
+            k: 每个查询返回的结果数量
+            filters: 文档过滤条件（见 match_document_filters）
+            
+        Returns:
+            与 queries 等长的搜索结果列表
+        """
+        error = self._check_searchable(kb_type)
+        if error:
+            return [[{"error": error}] for _ in queries]
+        
+        try:
+            query_embeddings = self._encode_queries(kb_type, queries)
+        except Exception as e:
+            return [[{"error": f"搜索失败: {e}"}] for _ in queries]
+        return self._search_vectors(kb_type, query_embeddings, k, filters)
+    
+    def search_all_knowledge_bases(self, query: str, k: int = 5, kb_types: Optional[List[KnowledgeBaseType]] = None,
+                                   filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        一次搜索多个知识库并合并结果
+        
+        使用同一嵌入模型的知识库共用一次查询编码。所有知识库使用同一模型时按距离合并，
+        否则距离不可比，按各自的排名交替合并。
+        
+        Args:
+            query: 查询文本
+            k: 合并后返回的结果数量
+            kb_types: 要搜索的知识库，为None时搜索全部
+            filters: 文档过滤条件（见 match_document_filters）
+            
+        Returns:
+            合并后的搜索结果列表，每个结果带 knowledge_base 字段；部分知识库不可搜索或搜索失败时只合并其余知识库，
+            全部失败时返回一个错误结果（见 search_all_knowledge_bases_with_errors）
+        """
+        return self.search_all_knowledge_bases_with_errors(query, k, kb_types, filters)[0]
+    
+    def search_all_knowledge_bases_with_errors(self, query: str, k: int = 5,
+                                               kb_types: Optional[List[KnowledgeBaseType]] = None,
+                                               filters: Optional[Dict[str, Any]] = None
+                                               ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        一次搜索多个知识库并合并结果，同时返回被跳过的知识库及原因
+        
+        Args:
+            query: 查询文本
+            k: 合并后返回的结果数量
+            kb_types: 要搜索的知识库，为None时搜索全部
+            filters: 文档过滤条件（见 match_document_filters）
+            
+        Returns:
+            (合并后的搜索结果列表, 不可搜索或搜索失败的知识库及原因)；全部知识库都失败时结果为一个包含全部原因的错误结果
+        """
+        kb_types = list(kb_types or KnowledgeBaseType)
+        errors = self.unsearchable_reasons(kb_types)
+        searchable = [kb_type for kb_type in kb_types if not self._check_searchable(kb_type)]
+        
+        results_by_kb = {}
+        if searchable:
+            with trace_span("kb.search_all", kbs=len(searchable), k=k):
+                results_by_kb = self.search_each_knowledge_base(query, k, searchable, filters)
+        hits = {}
+        for kb_type, results in results_by_kb.items():
+            if results and "error" in results[0]:
+                errors.append(f"{kb_type.value}: {results[0]['error']}")
+            else:
+                hits[kb_type] = results
+        
+        errors = list(dict.fromkeys(errors))
+        if not hits:
+            return [{"error": "；".join(errors)}], errors
+        return self.merge_search_results(hits, k), errors
+    
+    def search_each_knowledge_base(self, query: str, k: int = 5, kb_types: Optional[List[KnowledgeBaseType]] = None,
+                                   filters: Optional[Dict[str, Any]] = None) -> Dict[KnowledgeBaseType, List[Dict[str, Any]]]:
+        """
+        分别搜索多个知识库，不合并结果（使用同一嵌入模型的知识库共用一次查询编码）
+        
+        Args:
+            query: 查询文本
+            k: 每个知识库返回的结果数量
+            kb_types: 要搜索的知识库，为None时搜索全部
+            filters: 文档过滤条件（见 match_document_filters）
+            
+        Returns:
+            知识库类型到搜索结果的映射，只包含可以搜索的知识库；编码或搜索失败的知识库对应一个错误结果
+        """
+        results_by_kb = self.search_each_knowledge_base_many([query], k, kb_types, filters)
+        return {kb_type: results[0] for kb_type, results in results_by_kb.items()}
+    
+    def search_each_knowledge_base_many(self, queries: List[str], k: int = 5,
+                                        kb_types: Optional[List[KnowledgeBaseType]] = None,
+                                        filters: Optional[Dict[str, Any]] = None
+                                        ) -> Dict[KnowledgeBaseType, List[List[Dict[str, Any]]]]:
+        """
+        批量分别搜索多个知识库：使用同一嵌入模型的知识库共用一次批量编码，每个知识库做一次矩阵搜索
+        
+        Args:
+            queries: 查询文本列表
+            k: 每个查询在每个知识库返回的结果数量
+            kb_types: 要搜索的知识库，为None时搜索全部
+            filters: 文档过滤条件（见 match_document_filters）
+            
+        Returns:
+            知识库类型到搜索结果列表（与 queries 等长）的映射，只包含可以搜索的知识库；
+            编码或搜索失败时对应的每个查询都是一个错误结果
+        """
+        searchable = [kb_type for kb_type in (kb_types or KnowledgeBaseType) if not self._check_searchable(kb_type)]
+        
+        # 按嵌入模型分组，每组只编码一次查询
+        model_groups: Dict[int, List[KnowledgeBaseType]] = {}
+        for kb_type in searchable:
+            model_groups.setdefault(id(self.embedding_models[kb_type]), []).append(kb_type)
+        
+        results_by_kb = {}
+        for group in model_groups.values():
+            try:
+                query_embeddings = self._encode_queries(group[0], queries)
+            except Exception as e:
+                results_by_kb.update((kb_type, [[{"error": f"搜索失败: {e}"}] for _ in queries]) for kb_type in group)
+                continue
+            for kb_type in group:
+                results_by_kb[kb_type] = self._search_vectors(kb_type, query_embeddings, k, filters)
+        return results_by_kb
+        
+    def merge_search_results(self, results_by_kb: Dict[KnowledgeBaseType, List[Dict[str, Any]]],
+                             k: int) -> List[Dict[str, Any]]:
+        """
+        合并多个知识库的搜索结果并重新编号
+        
+        Args:
+            results_by_kb: 知识库类型到搜索结果的映射（见 search_each_knowledge_base）
+            k: 合并后返回的结果数量
+            
+        Returns:
+            合并后的搜索结果列表，每个结果带 knowledge_base 字段
+        """
+        merged = [dict(result, knowledge_base=kb_type.value)
+                  for kb_type, results in results_by_kb.items() for result in results]
+        if len({id(self.embedding_models.get(kb_type)) for kb_type in results_by_kb}) == 1:
+            merged.sort(key=lambda result: result["distance"])
+        else:
+            merged.sort(key=lambda result: (result["rank"], result["distance"]))
+        merged = merged[:k]
+        for rank, result in enumerate(merged, 1):
+            result["rank"] = rank
+        return merged
+    
+    def close(self):
+        """停止微批调度线程"""
+        if self._search_batcher is not None:
+            self._search_batcher.close()
+        models = {id(model): model for model in [self.embedding_model, *self._loaded_embeddings.values()]}
+        for model in models.values():
+            if FAISS_AVAILABLE and isinstance(model, MicroBatchEncoder):
+                model.batcher.close()
+    
+    def unsearchable_reasons(self, kb_types: Optional[List[KnowledgeBaseType]] = None) -> List[str]:
+        """
+        检查多个知识库，返回不可搜索的原因（未加载、加载失败等）
+        
+        Args:
+            kb_types: 要检查的知识库，为None时检查全部
+        
+        Returns:
+            去重后的原因列表，全部可以搜索时为空列表
+        """
+        reasons = map(self._check_searchable, kb_types or KnowledgeBaseType)
+        return list(dict.fromkeys(reason for reason in reasons if reason))
+    
+    def _check_searchable(self, kb_type: KnowledgeBaseType) -> Optional[str]:
+        """
+        检查知识库是否可以搜索
+        
+        Returns:
+            错误信息，可以搜索时返回None
+        """
         if not FAISS_AVAILABLE:
-            return [{"error": "FAISS未安装，无法进行向量搜索"}]
+            return "FAISS未安装，无法进行向量搜索"
+        
+        if kb_type in self.load_errors:
+            return f"{kb_type.value} 知识库加载失败：{self.load_errors[kb_type]}"
+        
+        if self.embedding_models.get(kb_type) is None:
+            return "嵌入模型不可用，无法进行向量搜索"
         
         if kb_type not in self.indices or self.indices[kb_type] is None:
-            return [{"error": f"{kb_type.value} 知识库未初始化"}]
+            return f"{kb_type.value} 知识库未初始化"
+        
+        return None
+    
+    def _encode_queries(self, kb_type: KnowledgeBaseType, queries: List[str]):
+        """用知识库的嵌入模型把查询编码为 float32 矩阵"""
+        encoder = self.embedding_models[kb_type]
+        if isinstance(encoder, MicroBatchEncoder):
+            # 搜索请求已经在调度器中合并，直接调用底层模型
+            encoder = encoder.encoder
+        with trace_span("kb.embed", queries=len(queries)):
+            return np.asarray(encoder.encode(list(queries)), dtype='float32')
+    
+    def _search_vectors(self, kb_type: KnowledgeBaseType, query_embeddings,
+                        k: int, filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        用一次 FAISS 搜索处理多个查询向量
         
+        Args:
+            kb_type: 知识库类型
+            query_embeddings: 形状为 (查询数, 维度) 的查询向量
+            k: 每个查询返回的结果数量
+            filters: 文档过滤条件，满足条件的文档编号通过 IDSelector 传给 FAISS
+            
+        Returns:
+            每个查询的搜索结果列表
+        """
         try:
-            # 对查询进行embedding
-            query_embedding = self.embedding_model.encode([query])
+            index = self.indices[kb_type]
+            vector_store = self.vector_stores.get(kb_type)
+            params = None
+            if filters:
+                allowed = self._filtered_ids(kb_type, filters)
+                if not len(allowed):
+                    return [[] for _ in range(len(query_embeddings))]
+                if isinstance(index, faiss.IndexPQ):
+                    # IndexPQ 不支持 IDSelector，直接在过滤后的文档子集上精确计算
+                    return self._search_subset(kb_type, query_embeddings, k, allowed)
+                selector = faiss.IDSelectorBatch(allowed)
+                params = faiss.SearchParameters(sel=selector)
             
-            # 搜索相似向量
-            distances, indices = self.indices[kb_type].search(
-                query_embedding.astype('float32'), k
-            )
+            if vector_store is None:
+                with trace_span("kb.faiss_search", kb=kb_type.value, queries=len(query_embeddings), k=k):
+                    distances, indices = index.search(query_embeddings, k, params=params)
+            else:
+                # 量化索引的距离是近似值：多取候选，再用原始向量精确重排
+                candidates = k * self.rescore_factor
+                with trace_span("kb.faiss_search", kb=kb_type.value, queries=len(query_embeddings), k=candidates):
+                    _, candidate_ids = index.search(query_embeddings, candidates, params=params)
+                with trace_span("kb.rescore", kb=kb_type.value, candidates=candidates):
+                    distances, indices = rescore(query_embeddings, candidate_ids, vector_store, k)
+            with trace_span("kb.format_results", kb=kb_type.value):
+                return [self._format_results(kb_type, row_distances, row_indices)
+                        for row_distances, row_indices in zip(distances, indices)]
+        except Exception as e:
+            return [[{"error": f"搜索失败: {e}"}] for _ in range(len(query_embeddings))]
+    
+    def _search_subset(self, kb_type: KnowledgeBaseType, query_embeddings, k: int,
+                       allowed) -> List[List[Dict[str, Any]]]:
+        """在指定编号的文档子集上做精确搜索（原始向量优先取自向量文件，否则从索引重建）"""
+        vector_store = self.vector_stores.get(kb_type)
+        if vector_store is not None:
+            vectors = np.asarray(vector_store[allowed], dtype='float32')
+        else:
+            vectors = self.indices[kb_type].reconstruct_batch(allowed)
+        with trace_span("kb.subset_search", kb=kb_type.value, documents=len(allowed), k=k):
+            distances, positions = faiss.knn(query_embeddings, vectors, min(k, len(allowed)))
+        return [self._format_results(kb_type, row_distances, allowed[row_positions])
+                for row_distances, row_positions in zip(distances, positions)]
+    
+    def _filtered_ids(self, kb_type: KnowledgeBaseType, filters: Dict[str, Any]):
+        """
+        满足过滤条件的文档编号，按 (知识库, 构建次数, 条件) 缓存
+        
+        Returns:
+            升序的 int64 编号数组
+        """
+        key = (kb_type, self.generation, json.dumps(filters, sort_keys=True, ensure_ascii=False, default=str))
+        allowed = self._filter_cache.get(key)
+        if allowed is None:
+            with trace_span("kb.filter", kb=kb_type.value):
+                allowed = np.array([i for i, doc in enumerate(self.documents[kb_type])
+                                    if match_document_filters(doc, filters)], dtype='int64')
+            if len(self._filter_cache) >= 128:
+                self._filter_cache.clear()
+            self._filter_cache[key] = allowed
+        return allowed
             
-            # 处理结果
-            results = []
-            for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-                if idx < len(self.documents[kb_type]):
-                    doc = self.documents[kb_type][idx]
-                    result = {
-                        'rank': i + 1,
-                        'title': doc.title,
-                        'content': doc.content,
-                        'summary': doc.summary,
-                        'source': doc.source,
-                        'file_type': doc.file_type,
-                        'similarity_score': 1.0 / (1.0 + distance),
-                        'distance': float(distance),
-                        'metadata': doc.metadata
-                    }
-                    results.append(result)
+    def _format_results(self, kb_type: KnowledgeBaseType, distances, indices) -> List[Dict[str, Any]]:
+        """把一个查询的 FAISS 搜索结果转换为结果字典列表"""
+        results = []
+        documents = self.documents[kb_type]
+        for i, (distance, idx) in enumerate(zip(distances, indices)):
+            # 结果不足 k 个时 FAISS 用 -1 填充
+            if 0 <= idx < len(documents):
+                doc = documents[idx]
+                result = {
+                    'rank': i + 1,
+                    'id': doc.id,
+                    'title': doc.title,
+                    'content': doc.content,
+                    'summary': doc.summary,
+                    'source': doc.source,
+                    'file_type': doc.file_type,
+                    'similarity_score': 1.0 / (1.0 + distance),
+                    'distance': float(distance),
+                    'metadata': doc.metadata
+                }
+                results.append(result)
+        return results
             
-            return results
+    def _run_search_batch(self, requests: List[Any]) -> List[List[Dict[str, Any]]]:
+        """
+        微批调度器的批处理函数：使用同一嵌入模型的查询一次编码，再按 (知识库, k) 分组各做一次 FAISS 搜索
+        
+        Args:
+            requests: (知识库类型, 查询文本, k) 列表
             
-        except Exception as e:
-            return [{"error": f"搜索失败: {e}"}]
+        Returns:
+            与 requests 等长的搜索结果列表
+        """
+        # 不同知识库可能使用不同的嵌入模型，按模型分组编码
+        model_groups: Dict[int, List[int]] = {}
+        for position, (kb_type, _, _) in enumerate(requests):
+            model_groups.setdefault(id(self.embedding_models[kb_type]), []).append(position)
+        
+        query_embeddings: List[Any] = [None] * len(requests)
+        for positions in model_groups.values():
+            kb_type = requests[positions[0]][0]
+            embeddings = self._encode_queries(kb_type, [requests[position][1] for position in positions])
+            for position, embedding in zip(positions, embeddings):
+                query_embeddings[position] = embedding
+        
+        groups: Dict[Any, List[int]] = {}
+        for position, (kb_type, _, k) in enumerate(requests):
+            groups.setdefault((kb_type, k), []).append(position)
+        
+        results: List[Any] = [None] * len(requests)
+        for (kb_type, k), positions in groups.items():
+            vectors = np.stack([query_embeddings[position] for position in positions])
+            for position, result in zip(positions, self._search_vectors(kb_type, vectors, k)):
+                results[position] = result
+        return results
 
 
 # 全局知识库管理器实例
 _kb_manager = None
+_kb_manager_lock = threading.Lock()
 
 
 def get_kb_manager() -> KnowledgeBaseManager:
-    """获取知识库管理器实例"""
+    """获取知识库管理器实例（多线程并发首次调用时只创建一个实例）"""
     global _kb_manager
     if _kb_manager is None:
-        _kb_manager = KnowledgeBaseManager()
+        with _kb_manager_lock:
+            if _kb_manager is None:
+                _kb_manager = KnowledgeBaseManager()
     return _kb_manager
 
 
-def query_knowledge_base(knowledge_base: str, query: str, top_k: int = 5) -> str:
+def set_kb_manager(manager: KnowledgeBaseManager):
     """
-    查询知识库
+    替换全局知识库管理器实例
+    
+    多进程服务的工作进程用它注入使用远程编码器和内存映射索引的管理器。
     
     Args:
-        knowledge_base: 知识库名称 (hpv, flu, hiv)
+        manager: 知识库管理器
+    """
+    global _kb_manager
+    with _kb_manager_lock:
+        _kb_manager = manager
+
+
+# 查询工具接受的知识库名称
+KNOWLEDGE_BASE_NAMES = {kb_type.value: kb_type for kb_type in KnowledgeBaseType}
+
+
+def parse_knowledge_base_names(knowledge_base: str) -> List[KnowledgeBaseType]:
+    """
+    解析查询工具的知识库参数
+    
+    Args:
+        knowledge_base: 知识库名称 (hpv, flu, hiv)，"all" 表示全部知识库，也可以用逗号分隔多个
+    
+    Returns:
+        去重后的知识库类型列表
+    """
+    names = [name.strip().lower() for name in knowledge_base.split(",") if name.strip()]
+    if names == ["all"]:
+        names = list(KNOWLEDGE_BASE_NAMES)
+    unknown = [name for name in names if name not in KNOWLEDGE_BASE_NAMES]
+    if not names or unknown:
+        raise ValueError(f"不支持的知识库类型 '{knowledge_base}'。支持的类型：{list(KNOWLEDGE_BASE_NAMES) + ['all']}")
+    return [KNOWLEDGE_BASE_NAMES[name] for name in dict.fromkeys(names)]
+
+
+def format_query_results(knowledge_base: str, query: str, results: List[Dict[str, Any]],
+                         skipped: Optional[List[str]] = None) -> str:
+    """
+    把搜索结果格式化为查询工具的输出
+    
+    Args:
+        knowledge_base: 工具调用中的知识库参数
         query: 查询文本
-        top_k: 返回结果数量
+        results: 搜索结果列表
+        skipped: 搜索多个知识库时被跳过的知识库及原因
         
     Returns:
         查询结果字符串
     """
-    try:
-        # 验证知识库类型
-        kb_type_map = {
-            "hpv": KnowledgeBaseType.HPV,
-            "flu": KnowledgeBaseType.FLU,
-            "hiv": KnowledgeBaseType.HIV
-        }
+    if results and "error" in results[0]:
+        return f"搜索错误：{results[0]['error']}"
         
-        if knowledge_base.lower() not in kb_type_map:
-            return f"错误：不支持的知识库类型 '{knowledge_base}'。支持的类型：{list(kb_type_map.keys())}"
+    skipped_text = f"（以下知识库未能搜索：{'；'.join(skipped)}）\n" if skipped else ""
+    if not results:
+        return f"在 {knowledge_base} 知识库中没有找到相关结果{skipped_text.rstrip()}"
         
-        kb_type = kb_type_map[knowledge_base.lower()]
-        manager = get_kb_manager()
+    # 格式化结果
+    result_text = f"在 {knowledge_base.upper()} 知识库中搜索 '{query}' 的结果：\n{skipped_text}"
+    result_text += "=" * 60 + "\n\n"
         
-        # 执行搜索
-        results = manager.search_knowledge_base(kb_type, query, top_k)
+    for result in results:
+        result_text += f"排名 {result['rank']}:\n"
+        if "knowledge_base" in result:
+            result_text += f"知识库: {result['knowledge_base'].upper()}\n"
+        result_text += f"标题: {result['title']}\n"
+        # 展示所有相关问题
+        if isinstance(result['summary'], list):
+            for idx, q in enumerate(result['summary'], 1):
+                result_text += f"可能的问题{idx}: {q}\n"
+        else:
+            result_text += f"可能的问题: {result['summary']}\n"
+        result_text += f"原文内容: {result['content']}\n"
+        result_text += f"来源: {result['source']}\n"
+        result_text += f"文件类型: {result['file_type']}\n"
+        result_text += f"相似度: {result['similarity_score']:.4f}\n"
+        result_text += "-" * 40 + "\n\n"
         
-        if not results:
-            return f"在 {knowledge_base} 知识库中没有找到相关结果"
+    return result_text
+
+
+def query_knowledge_base(knowledge_base: str, query: str, top_k: int = 5, file_type: Optional[str] = None,
+                         source: Optional[str] = None, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None) -> str:
+    """
+    查询知识库
+    
+    Args:
+        knowledge_base: 知识库名称 (hpv, flu, hiv)，"all" 表示一次搜索全部知识库，也可以用逗号分隔多个
+        query: 查询文本
+        top_k: 返回结果数量（搜索多个知识库时为合并后的数量）
+        file_type: 只搜索该类型的文档（pdf 或 excel）
+        source: 只搜索来源文件名中包含该文本的文档
+        date_from: 只搜索该日期及之后的文档（YYYY-MM-DD）
+        date_to: 只搜索该日期及之前的文档（YYYY-MM-DD）
         
-        if "error" in results[0]:
-            return f"搜索错误：{results[0]['error']}"
+    Returns:
+        查询结果字符串
+    """
+    try:
+        # 验证知识库类型
+        try:
+            kb_types = parse_knowledge_base_names(knowledge_base)
+        except ValueError as e:
+            return f"错误：{e}"
         
-        # 格式化结果
-        result_text = f"在 {knowledge_base.upper()} 知识库中搜索 '{query}' 的结果：\n"
-        result_text += "=" * 60 + "\n\n"
+        filters = {key: value for key, value in (("file_type", file_type), ("source", source),
+                                                  ("date_from", date_from), ("date_to", date_to)) if value}
+        manager = get_kb_manager()
         
-        for result in results:
-            result_text += f"排名 {result['rank']}:\n"
-            result_text += f"标题: {result['title']}\n"
-            # 展示所有相关问题
-            if isinstance(result['summary'], list):
-                for idx, q in enumerate(result['summary'], 1):
-                    result_text += f"可能的问题{idx}: {q}\n"
-            else:
-                result_text += f"可能的问题: {result['summary']}\n"
-            result_text += f"原文内容: {result['content']}\n"
-            result_text += f"来源: {result['source']}\n"
-            result_text += f"文件类型: {result['file_type']}\n"
-            result_text += f"相似度: {result['similarity_score']:.4f}\n"
-            result_text += "-" * 40 + "\n\n"
+        # 执行搜索
+        if len(kb_types) == 1:
+            with trace_span("kb.search", kb=kb_types[0].value, k=top_k):
+                results = manager.search_knowledge_base(kb_types[0], query, top_k, filters or None)
+            skipped = None
+        else:
+            with trace_span("kb.search", kb=",".join(kb_type.value for kb_type in kb_types), k=top_k):
+                results, skipped = manager.search_all_knowledge_bases_with_errors(query, top_k, kb_types,
+                                                                                  filters or None)
         
-        return result_text
+        return format_query_results(knowledge_base, query, results, skipped)
         
     except Exception as e:
         return f"查询知识库时发生错误: {str(e)}"
@@ -444,14 +1152,14 @@ def get_knowledge_base_tool_config():
         "type": "function",
         "function": {
             "name": "query_knowledge_base",
-            "description": "查询HPV、FLU、HIV知识库，支持向量相似度搜索",
+            "description": "查询HPV、FLU、HIV知识库，支持向量相似度搜索；问题涉及多个主题时用 all 一次查询全部知识库",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "knowledge_base": {
                         "type": "string",
-                        "enum": ["hpv", "flu", "hiv"],
-                        "description": "要查询的知识库类型"
+                        "enum": ["hpv", "flu", "hiv", "all"],
+                        "description": "要查询的知识库类型，all 表示同时查询全部知识库并合并结果"
                     },
                     "query": {
                         "type": "string",
@@ -463,6 +1171,23 @@ def get_knowledge_base_tool_config():
                         "minimum": 1,
                         "maximum": 20,
                         "description": "返回结果数量，默认为5"
+                    },
+                    "file_type": {
+                        "type": "string",
+                        "enum": ["pdf", "excel"],
+                        "description": "可选，只查询该类型的文档"
+                    },
+                    "source": {
+                        "type": "string",
+                        "description": "可选，只查询来源文件名中包含该文本的文档"
+                    },
+                    "date_from": {
+                        "type": "string",
+                        "description": "可选，只查询该日期及之后的文档，格式 YYYY-MM-DD"
+                    },
+                    "date_to": {
+                        "type": "string",
+                        "description": "可选，只查询该日期及之前的文档，格式 YYYY-MM-DD"
                     }
                 },
                 "required": ["knowledge_base", "query"]
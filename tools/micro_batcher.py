@@ -0,0 +1,170 @@
+"""
+微批调度模块
+把并发到达的编码/检索请求在几毫秒的窗口内合并成一批处理，提高CPU上的吞吐量
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """微批调度器类
+    
+    调用方通过 submit 提交单个请求并阻塞等待结果。后台线程取到第一个请求后，
+    最多再等待 max_wait_ms 毫秒或凑满 max_batch_size 个请求，然后调用一次 batch_fn。
+    单个请求的额外延迟不超过 max_wait_ms 加上一批的处理时间。
+    """
+    
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_wait_ms: float = 5.0,
+                 max_batch_size: int = 32, name: str = "micro-batcher"):
+        """
+        初始化微批调度器
+        
+        Args:
+            batch_fn: 批处理函数，输入请求列表，返回等长的结果列表
+            max_wait_ms: 凑批的最长等待时间（毫秒）
+            max_batch_size: 每批最多包含的请求数
+            name: 后台线程名称
+        """
+        self.batch_fn = batch_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+    
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """
+        提交请求并等待结果
+        
+        Args:
+            item: 请求
+            timeout: 等待超时时间（秒），为None时一直等待
+        
+        Returns:
+            batch_fn 为该请求返回的结果
+        """
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((item, future))
+        return future.result(timeout)
+    
+    def close(self):
+        """停止后台线程，已提交的请求处理完后退出"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+    
+    @property
+    def mean_batch_size(self) -> float:
+        """平均每批请求数"""
+        return self.items / self.batches if self.batches else 0.0
+    
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        """后台线程：收集请求并按批处理"""
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            
+            self._process(batch)
+    
+    def _process(self, batch):
+        """执行一批请求并把结果分发给各调用方"""
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"批处理结果数量不匹配：期望 {len(batch)}，实际 {len(results)}")
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+class MicroBatchEncoder:
+    """微批编码器类
+    
+    包装任意提供 encode 方法的嵌入模型，并发的 encode 调用合并成一次模型调用。
+    带额外参数（如 show_progress_bar）的调用直接透传，不参与合并。
+    """
+    
+    def __init__(self, encoder, max_wait_ms: float = 5.0, max_batch_size: int = 32):
+        """
+        初始化微批编码器
+        
+        Args:
+            encoder: 被包装的嵌入模型
+            max_wait_ms: 凑批的最长等待时间（毫秒）
+            max_batch_size: 每批最多合并的 encode 调用数
+        """
+        self.encoder = encoder
+        self.batcher = MicroBatcher(self._encode_batch, max_wait_ms, max_batch_size, name="micro-batch-encoder")
+    
+    def encode(self, texts, **kwargs):
+        """
+        编码文本
+        
+        Args:
+            texts: 文本列表
+            **kwargs: 透传给被包装模型的参数，非空时不参与合并
+        
+        Returns:
+            float32 向量数组
+        """
+        if kwargs:
+            return self.encoder.encode(texts, **kwargs)
+        return self.batcher.submit(list(texts))
+    
+    def describe(self):
+        """被包装模型的描述（见 embedding_backends.describe_embedding_model）"""
+        describe = getattr(self.encoder, "describe", None)
+        return describe() if callable(describe) else None
+    
+    def _encode_batch(self, requests: List[List[str]]) -> List[Any]:
+        """把多个调用的文本拼接后编码一次，再按调用拆分"""
+        texts = [text for request in requests for text in request]
+        embeddings = np.asarray(self.encoder.encode(texts), dtype="float32")
+        results = []
+        start = 0
+        for request in requests:
+            results.append(embeddings[start:start + len(request)])
+            start += len(request)
+        return results
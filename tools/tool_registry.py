@@ -3,82 +3,336 @@
 用于管理和注册所有可用的工具
 """
 
-from .weather_tool import get_weather_tool_config
-from .time_tool import get_time_tool_config
-from .calculator_tool import get_calculator_tool_config
-from .knowledge_base_tool import get_knowledge_base_tool_config
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .weather_tool import get_current_weather, get_weather_tool_config
+from .time_tool import get_current_time, get_time_tool_config
+from .calculator_tool import calculate, get_calculator_tool_config
+from .knowledge_base_tool import get_kb_manager, get_knowledge_base_tool_config, query_knowledge_base
+
+
+@dataclass
+class ToolCachePolicy:
+    """工具结果缓存策略
+    
+    Attributes:
+        cacheable: 是否缓存结果，只应对相同参数总是返回相同结果的工具开启
+        ttl: 结果有效期（秒），为None时不过期
+        key: 由参数字典计算缓存键的函数，为None时使用参数的规范化 JSON
+        should_cache: 判断结果是否写入缓存的函数（例如不缓存临时错误），为None时全部写入
+        max_entries: 最大条目数，超出时淘汰最久未使用的条目
+    """
+    cacheable: bool = False
+    ttl: Optional[float] = None
+    key: Optional[Callable[[Dict[str, Any]], Hashable]] = None
+    should_cache: Optional[Callable[[Any], bool]] = None
+    max_entries: int = 1024
+
+
+def _arguments_key(arguments: Dict[str, Any]) -> str:
+    """参数的规范化 JSON，键顺序不同的相同参数得到相同的缓存键"""
+    return json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _knowledge_base_cache_key(arguments: Dict[str, Any]) -> Hashable:
+    """知识库查询的缓存键：包含管理器编号和构建代数，知识库替换或重新构建后旧结果不再命中"""
+    manager = get_kb_manager()
+    return manager.instance_id, manager.generation, _arguments_key(arguments)
+
+
+def _is_knowledge_base_result(result: Any) -> bool:
+    """只缓存正常的查询结果，搜索错误可能是暂时的"""
+    return isinstance(result, str) and not result.startswith(("错误", "搜索错误", "查询知识库时发生错误"))
+
+
+class MemoizedTool:
+    """按缓存策略记忆结果的工具函数（线程安全，LRU 淘汰）"""
+    
+    def __init__(self, function: Callable[..., Any], policy: ToolCachePolicy):
+        """
+        初始化带缓存的工具函数
+        
+        Args:
+            function: 工具函数
+            policy: 缓存策略
+        """
+        self.function = function
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __call__(self, **kwargs):
+        try:
+            key = (self.policy.key or _arguments_key)(kwargs)
+            hash(key)
+        except Exception:
+            # 参数无法作为缓存键时直接调用
+            return self.function(**kwargs)
+        
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.policy.ttl is None or now - entry[1] <= self.policy.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        
+        result = self.function(**kwargs)
+        if self.policy.should_cache is None or self.policy.should_cache(result):
+            with self._lock:
+                self._entries[key] = (result, now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.policy.max_entries:
+                    self._entries.popitem(last=False)
+        return result
+    
+    def clear(self):
+        """清空缓存的结果"""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """
+        获取缓存统计
+        
+        Returns:
+            包含 hits、misses、entries 的字典
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+class ToolTimeoutError(TimeoutError):
+    """工具执行超时"""
+
+
+class _Waiter:
+    """排队等待并发名额的调用"""
+    __slots__ = ("notify", "granted")
+    
+    def __init__(self, notify: Callable[[], Any]):
+        self.notify = notify
+        self.granted = False
+
+
+def _resolve_waiter(future: "asyncio.Future"):
+    """在等待方的事件循环中唤醒等待并发名额的协程"""
+    if not future.done():
+        future.set_result(None)
+
+
+class ToolConcurrencyLimit:
+    """工具的并发限制
+    
+    同步调用（线程）和各事件循环中的异步调用共用同一个计数，名额按排队顺序转交给等待者。
+    """
+    
+    def __init__(self, limit: int):
+        """
+        初始化并发限制
+        
+        Args:
+            limit: 同时执行的最大次数
+        """
+        self.limit = limit
+        self._active = 0
+        self._waiters: "deque[_Waiter]" = deque()
+        self._lock = threading.Lock()
+    
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        在当前线程中等待并发名额
+        
+        Args:
+            timeout: 最长等待时间（秒），为None时一直等待
+            
+        Returns:
+            是否获得名额，超时未获得时返回False
+        """
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return True
+            event = threading.Event()
+            waiter = _Waiter(event.set)
+            self._waiters.append(waiter)
+        
+        if event.wait(timeout):
+            return True
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                return False
+        # 超时的同时获得了名额，转交给下一个等待者
+        self.release()
+        return False
+    
+    async def acquire_async(self):
+        """在当前事件循环中等待并发名额，被取消（例如超时）时退出排队"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return
+            future = loop.create_future()
+            waiter = _Waiter(functools.partial(loop.call_soon_threadsafe, _resolve_waiter, future))
+            self._waiters.append(waiter)
+        
+        try:
+            await future
+        except BaseException:
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    raise
+            self.release()
+            raise
+    
+    def release(self):
+        """释放名额，有等待者时直接转交给最早排队的等待者"""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True
+                try:
+                    waiter.notify()
+                    return
+                except RuntimeError:
+                    # 等待方的事件循环已关闭
+                    continue
+            self._active -= 1
+
+
+@dataclass
+class ToolSpec:
+    """已注册工具的执行方式
+    
+    Attributes:
+        function: 工具函数（同步函数或协程函数，可缓存的同步工具为 MemoizedTool）
+        is_async: 是否为协程函数
+        timeout: 单次执行的超时时间（秒），为None时不限制
+        max_concurrency: 同时执行的最大次数，为None时不限制
+    """
+    function: Callable[..., Any]
+    is_async: bool = False
+    timeout: Optional[float] = None
+    max_concurrency: Optional[int] = None
+    # 同步调用和异步调用共用的并发限制
+    limit: Optional[ToolConcurrencyLimit] = field(default=None, init=False, repr=False)
+    
+    def __post_init__(self):
+        if self.max_concurrency is not None:
+            self.limit = ToolConcurrencyLimit(self.max_concurrency)
 
 
 class ToolRegistry:
-    """工具注册表类"""
+    """工具注册表类
+    
+    工具可以是同步函数或协程函数。同步调用（call_tool）时，声明了超时的工具在受管线程池中执行，
+    协程工具在线程池中用独立的事件循环执行；异步调用（acall_tool）时，同步工具在线程池中执行，
+    不会阻塞事件循环，协程工具直接在当前事件循环中等待。超时后返回给调用方，仍在排队的调用不再执行，
+    已开始执行的同步工具无法中断，会在后台执行完毕。
+    """
     
-    def __init__(self):
+    def __init__(self, max_workers: int = 32):
+        """
+        初始化工具注册表
+        
+        Args:
+            max_workers: 执行工具的线程池大小
+        """
         self._tools = {}
+        self._specs: Dict[str, ToolSpec] = {}
         self._tool_configs = []
+        # 每次注册工具时递增，供提示词缓存判断工具列表是否变化
+        self._version = 0
+        self._max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
         self._register_default_tools()
     
     def _register_default_tools(self):
-        """注册默认工具"""
-        # 注册天气工具
+        """注册默认工具
+        
+        超时后仍在执行的同步工具会继续占用线程池，各默认工具的并发限制之和小于默认线程池大小，
+        某个工具的后端卡住时其他工具仍有空闲线程。
+        """
+        # 注册天气工具（实时数据，不缓存）
         self.register_tool(
             name="get_current_weather",
-            function=self._get_weather_function,
-            config=get_weather_tool_config()
+            function=get_current_weather,
+            config=get_weather_tool_config(),
+            timeout=10,
+            max_concurrency=8
         )
         
-        # 注册时间工具
+        # 注册时间工具（结果随时间变化，不缓存）
         self.register_tool(
             name="get_current_time",
-            function=self._get_time_function,
-            config=get_time_tool_config()
+            function=get_current_time,
+            config=get_time_tool_config(),
+            timeout=2,
+            max_concurrency=4
         )
         
-        # 注册计算器工具
+        # 注册计算器工具（纯函数，结果不过期）
         self.register_tool(
             name="calculate",
-            function=self._get_calculator_function,
-            config=get_calculator_tool_config()
+            function=calculate,
+            config=get_calculator_tool_config(),
+            cache_policy=ToolCachePolicy(cacheable=True),
+            timeout=5,
+            max_concurrency=4
         )
 
-        # 注册知识库查询工具
+        # 注册知识库查询工具（知识库重新构建后缓存键随之变化）
         self.register_tool(
             name="query_knowledge_base",
-            function=self._get_knowledge_base_function,
-            config=get_knowledge_base_tool_config()
+            function=query_knowledge_base,
+            config=get_knowledge_base_tool_config(),
+            cache_policy=ToolCachePolicy(cacheable=True, ttl=600, key=_knowledge_base_cache_key,
+                                         should_cache=_is_knowledge_base_result),
+            timeout=30,
+            max_concurrency=8
         )
     
-    def _get_weather_function(self, **kwargs):
-        """获取天气工具函数"""
-        from .weather_tool import get_current_weather
-        return get_current_weather(**kwargs)
-    
-    def _get_time_function(self, **kwargs):
-        """获取时间工具函数"""
-        from .time_tool import get_current_time
-        return get_current_time(**kwargs)
-    
-    def _get_calculator_function(self, **kwargs):
-        """获取计算器工具函数"""
-        from .calculator_tool import calculate
-        return calculate(**kwargs)
-
-    
-    def _get_knowledge_base_function(self, **kwargs):
-        """获取知识库查询工具函数"""
-        from .knowledge_base_tool import query_knowledge_base
-        return query_knowledge_base(**kwargs)
-    
-    def register_tool(self, name: str, function, config: dict):
+    def register_tool(self, name: str, function, config: dict, cache_policy: Optional[ToolCachePolicy] = None,
+                      timeout: Optional[float] = None, max_concurrency: Optional[int] = None):
         """
         注册新工具
         
         Args:
             name: 工具名称
-            function: 工具函数
+            function: 工具函数，可以是同步函数或协程函数
             config: 工具配置
+            cache_policy: 结果缓存策略，为None或不可缓存时每次调用都执行工具函数（协程工具不支持缓存）
+            timeout: 单次执行的超时时间（秒），为None时不限制
+            max_concurrency: 同时执行的最大次数，超出的调用排队等待（计入超时），为None时不限制
         """
+        is_async = inspect.iscoroutinefunction(function)
+        if cache_policy is not None and cache_policy.cacheable:
+            if is_async:
+                raise ValueError(f"协程工具 {name} 不支持结果缓存")
+            function = MemoizedTool(function, cache_policy)
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency 必须大于0")
         self._tools[name] = function
+        self._specs[name] = ToolSpec(function, is_async, timeout, max_concurrency)
         self._tool_configs.append(config)
+        self._version += 1
     
     def get_tool(self, name: str):
         """
@@ -92,6 +346,144 @@ class ToolRegistry:
         """
         return self._tools.get(name)
     
+    def get_tool_spec(self, name: str) -> Optional[ToolSpec]:
+        """
+        获取工具的执行方式
+        
+        Args:
+            name: 工具名称
+            
+        Returns:
+            工具执行方式，工具不存在时返回None
+        """
+        return self._specs.get(name)
+    
+    def call_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        """
+        同步执行工具，按工具声明的超时和并发限制执行
+        
+        Args:
+            name: 工具名称
+            arguments: 工具参数
+            
+        Returns:
+            工具输出
+            
+        Raises:
+            KeyError: 工具不存在
+            ToolTimeoutError: 执行超时
+        """
+        spec = self._require_spec(name)
+        if spec.timeout is None and not spec.is_async:
+            return self._run_sync(spec, arguments)
+        
+        deadline = None if spec.timeout is None else time.monotonic() + spec.timeout
+        # 复制上下文，让工具内的 span 挂在调用方之下
+        context = contextvars.copy_context()
+        future = self._get_executor().submit(context.run, self._run_sync, spec, arguments, deadline)
+        try:
+            return future.result(timeout=spec.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ToolTimeoutError(f"工具 {name} 执行超时（{spec.timeout}秒）") from None
+    
+    async def acall_tool(self, name: str, arguments: Dict[str, Any]) -> Any:
+        """
+        异步执行工具：协程工具在当前事件循环中等待，同步工具在线程池中执行
+        
+        Args:
+            name: 工具名称
+            arguments: 工具参数
+            
+        Returns:
+            工具输出
+            
+        Raises:
+            KeyError: 工具不存在
+            ToolTimeoutError: 执行超时
+        """
+        spec = self._require_spec(name)
+        if spec.is_async:
+            awaitable = self._run_async(spec, arguments)
+        else:
+            deadline = None if spec.timeout is None else time.monotonic() + spec.timeout
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            awaitable = loop.run_in_executor(
+                self._get_executor(), functools.partial(context.run, self._run_sync, spec, arguments, deadline)
+            )
+        try:
+            return await asyncio.wait_for(awaitable, spec.timeout)
+        except asyncio.TimeoutError:
+            raise ToolTimeoutError(f"工具 {name} 执行超时（{spec.timeout}秒）") from None
+    
+    def _require_spec(self, name: str) -> ToolSpec:
+        """获取工具的执行方式，工具不存在时抛出 KeyError"""
+        spec = self._specs.get(name)
+        if spec is None:
+            raise KeyError(f"未找到工具：{name}")
+        return spec
+    
+    @staticmethod
+    def _run_sync(spec: ToolSpec, arguments: Dict[str, Any], deadline: Optional[float] = None) -> Any:
+        """
+        在当前线程中执行工具（协程工具使用独立的事件循环），持有并发限制
+        
+        Args:
+            spec: 工具执行方式
+            arguments: 工具参数
+            deadline: 调用方的截止时间（time.monotonic），到期前仍未开始执行时不再执行
+            
+        Raises:
+            ToolTimeoutError: 等待线程或并发名额时已超过截止时间
+        """
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            raise ToolTimeoutError("工具排队超时，未执行")
+        limit = spec.limit
+        if limit is not None and not limit.acquire(remaining):
+            raise ToolTimeoutError("工具排队超时，未执行")
+        try:
+            if spec.is_async:
+                return asyncio.run(spec.function(**arguments))
+            return spec.function(**arguments)
+        finally:
+            if limit is not None:
+                limit.release()
+    
+    @staticmethod
+    async def _run_async(spec: ToolSpec, arguments: Dict[str, Any]) -> Any:
+        """在当前事件循环中执行协程工具，持有并发限制"""
+        limit = spec.limit
+        if limit is None:
+            return await spec.function(**arguments)
+        await limit.acquire_async()
+        try:
+            return await spec.function(**arguments)
+        finally:
+            limit.release()
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """执行工具的线程池（首次使用时创建）"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="tool")
+        return self._executor
+    
+    def is_cacheable(self, name: str) -> bool:
+        """
+        判断工具的结果是否按缓存策略缓存（相同参数总是返回相同结果）
+        
+        Args:
+            name: 工具名称
+            
+        Returns:
+            工具存在且缓存策略为可缓存时返回True
+        """
+        function = self._tools.get(name)
+        return isinstance(function, MemoizedTool) and function.policy.cacheable
+    
     def get_tool_configs(self):
         """
         获取所有工具配置
@@ -101,6 +493,35 @@ class ToolRegistry:
         """
         return self._tool_configs.copy()
     
+    def get_version(self) -> int:
+        """
+        获取工具列表版本号
+        
+        Returns:
+            版本号，每注册一个工具递增1
+        """
+        return self._version
+    
+    def clear_cache(self, name: Optional[str] = None):
+        """
+        清空工具结果缓存
+        
+        Args:
+            name: 工具名称，为None时清空全部工具的缓存
+        """
+        for tool_name, function in self._tools.items():
+            if isinstance(function, MemoizedTool) and name in (None, tool_name):
+                function.clear()
+    
+    def get_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取各缓存工具的命中统计
+        
+        Returns:
+            工具名称到 hits、misses、entries 的映射
+        """
+        return {name: function.stats() for name, function in self._tools.items() if isinstance(function, MemoizedTool)}
+    
     def list_tools(self):
         """
         列出所有可用工具
@@ -125,6 +546,16 @@ def get_tools():
     return _tool_registry.get_tool_configs()
 
 
+def get_tools_version() -> int:
+    """
+    获取全局工具列表的版本号
+    
+    Returns:
+        版本号
+    """
+    return _tool_registry.get_version()
+
+
 def get_tool_function(name: str):
     """
     获取指定工具的函数
@@ -138,13 +569,78 @@ def get_tool_function(name: str):
     return _tool_registry.get_tool(name)
 
 
-def register_tool(name: str, function, config: dict):
+def is_tool_cacheable(name: str) -> bool:
+    """
+    判断全局注册表中工具的结果是否可缓存（见 ToolRegistry.is_cacheable）
+    
+    Args:
+        name: 工具名称
+        
+    Returns:
+        是否可缓存
+    """
+    return _tool_registry.is_cacheable(name)
+
+
+def call_tool(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    同步执行全局注册表中的工具（见 ToolRegistry.call_tool）
+    
+    Args:
+        name: 工具名称
+        arguments: 工具参数
+        
+    Returns:
+        工具输出
+    """
+    return _tool_registry.call_tool(name, arguments)
+
+
+async def acall_tool(name: str, arguments: Dict[str, Any]) -> Any:
+    """
+    异步执行全局注册表中的工具（见 ToolRegistry.acall_tool）
+    
+    Args:
+        name: 工具名称
+        arguments: 工具参数
+        
+    Returns:
+        工具输出
+    """
+    return await _tool_registry.acall_tool(name, arguments)
+
+
+def register_tool(name: str, function, config: dict, cache_policy: Optional[ToolCachePolicy] = None,
+                  timeout: Optional[float] = None, max_concurrency: Optional[int] = None):
     """
     注册新工具
     
     Args:
         name: 工具名称
-        function: 工具函数
+        function: 工具函数，可以是同步函数或协程函数
         config: 工具配置
+        cache_policy: 结果缓存策略
+        timeout: 单次执行的超时时间（秒）
+        max_concurrency: 同时执行的最大次数
+    """
+    _tool_registry.register_tool(name, function, config, cache_policy, timeout, max_concurrency)
+
+
+def clear_tool_cache(name: Optional[str] = None):
+    """
+    清空全局工具注册表的结果缓存
+    
+    Args:
+        name: 工具名称，为None时清空全部
+    """
+    _tool_registry.clear_cache(name)
+
+
+def get_tool_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    获取全局工具注册表的缓存统计
+    
+    Returns:
+        工具名称到 hits、misses、entries 的映射
     """
-    _tool_registry.register_tool(name, function, config) 
\ No newline at end of file
+    return _tool_registry.get_cache_stats() 
\ No newline at end of file
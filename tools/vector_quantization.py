@@ -0,0 +1,193 @@
+"""
+向量量化存储模块
+知识库索引可选用标量量化（fp16、sq8）或乘积量化（pq）存储向量编码，原始 float32 向量单独保存为
+.npy 文件并以内存映射方式打开；搜索时先在量化索引中取较多候选，再用原始向量精确重排
+"""
+
+import os
+import pathlib
+from typing import Optional
+
+import faiss
+import numpy as np
+
+from observability.logger import get_logger
+
+logger = get_logger("vector_quantization")
+
+
+# 支持的量化方式及说明
+QUANTIZATION_TYPES = {
+    "fp16": "每维 2 字节，召回几乎无损",
+    "sq8": "每维 1 字节，内存为 float32 的 1/4",
+    "pq": "每个子向量 1 字节（pq<子向量数>，如 pq48；省略时为维度的 1/8），压缩率最高，依赖重排保证召回；"
+          "向量少于 9984 个时码本训练不足，改用 sq8",
+}
+
+# 乘积量化每个子空间有 256 个聚类中心，FAISS 建议每个中心至少 39 个训练向量
+MIN_PQ_TRAINING_VECTORS = 39 * 256
+
+
+def parse_quantization(quantization: Optional[str]) -> Optional[str]:
+    """
+    规范化量化方式名称
+    
+    Args:
+        quantization: "fp16"、"sq8"、"pq" 或 "pq<子向量数>"；None、空字符串、"flat" 或 "none" 表示不量化
+    
+    Returns:
+        规范化后的名称，不量化时返回None
+    """
+    if quantization is None:
+        return None
+    name = str(quantization).strip().lower()
+    if name in ("", "flat", "none"):
+        return None
+    if name in ("fp16", "sq8") or (name.startswith("pq") and (name == "pq" or name[2:].isdigit())):
+        return name
+    raise ValueError(f"不支持的量化方式：{quantization}，可选值为 flat、fp16、sq8、pq、pq<子向量数>")
+
+
+def resolve_quantization(quantization: Optional[str], num_vectors: int) -> Optional[str]:
+    """
+    按向量数确定实际使用的量化方式：向量数不足以训练乘积量化的码本时改用 sq8
+    
+    Args:
+        quantization: 量化方式（见 parse_quantization）
+        num_vectors: 用于训练的向量数
+    
+    Returns:
+        规范化后的量化方式，不量化时返回None
+    """
+    quantization = parse_quantization(quantization)
+    if quantization is not None and quantization.startswith("pq") and num_vectors < MIN_PQ_TRAINING_VECTORS:
+        logger.warning("只有 %d 个向量，乘积量化至少需要 %d 个训练向量，改用 sq8",
+                       num_vectors, MIN_PQ_TRAINING_VECTORS)
+        return "sq8"
+    return quantization
+
+
+def build_quantized_index(vectors: np.ndarray, quantization: str) -> "faiss.Index":
+    """
+    用给定向量训练并构建量化索引
+    
+    Args:
+        vectors: 形状为 (文档数, 维度) 的 float32 向量
+        quantization: 量化方式（见 parse_quantization），向量数不足以训练乘积量化时改用 sq8（见 resolve_quantization）
+    
+    Returns:
+        已添加全部向量的 FAISS 索引
+    """
+    quantization = resolve_quantization(quantization, len(vectors))
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    dimension = vectors.shape[1]
+    if quantization is None:
+        index = faiss.IndexFlatL2(dimension)
+    elif quantization == "fp16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+    elif quantization == "sq8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+    else:
+        subvectors = int(quantization[2:]) if len(quantization) > 2 else max(1, dimension // 8)
+        if dimension % subvectors:
+            raise ValueError(f"乘积量化的子向量数 {subvectors} 必须整除向量维度 {dimension}")
+        index = faiss.IndexPQ(dimension, subvectors, 8)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def vector_store_path(index_file: pathlib.Path) -> pathlib.Path:
+    """原始向量文件路径：{kb}_index.faiss -> {kb}_index.vectors.npy"""
+    return pathlib.Path(index_file).with_suffix(".vectors.npy")
+
+
+def write_index(index: "faiss.Index", index_file: pathlib.Path):
+    """
+    写出 FAISS 索引文件
+    
+    先写临时文件再原子替换：以 IO_FLAG_MMAP 映射旧文件的进程（多进程服务的工作进程）继续使用旧文件，
+    原地覆盖（通常会缩短文件）会使这些进程在访问已截断的页时收到 SIGBUS。
+    
+    Args:
+        index: FAISS 索引
+        index_file: 索引文件路径
+    """
+    index_file = pathlib.Path(index_file)
+    tmp_file = index_file.with_name(f"{index_file.name}.tmp{os.getpid()}")
+    faiss.write_index(index, str(tmp_file))
+    os.replace(tmp_file, index_file)
+
+
+def write_vector_store(index_file: pathlib.Path, vectors: np.ndarray):
+    """
+    写出用于重排的原始 float32 向量
+    
+    Args:
+        index_file: 索引文件路径
+        vectors: 形状为 (文档数, 维度) 的向量，行号与索引中的编号一致
+    """
+    store_file = vector_store_path(index_file)
+    # 先写临时文件再原子替换，正在映射旧文件的进程不受影响
+    tmp_file = store_file.with_name(f"{store_file.name}.tmp{os.getpid()}")
+    with open(tmp_file, "wb") as f:
+        np.save(f, np.ascontiguousarray(vectors, dtype="float32"))
+    os.replace(tmp_file, store_file)
+
+
+def open_vector_store(index_file: pathlib.Path) -> Optional[np.ndarray]:
+    """
+    以内存映射方式只读打开原始向量，重排时只有候选向量所在的页会被读入
+    
+    Returns:
+        np.memmap，文件不存在时返回None
+    """
+    store_file = vector_store_path(index_file)
+    if not store_file.exists():
+        return None
+    return np.load(store_file, mmap_mode="r")
+
+
+def reconstruct_vectors(index: "faiss.Index", index_file: Optional[pathlib.Path] = None) -> np.ndarray:
+    """
+    取出索引中的全部向量：优先读取原始向量文件，否则从索引重建（量化索引重建的是近似值）
+    
+    Args:
+        index: FAISS 索引
+        index_file: 索引文件路径
+    
+    Returns:
+        形状为 (文档数, 维度) 的 float32 向量
+    """
+    store = open_vector_store(index_file) if index_file is not None else None
+    if store is not None and len(store) == index.ntotal:
+        return np.array(store, dtype="float32")
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def rescore(query_vectors: np.ndarray, candidate_ids: np.ndarray, vector_store: np.ndarray, k: int):
+    """
+    用原始向量计算候选的精确 L2 距离并重新排序
+    
+    Args:
+        query_vectors: 形状为 (查询数, 维度) 的查询向量
+        candidate_ids: 量化索引返回的候选编号，形状为 (查询数, 候选数)，-1 表示空位
+        vector_store: 原始向量（内存映射）
+        k: 每个查询保留的结果数
+    
+    Returns:
+        (距离, 编号)，形状均为 (查询数, k)，结果不足 k 个时编号为 -1、距离为 inf，与 FAISS 一致
+    """
+    distances = np.full((len(query_vectors), k), np.inf, dtype="float32")
+    ids = np.full((len(query_vectors), k), -1, dtype="int64")
+    for row, (query, candidates) in enumerate(zip(query_vectors, candidate_ids)):
+        # 按编号顺序读取，减少内存映射上的随机访问
+        candidates = np.unique(candidates[candidates >= 0])
+        if not len(candidates):
+            continue
+        exact = ((np.asarray(vector_store[candidates], dtype="float32") - query) ** 2).sum(axis=1)
+        order = np.argsort(exact, kind="stable")[:k]
+        distances[row, :len(order)] = exact[order]
+        ids[row, :len(order)] = candidates[order]
+    return distances, ids
@@ -5,5 +5,10 @@
 from .message_handler import MessageHandler
 from .prompt_builder import PromptBuilder
 from .tool_parser import ToolCallParser
+from .stream_parser import StreamingToolCallParser
+from .semantic_cache import SemanticAnswerCache
+from .query_router import QueryRouter, RouteDecision
+from .speculative_retrieval import SpeculativeRetrieval
 
-__all__ = ['MessageHandler', 'PromptBuilder', 'ToolCallParser'] 
\ No newline at end of file
+__all__ = ['MessageHandler', 'PromptBuilder', 'ToolCallParser', 'StreamingToolCallParser', 'SemanticAnswerCache',
+           'QueryRouter', 'RouteDecision', 'SpeculativeRetrieval'] 
\ No newline at end of file
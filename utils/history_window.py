@@ -0,0 +1,146 @@
+"""
+对话历史窗口模块
+按token预算选择放入提示词的对话历史，并压缩较早的工具输出
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Dict, Any
+
+
+# 中日韩字符大致一个字符对应一个token，其余字符按约4个字符一个token估算
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+
+# 每条消息在提示词中的角色前缀和换行的额外开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@lru_cache(maxsize=4096)
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数量，结果按文本缓存，同一条消息只计算一次
+    
+    Args:
+        text: 文本内容
+    
+    Returns:
+        估算的token数量
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+@lru_cache(maxsize=1024)
+def summarize_tool_output(content: str, max_chars: int = 300) -> str:
+    """
+    压缩较早轮次的工具输出
+    
+    知识库查询结果只保留每条结果的标题和来源，其他工具输出直接截断。
+    
+    Args:
+        content: 工具输出内容
+        max_chars: 压缩后的最大字符数
+    
+    Returns:
+        压缩后的内容
+    """
+    if len(content) <= max_chars:
+        return content
+    
+    if "排名 " in content:
+        kept_prefixes = ("在 ", "排名 ", "标题:", "来源:")
+        lines = [line for line in content.splitlines() if line.startswith(kept_prefixes)]
+        summary = "\n".join(lines)
+    else:
+        summary = content
+    
+    if len(summary) > max_chars:
+        summary = summary[:max_chars]
+    return f"{summary}\n……（已省略 {len(content) - len(summary)} 字）"
+
+
+class HistoryWindow:
+    """对话历史窗口类"""
+    
+    def __init__(self, max_tokens: int = 3000, tool_summary_chars: int = 300):
+        """
+        初始化对话历史窗口
+        
+        Args:
+            max_tokens: 提示词中对话历史的总token预算，当前轮次的消息先计入，剩余部分留给较早历史
+            tool_summary_chars: 较早工具输出压缩后的最大字符数
+        """
+        self.max_tokens = max_tokens
+        self.tool_summary_chars = tool_summary_chars
+    
+    def select(self, conversation_history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        选择放入提示词的对话历史
+        
+        从最后一条用户消息开始的当前轮次完整保留并先计入预算；更早的消息从新到旧依次加入，
+        其中工具输出使用压缩后的内容，直到token预算用完。当前轮次本身超出预算时只返回当前轮次。
+        
+        Args:
+            conversation_history: 完整的对话历史
+        
+        Returns:
+            按时间顺序排列的消息列表，被压缩的消息为新的字典，不修改原历史
+        """
+        if not conversation_history:
+            return []
+        
+        current_start = 0
+        for i in range(len(conversation_history) - 1, -1, -1):
+            if conversation_history[i].get("role") == "user":
+                current_start = i
+                break
+        
+        current_turn = conversation_history[current_start:]
+        remaining = self.max_tokens - sum(self.count_message_tokens(m) for m in current_turn)
+        
+        selected = []
+        for message in reversed(conversation_history[:current_start]):
+            if message.get("role") == "tool":
+                message = self._compress_tool_message(message)
+            
+            cost = self.count_message_tokens(message)
+            if cost > remaining:
+                break
+            remaining -= cost
+            selected.append(message)
+        
+        selected.reverse()
+        return selected + list(current_turn)
+    
+    def count_message_tokens(self, message: Dict[str, Any]) -> int:
+        """
+        估算单条消息的token数量
+        
+        Args:
+            message: 消息字典
+        
+        Returns:
+            token数量
+        """
+        return estimate_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+    
+    def _compress_tool_message(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        压缩工具消息
+        
+        Args:
+            message: 工具消息
+        
+        Returns:
+            内容被压缩的工具消息副本，内容足够短时返回原消息
+        """
+        content = str(message.get("content", ""))
+        summary = summarize_tool_output(content, self.tool_summary_chars)
+        if summary == content:
+            return message
+        compressed = dict(message)
+        compressed["content"] = summary
+        return compressed
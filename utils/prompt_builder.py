@@ -4,19 +4,33 @@
 """
 
 from typing import List, Dict, Any
-from tools import get_tools
+from tools import get_tools, get_tools_version
+from .history_window import HistoryWindow
 
 
 class PromptBuilder:
     """提示词构建器类"""
     
-    def __init__(self):
+    def __init__(self, history_token_budget: int = 3000):
+        """
+        初始化提示词构建器
+        
+        Args:
+            history_token_budget: 对话历史（含当前轮次）可使用的总token预算
+        """
+        self.history_window = HistoryWindow(max_tokens=history_token_budget)
         self.tools = get_tools()
+        self._tools_version = get_tools_version()
+        # 静态前缀（系统说明、工具列表、格式说明）只渲染一次，工具注册后失效
+        self._static_prefix = None
     
     def build_prompt_with_tools(self, user_input: str, conversation_history: List[Dict[str, Any]] = None) -> str:
         """
         构建包含工具信息的完整提示词
         
+        静态前缀放在最前面，对话历史和用户问题追加在后面，使每一轮请求都共享字节完全相同的前缀，
+        便于服务端的上下文缓存命中。
+        
         Args:
             user_input: 用户输入
             conversation_history: 对话历史
@@ -24,21 +38,104 @@ class PromptBuilder:
         Returns:
             完整的提示词
         """
-        # 构建基础提示词
-        base_prompt = self._build_base_prompt(user_input, conversation_history)
-        
-        # 添加工具信息
-        tools_prompt = self._build_tools_prompt()
+        static_prefix = self.get_static_prefix()
         
-        # 添加工具调用格式说明
-        format_prompt = self._build_format_prompt()
-
-        trailing_prompt = self._build_trailing_prompt() # 添加重要说明              
+        # 构建对话历史
+        history_prompt = self._build_history_prompt(conversation_history)
         
         # 组合完整提示词（将用户问题放在最后）
-        full_prompt = f"{base_prompt}\n\n{tools_prompt}\n\n{format_prompt}\n\n{trailing_prompt}\n\n当前用户的问题是：{user_input}"
+        full_prompt = f"{static_prefix}{history_prompt}\n\n当前用户的问题是：{user_input}"
         
         return full_prompt
+    
+    def build_messages_with_tools(self, conversation_history: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        构建消息格式的请求
+        
+        静态前缀作为 system 消息发送，对话历史按 token 预算选择后依次追加（见 append_request_message），
+        当前用户的问题即历史中的最后一条用户消息。
+        
+        Args:
+            conversation_history: 对话历史
+            
+        Returns:
+            消息列表
+        """
+        messages = [{"role": "system", "content": self.get_static_prefix()}]
+        
+        for message in self.history_window.select(conversation_history or []):
+            self.append_request_message(messages, message)
+        
+        return messages
+    
+    def append_request_message(self, messages: List[Dict[str, Any]], message: Dict[str, Any]):
+        """
+        把对话历史中的一条消息追加到消息格式的请求中
+        
+        工具调用使用文本协议（助手消息中的 <tool_call> 标签），没有结构化的 tool_calls，
+        DashScope 不接受缺少对应 tool_call_id 的 tool 消息，因此工具输出按文本格式对话历史中的
+        “工具(名称)：输出”作为 user 消息发送。相邻的同角色消息合并为一条，保持用户和助手交替。
+        
+        Args:
+            messages: 消息列表（原地追加）
+            message: 对话历史中的消息
+        """
+        role = message.get("role", "")
+        content = message.get("content", "")
+        if role == "tool":
+            role = "user"
+            content = self.format_tool_result(message.get("name", ""), content)
+        elif role not in ("user", "assistant"):
+            return
+        
+        if messages and messages[-1]["role"] == role:
+            messages[-1] = {"role": role, "content": f"{messages[-1]['content']}\n{content}"}
+        else:
+            messages.append({"role": role, "content": content})
+    
+    @staticmethod
+    def format_tool_result(name: str, content: str) -> str:
+        """
+        按文本协议格式化一条工具输出
+        
+        Args:
+            name: 工具名称
+            content: 工具输出
+            
+        Returns:
+            “工具(名称)：输出”格式的文本
+        """
+        return f"工具({name})：{content}"
+    
+    def get_static_prefix(self) -> str:
+        """
+        获取提示词的静态前缀
+        
+        Returns:
+            由系统说明、工具信息、格式说明和重要说明组成的前缀，工具列表不变时返回同一个字符串
+        """
+        self._refresh_tools()
+        
+        if self._static_prefix is None:
+            base_prompt = self._build_base_prompt()
+            tools_prompt = self._build_tools_prompt()
+            format_prompt = self._build_format_prompt()
+            trailing_prompt = self._build_trailing_prompt() # 添加重要说明
+            self._static_prefix = f"{base_prompt}\n\n{tools_prompt}\n\n{format_prompt}\n\n{trailing_prompt}"
+        
+        return self._static_prefix
+    
+    def invalidate_static_prefix(self):
+        """使静态前缀缓存失效，下次构建提示词时重新渲染"""
+        self._static_prefix = None
+    
+    def _refresh_tools(self):
+        """工具注册表发生变化时重新获取工具列表并使静态前缀失效"""
+        current_version = get_tools_version()
+        if current_version != self._tools_version:
+            self.tools = get_tools()
+            self._tools_version = current_version
+            self.invalidate_static_prefix()
 
     def _build_trailing_prompt(self) -> str:
         """
@@ -52,21 +149,17 @@ class PromptBuilder:
 """
         return prompt
     
-    def _build_base_prompt(self, user_input: str, conversation_history: List[Dict[str, Any]] = None) -> str:
+    def _build_base_prompt(self) -> str:
         """
-        构建基础提示词
+        构建基础提示词（系统说明和示例）
         
-        Args:
-            user_input: 用户输入
-            conversation_history: 对话历史
-            
         Returns:
             基础提示词
         """
         prompt = """
 你是用于回答疫苗相关问题的助手。
 0. 有工具可以使用，当你需要使用工具时，请按照工具调用格式说明中的格式输出，此时不需要输出任何向用户说明的话。在下一轮对话中，会返回工具调用的结果。
-1. 当用户询问医学、健康、疾病等相关问题时，你应该使用知识库查询工具（query_knowledge_base）来获取权威的参考文献和链接。
+1. 当用户询问医学、健康、疾病等相关问题时，你应该使用知识库查询工具（query_knowledge_base）来获取权威的参考文献和链接。问题同时涉及多个知识库的主题时，将 knowledge_base 设为 all 一次查询，不要分多次调用。
 2. 你不需要向用户透露检索知识库的存在。如果你不知道答案，只需说你不知道，你不能伪造任何事实或者根据你自己的知识储备回答。
 3. 请用中文回答问题，在你的回答的最后附上参考链接，注意如果检索到的信息中参考链接是nan或者包含xxxxx或者格式错误，只需要提供来源就好了，不需要链接。
 4. 只需要提供和你的答案有关的参考链接。如果有参考URL，一定要提供URL。URL必须是真实的。
@@ -98,10 +191,24 @@ class PromptBuilder:
 
 """
         
+        return prompt
+    
+    def _build_history_prompt(self, conversation_history: List[Dict[str, Any]] = None) -> str:
+        """
+        构建对话历史提示词
+        
+        Args:
+            conversation_history: 对话历史
+            
+        Returns:
+            对话历史提示词，没有历史时返回空字符串
+        """
+        prompt = ""
+        
         # 添加对话历史
         if conversation_history:
             prompt += "\n\n对话历史：\n"
-            for message in conversation_history[-6:]:  # 只保留最近6条消息
+            for message in self.history_window.select(conversation_history):  # 按token预算选择历史
                 role = message.get("role", "")
                 content = message.get("content", "")
                 if role == "user":
@@ -109,8 +216,7 @@ class PromptBuilder:
                 elif role == "assistant":
                     prompt += f"助手：{content}\n"
                 elif role == "tool":
-                    name = message.get("name", "")
-                    prompt += f"工具({name})：{content}\n"
+                    prompt += self.format_tool_result(message.get("name", ""), content) + "\n"
         
         return prompt
     
@@ -192,4 +298,5 @@ class PromptBuilder:
         Returns:
             工具名称列表
         """
+        self._refresh_tools()
         return [tool["function"]["name"] for tool in self.tools] 
\ No newline at end of file
@@ -0,0 +1,172 @@
+"""
+知识库查询路由模块
+在本地判断问题属于哪个知识库，足够确定时由对话管理器直接检索，省去只用来输出工具调用的首轮模型请求
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# 各知识库的关键词（小写匹配）
+DEFAULT_ROUTE_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "hpv": ("hpv", "宫颈", "乳头瘤", "尖锐湿疣", "九价", "四价", "二价"),
+    "hiv": ("hiv", "艾滋", "免疫缺陷", "阻断药", "暴露后预防", "暴露前预防"),
+    "flu": ("流感", "influenza", "flu", "感冒", "发烧", "奥司他韦", "甲流", "乙流"),
+}
+
+# 更可能需要其他工具的问题不做路由，交给模型选择工具
+NON_KB_KEYWORDS: Tuple[str, ...] = ("计算", "等于", "天气", "几点", "现在时间", "今天几号", "日期")
+
+
+@dataclass
+class RouteDecision:
+    """路由结果"""
+    
+    knowledge_base: str
+    confidence: float
+    method: str
+    scores: Dict[str, float] = field(default_factory=dict)
+    
+    def to_tool_call(self, query: str, top_k: int = 5) -> Dict[str, object]:
+        """
+        转换为与模型输出解析结果格式一致的知识库查询工具调用
+        
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+        
+        Returns:
+            工具调用字典，包含 name 和 arguments
+        """
+        return {
+            "name": "query_knowledge_base",
+            "arguments": {"knowledge_base": self.knowledge_base, "query": query, "top_k": top_k},
+        }
+
+
+class QueryRouter:
+    """知识库查询路由类
+    
+    先按关键词分类：只命中一个知识库时路由到该知识库，命中多个时查询 all。没有关键词时，
+    用问题向量与各知识库文档向量中心的余弦相似度分类，最高分和次高分都满足阈值才认为足够确定。
+    问题更像计算、天气或时间查询时不路由。文档向量中心在知识库重新构建后重新计算。
+    """
+    
+    def __init__(self, kb_manager=None, keywords: Optional[Dict[str, Sequence[str]]] = None,
+                 use_centroids: bool = True, min_similarity: float = 0.5, min_margin: float = 0.05,
+                 top_k: int = 5):
+        """
+        初始化查询路由
+        
+        Args:
+            kb_manager: 知识库管理器，用于获取嵌入模型和索引向量；为None时使用全局实例
+            keywords: 知识库名称到关键词列表的映射，为None时使用 DEFAULT_ROUTE_KEYWORDS
+            use_centroids: 没有命中关键词时是否使用向量中心分类
+            min_similarity: 向量中心分类所需的最小余弦相似度
+            min_margin: 向量中心分类中最高分与次高分的最小差值
+            top_k: 路由后查询返回的结果数量
+        """
+        self._kb_manager = kb_manager
+        self.keywords = {kb: tuple(word.lower() for word in words)
+                         for kb, words in (keywords or DEFAULT_ROUTE_KEYWORDS).items()}
+        self.use_centroids = use_centroids
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._centroids = None
+        self._kb_generation = None
+    
+    @property
+    def kb_manager(self):
+        """知识库管理器（延迟获取全局实例，避免导入时加载嵌入模型）"""
+        if self._kb_manager is None:
+            from tools.knowledge_base_tool import get_kb_manager
+            self._kb_manager = get_kb_manager()
+        return self._kb_manager
+    
+    def route(self, question: str) -> Optional[RouteDecision]:
+        """
+        判断问题应查询的知识库
+        
+        Args:
+            question: 用户问题
+        
+        Returns:
+            路由结果，不够确定或不应查询知识库时返回None
+        """
+        lowered = question.lower()
+        if not lowered.strip() or any(keyword in lowered for keyword in NON_KB_KEYWORDS):
+            return None
+        
+        matched = {kb: sum(keyword in lowered for keyword in words) for kb, words in self.keywords.items()}
+        matched = {kb: count for kb, count in matched.items() if count}
+        if len(matched) == 1:
+            return RouteDecision(next(iter(matched)), 1.0, "keyword", dict(matched))
+        if matched:
+            return RouteDecision("all", 1.0, "keyword", dict(matched))
+        
+        if self.use_centroids:
+            return self._route_by_centroid(question)
+        return None
+    
+    def _route_by_centroid(self, question: str) -> Optional[RouteDecision]:
+        """按问题向量与各知识库向量中心的相似度分类"""
+        if not NUMPY_AVAILABLE:
+            return None
+        
+        centroids = self._get_centroids()
+        if len(centroids) < 2:
+            # 只有一个可用知识库时无从比较，交给模型判断
+            return None
+        
+        # 各知识库可能使用不同的嵌入模型，同一模型只编码一次
+        embeddings = {}
+        scores = {}
+        for kb, (model, centroid) in centroids.items():
+            if id(model) not in embeddings:
+                vector = np.asarray(model.encode([question]), dtype="float32")[0]
+                embeddings[id(model)] = vector / (np.linalg.norm(vector) or 1.0)
+            scores[kb] = float(np.dot(embeddings[id(model)], centroid))
+        
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best, second = scores[ranked[0]], scores[ranked[1]]
+        if best < self.min_similarity or best - second < self.min_margin:
+            return None
+        return RouteDecision(ranked[0], best, "centroid", scores)
+    
+    def _get_centroids(self) -> Dict[str, tuple]:
+        """
+        取出各知识库的 (嵌入模型, 归一化向量中心)，知识库重新构建后重新计算
+        
+        Returns:
+            知识库名称到 (嵌入模型, 向量中心) 的映射，只包含可以搜索的知识库
+        """
+        manager = self.kb_manager
+        with self._lock:
+            if self._centroids is not None and self._kb_generation == manager.generation:
+                return self._centroids
+            
+            centroids = {}
+            for kb_type, index in manager.indices.items():
+                model = manager.embedding_models.get(kb_type)
+                if index is None or model is None or index.ntotal == 0:
+                    continue
+                # 量化索引优先使用保存的原始向量
+                store = getattr(manager, "vector_stores", {}).get(kb_type)
+                vectors = np.asarray(store if store is not None else index.reconstruct_n(0, index.ntotal),
+                                     dtype="float32")
+                vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+                centroid = vectors.mean(axis=0)
+                centroids[kb_type.value] = (model, centroid / (np.linalg.norm(centroid) or 1.0))
+            
+            self._centroids = centroids
+            self._kb_generation = manager.generation
+            return centroids
@@ -0,0 +1,165 @@
+"""
+语义答案缓存模块
+用嵌入向量查找与历史问题语义相近的首轮问题，直接复用已生成的答案
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+try:
+    import faiss
+    import numpy as np
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+
+class SemanticAnswerCache:
+    """语义答案缓存类
+    
+    问题向量归一化后存入内积索引，相似度即余弦相似度。知识库重新构建后缓存整体失效。
+    """
+    
+    def __init__(self, kb_manager=None, similarity_threshold: float = 0.92,
+                 ttl: Optional[float] = 24 * 3600, max_entries: int = 2000):
+        """
+        初始化语义答案缓存
+        
+        Args:
+            kb_manager: 知识库管理器，用于获取嵌入模型和构建代数；为None时使用全局实例
+            similarity_threshold: 命中所需的最小余弦相似度
+            ttl: 条目有效期（秒），为None时不过期
+            max_entries: 最大条目数，超出时淘汰最早写入的条目
+        """
+        self._kb_manager = kb_manager
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._index = None
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 0
+        self._kb_generation = None
+    
+    @property
+    def kb_manager(self):
+        """知识库管理器（延迟获取全局实例，避免导入时加载嵌入模型）"""
+        if self._kb_manager is None:
+            from tools.knowledge_base_tool import get_kb_manager
+            self._kb_manager = get_kb_manager()
+        return self._kb_manager
+    
+    @property
+    def available(self) -> bool:
+        """是否可用：需要 FAISS 和嵌入模型"""
+        return FAISS_AVAILABLE and self.kb_manager.embedding_model is not None
+    
+    def lookup(self, question: str) -> Optional[str]:
+        """
+        查找语义相近问题的缓存答案
+        
+        Args:
+            question: 用户问题
+        
+        Returns:
+            缓存的答案，未命中时返回None
+        """
+        if not question.strip() or not self.available:
+            return None
+        
+        vector = self._encode(question)
+        with self._lock:
+            self._check_kb_generation()
+            if self._index is None or self._index.ntotal == 0:
+                return None
+            
+            k = min(5, self._index.ntotal)
+            scores, ids = self._index.search(vector, k)
+            now = time.time()
+            expired = []
+            answer = None
+            for score, entry_id in zip(scores[0], ids[0]):
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if self.ttl is not None and now - entry["created_at"] > self.ttl:
+                    expired.append(int(entry_id))
+                    continue
+                if score >= self.similarity_threshold:
+                    answer = entry["answer"]
+                break
+            
+            if expired:
+                self._remove(expired)
+            return answer
+    
+    def store(self, question: str, answer: str):
+        """
+        缓存问题和答案
+        
+        Args:
+            question: 用户问题
+            answer: 最终答案
+        """
+        if not question.strip() or not answer or not self.available:
+            return
+        
+        vector = self._encode(question)
+        with self._lock:
+            self._check_kb_generation()
+            if self._index is None:
+                self._index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = {"question": question, "answer": answer, "created_at": time.time()}
+            
+            # 字典按写入顺序保存，超出上限时淘汰最早的条目
+            if len(self._entries) > self.max_entries:
+                excess = len(self._entries) - self.max_entries
+                self._remove(list(self._entries.keys())[:excess])
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _encode(self, question: str):
+        """
+        编码并归一化问题向量
+        
+        Args:
+            question: 用户问题
+        
+        Returns:
+            形状为 (1, d) 的 float32 向量
+        """
+        vector = np.asarray(self.kb_manager.embedding_model.encode([question]), dtype='float32')
+        faiss.normalize_L2(vector)
+        return vector
+    
+    def _check_kb_generation(self):
+        """知识库重新构建后清空缓存（调用方需持有锁）"""
+        generation = self.kb_manager.generation
+        if generation != self._kb_generation:
+            self._index = None
+            self._entries.clear()
+            self._kb_generation = generation
+    
+    def _remove(self, entry_ids):
+        """
+        删除指定条目（调用方需持有锁）
+        
+        Args:
+            entry_ids: 条目ID列表
+        """
+        for entry_id in entry_ids:
+            self._entries.pop(entry_id, None)
+        if self._index is not None:
+            self._index.remove_ids(np.array(entry_ids, dtype='int64'))
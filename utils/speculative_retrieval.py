@@ -0,0 +1,174 @@
+"""
+推测检索模块
+首轮模型请求进行的同时，用用户的原始问题预先检索知识库；模型随后发起相同或几乎相同的查询时直接使用预先检索的结果
+"""
+
+import contextvars
+import difflib
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from observability import trace_span
+from observability.logger import get_logger
+
+
+logger = get_logger("speculative_retrieval")
+
+# 比较查询时忽略的空白和标点
+_IGNORED_CHARACTERS = re.compile(r"[\W_]+")
+
+
+def normalize_query(query: str) -> str:
+    """去掉空白和标点并转为小写，用于判断两个查询是否相同"""
+    return _IGNORED_CHARACTERS.sub("", str(query)).lower()
+
+
+class SpeculativeSearch:
+    """一次推测检索（只在所属的对话轮次中使用）"""
+    
+    def __init__(self, retrieval: "SpeculativeRetrieval", question: str, kb_types: List[Any], future: Future):
+        """
+        初始化推测检索
+        
+        Args:
+            retrieval: 发起检索的 SpeculativeRetrieval
+            question: 用户的原始问题
+            kb_types: 检索的知识库类型列表
+            future: 后台检索任务，结果为知识库类型到搜索结果的映射
+        """
+        self.retrieval = retrieval
+        self.question = question
+        self.kb_types = kb_types
+        self.future = future
+        self._normalized_question = normalize_query(question)
+    
+    def matches(self, query: str) -> bool:
+        """判断查询与原始问题是否相同或几乎相同"""
+        normalized = normalize_query(query)
+        if normalized == self._normalized_question:
+            return True
+        ratio = difflib.SequenceMatcher(None, normalized, self._normalized_question).ratio()
+        return ratio >= self.retrieval.similarity_threshold
+    
+    def serve(self, arguments: Dict[str, Any]) -> Optional[str]:
+        """
+        尝试用推测检索的结果回答一次知识库查询工具调用
+        
+        Args:
+            arguments: query_knowledge_base 的参数
+        
+        Returns:
+            与 query_knowledge_base 相同格式的输出，不能使用推测结果时返回None
+        """
+        from tools.knowledge_base_tool import format_query_results, parse_knowledge_base_names
+        
+        knowledge_base = arguments.get("knowledge_base", "")
+        query = arguments.get("query", "")
+        try:
+            top_k = int(arguments.get("top_k", 5))
+            kb_types = parse_knowledge_base_names(str(knowledge_base))
+        except (TypeError, ValueError):
+            return None
+        # 推测检索不带过滤条件，结果数也有上限
+        filters = {key for key, value in arguments.items() if value not in (None, "")} - {"knowledge_base", "query", "top_k"}
+        if filters or not 0 < top_k <= self.retrieval.k:
+            return None
+        if any(kb_type not in self.kb_types for kb_type in kb_types) or not self.matches(query):
+            return None
+        
+        try:
+            results_by_kb = self.future.result()
+        except Exception as e:
+            logger.warning("推测检索失败：%s", e)
+            return None
+        
+        if len(kb_types) == 1:
+            results = results_by_kb.get(kb_types[0])
+            results_by_kb = {kb_types[0]: results} if results is not None else {}
+        else:
+            results_by_kb = {kb_type: results_by_kb[kb_type] for kb_type in kb_types if kb_type in results_by_kb}
+        # 推测检索出错时交给工具重新检索
+        if not results_by_kb or any(results and "error" in results[0] for results in results_by_kb.values()):
+            return None
+        if len(kb_types) == 1:
+            results = results[:top_k]
+        else:
+            results = self.retrieval.kb_manager.merge_search_results(results_by_kb, top_k)
+        
+        self.retrieval.record_hit()
+        with trace_span("kb.speculative_hit", kb=str(knowledge_base), k=top_k):
+            return format_query_results(str(knowledge_base), query, results)
+    
+    def discard(self):
+        """丢弃推测结果，检索尚未开始时取消"""
+        self.future.cancel()
+
+
+class SpeculativeRetrieval:
+    """推测检索类
+    
+    对话管理器在首轮模型请求前调用 start，检索在后台线程中与模型请求并行进行。多个知识库使用同一嵌入模型时
+    只编码一次问题。推测结果只用于本轮对话的首轮工具调用，之后丢弃。
+    """
+    
+    def __init__(self, kb_manager=None, k: int = 10, similarity_threshold: float = 0.9, max_workers: int = 4):
+        """
+        初始化推测检索
+        
+        Args:
+            kb_manager: 知识库管理器；为None时使用全局实例
+            k: 每个知识库预先检索的结果数，工具调用的 top_k 不超过该值时才能使用推测结果
+            similarity_threshold: 模型的查询与原始问题（去掉空白和标点后）的最小字符相似度
+            max_workers: 后台检索线程数
+        """
+        self._kb_manager = kb_manager
+        self.k = k
+        self.similarity_threshold = similarity_threshold
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-retrieval")
+        self._lock = threading.Lock()
+        self.stats = {"started": 0, "served": 0}
+    
+    @property
+    def kb_manager(self):
+        """知识库管理器（延迟获取全局实例，避免导入时加载嵌入模型）"""
+        if self._kb_manager is None:
+            from tools.knowledge_base_tool import get_kb_manager
+            self._kb_manager = get_kb_manager()
+        return self._kb_manager
+    
+    def start(self, question: str, knowledge_bases: Optional[List[str]] = None) -> SpeculativeSearch:
+        """
+        在后台开始检索用户的原始问题
+        
+        Args:
+            question: 用户问题
+            knowledge_bases: 要检索的知识库名称列表，为None时检索全部知识库
+        
+        Returns:
+            推测检索对象
+        """
+        from tools.knowledge_base_tool import KnowledgeBaseType
+        
+        kb_types = [KnowledgeBaseType(name) for name in knowledge_bases] if knowledge_bases else list(KnowledgeBaseType)
+        manager = self.kb_manager
+        
+        def search():
+            with trace_span("kb.speculative_search", kbs=len(kb_types), k=self.k):
+                return manager.search_each_knowledge_base(question, self.k, kb_types)
+        
+        with self._lock:
+            self.stats["started"] += 1
+        # 复制上下文，让检索的 span 挂在本轮调用之下
+        future = self._executor.submit(contextvars.copy_context().run, search)
+        return SpeculativeSearch(self, question, kb_types, future)
+    
+    def record_hit(self):
+        """记录一次使用推测结果的工具调用"""
+        with self._lock:
+            self.stats["served"] += 1
+    
+    def close(self):
+        """停止后台检索线程"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
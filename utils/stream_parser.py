@@ -0,0 +1,130 @@
+"""
+流式工具调用解析器模块
+增量解析模型的流式输出，在工具调用标签闭合时立即产出事件
+"""
+
+import re
+from typing import List, Dict, Any
+from .tool_parser import ToolCallParser
+
+
+class StreamingToolCallParser:
+    """流式工具调用解析器类
+    
+    与 ToolCallParser 的批量解析保持相同的语义：未闭合的 <tool_call> 按普通文本处理，
+    格式无效的工具调用会被丢弃。每次 feed 只扫描新增的文本，不会重复扫描整个缓冲区。
+    """
+    
+    OPEN_TAG = "<tool_call>"
+    CLOSE_TAG = "</tool_call>"
+    
+    def __init__(self):
+        self._parser = ToolCallParser()
+        self._open_pattern = re.compile(re.escape(self.OPEN_TAG), re.IGNORECASE)
+        self._close_pattern = re.compile(re.escape(self.CLOSE_TAG), re.IGNORECASE)
+        self.reset()
+    
+    def reset(self):
+        """重置解析状态，用于开始解析新的一轮输出"""
+        # 尚未产出的文本：标签外时只保存可能是开始标签前缀的尾部，标签内时保存工具调用正文
+        self._buffer = ""
+        self._in_tool_call = False
+        # 下一次查找标签的起始位置，避免重复扫描已确认不含标签的部分
+        self._scan_from = 0
+        self._closed = False
+    
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        """
+        输入一段增量文本
+        
+        Args:
+            delta: 模型流式输出的增量文本
+        
+        Returns:
+            本次新产出的事件列表，事件格式为
+            {"type": "text", "content": 文本} 或
+            {"type": "tool_call", "name": 工具名称, "arguments": 参数字典}
+        """
+        if self._closed:
+            raise RuntimeError("解析器已关闭，请先调用 reset()")
+        
+        events = []
+        if not delta:
+            return events
+        
+        self._buffer += delta
+        
+        while True:
+            if self._in_tool_call:
+                match = self._close_pattern.search(self._buffer, self._scan_from)
+                if not match:
+                    # 结束标签可能跨越分块边界，下次从可能的起点继续查找
+                    self._scan_from = max(0, len(self._buffer) - len(self.CLOSE_TAG) + 1)
+                    break
+                
+                tool_call = self._parser._parse_single_tool_call(self._buffer[:match.start()].strip())
+                if tool_call:
+                    events.append({"type": "tool_call", **tool_call})
+                
+                self._buffer = self._buffer[match.end():]
+                self._in_tool_call = False
+                self._scan_from = 0
+            else:
+                match = self._open_pattern.search(self._buffer, self._scan_from)
+                if not match:
+                    # 保留可能是开始标签前缀的尾部，其余文本立即产出
+                    keep = self._partial_tag_length(self._buffer)
+                    emit_end = len(self._buffer) - keep
+                    if emit_end > 0:
+                        events.append({"type": "text", "content": self._buffer[:emit_end]})
+                        self._buffer = self._buffer[emit_end:]
+                    self._scan_from = 0
+                    break
+                
+                if match.start() > 0:
+                    events.append({"type": "text", "content": self._buffer[:match.start()]})
+                
+                self._buffer = self._buffer[match.end():]
+                self._in_tool_call = True
+                self._scan_from = 0
+        
+        return events
+    
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        结束输入并产出剩余内容
+        
+        Returns:
+            剩余的事件列表；未闭合的工具调用按普通文本产出
+        """
+        events = []
+        if self._closed:
+            return events
+        
+        remaining = self._buffer
+        if self._in_tool_call:
+            remaining = self.OPEN_TAG + remaining
+        if remaining:
+            events.append({"type": "text", "content": remaining})
+        
+        self._buffer = ""
+        self._in_tool_call = False
+        self._closed = True
+        return events
+    
+    def _partial_tag_length(self, text: str) -> int:
+        """
+        计算文本末尾与开始标签前缀重合的长度
+        
+        Args:
+            text: 待检查的文本
+        
+        Returns:
+            需要保留等待后续分块的字符数
+        """
+        tag = self.OPEN_TAG
+        max_len = min(len(tag) - 1, len(text))
+        for length in range(max_len, 0, -1):
+            if text[-length:].lower() == tag[:length]:
+                return length
+        return 0
@@ -7,6 +7,11 @@ import re
 import json
 from typing import List, Dict, Any, Optional, Tuple
 
+from observability.logger import get_logger
+
+
+logger = get_logger("tool_parser")
+
 
 class ToolCallParser:
     """工具调用解析器类"""
@@ -75,7 +80,7 @@ class ToolCallParser:
             }
             
         except Exception as e:
-            print(f"解析工具调用时出错：{e}")
+            logger.warning("解析工具调用时出错：%s", e)
             return None
     
     def _parse_simple_params(self, params_text: str) -> Dict[str, Any]:
@@ -163,4 +168,17 @@ class ToolCallParser:
             args_str = json.dumps(arguments, ensure_ascii=False, indent=2)
             return f"工具：{name}\n参数：{args_str}"
         else:
-            return f"工具：{name}\n参数：无" 
\ No newline at end of file
+            return f"工具：{name}\n参数：无"
+    
+    def format_tool_call(self, tool_call: Dict[str, Any]) -> str:
+        """
+        按提示词约定的格式输出工具调用标签（与 parse_tool_calls 互逆）
+        
+        Args:
+            tool_call: 工具调用信息
+            
+        Returns:
+            <tool_call> 标签文本
+        """
+        arguments = json.dumps(tool_call.get("arguments", {}), ensure_ascii=False)
+        return f"<tool_call>\n工具名称：{tool_call.get('name', '')}\n参数：{arguments}\n</tool_call>"